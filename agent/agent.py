@@ -11,9 +11,10 @@ Tính năng:
 - Export to MD (ExportTool)
 """
 
+import asyncio
 import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 from datetime import datetime
 
 # Thêm project root vào path
@@ -21,7 +22,8 @@ project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from agent.config import AGENT_NAME, AGENT_DESCRIPTION, MAX_CONVERSATION_HISTORY
+from agent.config import AGENT_NAME, AGENT_DESCRIPTION, MAX_CONVERSATION_HISTORY, ANSWER_CACHE_ENABLED
+from agent.answer_cache import get_answer_cache
 from agent.pdf_manager import get_pdf_manager
 from agent.collection_manager import get_collection_manager
 from agent.intent_classifier import get_intent_classifier
@@ -39,8 +41,11 @@ from agent.tools.setup_tool import get_setup_tool
 
 # Import export function
 from src.export_md import convert_to_markdown
+from src.vector_store import normalize_vectors
 
 from src.logging_config import get_logger
+from src.llm_metrics import get_usage_tracker
+from src.config import LLM_USAGE_EXPORT_FILE
 
 logger = get_logger(__name__)
 
@@ -71,6 +76,7 @@ class Agent:
         self.topic_tool = get_topic_tool(self.topic_suggester)  # TopicTool
         self.export_tool = get_export_tool()  # ExportTool
         self.rag_tool = None  # RagTool - sẽ được khởi tạo sau khi có LLM
+        self.answer_cache = get_answer_cache() if ANSWER_CACHE_ENABLED else None  # Cache câu trả lời
         self.collection_tool = None  # CollectionTool - quản lý collections
         self.setup_tool = None  # SetupTool - xử lý setup workflow
         
@@ -255,13 +261,62 @@ class Agent:
             else:
                 print("❌ Lệnh không hợp lệ")
     
-    def process_message(self, message: str) -> str:
-        """Xử lý tin nhắn từ user: phát hiện intent -> trả lời"""
+    def process_message(self, message: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Xử lý tin nhắn từ user: phát hiện intent -> trả lời
+        
+        Args:
+            message: Tin nhắn của user
+            on_token: Callback nhận từng đoạn câu trả lời của LLM khi stream
+                (response trả về vẫn là câu trả lời đầy đủ)
+        """
         logger.info(f"User: {message}")
         
         # Add to conversation history (using ConversationHistory)
         self.conversation_history.add_message('user', message)
         
+        route = self._route_message(message)
+        if route == 'rag':
+            response = self._handle_question(message, on_token=on_token)
+        elif route == 'chat':
+            response = self._handle_general_chat(message, on_token=on_token)
+        else:
+            response = self._handle_intent(route)
+        
+        # Add response to conversation history
+        self.conversation_history.add_message('assistant', response)
+        
+        return response
+    
+    async def aprocess_message(self, message: str) -> str:
+        """
+        Phiên bản async của process_message.
+        
+        RAG và chat dùng aanswer_question / agenerate nên nhiều Agent (mỗi hội
+        thoại một Agent) có thể chạy đồng thời trong một event loop, dùng chung
+        embedding model và key pool. Lệnh khác (export, check...) chạy trong thread.
+        """
+        logger.info(f"User: {message}")
+        self.conversation_history.add_message('user', message)
+        
+        route = self._route_message(message)
+        if route == 'rag':
+            response = await self._ahandle_question(message)
+        elif route == 'chat':
+            response = await self._ahandle_general_chat(message)
+        else:
+            response = await asyncio.to_thread(self._handle_intent, route)
+        
+        self.conversation_history.add_message('assistant', response)
+        return response
+    
+    def _route_message(self, message: str) -> str:
+        """
+        Phân loại tin nhắn.
+        
+        Returns:
+            'rag' (câu hỏi về tài liệu), 'chat' (chat thường) hoặc intent khác
+        """
         # Classify: PDF-related or general chat
         pdf_classification = self.intent_classifier.classify(message)
         print(f"\n🔍 Phân loại: {pdf_classification['intent']} (tin cậy: {pdf_classification['confidence']:.2f})")
@@ -273,36 +328,32 @@ class Agent:
         confidence = intent_result['confidence']
         print(f"   Ý định chi tiết: {intent} (độ tin cậy: {confidence:.2f})")
         
-        # Route to appropriate handler
+        if intent == 'question':
+            if pdf_classification['intent'] == 'pdf_related':
+                print("   → Sử dụng RAG để trả lời từ tài liệu")
+                return 'rag'
+            print("   → Chat bình thường không cần tìm kiếm tài liệu")
+            return 'chat'
+        return intent
+    
+    def _handle_intent(self, intent: str) -> str:
+        """Trả lời các intent không cần LLM (chào hỏi, lệnh, gợi ý chủ đề...)."""
         if intent == 'greeting':
-            response = self._handle_greeting()
+            return self._handle_greeting()
         elif intent == 'farewell':
-            response = self._handle_farewell()
+            return self._handle_farewell()
         elif intent == 'thanks':
-            response = self._handle_thanks()
+            return self._handle_thanks()
         elif intent == 'help':
-            response = self._handle_help()
+            return self._handle_help()
         elif intent == 'command_export':
-            response = self._handle_export_command()
+            return self._handle_export_command()
         elif intent == 'command_check':
-            response = self._handle_check_command()
+            return self._handle_check_command()
         elif intent == 'no_idea':
             print("   → Đề xuất các chủ đề từ tài liệu")
-            response = self.handle_no_idea_question()
-        elif intent == 'question':
-            if pdf_classification['intent'] == 'pdf_related':
-                print("   → Sử dụng RAG để trả lời từ tài liệu")
-                response = self._handle_question(message)
-            else:
-                print("   → Chat bình thường không cần tìm kiếm tài liệu")
-                response = self._handle_general_chat(message)
-        else:
-            response = "Tôi không hiểu. Vui lòng diễn đạt lại."
-        
-        # Add response to conversation history
-        self.conversation_history.add_message('assistant', response)
-        
-        return response
+            return self.handle_no_idea_question()
+        return "Tôi không hiểu. Vui lòng diễn đạt lại."
     
     def _handle_greeting(self) -> str:
         return f"Hello! I'm {self.name}. I can help you search information from PDF documents. What would you like to know?"
@@ -322,6 +373,7 @@ class Agent:
 4. Re-setup: Type 'setup' to select different PDFs/collections
 5. Export MD: Ask me to export PDFs to Markdown
 6. Check collection: Ask me to check collection status
+7. LLM usage: Type 'stats' (or 'stats export [file]') to see tokens/latency per model
 
 Example questions:
 - "What is ROUGE?"
@@ -364,16 +416,15 @@ Try asking me something!"""
             return "Chưa chọn collection nào. Vui lòng chạy setup trước."
         
         try:
-            from pymilvus import Collection
+            from src.vector_store import get_vector_store
             
+            vector_store = get_vector_store()
             status_info = []
             total_docs = 0
             
             for col_name in self.selected_collections:
                 try:
-                    collection = Collection(col_name)
-                    collection.load()
-                    num_entities = collection.num_entities
+                    num_entities = vector_store.num_entities(col_name)
                     total_docs += num_entities
                     status_info.append(f"- {col_name}: {num_entities} tài liệu")
                 except Exception as e:
@@ -388,7 +439,7 @@ Try asking me something!"""
             logger.error(f"Check command failed: {e}", exc_info=True)
             return f"Error checking collections: {str(e)}"
     
-    def _handle_general_chat(self, message: str) -> str:
+    def _handle_general_chat(self, message: str, on_token: Optional[Callable[[str], None]] = None) -> str:
         """
         Xử lý chat bình thường không liên quan đến PDF
         Sử dụng LLM để trả lời tự nhiên mà không cần tìm kiếm tài liệu
@@ -396,27 +447,17 @@ Try asking me something!"""
         self._ensure_llm_initialized()
         
         try:
-            # Get recent context from conversation history
-            recent_history = self.conversation_history.get_recent(n=3)
+            prompt = self._chat_prompt(message)
             
-            # Format context for LLM
-            context = ""
-            if recent_history:
-                for msg in recent_history:
-                    role = "User" if msg['role'] == 'user' else "Assistant"
-                    context += f"{role}: {msg['content']}\n"
-            
-            # Prompt for general chat
-            prompt = f"""Bạn là một trợ lý AI thân thiện. Hãy trả lời câu hỏi của người dùng một cách tự nhiên và hữu ích.
-
-{context}
-
-User: {message}
-
-Hãy trả lời ngắn gọn, tự nhiên và thân thiện."""
-
             # Call LLM using LangChain interface
-            answer = self.llm_client.generate(prompt).strip()
+            if on_token is None:
+                answer = self.llm_client.generate(prompt).strip()
+            else:
+                parts = []
+                for chunk in self.llm_client.generate_stream(prompt):
+                    parts.append(chunk)
+                    on_token(chunk)
+                answer = "".join(parts).strip()
             
             return answer
         
@@ -424,7 +465,40 @@ Hãy trả lời ngắn gọn, tự nhiên và thân thiện."""
             logger.error(f"Lỗi khi chat: {e}", exc_info=True)
             return "Xin lỗi, tôi gặp lỗi khi xử lý tin nhắn của bạn."
     
-    def _handle_question(self, question: str) -> str:
+    async def _ahandle_general_chat(self, message: str) -> str:
+        """Phiên bản async của _handle_general_chat."""
+        self._ensure_llm_initialized()
+        
+        try:
+            answer = await self.llm_client.agenerate(self._chat_prompt(message))
+            return answer.strip()
+        
+        except Exception as e:
+            logger.error(f"Lỗi khi chat: {e}", exc_info=True)
+            return "Xin lỗi, tôi gặp lỗi khi xử lý tin nhắn của bạn."
+    
+    def _chat_prompt(self, message: str) -> str:
+        """Prompt chat thường kèm vài tin nhắn gần nhất."""
+        # Get recent context from conversation history
+        recent_history = self.conversation_history.get_recent(n=3)
+        
+        # Format context for LLM
+        context = ""
+        if recent_history:
+            for msg in recent_history:
+                role = "User" if msg['role'] == 'user' else "Assistant"
+                context += f"{role}: {msg['content']}\n"
+        
+        # Prompt for general chat
+        return f"""Bạn là một trợ lý AI thân thiện. Hãy trả lời câu hỏi của người dùng một cách tự nhiên và hữu ích.
+
+{context}
+
+User: {message}
+
+Hãy trả lời ngắn gọn, tự nhiên và thân thiện."""
+    
+    def _handle_question(self, question: str, on_token: Optional[Callable[[str], None]] = None) -> str:
         """Handle question using RagTool - delegate to tool"""
         if not self.initialized:
             return "Agent chưa setup. Chạy setup() trước."
@@ -435,44 +509,144 @@ Hãy trả lời ngắn gọn, tự nhiên và thân thiện."""
         self._ensure_rag_tool_initialized()
         
         try:
-            print(f"\nĐang tìm trong {len(self.selected_collections)} collection...")
-            
-            # Delegate to RagTool
-            result = self.rag_tool.answer_question(
-                question=question,
-                collection_names=self.selected_collections,
-                conversation_history=self.conversation_history.get_all(),
-                top_k=20
-            )
-            
-            if not result['success'] or not result['sources']:
-                return self._show_no_results_with_suggestions()
+            question_vector = self._encode_question(question)
+            result = self._lookup_answer_cache(question_vector)
             
-            # Format response with sources
-            answer = result['answer']
-            sources = result['sources']
-            
-            response = f"{answer}\n\n**Nguồn ({len(sources)} tài liệu):**"
+            if result is None:
+                print(f"\nĐang tìm trong {len(self.selected_collections)} collection...")
+                
+                # Delegate to RagTool
+                result = self.rag_tool.answer_question(
+                    question=question,
+                    collection_names=self.selected_collections,
+                    conversation_history=self.conversation_history.get_all(),
+                    top_k=20,
+                    on_token=on_token
+                )
+                
+                if result['success'] and result['sources']:
+                    self._store_answer_cache(question, question_vector, result)
             
-            from collections import defaultdict
-            sources_by_pdf = defaultdict(list)
-            for source in sources[:15]:  # Show top 15 sources
-                pdf_name = source.get('source', 'Unknown')
-                page = source.get('page', 'N/A')
-                score = source.get('score', 0)
-                sources_by_pdf[pdf_name].append((page, score))
+            return self._format_rag_response(result)
             
-            for i, (pdf_name, pages_info) in enumerate(sources_by_pdf.items(), 1):
-                response += f"\n  {i}. {pdf_name}"
-                for page, score in pages_info[:3]:  # Top 3 pages per PDF
-                    response += f"\n     - Trang {page}"
+        except Exception as e:
+            logger.error(f"Lỗi: {e}", exc_info=True)
+            return f"Lỗi: {str(e)}"
+    
+    async def _ahandle_question(self, question: str) -> str:
+        """Phiên bản async của _handle_question (encode câu hỏi chạy trong thread)."""
+        if not self.initialized:
+            return "Agent chưa setup. Chạy setup() trước."
+        if not self.selected_collections:
+            return "Chưa chọn collection nào."
+        
+        self._ensure_rag_tool_initialized()
+        
+        try:
+            question_vector = await asyncio.to_thread(self._encode_question, question)
+            result = self._lookup_answer_cache(question_vector)
+            
+            if result is None:
+                result = await self.rag_tool.aanswer_question(
+                    question=question,
+                    collection_names=self.selected_collections,
+                    conversation_history=self.conversation_history.get_all(),
+                    top_k=20
+                )
+                
+                if result['success'] and result['sources']:
+                    self._store_answer_cache(question, question_vector, result)
             
-            return response
+            return self._format_rag_response(result)
             
         except Exception as e:
             logger.error(f"Lỗi: {e}", exc_info=True)
             return f"Lỗi: {str(e)}"
     
+    def _format_rag_response(self, result: Dict[str, Any]) -> str:
+        """Câu trả lời RAG kèm danh sách nguồn (hoặc gợi ý nếu không có kết quả)."""
+        if not result['success'] or not result['sources']:
+            return self._show_no_results_with_suggestions()
+        
+        # Format response with sources
+        answer = result['answer']
+        sources = result['sources']
+        
+        response = f"{answer}\n\n**Nguồn ({len(sources)} tài liệu):**"
+        if result.get('cached'):
+            response = f"⚡ (Trả lời từ cache)\n{response}"
+        
+        from collections import defaultdict
+        sources_by_pdf = defaultdict(list)
+        for source in sources[:15]:  # Show top 15 sources
+            pdf_name = source.get('source', 'Unknown')
+            page = source.get('page', 'N/A')
+            score = source.get('score', 0)
+            sources_by_pdf[pdf_name].append((page, score))
+        
+        for i, (pdf_name, pages_info) in enumerate(sources_by_pdf.items(), 1):
+            response += f"\n  {i}. {pdf_name}"
+            for page, score in pages_info[:3]:  # Top 3 pages per PDF
+                response += f"\n     - Trang {page}"
+        
+        return response
+    
+    def _encode_question(self, question: str) -> Optional[Any]:
+        """
+        Embedding câu hỏi cho answer cache.
+        
+        None (bỏ qua cache cả lúc tra lẫn lúc lưu) nếu cache tắt, lỗi, hoặc hội
+        thoại đã có lượt trước: câu trả lời được sinh kèm conversation_history nên
+        câu hỏi nối tiếp ("còn cái thứ hai thì sao?") phụ thuộc ngữ cảnh, không
+        dùng chung được giữa các hội thoại.
+        """
+        if self.answer_cache is None:
+            return None
+        
+        # Tin nhắn hiện tại đã được thêm vào history trước khi xử lý
+        if len(self.conversation_history) > 1:
+            return None
+        
+        try:
+            return normalize_vectors(self.search_tool.encode_queries([question]))[0]
+        except Exception as e:
+            logger.warning(f"⚠️ Không encode được câu hỏi cho answer cache: {e}")
+            return None
+    
+    def _lookup_answer_cache(self, question_vector: Optional[Any]) -> Optional[Dict[str, Any]]:
+        """
+        Tìm câu trả lời đã cache cho câu hỏi gần giống trên các collection đang chọn.
+        
+        Returns:
+            Kết quả RAG với 'cached' = True, hoặc None nếu không có
+        """
+        if self.answer_cache is None or question_vector is None:
+            return None
+        
+        try:
+            versions = self.collection_manager.get_collection_versions(self.selected_collections)
+            cached = self.answer_cache.lookup(question_vector, self.selected_collections, versions)
+        except Exception as e:
+            logger.warning(f"⚠️ Không tra được answer cache: {e}")
+            return None
+        
+        if cached is None:
+            return None
+        
+        logger.info(f"⚡ Answer cache hit (similarity {cached['similarity']:.3f}): {cached['cached_question']}")
+        return dict(cached, cached=True)
+    
+    def _store_answer_cache(self, question: str, question_vector: Optional[Any], result: Dict[str, Any]):
+        """Lưu câu trả lời vào answer cache (dùng vector đã encode khi tra cache)."""
+        if self.answer_cache is None or question_vector is None:
+            return
+        
+        try:
+            versions = self.collection_manager.get_collection_versions(self.selected_collections)
+            self.answer_cache.store(question, question_vector, self.selected_collections, versions, result)
+        except Exception as e:
+            logger.warning(f"⚠️ Không lưu được answer cache: {e}")
+    
     def _show_no_results_with_suggestions(self) -> str:
         """Hiển thị thông báo không tìm thấy kèm gợi ý"""
         no_result_msg = "❌ Không tìm thấy thông tin liên quan trong tài liệu.\n"
@@ -522,6 +696,28 @@ Hãy trả lời ngắn gọn, tự nhiên và thân thiện."""
         
         return summary + "\n\n" + formatted_suggestions
     
+    def show_stats(self) -> str:
+        """Thống kê usage LLM (token, latency, retry, fallback theo model) và response cache"""
+        text = get_usage_tracker().format_summary()
+        
+        response_cache = getattr(self.llm_client, 'response_cache', None)
+        if response_cache is not None:
+            cache = response_cache.stats()
+            text += (
+                f"\n\n💾 Response cache: {cache['hits']} hit / {cache['misses']} miss "
+                f"(hit rate {cache['hit_rate']:.0%}), {cache['entries']} entry"
+            )
+        return text
+    
+    def export_stats(self, path: Optional[str] = None) -> str:
+        """Export thống kê usage LLM ra file (JSON, hoặc Prometheus nếu đuôi .prom) cho dashboard"""
+        try:
+            output = get_usage_tracker().export(path or LLM_USAGE_EXPORT_FILE)
+            return f"✅ Đã export thống kê LLM: {output}"
+        except OSError as e:
+            logger.error(f"Export stats failed: {e}", exc_info=True)
+            return f"Lỗi khi export thống kê: {e}"
+    
     def handle_no_idea_question(self) -> str:
         """
         Xử lý khi user nói 'tôi không biết hỏi gì' hoặc 'đề xuất chủ đề'
@@ -590,6 +786,14 @@ def run_cli():
                     # Quản lý collection
                     agent.manage_collections()
                     continue
+                elif user_input.lower().startswith('stats export'):
+                    # Export thống kê LLM (mặc định LLM_USAGE_EXPORT_FILE)
+                    print(agent.export_stats(user_input[len('stats export'):].strip() or None))
+                    continue
+                elif user_input.lower() in ['stats', 'stat']:
+                    # Thống kê token/latency của LLM
+                    print(f"\n{agent.show_stats()}")
+                    continue
                 elif user_input.lower() in ['topics', 'topic', 'suggest', 'gợi ý']:
                     # Xem các chủ đề có sẵn
                     topics_info = agent.show_topics()
@@ -608,9 +812,24 @@ def run_cli():
                     print(f"\nAgent: {response}")
                     continue
                 
-                # Xử lý tin nhắn thông thường
-                response = agent.process_message(user_input)
-                print(f"\nAgent: {response}")
+                # Xử lý tin nhắn thông thường (câu trả lời LLM được in ngay khi stream)
+                streamed = []
+                
+                def print_token(token: str):
+                    if not streamed:
+                        print("\nAgent: ", end="")
+                    streamed.append(token)
+                    print(token, end="", flush=True)
+                
+                response = agent.process_message(user_input, on_token=print_token)
+                streamed_text = "".join(streamed).strip()
+                if streamed_text and response.startswith(streamed_text):
+                    # Chỉ in phần còn lại (nguồn trích dẫn)
+                    print(response[len(streamed_text):])
+                else:
+                    if streamed:
+                        print()
+                    print(f"\nAgent: {response}")
                 
             except KeyboardInterrupt:
                 print("\nTạm biệt!")
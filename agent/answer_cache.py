@@ -0,0 +1,224 @@
+"""
+Answer Cache - Cache câu trả lời theo ngữ nghĩa câu hỏi.
+
+Câu hỏi giống hoặc gần giống câu đã trả lời (cosine similarity của query
+embedding ≥ ngưỡng) trên cùng tập collection được trả lời ngay từ cache,
+không cần retrieval và gọi LLM.
+
+Key gồm tập collection và version của từng collection (đổi mỗi lần collection
+được ingest hoặc xóa, xem src/collection_versions.py), nên khi dữ liệu thay đổi
+thì các câu trả lời cũ tự động không còn khớp. Agent chỉ dùng cache cho câu hỏi
+đầu hội thoại (câu nối tiếp phụ thuộc conversation_history).
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Thêm thư mục gốc project vào sys.path
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from agent.config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_FILE,
+)
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class AnswerCache:
+    """
+    Semantic cache: (query embedding, tập collection, version collection) -> kết quả RAG.
+
+    Eviction theo LRU (tối đa max_entries) và TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+        path: Optional[str] = ANSWER_CACHE_FILE
+    ):
+        """
+        Args:
+            max_entries: Số câu trả lời tối đa giữ trong cache
+            ttl_seconds: Thời gian sống của mỗi câu trả lời (giây)
+            similarity_threshold: Cosine similarity tối thiểu để coi là cùng câu hỏi
+            path: File .npz lưu cache (None = chỉ giữ trong bộ nhớ)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+        if self.path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _scope(collections: Sequence[str], versions: Dict[str, Any]) -> List[List[Any]]:
+        """Key phạm vi: các cặp (collection, version) đã sort."""
+        return sorted([name, versions.get(name)] for name in set(collections))
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry['created'] > self.ttl_seconds
+
+    def lookup(
+        self,
+        query_vector: np.ndarray,
+        collections: Sequence[str],
+        versions: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Tìm câu trả lời đã cache cho câu hỏi gần giống.
+
+        Args:
+            query_vector: Embedding câu hỏi (đã chuẩn hóa)
+            collections: Các collection đang chọn
+            versions: Version hiện tại của từng collection
+
+        Returns:
+            Kết quả RAG đã cache (kèm 'cached_question', 'similarity') hoặc None
+        """
+        scope = self._scope(collections, versions)
+        now = time.time()
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+
+        with self._lock:
+            # Bỏ entry hết hạn hoặc thuộc version collection cũ
+            stale = [
+                entry_id for entry_id, entry in self._entries.items()
+                if self._expired(entry, now) or self._outdated(entry, versions)
+            ]
+            for entry_id in stale:
+                del self._entries[entry_id]
+
+            candidates = [(i, e) for i, e in self._entries.items() if e['scope'] == scope]
+            best_id, best_similarity = None, -1.0
+            if candidates:
+                similarities = np.stack([e['vector'] for _, e in candidates]) @ query_vector
+                best = int(np.argmax(similarities))
+                best_id, best_similarity = candidates[best][0], float(similarities[best])
+
+            if best_id is None or best_similarity < self.similarity_threshold:
+                self.stats['misses'] += 1
+                if stale:
+                    self._save()
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.stats['hits'] += 1
+            entry = self._entries[best_id]
+            return dict(entry['result'], cached_question=entry['question'], similarity=best_similarity)
+
+    @staticmethod
+    def _outdated(entry: Dict[str, Any], versions: Dict[str, Any]) -> bool:
+        """Entry thuộc collection đã được index lại (version khác version hiện tại)."""
+        return any(name in versions and versions[name] != version for name, version in entry['scope'])
+
+    def store(
+        self,
+        question: str,
+        query_vector: np.ndarray,
+        collections: Sequence[str],
+        versions: Dict[str, Any],
+        result: Dict[str, Any]
+    ):
+        """
+        Lưu kết quả RAG của câu hỏi.
+
+        Args:
+            question: Câu hỏi gốc
+            query_vector: Embedding câu hỏi (đã chuẩn hóa)
+            collections: Các collection đã search
+            versions: Version của từng collection lúc trả lời
+            result: Kết quả từ RagTool.answer_question (chỉ lưu answer và sources)
+        """
+        entry = {
+            'question': question,
+            'vector': np.asarray(query_vector, dtype=np.float32),
+            'scope': self._scope(collections, versions),
+            'result': {'success': result.get('success', True), 'answer': result['answer'], 'sources': result.get('sources', [])},
+            'created': time.time()
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, collection: Optional[str] = None):
+        """Xóa các câu trả lời dùng collection (hoặc toàn bộ cache)."""
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+            else:
+                for entry_id in [i for i, e in self._entries.items() if any(n == collection for n, _ in e['scope'])]:
+                    del self._entries[entry_id]
+            self._save()
+
+    def _load(self):
+        """Đọc cache từ file (bỏ qua entry đã hết hạn)."""
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                entries = json.loads(str(data['entries']))
+                vectors = data['vectors']
+            now = time.time()
+            for entry, vector in zip(entries, vectors):
+                entry['vector'] = vector
+                if not self._expired(entry, now):
+                    self._entries[self._next_id] = entry
+                    self._next_id += 1
+            logger.info(f"📂 Đã load {len(self._entries)} câu trả lời từ {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Không đọc được answer cache {self.path}: {e}")
+
+    def _save(self):
+        """Ghi cache ra file (gọi khi đang giữ lock)."""
+        if self.path is None:
+            return
+        try:
+            entries = list(self._entries.values())
+            dim = entries[0]['vector'].shape[-1] if entries else 0
+            vectors = np.stack([e['vector'] for e in entries]) if entries else np.zeros((0, dim), np.float32)
+            meta = json.dumps([{k: v for k, v in e.items() if k != 'vector'} for e in entries], ensure_ascii=False)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, entries=np.array(meta), vectors=vectors)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Không lưu được answer cache {self.path}: {e}")
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """Lấy AnswerCache dùng chung (lưu ở ANSWER_CACHE_FILE)."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
@@ -6,11 +6,14 @@ Strategy:
 - LRU cache: Giữ N collections gần đây nhất
 - Manual control: User có thể list/delete collections
 - Auto-cleanup khi vượt limit
+
+Với STORAGE_LAYOUT = "partitioned", mỗi "collection" là một partition trong
+collection chung (xem PartitionedVectorStore): API giữ nguyên, không giới hạn số PDF.
 """
 
 import sys
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Any, List, Dict, Optional, Tuple
 from datetime import datetime
 import json
 
@@ -19,9 +22,12 @@ project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from pymilvus import Collection, connections, utility
+from src.collection_versions import get_collection_versions
 from src.config import EMBEDDING_DIM
 from src.logging_config import get_logger
+from src.vector_store import get_vector_store
+from src.index_policy import get_index_policy
+from src.lexical_index import get_lexical_store
 
 logger = get_logger(__name__)
 
@@ -40,16 +46,16 @@ class CollectionManager:
     def __init__(self):
         """Khởi tạo Collection Manager."""
         self.metadata = self._load_metadata()
-        self._connect_milvus()
+        self._connect_vector_store()
         logger.info("✅ CollectionManager đã khởi tạo")
     
-    def _connect_milvus(self):
-        """Connect to Milvus."""
+    def _connect_vector_store(self):
+        """Connect to vector store backend (Milvus hoặc local)."""
         try:
-            connections.connect(host="localhost", port="19530")
-            logger.info("✅ Kết nối Milvus thành công")
+            self.vector_store = get_vector_store()
+            logger.info(f"✅ Kết nối vector store ({self.vector_store.backend}) thành công")
         except Exception as e:
-            logger.error(f"❌ Không thể kết nối Milvus: {e}")
+            logger.error(f"❌ Không thể kết nối vector store: {e}")
             raise
     
     def _load_metadata(self) -> Dict:
@@ -115,7 +121,7 @@ class CollectionManager:
     def collection_exists(self, collection_name: str) -> bool:
         """Kiểm tra collection có tồn tại không."""
         try:
-            return utility.has_collection(collection_name)
+            return self.vector_store.has_collection(collection_name)
         except Exception as e:
             logger.error(f"❌ Lỗi khi check collection: {e}")
             return False
@@ -130,8 +136,6 @@ class CollectionManager:
         Returns:
             Collection name
         """
-        from pymilvus import CollectionSchema, FieldSchema, DataType
-        
         collection_name = self.get_collection_name(pdf_name)
         
         # Check if exists
@@ -140,27 +144,14 @@ class CollectionManager:
             self._update_access_time(collection_name, pdf_name)
             return collection_name
         
-        # Create schema
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
-            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="page", dtype=DataType.INT64),
-            FieldSchema(name="pdf_source", dtype=DataType.VARCHAR, max_length=512)
-        ]
-        
-        schema = CollectionSchema(fields, description=f"Collection for {pdf_name}")
-        
-        # Create collection
-        collection = Collection(collection_name, schema)
-        
-        # Create index
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024}
-        }
-        collection.create_index("embedding", index_params)
+        # Create collection (schema: embedding, text, page, pdf_source + vector index)
+        # Collection rỗng dùng FLAT, index được nâng cấp theo kích thước sau khi insert
+        self.vector_store.create_collection(
+            collection_name,
+            dim=EMBEDDING_DIM,
+            description=f"Collection for {pdf_name}",
+            index_params=get_index_policy().initial_index_params(self.vector_store, collection_name)
+        )
         
         logger.info(f"✅ Đã tạo collection '{collection_name}'")
         
@@ -172,7 +163,7 @@ class CollectionManager:
         
         return collection_name
     
-    def get_collection(self, pdf_name: str) -> Collection:
+    def get_collection(self, pdf_name: str) -> Any:
         """
         Lấy collection cho PDF.
         
@@ -180,7 +171,7 @@ class CollectionManager:
             pdf_name: Tên PDF file
             
         Returns:
-            Collection instance
+            Collection handle của backend (pymilvus Collection hoặc LocalCollection), đã load
         """
         collection_name = self.get_collection_name(pdf_name)
         
@@ -188,8 +179,7 @@ class CollectionManager:
             logger.info(f"⚠️ Collection '{collection_name}' không tồn tại, tạo mới...")
             collection_name = self.create_collection(pdf_name)
         
-        collection = Collection(collection_name)
-        collection.load()
+        collection = self.vector_store.get_collection(collection_name)
         
         # Update access time
         self._update_access_time(collection_name, pdf_name)
@@ -198,13 +188,31 @@ class CollectionManager:
     
     def _update_access_time(self, collection_name: str, pdf_name: str):
         """Update last access time của collection."""
+        entry = self.metadata.get(collection_name, {})
         self.metadata[collection_name] = {
+            **entry,
             'pdf_name': pdf_name,
             'last_accessed': datetime.now().isoformat(),
-            'created': self.metadata.get(collection_name, {}).get('created', datetime.now().isoformat())
+            'created': entry.get('created', datetime.now().isoformat())
         }
         self._save_metadata()
     
+    def _bump_version(self, collection_name: str):
+        """Đánh dấu dữ liệu collection vừa thay đổi (index lại hoặc xóa)."""
+        get_collection_versions().bump(collection_name)
+    
+    def get_collection_versions(self, collection_names: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Version dữ liệu của các collection (dùng làm key cho answer cache).
+        
+        Args:
+            collection_names: Danh sách tên collection
+            
+        Returns:
+            Dict tên collection -> version (None nếu chưa có thông tin)
+        """
+        return get_collection_versions().get(collection_names)
+    
     def list_collections(self) -> List[Dict]:
         """
         List tất cả collections với metadata.
@@ -215,8 +223,8 @@ class CollectionManager:
         collections = []
         
         try:
-            # Get all collections from Milvus
-            all_collections = utility.list_collections()
+            # Get all collections from vector store
+            all_collections = self.vector_store.list_collections()
             
             for col_name in all_collections:
                 # Get metadata
@@ -224,9 +232,7 @@ class CollectionManager:
                 
                 # Get collection stats
                 try:
-                    collection = Collection(col_name)
-                    collection.load()
-                    num_entities = collection.num_entities
+                    num_entities = self.vector_store.num_entities(col_name)
                 except Exception as e:
                     logger.warning(f"⚠️ Không thể load collection {col_name}: {e}")
                     num_entities = 0
@@ -289,7 +295,10 @@ class CollectionManager:
                 return False
             
             # Drop collection
-            utility.drop_collection(collection_name)
+            self.vector_store.drop_collection(collection_name)
+            get_index_policy().invalidate(self.vector_store, collection_name)
+            get_lexical_store().drop(collection_name)
+            self._bump_version(collection_name)
             
             # Remove from metadata
             if collection_name in self.metadata:
@@ -307,7 +316,12 @@ class CollectionManager:
         """
         Auto cleanup collections cũ khi vượt limit.
         LRU strategy: Giữ N collections gần đây nhất.
+        
+        Bỏ qua với layout partitioned: partition không tốn index/memory riêng.
         """
+        if self.vector_store.partitioned:
+            return
+        
         collections = self.list_collections()
         
         if len(collections) <= self.MAX_COLLECTIONS:
@@ -406,12 +420,15 @@ class CollectionManager:
         
         try:
             # Import necessary modules
-            from src.ingest_langchain import get_embedding_model, chunk_text
+            from src.ingest_langchain import (
+                get_embedding_model,
+                chunk_text,
+                chunk_text_by_tokens,
+                count_truncated_chunks
+            )
+            from src.config import CHUNK_MODE
             from pathlib import Path
             
-            # Get collection
-            collection = Collection(collection_name)
-            
             # ĐỌC TỪ FILE MD thay vì extract từ PDF
             # Tìm file MD tương ứng trong thư mục OUTPUT_DIR
             from src.config import OUTPUT_DIR
@@ -479,8 +496,11 @@ class CollectionManager:
                 if not text or not text.strip():
                     continue
                 
-                # Chunk text
-                chunks = chunk_text(text)
+                # Chunk text (theo ký tự hoặc theo token của embedding model)
+                if CHUNK_MODE == "tokens":
+                    chunks = chunk_text_by_tokens(text, embedding_model)
+                else:
+                    chunks = chunk_text(text)
                 
                 for chunk in chunks:
                     if chunk.strip():  # Chỉ thêm chunk không rỗng
@@ -492,26 +512,51 @@ class CollectionManager:
                 logger.warning(f"⚠️ Không có text để index từ {pdf_name}")
                 return (collection_name, False)
             
+            # Báo cáo số chunk sẽ bị cắt cụt với cấu hình chunking hiện tại
+            truncated = count_truncated_chunks(all_texts, embedding_model)
+            if truncated:
+                logger.warning(
+                    f"⚠️ {truncated}/{len(all_texts)} chunks vượt max_seq_length "
+                    f"({embedding_model.max_seq_length} tokens) của embedding model "
+                    f"và sẽ bị cắt khi encode (CHUNK_MODE={CHUNK_MODE})"
+                )
+            
             logger.info(f"📝 Đang encode {len(all_texts)} chunks...")
             
             # Generate embeddings
+            # Vector gốc: collection IP được backend chuẩn hóa khi insert (giống query khi search)
             embeddings = embedding_model.encode(all_texts, show_progress_bar=True)
             
-            # Insert to Milvus
+            # Insert to vector store
             logger.info(f"💾 Đang insert vào collection {collection_name}...")
             
-            data = [
-                embeddings.tolist(),
+            self.vector_store.insert(
+                collection_name,
+                embeddings,
                 all_texts,
                 all_pages,
                 all_sources
-            ]
-            
-            collection.insert(data)
-            collection.flush()
+            )
             
             logger.info(f"✅ Đã index {len(all_texts)} chunks vào collection {collection_name}")
             
+            # Build inverted index BM25 cho hybrid retrieval
+            try:
+                get_lexical_store().add_documents(collection_name, all_texts, all_pages, all_sources)
+            except Exception as e:
+                logger.warning(f"⚠️ Không thể build lexical index: {e}")
+            self._bump_version(collection_name)
+            
+            # Chọn lại loại index theo kích thước mới và tune search params
+            try:
+                entry = get_index_policy().ensure_index(self.vector_store, collection_name)
+                logger.info(
+                    f"🎯 Index {entry['index_params']['index_type']}, "
+                    f"search params {entry['search_params']['params']} (recall {entry['recall']:.3f})"
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Không thể cập nhật index: {e}")
+            
             return (collection_name, True)
             
         except Exception as e:
@@ -637,10 +682,7 @@ if __name__ == "__main__":
                     
                     if exists:
                         try:
-                            from pymilvus import Collection
-                            col = Collection(collection_name)
-                            col.load()
-                            print(f"   Documents: {col.num_entities}")
+                            print(f"   Documents: {manager.vector_store.num_entities(collection_name)}")
                         except:
                             pass
                 
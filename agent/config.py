@@ -16,6 +16,7 @@ if str(project_root) not in sys.path:
 from src.config import (
     GEMINI_MODELS,
     GEMINI_INPUT_TOKEN_LIMIT,
+    CONTEXT_TOKEN_BUDGET,
     EMBEDDING_MODEL_NAME,
     COLLECTION_NAME,
     OUTPUT_DIR
@@ -50,7 +51,14 @@ ENABLE_CALCULATOR_TOOL = False  # Bật/tắt calculator (future)
 RAG_TOOL_NAME = "search_documents"
 RAG_TOOL_DESCRIPTION = "Tìm kiếm thông tin trong tài liệu PDF đã được index. Sử dụng khi cần tra cứu thông tin cụ thể."
 RAG_MAX_RESULTS = 15  # Số kết quả tối đa từ RAG (tăng lên 15)
-RAG_SIMILARITY_THRESHOLD = 0.15  # Ngưỡng similarity (0-1), giảm xuống cho L2 distance
+RAG_SIMILARITY_THRESHOLD = 0.15  # Ngưỡng cosine similarity (metric IP); collection L2 cũ dùng 1/(1+distance)
+
+# Semantic answer cache (câu hỏi gần giống trên cùng collections → trả lời từ cache)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIZE = 256  # Số câu trả lời tối đa (LRU)
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600  # Thời gian sống mỗi câu trả lời
+ANSWER_CACHE_SIMILARITY = 0.95  # Cosine similarity tối thiểu giữa 2 câu hỏi
+ANSWER_CACHE_FILE = "data/answer_cache.npz"  # None = chỉ cache trong bộ nhớ
 
 # Conversation settings
 MAX_CONVERSATION_HISTORY = 10  # Số lượt hội thoại giữ lại
@@ -11,9 +11,11 @@ Chức năng:
 - LLM answer generation
 """
 
+import asyncio
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import re
 
 project_root = Path(__file__).parent.parent.parent
@@ -21,6 +23,8 @@ if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
 from agent.tools.search_tool_langchain import SearchTool
+from src.config import LLM_MAX_CONCURRENCY, LLM_RESPONSE_CACHE_RAG
+from src.llm_langchain import LLMManager
 from src.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -56,6 +60,12 @@ class RagTool:
         self.llm_type = llm_type
         self.ollama_model = ollama_model
         
+        # Số câu hỏi con được trả lời song song (giới hạn theo provider)
+        self.max_concurrency = max(1, LLM_MAX_CONCURRENCY.get(llm_type, 1))
+        
+        # Cùng câu hỏi trên cùng context → prompt giống hệt → dùng response cache của LLMManager
+        self.llm_options = {'cache': True} if LLM_RESPONSE_CACHE_RAG and isinstance(llm_client, LLMManager) else {}
+        
         logger.info(f"✅ RagTool initialized with LLM type: {llm_type}")
     
     def answer_question(
@@ -63,7 +73,8 @@ class RagTool:
         question: str,
         collection_names: List[str],
         conversation_history: Optional[List[Dict]] = None,
-        top_k: int = 15
+        top_k: int = 15,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
         """
         Complete RAG workflow để trả lời câu hỏi
@@ -73,6 +84,8 @@ class RagTool:
             collection_names: List các collection cần search
             conversation_history: Lịch sử hội thoại (optional)
             top_k: Số kết quả tối đa
+            on_token: Callback nhận từng đoạn câu trả lời khi LLM stream
+                (chỉ câu hỏi đơn giản; câu hỏi con được trả lời song song nên không stream)
             
         Returns:
             Dict với keys:
@@ -103,7 +116,8 @@ class RagTool:
                     question,
                     collection_names,
                     conversation_history,
-                    top_k
+                    top_k,
+                    on_token=on_token
                 )
         
         except Exception as e:
@@ -121,28 +135,32 @@ class RagTool:
         question: str,
         collection_names: List[str],
         conversation_history: Optional[List[Dict]],
-        top_k: int
+        top_k: int,
+        search_results: Optional[List[Dict[str, Any]]] = None,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
-        """Xử lý câu hỏi đơn giản"""
+        """
+        Xử lý câu hỏi đơn giản
+        
+        Args:
+            search_results: Kết quả search đã có sẵn (vd từ search_many), None = tự search
+            on_token: Callback nhận từng đoạn câu trả lời (None = không stream)
+        """
         
         # BƯỚC 2: Search trong collections
-        search_results = self.search_tool.search_multi_collections(
-            query=question,
-            collection_names=collection_names,
-            top_k=top_k,
-            similarity_threshold=0.10
-        )
+        if search_results is None:
+            search_results = self.search_tool.search_multi_collections(
+                query=question,
+                collection_names=collection_names,
+                top_k=top_k,
+                similarity_threshold=0.10
+            )
         
         if not search_results:
-            return {
-                'success': True,
-                'answer': "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu.",
-                'sources': [],
-                'search_results': []
-            }
+            return self._no_results()
         
         # BƯỚC 3: Format context cho LLM
-        context = self.search_tool.format_results_for_context(
+        packed = self.search_tool.pack_results_for_context(
             search_results,
             max_results=top_k
         )
@@ -150,18 +168,37 @@ class RagTool:
         # BƯỚC 4: Generate answer với LLM
         answer = self._generate_answer(
             question=question,
-            context=context,
-            conversation_history=conversation_history
+            context=packed['text'],
+            conversation_history=conversation_history,
+            on_token=on_token
         )
         
         # BƯỚC 5: Extract sources
-        sources = self._extract_sources(search_results)
-        
+        return self._answer_result(answer, search_results, packed)
+    
+    @staticmethod
+    def _no_results() -> Dict[str, Any]:
+        """Kết quả khi không search được gì."""
+        return {
+            'success': True,
+            'answer': "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu.",
+            'sources': [],
+            'search_results': []
+        }
+    
+    def _answer_result(
+        self,
+        answer: str,
+        search_results: List[Dict[str, Any]],
+        packed: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Kết quả RAG gồm câu trả lời, nguồn trích dẫn và báo cáo context (chunk bị cắt / bỏ)."""
         return {
             'success': True,
             'answer': answer,
-            'sources': sources,
-            'search_results': search_results
+            'sources': self._extract_sources(search_results),
+            'search_results': search_results,
+            'context': {key: packed[key] for key in ('tokens', 'truncated', 'dropped')}
         }
     
     def _handle_complex_question(
@@ -171,23 +208,53 @@ class RagTool:
         conversation_history: Optional[List[Dict]],
         top_k: int
     ) -> Dict[str, Any]:
-        """Xử lý câu hỏi phức tạp (multi-part)"""
+        """
+        Xử lý câu hỏi phức tạp (multi-part)
         
-        all_answers = []
-        all_sources = []
-        all_search_results = []
+        Retrieval cho mọi câu hỏi con chạy một lần (search_many), sau đó các câu
+        trả lời con được generate song song (tối đa max_concurrency request LLM)
+        và ghép lại theo đúng thứ tự câu hỏi.
+        """
+        
+        sub_top_k = max(1, top_k // len(sub_questions))  # Chia đều top_k
+        
+        # Search tất cả câu hỏi con trong một lần (encode một batch, mỗi collection một search)
+        batch_results = self.search_tool.search_many(
+            queries=sub_questions,
+            collection_names=collection_names,
+            top_k=sub_top_k,
+            similarity_threshold=0.10
+        )
         
-        # Trả lời từng câu hỏi con
-        for i, sub_q in enumerate(sub_questions, 1):
+        def answer_sub_question(i: int, sub_q: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
             logger.info(f"  [{i}/{len(sub_questions)}] {sub_q}")
-            
-            result = self._handle_simple_question(
+            return self._handle_simple_question(
                 question=sub_q,
                 collection_names=collection_names,
                 conversation_history=conversation_history,
-                top_k=top_k // len(sub_questions)  # Chia đều top_k
+                top_k=sub_top_k,
+                search_results=search_results
             )
-            
+        
+        # Trả lời các câu hỏi con song song, giữ thứ tự gốc khi ghép
+        jobs = list(enumerate(zip(sub_questions, batch_results), 1))
+        workers = min(self.max_concurrency, len(jobs))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-sub") as executor:
+                futures = [executor.submit(answer_sub_question, i, sub_q, res) for i, (sub_q, res) in jobs]
+                results = [future.result() for future in futures]
+        else:
+            results = [answer_sub_question(i, sub_q, res) for i, (sub_q, res) in jobs]
+        
+        return self._combine_sub_answers(sub_questions, results)
+    
+    def _combine_sub_answers(self, sub_questions: List[str], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Ghép câu trả lời các câu hỏi con theo đúng thứ tự câu hỏi."""
+        all_answers = []
+        all_sources = []
+        all_search_results = []
+        
+        for i, (sub_q, result) in enumerate(zip(sub_questions, results), 1):
             if result['success']:
                 all_answers.append(f"**{i}. {sub_q}**\n{result['answer']}")
                 all_sources.extend(result['sources'])
@@ -206,6 +273,91 @@ class RagTool:
             'search_results': all_search_results
         }
     
+    # ------------------------------------------------------------------
+    # Async API: nhiều hội thoại dùng chung một process (embedding model, key pool)
+    # ------------------------------------------------------------------
+    
+    async def aanswer_question(
+        self,
+        question: str,
+        collection_names: List[str],
+        conversation_history: Optional[List[Dict]] = None,
+        top_k: int = 15
+    ) -> Dict[str, Any]:
+        """
+        Phiên bản async của answer_question (cùng kết quả trả về).
+        
+        Search chạy qua asearch_many (encode ở executor), LLM qua agenerate nên
+        event loop không bị chặn trong lúc chờ embedding, vector store hay LLM.
+        """
+        try:
+            logger.info(f"RAG (async): Answering question in {len(collection_names)} collections")
+            
+            sub_questions = self.split_complex_question(question)
+            sub_top_k = max(1, top_k // len(sub_questions))
+            
+            batch_results = await self.search_tool.asearch_many(
+                queries=sub_questions,
+                collection_names=collection_names,
+                top_k=sub_top_k,
+                similarity_threshold=0.10
+            )
+            
+            if len(sub_questions) == 1:
+                return await self._ahandle_search_results(question, batch_results[0], sub_top_k)
+            
+            # Câu hỏi con được trả lời đồng thời, tối đa max_concurrency request LLM
+            logger.info(f"📝 Phát hiện {len(sub_questions)} câu hỏi con")
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            
+            async def answer_sub_question(sub_q: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self._ahandle_search_results(sub_q, search_results, sub_top_k)
+            
+            results = await asyncio.gather(*(
+                answer_sub_question(sub_q, res) for sub_q, res in zip(sub_questions, batch_results)
+            ))
+            return self._combine_sub_answers(sub_questions, results)
+        
+        except Exception as e:
+            logger.error(f"❌ RAG error: {e}", exc_info=True)
+            return {
+                'success': False,
+                'answer': f"Xin lỗi, tôi gặp lỗi khi xử lý câu hỏi: {str(e)}",
+                'sources': [],
+                'search_results': [],
+                'error': str(e)
+            }
+    
+    async def _ahandle_search_results(
+        self,
+        question: str,
+        search_results: List[Dict[str, Any]],
+        top_k: int
+    ) -> Dict[str, Any]:
+        """Format context và generate câu trả lời (async) từ kết quả search có sẵn."""
+        if not search_results:
+            return self._no_results()
+        
+        packed = self.search_tool.pack_results_for_context(search_results, max_results=top_k)
+        answer = await self._agenerate_answer(question, packed['text'])
+        return self._answer_result(answer, search_results, packed)
+    
+    async def _agenerate_answer(self, question: str, context: str) -> str:
+        """Phiên bản async của _generate_answer (LLM không có agenerate thì chạy trong thread)."""
+        prompt = self._build_prompt(question, context)
+        
+        try:
+            if hasattr(self.llm_client, 'agenerate'):
+                answer = await self.llm_client.agenerate(prompt, **self.llm_options)
+            else:
+                answer = await asyncio.to_thread(self.llm_client.generate, prompt, **self.llm_options)
+            return answer.strip() if answer else "Xin lỗi, không thể tạo câu trả lời."
+        
+        except Exception as e:
+            logger.error(f"LLM generation error: {e}")
+            return f"Xin lỗi, gặp lỗi khi tạo câu trả lời: {str(e)}"
+    
     def split_complex_question(self, question: str) -> List[str]:
         """
         Tách câu hỏi phức tạp thành các câu hỏi con
@@ -265,7 +417,8 @@ class RagTool:
         self,
         question: str,
         context: str,
-        conversation_history: Optional[List[Dict]] = None
+        conversation_history: Optional[List[Dict]] = None,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> str:
         """
         Generate answer sử dụng LLM
@@ -274,12 +427,34 @@ class RagTool:
             question: Câu hỏi
             context: Context từ search results
             conversation_history: Lịch sử hội thoại
+            on_token: Callback nhận từng đoạn câu trả lời (dùng generate_stream)
             
         Returns:
             Answer string
         """
-        # Build prompt
-        prompt = f"""Based on the following information, answer the question accurately.
+        prompt = self._build_prompt(question, context)
+        
+        try:
+            # Unified generation với LLMManager
+            # LLMManager.generate() / generate_stream() hỗ trợ cả Gemini và Ollama
+            if on_token is None:
+                answer = self.llm_client.generate(prompt, **self.llm_options)
+            else:
+                parts = []
+                for chunk in self.llm_client.generate_stream(prompt, **self.llm_options):
+                    parts.append(chunk)
+                    on_token(chunk)
+                answer = "".join(parts)
+            return answer.strip() if answer else "Xin lỗi, không thể tạo câu trả lời."
+        
+        except Exception as e:
+            logger.error(f"LLM generation error: {e}")
+            return f"Xin lỗi, gặp lỗi khi tạo câu trả lời: {str(e)}"
+    
+    @staticmethod
+    def _build_prompt(question: str, context: str) -> str:
+        """Prompt RAG từ câu hỏi và context."""
+        return f"""Based on the following information, answer the question accurately.
 
 Context from documents:
 {context}
@@ -293,16 +468,6 @@ Instructions:
 - Use the same language as the question (Vietnamese or English)
 
 Answer:"""
-        
-        try:
-            # Unified generation với LLMManager
-            # LLMManager.generate() hỗ trợ cả Gemini và Ollama
-            answer = self.llm_client.generate(prompt)
-            return answer.strip() if answer else "Xin lỗi, không thể tạo câu trả lời."
-        
-        except Exception as e:
-            logger.error(f"LLM generation error: {e}")
-            return f"Xin lỗi, gặp lỗi khi tạo câu trả lời: {str(e)}"
     
     def _extract_sources(self, search_results: List[Dict]) -> List[Dict]:
         """
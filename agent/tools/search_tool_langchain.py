@@ -9,7 +9,12 @@ Migration từ search_tool.py:
 - Tương thích với LangGraph agents
 """
 
+import asyncio
 import sys
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Annotated
 import json
@@ -19,7 +24,6 @@ if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
 import torch
-from pymilvus import Collection
 from sentence_transformers import SentenceTransformer
 
 # LangChain imports
@@ -27,8 +31,13 @@ from langchain_core.tools import tool
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 
-from src.config import EMBEDDING_MODEL_NAME
+from src.config import EMBEDDING_MODEL_NAME, SEARCH_MAX_WORKERS, SEARCH_DEADLINE_SECONDS, RETRIEVAL_MODE, BM25_MIN_SCORE
 from src.logging_config import get_logger
+from src.vector_store import VectorStore, get_vector_store, similarity_from_distance
+from src.index_policy import get_index_policy
+from src.context_packer import get_context_packer
+from src.embedding_cache import QueryEmbeddingCache
+from src.lexical_index import LexicalIndexStore, get_lexical_store, reciprocal_rank_fusion
 
 logger = get_logger(__name__)
 
@@ -66,13 +75,37 @@ class SearchToolLangChain:
     2. LangChain tools qua get_langchain_tools()
     """
     
-    def __init__(self, embedding_model: Optional[SentenceTransformer] = None):
+    def __init__(
+        self,
+        embedding_model: Optional[SentenceTransformer] = None,
+        vector_store: Optional[VectorStore] = None,
+        embedding_model_name: str = EMBEDDING_MODEL_NAME,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        lexical_store: Optional[LexicalIndexStore] = None,
+        retrieval_mode: str = RETRIEVAL_MODE
+    ):
         """
         Args:
             embedding_model: Model SentenceTransformer đã load sẵn (tùy chọn)
+            vector_store: Vector store backend (mặc định theo config)
+            embedding_model_name: Tên embedding model (dùng làm key cache)
+            query_cache: Cache vector câu hỏi (mặc định LRU lưu ra QUERY_CACHE_FILE)
+            lexical_store: Index BM25 của các collection (mặc định LEXICAL_INDEX_DIR)
+            retrieval_mode: "vector", "lexical" hoặc "hybrid" (mặc định RETRIEVAL_MODE)
         """
         self.name = "search_tool_langchain"
         self.description = "Tìm kiếm trong nhiều PDF collection bằng vector similarity"
+        self.vector_store = vector_store or get_vector_store()
+        self.embedding_model_name = embedding_model_name
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.lexical_store = lexical_store or get_lexical_store()
+        self.retrieval_mode = retrieval_mode
+        
+        # Thread pool dùng chung cho mọi query (tạo lazy, không tạo lại mỗi lần search)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Thread riêng cho encode của API async: các hội thoại đồng thời dùng chung
+        # một model, encode lần lượt thay vì tranh CPU (torch đã dùng mọi core)
+        self._embed_executor: Optional[ThreadPoolExecutor] = None
         
         # Dùng model được truyền vào hoặc load mới
         if embedding_model:
@@ -82,77 +115,400 @@ class SearchToolLangChain:
             self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME).to(device)
             logger.info(f"🔧 Đã load embedding model trên {device}")
     
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lấy thread pool để fan-out search (tạo lần đầu khi cần)."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=SEARCH_MAX_WORKERS,
+                thread_name_prefix="search"
+            )
+        return self._executor
+    
+    def _get_embed_executor(self) -> ThreadPoolExecutor:
+        """Lấy executor chạy encode cho API async (tạo lần đầu khi cần)."""
+        if self._embed_executor is None:
+            self._embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        return self._embed_executor
+    
+    def close(self):
+        """Giải phóng thread pool và lưu cache vector câu hỏi."""
+        self.query_cache.save()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._embed_executor is not None:
+            self._embed_executor.shutdown(wait=False, cancel_futures=True)
+            self._embed_executor = None
+    
+    def _search_collection(
+        self,
+        col_name: str,
+        query_vectors: Any,
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search một collection cho nhiều query (một lần search với nq = số query).
+        
+        Kết quả mỗi query giữ nguyên thứ tự của vector store (distance tăng dần = score giảm dần).
+        """
+        hits_per_query = self.vector_store.search(
+            col_name,
+            query_vectors,
+            top_k=top_k,
+            output_fields=["text", "page", "pdf_source"],
+            search_params=get_index_policy().get_search_params(self.vector_store, col_name)
+        )
+        
+        metric_type = self.vector_store.metric_type(col_name)
+        results = [
+            self._to_results(hits, similarity_threshold, metric_type, col_name)
+            for hits in hits_per_query
+        ]
+        
+        logger.debug(f"✅ Tìm thấy {sum(len(r) for r in results)} kết quả trong {col_name}")
+        return results
+    
+    def _search_partitions(
+        self,
+        collection_names: List[str],
+        query_vectors: Any,
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search tất cả collections bằng một lần search (layout partitioned).
+        
+        Lấy top_k × số collections kết quả chung thay vì top_k mỗi collection.
+        """
+        hits_per_query = self.vector_store.search_collections(
+            collection_names,
+            query_vectors,
+            top_k=top_k * len(collection_names),
+            output_fields=["text", "page", "pdf_source", "partition"],
+            search_params=get_index_policy().get_search_params(self.vector_store, collection_names[0])
+        )
+        
+        metric_type = self.vector_store.metric_type(collection_names[0])
+        return [self._to_results(hits, similarity_threshold, metric_type) for hits in hits_per_query]
+    
+    def _to_results(
+        self,
+        hits: List[Dict[str, Any]],
+        similarity_threshold: float,
+        metric_type: str,
+        col_name: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Chuyển hits của vector store thành kết quả search, lọc theo threshold."""
+        results = []
+        for hit in hits:
+            # IP: cosine similarity; L2 (collection cũ): 1 / (1 + distance)
+            score = similarity_from_distance(hit['distance'], metric_type)
+            
+            if score >= similarity_threshold:
+                results.append({
+                    'text': hit.get('text'),
+                    'page': hit.get('page'),
+                    'pdf_source': hit.get('pdf_source'),
+                    'collection': col_name or hit.get('partition'),
+                    'score': score,
+                    'distance': hit['distance']
+                })
+        return results
+    
     def search_multi_collections(
         self,
         query: str,
         collection_names: List[str],
         top_k: int = 15,
-        similarity_threshold: float = 0.15
+        similarity_threshold: float = 0.15,
+        max_results: Optional[int] = None,
+        deadline: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Tìm kiếm trong nhiều collections.
+        Tìm kiếm song song trong nhiều collections.
+        
+        Mọi collection được search cùng lúc qua thread pool. Kết quả được merge
+        bằng heap (k-way merge các list đã sort) thay vì gom hết rồi sort.
+        Collection nào chưa xong khi hết deadline sẽ bị bỏ qua.
+        Với layout partitioned, chỉ cần một lần search trên collection chung.
+        Ở chế độ hybrid, kết quả vector và BM25 được gộp bằng RRF.
         
         Args:
             query: Câu hỏi tìm kiếm
             collection_names: Danh sách tên collections
             top_k: Số kết quả tối đa mỗi collection
             similarity_threshold: Ngưỡng similarity tối thiểu
+            max_results: Số kết quả tối đa sau khi merge (None = top_k × số collections)
+            deadline: Thời gian tối đa (giây) cho cả query (None = SEARCH_DEADLINE_SECONDS)
+            retrieval_mode: "vector", "lexical" hoặc "hybrid" (None = self.retrieval_mode)
             
         Returns:
-            List kết quả đã sort theo score
+            List kết quả đã sort theo độ liên quan
+        """
+        return self.search_many(
+            [query],
+            collection_names,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            max_results=max_results,
+            deadline=deadline,
+            retrieval_mode=retrieval_mode
+        )[0]
+    
+    def search_many(
+        self,
+        queries: List[str],
+        collection_names: List[str],
+        top_k: int = 15,
+        similarity_threshold: float = 0.15,
+        max_results: Optional[int] = None,
+        deadline: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
         """
-        logger.info(f"🔍 Đang search trong {len(collection_names)} collections: {collection_names}")
+        Tìm kiếm nhiều câu hỏi cùng lúc trong nhiều collections.
         
-        # Encode query
-        query_vector = self.embedding_model.encode([query])[0]
+        Tất cả câu hỏi được encode chung một batch, mỗi collection chỉ nhận một
+        lần search với nq = số câu hỏi (thay vì một lần search cho mỗi câu hỏi).
+        Fan-out, deadline và heap merge giống search_multi_collections.
         
-        all_results = []
+        Chế độ retrieval:
+        - "vector": chỉ vector search
+        - "lexical": chỉ BM25, không encode câu hỏi và không gọi vector store;
+          'score' là lexical_score (bm25 chuẩn hóa, so sánh được giữa collections)
+        - "hybrid": BM25 chạy trong lúc chờ vector search; danh sách vector và
+          danh sách BM25 của từng collection được gộp bằng reciprocal rank fusion,
+          'score' là rrf_score (similarity gốc giữ ở 'vector_score'). Collection quá
+          deadline hoặc lỗi vẫn có kết quả BM25 (fast path khi Milvus chậm).
+        Hit BM25 có lexical_score dưới BM25_MIN_SCORE bị bỏ.
         
-        for col_name in collection_names:
+        Args:
+            queries: Danh sách câu hỏi
+            collection_names: Danh sách tên collections
+            top_k: Số kết quả tối đa mỗi collection (cho mỗi câu hỏi)
+            similarity_threshold: Ngưỡng similarity tối thiểu
+            max_results: Số kết quả tối đa mỗi câu hỏi sau khi merge (None = top_k × số collections)
+            deadline: Thời gian tối đa (giây) cho cả batch (None = SEARCH_DEADLINE_SECONDS)
+            retrieval_mode: "vector", "lexical" hoặc "hybrid" (None = self.retrieval_mode)
+            
+        Returns:
+            List kết quả cho từng câu hỏi (cùng thứ tự queries), mỗi list đã sort theo độ liên quan
+        """
+        logger.info(
+            f"🔍 Đang search {len(queries)} query trong {len(collection_names)} collections: {collection_names}"
+        )
+        
+        if not collection_names or not queries:
+            return [[] for _ in queries]
+        
+        deadline = SEARCH_DEADLINE_SECONDS if deadline is None else deadline
+        max_results = max_results or top_k * len(collection_names)
+        mode = retrieval_mode or self.retrieval_mode
+        start = time.perf_counter()
+        
+        futures = {}
+        if mode != "lexical":
+            futures = self._submit_vector_searches(queries, collection_names, top_k, similarity_threshold)
+        
+        # BM25 chạy trên thread hiện tại trong lúc chờ vector search
+        lexical_results = None
+        if mode != "vector":
+            lexical_results = self._search_lexical(queries, collection_names, top_k)
+        
+        remaining = max(0.0, deadline - (time.perf_counter() - start))
+        done, not_done = wait(futures, timeout=remaining) if futures else (set(), set())
+        
+        return self._merge_results(queries, futures, done, not_done, lexical_results, mode, max_results, deadline, start)
+    
+    def _merge_results(
+        self,
+        queries: List[str],
+        futures: Dict[Any, str],
+        done: set,
+        not_done: set,
+        lexical_results: Optional[List[List[List[Dict[str, Any]]]]],
+        mode: str,
+        max_results: int,
+        deadline: float,
+        start: float
+    ) -> List[List[Dict[str, Any]]]:
+        """Gộp kết quả vector search đã xong (heap merge) với BM25 theo chế độ retrieval."""
+        for future in not_done:
+            future.cancel()
+            logger.warning(f"⏱️ Collection {futures[future]} quá deadline {deadline:.1f}s, bỏ qua")
+        
+        # Giữ thứ tự collection_names để kết quả có score bằng nhau ổn định như trước
+        per_collection = []
+        for future, col_name in futures.items():
+            if future not in done:
+                continue
             try:
-                # Load collection
-                collection = Collection(col_name)
-                collection.load()
-                
-                # Search parameters
-                search_params = {
-                    "metric_type": "L2",
-                    "params": {"nprobe": 10}
-                }
-                
-                # Execute search
-                results = collection.search(
-                    data=[query_vector.tolist()],
-                    anns_field="embedding",
-                    param=search_params,
-                    limit=top_k,
-                    output_fields=["text", "page", "pdf_source"]
-                )
-                
-                # Process results
-                for hit in results[0]:
-                    score = 1.0 / (1.0 + hit.distance)  # Chuyển L2 distance sang similarity
-                    
-                    if score >= similarity_threshold:
-                        all_results.append({
-                            'text': hit.entity.get('text'),
-                            'page': hit.entity.get('page'),
-                            'pdf_source': hit.entity.get('pdf_source'),
-                            'collection': col_name,
-                            'score': score,
-                            'distance': hit.distance
-                        })
-                
-                logger.debug(f"✅ Tìm thấy {len([r for r in results[0] if 1.0/(1.0+r.distance) >= similarity_threshold])} kết quả trong {col_name}")
-                
+                per_collection.append(future.result())
             except Exception as e:
                 logger.error(f"❌ Lỗi khi search collection {col_name}: {e}")
+        
+        all_results = []
+        for q in range(len(queries)):
+            if mode == "lexical":
+                merged = heapq.merge(*lexical_results[q], key=lambda x: x['lexical_score'], reverse=True)
+                all_results.append([dict(r, score=r['lexical_score']) for r in itertools.islice(merged, max_results)])
                 continue
+            
+            # K-way merge bằng heap, chỉ lấy max_results phần tử đầu
+            merged = heapq.merge(*(results[q] for results in per_collection), key=lambda x: x['score'], reverse=True)
+            vector_results = list(itertools.islice(merged, max_results))
+            
+            if mode == "vector":
+                all_results.append(vector_results)
+            else:
+                # Mỗi collection là một danh sách BM25 riêng: bm25 thô của các collection không so sánh được
+                fused = reciprocal_rank_fusion([vector_results, *lexical_results[q]], limit=max_results)
+                for result in fused:
+                    if 'score' in result:
+                        result['vector_score'] = result['score']
+                    result['score'] = result['rrf_score']
+                all_results.append(fused)
+        
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"📊 Tổng số kết quả: {[len(r) for r in all_results]} ({elapsed_ms:.0f} ms)")
+        return all_results
+    
+    async def asearch_many(
+        self,
+        queries: List[str],
+        collection_names: List[str],
+        top_k: int = 15,
+        similarity_threshold: float = 0.15,
+        max_results: Optional[int] = None,
+        deadline: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Phiên bản async của search_many (cùng tham số và kết quả).
+        
+        Encode câu hỏi (CPU-bound) chạy trên embed executor, BM25 trên thread
+        khác, vector search trên thread pool fan-out; event loop chỉ await nên
+        nhiều hội thoại có thể search đồng thời với cùng một embedding model.
+        """
+        logger.info(
+            f"🔍 Đang search (async) {len(queries)} query trong {len(collection_names)} collections: {collection_names}"
+        )
+        
+        if not collection_names or not queries:
+            return [[] for _ in queries]
+        
+        deadline = SEARCH_DEADLINE_SECONDS if deadline is None else deadline
+        max_results = max_results or top_k * len(collection_names)
+        mode = retrieval_mode or self.retrieval_mode
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        
+        futures = {}
+        if mode != "lexical":
+            query_vectors = await loop.run_in_executor(self._get_embed_executor(), self.encode_queries, queries)
+            futures = self._submit_vector_searches(
+                queries, collection_names, top_k, similarity_threshold, query_vectors=query_vectors
+            )
+        
+        lexical_results = None
+        if mode != "vector":
+            lexical_results = await asyncio.to_thread(self._search_lexical, queries, collection_names, top_k)
+        
+        done, not_done = set(), set(futures)
+        if futures:
+            remaining = max(0.0, deadline - (time.perf_counter() - start))
+            wrapped = {asyncio.wrap_future(future): future for future in futures}
+            finished, _ = await asyncio.wait(wrapped, timeout=remaining)
+            done = {wrapped[w] for w in finished}
+            not_done = set(futures) - done
+        
+        return self._merge_results(queries, futures, done, not_done, lexical_results, mode, max_results, deadline, start)
+    
+    async def asearch_multi_collections(
+        self,
+        query: str,
+        collection_names: List[str],
+        top_k: int = 15,
+        similarity_threshold: float = 0.15,
+        max_results: Optional[int] = None,
+        deadline: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Phiên bản async của search_multi_collections."""
+        return (await self.asearch_many(
+            [query],
+            collection_names,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            max_results=max_results,
+            deadline=deadline,
+            retrieval_mode=retrieval_mode
+        ))[0]
+    
+    def encode_queries(self, queries: List[str]) -> Any:
+        """
+        Encode câu hỏi thành vector gốc của model (chưa chuẩn hóa).
+        
+        Backend tự chuẩn hóa query khi search collection metric IP (score = cosine);
+        collection L2 cũ (vector gốc, chưa migrate_metric) được so với vector gốc
+        như lúc index, nên distance và threshold không đổi.
+        Encode một batch, dùng lại vector đã có trong query cache.
+        """
+        # Key cache riêng: file cache cũ chứa vector đã chuẩn hóa
+        query_vectors = self.query_cache.encode(
+            self.embedding_model,
+            f"{self.embedding_model_name}:raw",
+            queries
+        )
+        logger.debug(f"🧠 Query embedding cache: {self.query_cache.stats}")
+        return query_vectors
+    
+    def _submit_vector_searches(
+        self,
+        queries: List[str],
+        collection_names: List[str],
+        top_k: int,
+        similarity_threshold: float,
+        query_vectors: Optional[Any] = None
+    ) -> Dict[Any, str]:
+        """Encode queries (nếu chưa có vector) và gửi vector search lên thread pool, trả về {future: tên collection}."""
+        if query_vectors is None:
+            query_vectors = self.encode_queries(queries)
         
-        # Sort theo score giảm dần
-        all_results.sort(key=lambda x: x['score'], reverse=True)
+        executor = self._get_executor()
+        if self.vector_store.partitioned:
+            # Layout partitioned: một lần search với partition filter
+            label = ", ".join(collection_names)
+            return {
+                executor.submit(self._search_partitions, collection_names, query_vectors, top_k, similarity_threshold): label
+            }
         
-        logger.info(f"📊 Tổng số kết quả: {len(all_results)}")
+        # Fan-out: gửi tất cả search cùng lúc
+        return {
+            executor.submit(self._search_collection, col_name, query_vectors, top_k, similarity_threshold): col_name
+            for col_name in collection_names
+        }
+    
+    def _search_lexical(
+        self,
+        queries: List[str],
+        collection_names: List[str],
+        top_k: int
+    ) -> List[List[List[Dict[str, Any]]]]:
+        """BM25 search mỗi query trong các collections (mỗi collection một danh sách xếp hạng riêng)."""
+        all_results = []
+        for query in queries:
+            per_collection = []
+            for col_name in collection_names:
+                try:
+                    hits = self.lexical_store.search(col_name, query, top_k, min_score=BM25_MIN_SCORE)
+                except Exception as e:
+                    logger.error(f"❌ Lỗi BM25 search collection {col_name}: {e}")
+                    continue
+                per_collection.append([dict(hit, collection=col_name) for hit in hits])
+            all_results.append(per_collection)
         return all_results
     
     def search_single_collection(
@@ -189,6 +545,10 @@ class SearchToolLangChain:
         """
         Format search results thành context string cho LLM.
         
+        Context được đóng gói theo CONTEXT_TOKEN_BUDGET: kết quả xếp hạng cao
+        (results đã sort theo độ liên quan) được giữ trước, phần vượt ngân sách
+        bị cắt theo câu hoặc bỏ (xem pack_results_for_context để lấy báo cáo).
+        
         Args:
             results: List kết quả từ search_multi_collections
             max_results: Số lượng kết quả tối đa (None = tất cả)
@@ -196,8 +556,26 @@ class SearchToolLangChain:
         Returns:
             Context string đã format sẵn
         """
+        return self.pack_results_for_context(results, max_results)['text']
+    
+    def pack_results_for_context(
+        self,
+        results: List[Dict[str, Any]],
+        max_results: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Format và đóng gói search results, kèm báo cáo của context packer.
+        
+        Args:
+            results: List kết quả từ search_multi_collections
+            max_results: Số lượng kết quả tối đa (None = tất cả)
+            
+        Returns:
+            Dict với 'text' (context), 'tokens', 'truncated' và 'dropped'
+            (nguồn của các kết quả bị cắt / bị bỏ: pdf_source, page, collection)
+        """
         if not results:
-            return "Không tìm thấy thông tin liên quan."
+            return {'text': "Không tìm thấy thông tin liên quan.", 'tokens': 0, 'truncated': [], 'dropped': []}
         
         # Limit results if specified
         if max_results:
@@ -218,7 +596,20 @@ class SearchToolLangChain:
                 f"{text}\n"
             )
         
-        return "\n---\n".join(context_parts)
+        packed = get_context_packer().pack(context_parts, separator="\n---\n")
+        
+        def refs(indices: List[int]) -> List[Dict[str, Any]]:
+            return [
+                {field: results[i].get(field) for field in ('pdf_source', 'page', 'collection')}
+                for i in indices
+            ]
+        
+        return {
+            'text': packed['text'],
+            'tokens': packed['tokens'],
+            'truncated': refs(packed['truncated']),
+            'dropped': refs(packed['dropped'])
+        }
     
     def get_langchain_tools(self) -> List[BaseTool]:
         """
@@ -234,20 +234,16 @@ class TopicSuggester:
         Returns:
             Dict mapping collection_name -> topics
         """
-        from pymilvus import Collection
+        from src.vector_store import get_vector_store
         
+        vector_store = get_vector_store()
         all_topics = {}
         
         for col_name in collection_names:
             try:
-                # Load collection
-                collection = Collection(col_name)
-                collection.load()
-                
                 # Lấy sample documents
-                # Query random documents
-                results = collection.query(
-                    expr="id >= 0",
+                results = vector_store.query(
+                    col_name,
                     output_fields=["text", "pdf_source"],  # Sửa từ 'source' thành 'pdf_source'
                     limit=sample_size
                 )
@@ -0,0 +1,126 @@
+"""
+Benchmark Expansion Query - Latency của query mở rộng context theo trang.
+
+RAGChain._format_docs chạy query "page >= X && page <= Y" mỗi câu hỏi.
+So sánh theo kích thước collection:
+- LocalVectorStore: quét cả cột page (cách cũ) vs scalar index (_SortedIndex)
+- MilvusVectorStore (tùy chọn, --milvus): không có scalar index vs STL_SORT/INVERTED
+
+Chạy:
+    python benchmarks/bench_expansion_query.py --sizes 10000 100000 --queries 200
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.vector_store import LocalVectorStore, MilvusVectorStore
+
+CHUNKS_PER_PAGE = 10
+EXPANSION = (1, 2)  # Giống _format_docs: cửa sổ [page - 1, page + 2] quanh mỗi hit
+FLAT_INDEX = {"metric_type": "IP", "index_type": "FLAT", "params": {}}
+
+
+def _make_data(num_rows: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(num_rows, dim)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(num_rows)]
+    pages = [i // CHUNKS_PER_PAGE + 1 for i in range(num_rows)]
+    sources = ["bench.pdf"] * num_rows
+    return embeddings, texts, pages, sources
+
+
+def _page_ranges(num_rows: int, num_queries: int, seed: int = 1):
+    num_pages = num_rows // CHUNKS_PER_PAGE
+    rng = np.random.default_rng(seed)
+    hit_pages = rng.integers(1, num_pages + 1, num_queries)
+    return [(max(1, int(p) - EXPANSION[0]), int(p) + EXPANSION[1]) for p in hit_pages]
+
+
+def _time_ms(fn, ranges):
+    start = time.perf_counter()
+    for page_range in ranges:
+        fn(page_range)
+    return (time.perf_counter() - start) * 1000 / len(ranges)
+
+
+def run(sizes, num_queries, dim, use_milvus):
+    print("=" * 70)
+    print("📊 EXPANSION QUERY BENCHMARK")
+    print("=" * 70)
+    print(f"dim={dim}, queries={num_queries}, {CHUNKS_PER_PAGE} chunks/page, expansion ±{EXPANSION}")
+
+    for num_rows in sizes:
+        embeddings, texts, pages, sources = _make_data(num_rows, dim)
+        ranges = _page_ranges(num_rows, num_queries)
+
+        print(f"\n--- {num_rows} chunks ---")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = LocalVectorStore(base_dir=tmp_dir)
+            store.create_collection("bench", dim=dim, index_params=FLAT_INDEX)
+            store.insert("bench", embeddings, texts, pages, sources)
+            collection = store.get_collection("bench")
+            fields = ["text", "page"]
+
+            def scan(page_range):
+                # Cách cũ: mask trên toàn bộ cột page
+                mask = (collection.pages >= page_range[0]) & (collection.pages <= page_range[1])
+                return [collection._row_to_dict(int(row), fields) for row in np.flatnonzero(mask)]
+
+            def indexed(page_range):
+                return store.query("bench", page_range=page_range, output_fields=fields)
+
+            assert scan(ranges[0]) == indexed(ranges[0])
+            print(f"   local full scan    : {_time_ms(scan, ranges):8.3f} ms/query")
+            print(f"   local scalar index : {_time_ms(indexed, ranges):8.3f} ms/query")
+
+        if use_milvus:
+            store = MilvusVectorStore()
+            name = "bench_expansion_query"
+            if store.has_collection(name):
+                store.drop_collection(name)
+            store.create_collection(name, dim=dim, index_params=FLAT_INDEX)
+            store.insert(name, embeddings, texts, pages, sources)
+
+            def milvus_query(page_range):
+                return store.query(name, page_range=page_range, output_fields=["text", "page"])
+
+            # Bỏ scalar index để đo baseline
+            collection = store.handles.get(name, load=False)
+            store.handles.release(name)
+            for field in ("page", "pdf_source"):
+                collection.drop_index(index_name=f"{field}_idx")
+            milvus_query(ranges[0])  # warm-up (load)
+            print(f"   milvus no index    : {_time_ms(milvus_query, ranges):8.3f} ms/query")
+
+            store.ensure_scalar_indexes(name)
+            milvus_query(ranges[0])
+            print(f"   milvus STL_SORT    : {_time_ms(milvus_query, ranges):8.3f} ms/query")
+
+            store.drop_collection(name)
+
+    print("\n" + "=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark context expansion query")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=64, help="Số chiều vector (không ảnh hưởng scalar query)")
+    parser.add_argument("--milvus", action="store_true", help="Benchmark cả Milvus server")
+    args = parser.parse_args()
+
+    run(args.sizes, args.queries, args.dim, args.milvus)
+
+
+if __name__ == "__main__":
+    main()
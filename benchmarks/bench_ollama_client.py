@@ -0,0 +1,123 @@
+"""
+Benchmark Ollama Client - Session keep-alive vs wrapper Ollama của LangChain.
+
+Chạy với stub server local giả lập /api/generate (không cần Ollama thật), đo:
+- Latency trung bình khi gọi tuần tự và song song
+- Số kết nối TCP server nhận được
+
+Chạy:
+    python benchmarks/bench_ollama_client.py --requests 200 --concurrency 4 --latency-ms 2
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain_community.llms import Ollama
+
+from src.ollama_client import OllamaClient, OllamaSessionLLM
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """Stub /api/generate: trả lời sau `latency` giây, đếm số kết nối TCP."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StubHandler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    wbufsize = 1 << 16  # gửi header + body trong một lần ghi (tránh trễ Nagle/delayed ACK)
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.latency)
+        lines = [{'response': "ok", 'done': False}, {'response': "", 'done': True}]
+        if not payload.get('stream', True):
+            lines = [{'response': "ok", 'done': True}]
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _run(server, llm, num_requests, concurrency):
+    """Trả về (ms/request, số kết nối mới)."""
+    server.connections = 0
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(num_requests):
+            llm.invoke(f"q{i}")
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda i: llm.invoke(f"q{i}"), range(num_requests)))
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / num_requests, server.connections
+
+
+def run(num_requests, concurrency, latency_ms):
+    print("=" * 70)
+    print("📊 OLLAMA CLIENT BENCHMARK (stub server)")
+    print("=" * 70)
+    print(f"requests={num_requests}, concurrency={concurrency}, server latency={latency_ms}ms")
+
+    server = StubOllamaServer(latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = OllamaClient(server.url, keep_alive="30m", max_concurrency=concurrency)
+    llms = {
+        "langchain Ollama": Ollama(base_url=server.url, model="stub"),
+        "OllamaSessionLLM": OllamaSessionLLM(client=client, model="stub"),
+    }
+
+    try:
+        for mode, workers in (("tuần tự", 1), ("song song", concurrency)):
+            print(f"\n--- {mode} ---")
+            for name, llm in llms.items():
+                _run(server, llm, min(10, num_requests), workers)  # warm-up
+                ms, connections = _run(server, llm, num_requests, workers)
+                print(f"   {name:<18}: {ms:7.2f} ms/request   kết nối mới={connections}")
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ollama session client")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    run(args.requests, args.concurrency, args.latency_ms)
+
+
+if __name__ == "__main__":
+    main()
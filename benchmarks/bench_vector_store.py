@@ -0,0 +1,123 @@
+"""
+Benchmark Vector Store - Baseline search latency và recall.
+
+So sánh trên dữ liệu ngẫu nhiên (không cần PDF hay embedding model):
+- LocalVectorStore exact (FLAT) - baseline / ground truth
+- LocalVectorStore IVF (nprobe sweep)
+- MilvusVectorStore (tùy chọn, --milvus, cần Milvus server)
+
+Chạy:
+    python benchmarks/bench_vector_store.py --sizes 1000 10000 --queries 50
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import EMBEDDING_DIM
+from src.vector_store import LocalVectorStore, MilvusVectorStore
+
+
+def _make_data(num_rows: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(num_rows, dim)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(num_rows)]
+    pages = [i // 10 + 1 for i in range(num_rows)]
+    sources = ["bench.pdf"] * num_rows
+    return embeddings, texts, pages, sources
+
+
+def _time_search(store, name, queries, top_k, search_params):
+    """Trả về (latency trung bình ms/query, list ids mỗi query)."""
+    ids = []
+    start = time.perf_counter()
+    for query in queries:
+        hits = store.search(name, [query], top_k=top_k, search_params=search_params)[0]
+        ids.append([h['id'] for h in hits])
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / len(queries), ids
+
+
+def _recall(result_ids, truth_ids):
+    total = sum(len(set(r) & set(t)) for r, t in zip(result_ids, truth_ids))
+    return total / max(1, sum(len(t) for t in truth_ids))
+
+
+def run(sizes, num_queries, top_k, dim, nlist, use_milvus):
+    print("=" * 70)
+    print("📊 VECTOR STORE BENCHMARK")
+    print("=" * 70)
+    print(f"dim={dim}, top_k={top_k}, queries={num_queries}, nlist={nlist}")
+
+    rng = np.random.default_rng(1)
+
+    for num_rows in sizes:
+        embeddings, texts, pages, sources = _make_data(num_rows, dim)
+        queries = embeddings[rng.choice(num_rows, num_queries, replace=False)] + 0.01
+
+        print(f"\n--- {num_rows} vectors ---")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = LocalVectorStore(base_dir=tmp_dir)
+            index_params = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": nlist}}
+
+            start = time.perf_counter()
+            store.create_collection("bench", dim=dim, index_params=index_params)
+            store.insert("bench", embeddings, texts, pages, sources)
+            print(f"   local build (insert + IVF train): {time.perf_counter() - start:.2f}s")
+
+            exact_ms, truth = _time_search(store, "bench", queries, top_k, {"params": {}})
+            print(f"   local exact        : {exact_ms:8.2f} ms/query   recall=1.000")
+
+            for nprobe in (1, 4, 10, 32):
+                ms, ids = _time_search(store, "bench", queries, top_k, {"params": {"nprobe": nprobe}})
+                print(f"   local IVF nprobe={nprobe:<3}: {ms:8.2f} ms/query   recall={_recall(ids, truth):.3f}")
+
+        if use_milvus:
+            store = MilvusVectorStore()
+            name = "bench_vector_store"
+            if store.has_collection(name):
+                store.drop_collection(name)
+            store.create_collection(name, dim=dim, index_params=index_params)
+            store.insert(name, embeddings, texts, pages, sources)
+
+            # Milvus auto_id khác row index → so recall theo text
+            truth_texts = [[texts[i] for i in t] for t in truth]
+            for nprobe in (1, 4, 10, 32):
+                params = {"metric_type": "L2", "params": {"nprobe": nprobe}}
+                start = time.perf_counter()
+                result_texts = [
+                    [h['text'] for h in store.search(name, [q], top_k=top_k, search_params=params)[0]]
+                    for q in queries
+                ]
+                ms = (time.perf_counter() - start) * 1000 / len(queries)
+                print(f"   milvus nprobe={nprobe:<3}: {ms:8.2f} ms/query   recall={_recall(result_texts, truth_texts):.3f}")
+
+            store.drop_collection(name)
+
+    print("\n" + "=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--nlist", type=int, default=128)
+    parser.add_argument("--milvus", action="store_true", help="Benchmark cả Milvus server")
+    args = parser.parse_args()
+
+    run(args.sizes, args.queries, args.top_k, args.dim, args.nlist, args.milvus)
+
+
+if __name__ == "__main__":
+    main()
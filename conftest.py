@@ -0,0 +1,66 @@
+"""
+Fixture dùng chung cho các test LLMManager (provider gemini)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+Mỗi file test chỉ giữ fake model riêng của mình.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+import src.gemini_pool as gemini_pool
+import src.llm_langchain as llm_langchain
+from src.gemini_pool import GeminiKeyPool
+from src.llm_health import HealthTable
+
+
+class FakeClientManager:
+    """Thay _ClientManager: "client" của mỗi key chính là key đó."""
+
+    def configure(self, api_key):
+        self.api_key = api_key
+
+    def get_default_client(self, name):
+        return self.api_key
+
+    def make_client(self, name):
+        return self.api_key
+
+
+@pytest.fixture
+def fake_client_manager(monkeypatch):
+    """Thay _ClientManager của google.generativeai bằng FakeClientManager."""
+    monkeypatch.setattr(gemini_pool.genai_client, "_ClientManager", FakeClientManager)
+    return FakeClientManager
+
+
+@pytest.fixture
+def gemini_manager(fake_client_manager, monkeypatch):
+    """
+    Factory tạo LLMManager(provider="gemini") chạy trên fake model.
+
+    gemini_manager(model_cls, keys, models, manager_kwargs=None, **overrides):
+        model_cls: Class thay genai.GenerativeModel
+        keys: API keys của key pool
+        models: GEMINI_MODELS (model đầu tiên là model chính)
+        manager_kwargs: Tham số thêm cho LLMManager (vd hedge=True)
+        overrides: Thay thêm thuộc tính của src.llm_langchain
+            (vd get_health_table, get_usage_tracker, get_response_cache)
+    """
+    def _make(model_cls, keys=("k1",), models=("m1",), manager_kwargs=None, **overrides):
+        monkeypatch.setattr(llm_langchain.genai, "GenerativeModel", model_cls)
+        monkeypatch.setattr(llm_langchain, "get_health_table", lambda: HealthTable(ttl_seconds=60))
+        monkeypatch.setattr(llm_langchain, "get_gemini_pool", lambda api_keys: GeminiKeyPool(api_keys))
+        monkeypatch.setattr(llm_langchain.LLMManager, "_get_gemini_api_keys", lambda self: list(keys))
+        monkeypatch.setattr(llm_langchain, "GEMINI_MODELS", list(models))
+        for name, value in overrides.items():
+            monkeypatch.setattr(llm_langchain, name, value)
+        return llm_langchain.LLMManager(provider="gemini", **(manager_kwargs or {}))
+
+    return _make
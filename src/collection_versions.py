@@ -0,0 +1,118 @@
+"""
+Collection Versions - Version dữ liệu của từng collection.
+
+Mỗi lần collection được ingest thêm, build lại hoặc xóa, version của nó được
+đổi (thời điểm thay đổi). Các cache phụ thuộc nội dung collection (vd answer
+cache của agent) dùng version làm một phần của key, nên dữ liệu đổi thì kết
+quả cũ tự động không còn khớp.
+
+Version lưu ở COLLECTION_VERSIONS_FILE và được đọc lại khi file đổi, nên ingest
+chạy ở process khác (vd `python src/ingest_langchain.py`) cũng có hiệu lực ngay.
+"""
+
+import json
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import COLLECTION_VERSIONS_FILE
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class CollectionVersions:
+    """Bảng collection -> version, lưu ra file JSON, thread-safe."""
+
+    def __init__(self, path: Optional[str] = COLLECTION_VERSIONS_FILE):
+        """
+        Args:
+            path: File JSON lưu version (None = chỉ giữ trong bộ nhớ)
+        """
+        self.path = Path(path) if path else None
+        self._versions: Dict[str, str] = {}
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        """Đọc lại file nếu process khác đã ghi (gọi khi đang giữ lock)."""
+        if self.path is None:
+            return
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._versions = json.load(f)
+            self._mtime = mtime
+        except Exception as e:
+            logger.warning(f"⚠️ Không đọc được collection versions {self.path}: {e}")
+
+    def _save(self):
+        """Ghi file (gọi khi đang giữ lock)."""
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._versions, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._mtime = self.path.stat().st_mtime_ns
+        except Exception as e:
+            logger.warning(f"⚠️ Không lưu được collection versions {self.path}: {e}")
+
+    def bump(self, name: str) -> str:
+        """
+        Đánh dấu dữ liệu collection vừa thay đổi (ingest, build lại hoặc xóa).
+
+        Args:
+            name: Tên collection
+
+        Returns:
+            Version mới
+        """
+        # Thêm hậu tố ngẫu nhiên: hai lần ingest trong cùng một tick đồng hồ vẫn khác version
+        version = f"{datetime.now().isoformat()}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._reload()
+            self._versions[name] = version
+            self._save()
+        return version
+
+    def get(self, names: Sequence[str]) -> Dict[str, Optional[str]]:
+        """
+        Version hiện tại của các collection.
+
+        Args:
+            names: Danh sách tên collection
+
+        Returns:
+            Dict tên collection -> version (None nếu chưa từng ingest qua registry)
+        """
+        with self._lock:
+            self._reload()
+            return {name: self._versions.get(name) for name in names}
+
+
+_collection_versions: Optional[CollectionVersions] = None
+
+
+def get_collection_versions() -> CollectionVersions:
+    """Lấy CollectionVersions dùng chung (lưu ở COLLECTION_VERSIONS_FILE)."""
+    global _collection_versions
+    if _collection_versions is None:
+        _collection_versions = CollectionVersions()
+    return _collection_versions
@@ -25,6 +25,96 @@ EMBEDDING_DIM = 768
 # Tên collection trong Milvus để lưu trữ các vector.
 COLLECTION_NAME = "pdf_rag_collection"
 
+# --- CẤU HÌNH VECTOR STORE ---
+# Backend lưu vector:
+# - "milvus": Milvus server (localhost:19530)
+# - "local": lưu ma trận numpy trong LOCAL_VECTOR_STORE_DIR, không cần server
+# Có thể override bằng biến môi trường VECTOR_STORE_BACKEND
+VECTOR_STORE_BACKEND = "milvus"
+
+# Thư mục lưu dữ liệu của backend "local"
+LOCAL_VECTOR_STORE_DIR = "data/vector_store"
+
+# Cách lưu các PDF:
+# - "per_pdf": mỗi PDF một collection riêng (giới hạn bởi CollectionManager.MAX_COLLECTIONS)
+# - "partitioned": mọi PDF trong một collection chung SHARED_COLLECTION_NAME, mỗi PDF một partition.
+#   Search nhiều PDF chỉ tốn một lần search, không giới hạn số PDF.
+# Có thể override bằng biến môi trường STORAGE_LAYOUT
+STORAGE_LAYOUT = "per_pdf"
+
+# Tên collection chung khi STORAGE_LAYOUT = "partitioned"
+SHARED_COLLECTION_NAME = "pdf_rag_shared"
+
+# File lưu version dữ liệu của từng collection (đổi mỗi lần ingest/xóa; answer cache dùng làm key)
+COLLECTION_VERSIONS_FILE = "data/collection_versions.json"
+
+# --- CẤU HÌNH INDEX ---
+# Metric của vector index:
+# - "IP": inner product trên vector đã chuẩn hóa = cosine similarity (score = distance, từ -1 đến 1)
+# - "L2": khoảng cách Euclid bình phương, score = 1 / (1 + distance) (collection cũ)
+# Collection L2 cũ chuyển sang IP bằng: python src/index_policy.py --migrate-metric IP
+VECTOR_METRIC = "IP"
+
+# Loại index chọn theo số entities của collection (xem src/index_policy.py):
+# - < INDEX_FLAT_MAX_ENTITIES: FLAT (exact search)
+# - < INDEX_HNSW_MIN_ENTITIES: IVF_FLAT với nlist ≈ 4·√N
+# - còn lại: HNSW (backend local không có HNSW → IVF_FLAT)
+INDEX_FLAT_MAX_ENTITIES = 20000
+INDEX_HNSW_MIN_ENTITIES = 200000
+
+# Recall@k mục tiêu khi tự chọn nprobe / ef (so với exact search)
+INDEX_TARGET_RECALL = 0.95
+
+# File lưu index/search params đã tune cho từng collection
+INDEX_PARAMS_FILE = "data/index_params.json"
+
+# --- CẤU HÌNH SEARCH ---
+# Số thread tối đa khi search song song nhiều collection
+SEARCH_MAX_WORKERS = 8
+
+# Deadline (giây) cho mỗi query multi-collection.
+# Collection nào chưa trả kết quả khi hết deadline sẽ bị bỏ qua (trả kết quả một phần).
+SEARCH_DEADLINE_SECONDS = 5.0
+
+# Số vector câu hỏi tối đa giữ trong LRU cache (key = model + câu hỏi đã chuẩn hóa)
+QUERY_CACHE_SIZE = 2048
+
+# File lưu cache vector câu hỏi giữa các lần chạy (None = chỉ cache trong bộ nhớ)
+QUERY_CACHE_FILE = "data/query_embeddings.npz"
+
+# --- CẤU HÌNH HYBRID RETRIEVAL (BM25 + VECTOR) ---
+# Chế độ retrieval mặc định:
+# - "vector": chỉ vector search
+# - "lexical": chỉ BM25 (không cần Milvus)
+# - "hybrid": vector + BM25, gộp bằng reciprocal rank fusion (RRF) - bật tùy chọn
+RETRIEVAL_MODE = "vector"
+
+# Thư mục lưu inverted index BM25 (mỗi collection một thư mục con)
+LEXICAL_INDEX_DIR = "data/lexical_index"
+
+# Tham số BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Ngưỡng liên quan tối thiểu của hit BM25 (lexical_score ∈ [0, 1): tỉ lệ trọng lượng
+# idf của query mà chunk khớp). Hit dưới ngưỡng bị bỏ trước khi gộp RRF.
+BM25_MIN_SCORE = 0.05
+
+# Hằng số k của RRF: score = Σ 1 / (k + rank)
+RRF_K = 60
+
+# --- CẤU HÌNH MỞ RỘNG CONTEXT ---
+# Mỗi hit được mở rộng thành cửa sổ [trang - BEFORE, trang + AFTER]; các cửa sổ chồng nhau được gộp
+CONTEXT_PAGES_BEFORE = 1
+CONTEXT_PAGES_AFTER = 2
+
+# Số trang tối đa giữ trong LRU cache nội dung trang (mỗi RAGChain)
+PAGE_CACHE_SIZE = 512
+
+# Ngân sách token cho phần context trong prompt (bị chặn bởi GEMINI_INPUT_TOKEN_LIMIT).
+# Chunk quan trọng nhất được đưa vào trước, phần vượt ngân sách bị cắt theo câu hoặc bỏ.
+CONTEXT_TOKEN_BUDGET = 30000
+
 # --- CẤU HÌNH CHO CHUNKING ---
 # Kích thước chunk (ký tự) khi chia tài liệu
 CHUNK_SIZE = 1000
@@ -32,11 +122,26 @@ CHUNK_SIZE = 1000
 # Số ký tự overlap giữa các chunk
 CHUNK_OVERLAP = 200
 
+# Chế độ chunking:
+# - "chars": chia theo số ký tự (CHUNK_SIZE / CHUNK_OVERLAP) như trước
+# - "tokens": chia theo tokenizer của embedding model, mỗi chunk lấp đầy đúng
+#   max_seq_length của model (không bị cắt cụt khi encode)
+CHUNK_MODE = "chars"
+
+# Số token overlap giữa các chunk khi CHUNK_MODE = "tokens"
+CHUNK_TOKEN_OVERLAP = 32
+
 # --- CẤU HÌNH CHO OLLAMA ---
 
 # URL của Ollama API endpoint
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
 
+# Thời gian model ở lại trong bộ nhớ sau mỗi request (tránh load lại model mỗi câu hỏi)
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Timeout đọc response từ Ollama (giây); model lớn trên CPU có thể trả lời chậm
+OLLAMA_REQUEST_TIMEOUT = 300
+
 # Danh sách các model Ollama để lựa chọn.
 # Model đầu tiên trong danh sách sẽ là lựa chọn mặc định.
 # Đảm bảo model đã được pull: ollama pull llama3:latest
@@ -57,3 +162,52 @@ GEMINI_MODELS = [
 ]
 
 GEMINI_INPUT_TOKEN_LIMIT = 1000000 # Giới hạn token an toàn cho prompt gửi đến Gemini (2.0 Flash hỗ trợ đến 1M tokens)
+
+# Thời gian (giây) giữ trạng thái ok/lỗi của mỗi cặp (API key, model) Gemini.
+# Không gửi prompt thử khi khởi tạo: trạng thái được ghi nhận từ request thật,
+# cặp bị lỗi được bỏ qua khi failover cho đến khi hết hạn.
+LLM_HEALTH_TTL_SECONDS = 300
+
+# Giới hạn tốc độ cho MỖI API key Gemini (token bucket, xem src/gemini_pool.py).
+# Request được chia round-robin giữa các key còn quota → throughput tăng theo số key.
+# Đặt theo quota thực tế của tài khoản (free tier: ~10 RPM, 250K TPM cho Flash).
+GEMINI_RPM_PER_KEY = 10
+GEMINI_TPM_PER_KEY = 250000
+GEMINI_POOL_MAX_WAIT_SECONDS = 60  # Chờ tối đa khi mọi key đều hết quota
+
+# Retry request LLM (src/llm_retry.py): exponential backoff + jitter, tôn trọng Retry-After.
+LLM_RETRY_MAX_ATTEMPTS = 4       # Tổng số lần gửi request (kể cả lần đầu)
+LLM_RETRY_BASE_DELAY = 0.5       # Backoff lần retry đầu (giây), nhân đôi mỗi lần
+LLM_RETRY_MAX_DELAY = 20         # Chờ tối đa giữa hai lần thử (giây)
+
+# Circuit breaker cho mỗi cặp (API key, model): cặp bị ngắt được bỏ qua trong thời gian cooldown.
+# Cooldown của lỗi 429 / lỗi tạm thời nhân đôi theo số lần lỗi liên tiếp (tối đa LLM_HEALTH_TTL_SECONDS).
+LLM_CIRCUIT_COOLDOWN_SECONDS = 10
+LLM_CIRCUIT_FAILURE_THRESHOLD = 3  # Số lỗi tạm thời (5xx, timeout) liên tiếp trước khi ngắt
+
+# Hedged request (tùy chọn): model chính chưa trả lời sau phân vị độ trễ gần đây của nó
+# thì gửi cùng prompt tới model tiếp theo trong GEMINI_MODELS (hoặc key khác), lấy kết quả về trước.
+# Tốn thêm quota cho các request chậm, đổi lại giảm p99 độ trễ.
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_PERCENTILE = 95        # Phân vị độ trễ dùng làm ngưỡng hedging
+LLM_HEDGE_MIN_SAMPLES = 20       # Số request tối thiểu của model trước khi dùng phân vị
+LLM_HEDGE_DEFAULT_DELAY = 8.0    # Ngưỡng hedging (giây) khi chưa đủ mẫu
+LLM_LATENCY_WINDOW = 200         # Số request gần nhất giữ trong histogram độ trễ mỗi model
+
+# Cache response LLM theo prompt chính xác (SQLite), chỉ dùng khi caller bật cache=True
+LLM_RESPONSE_CACHE_FILE = "data/llm_responses.sqlite"  # None = chỉ cache trong bộ nhớ
+LLM_RESPONSE_CACHE_SIZE = 5000                         # Số response tối đa (LRU)
+LLM_RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600         # Thời gian sống mặc định mỗi response
+LLM_RESPONSE_CACHE_RAG = True   # Cache câu trả lời RAG (cùng câu hỏi trên cùng context); chat thường không cache
+
+# Thống kê usage LLM (token, latency, retry, fallback) - xem bằng lệnh `stats` của agent
+LLM_USAGE_WINDOW = 1000                      # Số lời gọi gần nhất giữ cho histogram
+LLM_USAGE_EXPORT_FILE = "data/llm_usage.json"  # `stats export` (đuôi .prom = Prometheus text format)
+
+# Số request LLM tối đa chạy song song (vd khi trả lời các câu hỏi con cùng lúc).
+# Gemini free tier giới hạn request/phút; Ollama local xử lý song song rất hạn chế
+# (giá trị "ollama" nên bằng OLLAMA_NUM_PARALLEL của server, cũng là kích thước connection pool).
+LLM_MAX_CONCURRENCY = {
+    "gemini": 4,
+    "ollama": 2,
+}
@@ -0,0 +1,182 @@
+"""
+Context Expansion - Mở rộng context theo cửa sổ trang quanh từng hit.
+
+Thay vì lấy cả khoảng min(hit_pages)-1 .. max(hit_pages)+2 (hit ở trang 3 và 700
+sẽ kéo gần cả cuốn sách vào prompt), mỗi hit chỉ mở rộng ±N trang, các cửa sổ
+chồng/liền nhau được gộp lại và toàn bộ trang cần lấy được query một lần
+(`page in [...]`). Nội dung từng trang được giữ trong LRU cache nên câu hỏi
+tiếp theo về cùng phần tài liệu không phải query lại vector store; key gồm
+version của collection (src/collection_versions.py) nên collection được ingest
+lại hoặc xóa rồi tạo lại thì nội dung cũ không còn được dùng.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.collection_versions import CollectionVersions, get_collection_versions
+from src.config import CONTEXT_PAGES_BEFORE, CONTEXT_PAGES_AFTER, PAGE_CACHE_SIZE
+from src.logging_config import get_logger
+from src.vector_store import VectorStore
+
+logger = get_logger(__name__)
+
+# Giới hạn số chunk mỗi lần query (giới hạn limit của Milvus)
+MAX_QUERY_LIMIT = 16384
+
+
+def merge_page_windows(
+    hit_pages: Sequence[int],
+    before: int = CONTEXT_PAGES_BEFORE,
+    after: int = CONTEXT_PAGES_AFTER
+) -> List[Tuple[int, int]]:
+    """
+    Tạo cửa sổ [page - before, page + after] quanh mỗi hit và gộp các cửa sổ
+    chồng lên nhau hoặc liền kề.
+
+    Args:
+        hit_pages: Số trang của các hit
+        before: Số trang lấy thêm phía trước mỗi hit
+        after: Số trang lấy thêm phía sau mỗi hit
+
+    Returns:
+        List (start, end) đã sort, không chồng nhau (bao gồm 2 đầu)
+    """
+    windows: List[Tuple[int, int]] = []
+
+    for page in sorted(set(int(p) for p in hit_pages)):
+        start, end = max(1, page - before), page + after
+        if windows and start <= windows[-1][1] + 1:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+
+    return windows
+
+
+def window_pages(windows: Sequence[Tuple[int, int]]) -> List[int]:
+    """Danh sách trang thuộc các cửa sổ."""
+    return [page for start, end in windows for page in range(start, end + 1)]
+
+
+class PageCache:
+    """
+    LRU cache nội dung trang: (collection, version, page) -> list text chunk theo thứ tự insert.
+
+    Trang không có chunk nào cũng được cache (list rỗng) để không query lại.
+    Khi version của collection đổi, các trang của version cũ bị bỏ.
+    """
+
+    def __init__(self, max_pages: int = PAGE_CACHE_SIZE, versions: Optional[CollectionVersions] = None):
+        """
+        Args:
+            max_pages: Số trang tối đa giữ trong cache
+            versions: Nguồn version collection (None = get_collection_versions())
+        """
+        self.max_pages = max_pages
+        self.versions = versions if versions is not None else get_collection_versions()
+        self._pages: "OrderedDict[Tuple[str, Optional[str], int], List[str]]" = OrderedDict()
+        self._current: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'queries': 0}
+
+    def get_pages(
+        self,
+        vector_store: VectorStore,
+        collection: str,
+        pages: Sequence[int]
+    ) -> Dict[int, List[str]]:
+        """
+        Lấy nội dung các trang, chỉ query những trang chưa có trong cache.
+
+        Args:
+            vector_store: Vector store backend
+            collection: Tên collection
+            pages: Các trang cần lấy
+
+        Returns:
+            Dict page -> list text chunk (chỉ gồm trang có nội dung)
+        """
+        result: Dict[int, List[str]] = {}
+        missing: List[int] = []
+        version = self.versions.get([collection])[collection]
+
+        with self._lock:
+            if collection in self._current and self._current[collection] != version:
+                # Collection đã được ingest lại / xóa → bỏ nội dung version cũ
+                self._drop_locked(collection)
+            self._current[collection] = version
+
+            for page in sorted(set(int(p) for p in pages)):
+                key = (collection, version, page)
+                if key in self._pages:
+                    self._pages.move_to_end(key)
+                    result[page] = self._pages[key]
+                    self.stats['hits'] += 1
+                else:
+                    missing.append(page)
+                    self.stats['misses'] += 1
+
+        if missing:
+            fetched = self._fetch(vector_store, collection, version, missing)
+            result.update(fetched)
+
+        return {page: texts for page, texts in sorted(result.items()) if texts}
+
+    def _fetch(
+        self,
+        vector_store: VectorStore,
+        collection: str,
+        version: Optional[str],
+        pages: List[int]
+    ) -> Dict[int, List[str]]:
+        """Query các trang còn thiếu trong một lần (`page in [...]`) và đưa vào cache."""
+        rows = vector_store.query(
+            collection,
+            pages=pages,
+            output_fields=["text", "page"],
+            limit=MAX_QUERY_LIMIT
+        )
+        with self._lock:
+            self.stats['queries'] += 1
+
+        fetched: Dict[int, List[str]] = {page: [] for page in pages}
+        for row in rows:
+            fetched.setdefault(int(row.get('page', 0)), []).append(row.get('text', ''))
+
+        if len(rows) >= MAX_QUERY_LIMIT:
+            # Kết quả bị cắt → không biết trang nào thiếu chunk, không cache
+            logger.warning(f"⚠️ Query {len(pages)} trang chạm limit {MAX_QUERY_LIMIT}, bỏ qua cache")
+            return fetched
+
+        with self._lock:
+            if self._current.get(collection) != version:
+                # Collection đổi version trong lúc query → không cache dữ liệu có thể đã cũ
+                return fetched
+            for page, texts in fetched.items():
+                self._pages[(collection, version, page)] = texts
+                self._pages.move_to_end((collection, version, page))
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+        return fetched
+
+    def invalidate(self, collection: Optional[str] = None):
+        """Xóa cache của một collection (hoặc toàn bộ) khi dữ liệu thay đổi."""
+        with self._lock:
+            if collection is None:
+                self._pages.clear()
+                return
+            self._drop_locked(collection)
+
+    def _drop_locked(self, collection: str):
+        """Xóa các trang của collection (gọi khi đang giữ lock)."""
+        for key in [k for k in self._pages if k[0] == collection]:
+            del self._pages[key]
@@ -0,0 +1,185 @@
+"""
+Context Packer - Đóng gói context vào ngân sách token trước khi gửi LLM.
+
+Các chunk được xếp theo độ ưu tiên (chunk đầu tiên / score cao nhất trước) và
+đưa vào prompt cho đến khi hết CONTEXT_TOKEN_BUDGET (không vượt quá
+GEMINI_INPUT_TOKEN_LIMIT). Chunk không vừa phần còn lại được cắt ở ranh giới câu,
+chunk không còn chỗ bị bỏ và được báo lại. Context ngắn hơn nghĩa là LLM trả lời
+nhanh hơn và rẻ hơn mỗi câu hỏi.
+"""
+
+import math
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import CONTEXT_TOKEN_BUDGET, GEMINI_INPUT_TOKEN_LIMIT
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Ước lượng: tokenizer BPE của LLM trung bình ~4 byte UTF-8 / token.
+# Đếm theo byte nên tiếng Việt có dấu (2-3 byte/ký tự) không bị đếm thiếu.
+BYTES_PER_TOKEN = 4
+
+# Phần còn lại của ngân sách nhỏ hơn mức này thì bỏ chunk thay vì cắt
+MIN_TRUNCATE_TOKENS = 32
+
+# Ranh giới câu: sau dấu kết câu + khoảng trắng, hoặc xuống dòng
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…:;])\s+|\n+")
+
+
+class TokenCounter:
+    """
+    Đếm token nhanh, có cache theo nội dung text.
+
+    Mặc định dùng ước lượng theo số byte; có thể truyền hàm đếm chính xác
+    (ví dụ tokenizer của model) qua `count_fn`.
+    """
+
+    def __init__(self, count_fn: Optional[Callable[[str], int]] = None, cache_size: int = 4096):
+        self._count_fn = count_fn or self.estimate
+        self._cached = lru_cache(maxsize=cache_size)(self._count_fn)
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """Ước lượng số token của text."""
+        return math.ceil(len(text.encode('utf-8')) / BYTES_PER_TOKEN)
+
+    def count(self, text: str) -> int:
+        """Số token của text (có cache)."""
+        if not text:
+            return 0
+        return self._cached(text)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Tách text thành các câu / dòng (giữ nguyên nội dung từng câu)."""
+    return [s for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+class ContextPacker:
+    """
+    Chọn các chunk có giá trị cao nhất sao cho tổng token không vượt ngân sách.
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        counter: Optional[TokenCounter] = None,
+        min_truncate_tokens: int = MIN_TRUNCATE_TOKENS
+    ):
+        """
+        Args:
+            budget: Ngân sách token cho context (bị chặn bởi GEMINI_INPUT_TOKEN_LIMIT)
+            counter: TokenCounter dùng để đếm (mặc định ước lượng theo byte)
+            min_truncate_tokens: Chỉ cắt chunk khi phần ngân sách còn lại ≥ giá trị này
+        """
+        self.budget = min(budget, GEMINI_INPUT_TOKEN_LIMIT)
+        self.counter = counter or TokenCounter()
+        self.min_truncate_tokens = min_truncate_tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cắt text ở ranh giới câu để không vượt max_tokens.
+
+        Text được cắt tại chỗ (text[:end]) nên khoảng trắng, xuống dòng và câu
+        nằm giữa dòng được giữ nguyên như bản gốc.
+
+        Returns:
+            Phần đầu text gồm các câu trọn vẹn ("" nếu câu đầu tiên đã không vừa)
+        """
+        # Vị trí kết thúc từng câu (ngay trước khoảng trắng / xuống dòng phân tách)
+        ends = sorted({m.start() for m in _SENTENCE_SPLIT.finditer(text)} | {len(text)})
+        ends = [end for end in ends if text[:end].strip()]
+
+        # Số câu giữ được lớn nhất (số token tăng theo độ dài prefix → binary search)
+        low, high = 0, len(ends)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.counter.count(text[:ends[mid - 1]]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:ends[low - 1]] if low else ""
+
+    def pack(
+        self,
+        blocks: Sequence[str],
+        priorities: Optional[Sequence[float]] = None,
+        separator: str = "\n\n"
+    ) -> Dict[str, Any]:
+        """
+        Đóng gói các block context vào ngân sách token.
+
+        Args:
+            blocks: Các block text (đã format header nguồn/trang)
+            priorities: Độ ưu tiên từng block, lớn hơn = quan trọng hơn
+                (None = block đứng trước quan trọng hơn)
+            separator: Chuỗi nối giữa các block
+
+        Returns:
+            Dict với 'text' (context đã ghép theo thứ tự gốc), 'tokens',
+            'kept', 'truncated', 'dropped' (index các block)
+        """
+        if priorities is None:
+            priorities = [-i for i in range(len(blocks))]
+
+        order = sorted(range(len(blocks)), key=lambda i: priorities[i], reverse=True)
+        separator_tokens = self.counter.count(separator)
+
+        packed: Dict[int, str] = {}
+        truncated: List[int] = []
+        dropped: List[int] = []
+        used = 0
+
+        for i in order:
+            extra = separator_tokens if packed else 0
+            remaining = self.budget - used - extra
+            tokens = self.counter.count(blocks[i])
+
+            if tokens <= remaining:
+                packed[i] = blocks[i]
+                used += tokens + extra
+                continue
+
+            text = self.truncate(blocks[i], remaining) if remaining >= self.min_truncate_tokens else ""
+            if text:
+                packed[i] = text
+                truncated.append(i)
+                used += self.counter.count(text) + extra
+            else:
+                dropped.append(i)
+
+        kept = sorted(packed)
+        if truncated or dropped:
+            logger.info(
+                f"✂️ Context packer: giữ {len(kept)}/{len(blocks)} chunk "
+                f"({used}/{self.budget} tokens), cắt {len(truncated)}, bỏ {len(dropped)}"
+            )
+
+        return {
+            'text': separator.join(packed[i] for i in kept),
+            'tokens': used,
+            'kept': kept,
+            'truncated': sorted(truncated),
+            'dropped': sorted(dropped)
+        }
+
+
+_context_packer: Optional[ContextPacker] = None
+
+
+def get_context_packer() -> ContextPacker:
+    """Lấy ContextPacker dùng chung (ngân sách CONTEXT_TOKEN_BUDGET)."""
+    global _context_packer
+    if _context_packer is None:
+        _context_packer = ContextPacker()
+    return _context_packer
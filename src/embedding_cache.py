@@ -0,0 +1,154 @@
+"""
+Query Embedding Cache - LRU cache vector của câu hỏi.
+
+Encode câu hỏi là chi phí cố định lớn nhất của bước retrieval khi chạy CPU.
+Agent thường hỏi lại cùng một câu (câu hỏi con, retry khi không có kết quả,
+người dùng lặp lại), nên vector được cache theo (tên model, câu hỏi đã chuẩn hóa).
+Cache có thể lưu ra file .npz để dùng lại sau khi khởi động lại.
+"""
+
+import atexit
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import QUERY_CACHE_SIZE, QUERY_CACHE_FILE
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Ký tự phân cách model và query trong key khi lưu file
+_KEY_SEP = "\x1f"
+
+
+def normalize_query(text: str) -> str:
+    """Chuẩn hóa câu hỏi làm key cache: Unicode NFC, gộp khoảng trắng."""
+    return " ".join(unicodedata.normalize('NFC', text).split())
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache: (model_name, câu hỏi chuẩn hóa) -> vector float32.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, path: Optional[str] = QUERY_CACHE_FILE):
+        """
+        Args:
+            max_size: Số vector tối đa trong cache
+            path: File .npz để lưu/đọc cache (None = chỉ giữ trong bộ nhớ)
+        """
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self._vectors: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.stats = {'hits': 0, 'misses': 0}
+
+        if self.path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        """Lấy vector đã cache (None nếu chưa có)."""
+        key = (model_name, normalize_query(query))
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.stats['misses'] += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.stats['hits'] += 1
+            return vector
+
+    def put(self, model_name: str, query: str, vector: np.ndarray):
+        """Thêm vector vào cache (đẩy phần tử cũ nhất ra nếu đầy)."""
+        key = (model_name, normalize_query(query))
+        with self._lock:
+            self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+            self._dirty = True
+
+    def encode(self, model, model_name: str, queries: Sequence[str], **encode_kwargs) -> np.ndarray:
+        """
+        Encode danh sách câu hỏi, chỉ gọi model cho các câu chưa có trong cache.
+
+        Các câu thiếu được encode chung một batch.
+
+        Args:
+            model: SentenceTransformer (hoặc object có .encode)
+            model_name: Tên model (một phần của key cache)
+            queries: Danh sách câu hỏi
+            **encode_kwargs: Tham số truyền cho model.encode (vd normalize_embeddings)
+
+        Returns:
+            np.ndarray shape (len(queries), dim)
+        """
+        vectors: List[Optional[np.ndarray]] = [self.get(model_name, q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            # Câu hỏi trùng nhau trong cùng batch chỉ encode một lần
+            unique = list(dict.fromkeys(normalize_query(queries[i]) for i in missing))
+            encoded = dict(zip(unique, np.asarray(model.encode(unique, **encode_kwargs), dtype=np.float32)))
+            for text, vector in encoded.items():
+                self.put(model_name, text, vector)
+            for i in missing:
+                vectors[i] = encoded[normalize_query(queries[i])]
+
+        return np.stack(vectors)
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._vectors.clear()
+            self._dirty = True
+
+    def load(self):
+        """Đọc cache từ file .npz (nếu có)."""
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                keys, vectors = data['keys'], data['vectors']
+            with self._lock:
+                for key, vector in zip(keys[-self.max_size:], vectors[-self.max_size:]):
+                    model_name, query = str(key).split(_KEY_SEP, 1)
+                    self._vectors[(model_name, query)] = vector
+            logger.info(f"📂 Đã load {len(self._vectors)} query embeddings từ {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Không đọc được query embedding cache {self.path}: {e}")
+
+    def save(self):
+        """Lưu cache ra file .npz (thứ tự LRU được giữ nguyên)."""
+        if self.path is None or not self._dirty:
+            return
+        try:
+            with self._lock:
+                items = list(self._vectors.items())
+                self._dirty = False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            keys = np.array([f"{model_name}{_KEY_SEP}{query}" for (model_name, query), _ in items], dtype=str)
+            # Các model có thể khác số chiều → chỉ lưu các vector cùng chiều với vector mới nhất
+            dim = items[-1][1].shape[-1] if items else 0
+            same_dim = [i for i, (_, v) in enumerate(items) if v.shape[-1] == dim]
+            vectors = np.stack([items[i][1] for i in same_dim]) if same_dim else np.zeros((0, 0), np.float32)
+            with open(self.path, 'wb') as f:
+                np.savez(f, keys=keys[same_dim], vectors=vectors)
+            logger.info(f"💾 Đã lưu {len(same_dim)} query embeddings vào {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Không lưu được query embedding cache {self.path}: {e}")
@@ -0,0 +1,304 @@
+"""
+Gemini Key Pool - Client riêng cho từng API key + giới hạn tốc độ theo token bucket.
+
+`genai.configure(api_key=...)` là cấu hình global của process, nên trước đây chỉ
+một key hoạt động tại một thời điểm và key chỉ được đổi sau khi đã lỗi. Pool giữ
+một client đã cấu hình cho mỗi key và phân phối request round-robin giữa các key.
+
+Mỗi key có 2 token bucket:
+- RPM: số request mỗi phút (GEMINI_RPM_PER_KEY)
+- TPM: số token mỗi phút (GEMINI_TPM_PER_KEY)
+
+Request chỉ được gửi qua key còn đủ quota trong cả 2 bucket; nếu mọi key đều
+hết, request chờ tới khi bucket sớm nhất nạp lại thay vì nhận lỗi 429.
+Throughput tăng tuyến tính theo số GEMINI_API_KEY_n.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from src.config import GEMINI_RPM_PER_KEY, GEMINI_TPM_PER_KEY, GEMINI_POOL_MAX_WAIT_SECONDS
+from src.logging_config import get_logger
+from src.llm_retry import RATE_LIMIT
+
+logger = get_logger(__name__)
+
+
+class KeyPoolExhausted(RuntimeError):
+    """Không có key nào gửi được request (hết quota hoặc đều đang bị ngắt mạch)."""
+
+    category = RATE_LIMIT
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket nạp đều theo phút, thread-safe.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Số token được nạp mỗi phút
+            capacity: Dung lượng tối đa (mặc định = rate_per_minute)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Số giây cần chờ để bucket có đủ `amount` (0 nếu đã đủ)."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            missing = amount - self._tokens
+            return 0.0 if missing <= 0 else missing / self.rate
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Lấy `amount` token nếu đủ (yêu cầu lớn hơn capacity được tính bằng capacity)."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def consume(self, amount: float):
+        """Trừ (hoặc hoàn lại nếu âm) token không cần kiểm tra, có thể làm bucket âm."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class KeySlot:
+    """Một API key trong pool: client riêng + bucket RPM/TPM."""
+
+    def __init__(self, index: int, api_key: str, rpm: float, tpm: float):
+        self.index = index
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._clients = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def clients(self):
+        """_ClientManager của riêng key này (tạo lazy, không ảnh hưởng genai.configure global)."""
+        with self._lock:
+            if self._clients is None:
+                manager = genai_client._ClientManager()
+                manager.configure(api_key=self.api_key)
+                self._clients = manager
+            return self._clients
+
+    def async_client(self):
+        """Client async của key cho event loop hiện tại."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+        if client is None:
+            client = self.clients.make_client("generative_async")
+            with self._lock:
+                client = self._async_clients.setdefault(loop, client)
+        return client
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        """Lấy 1 request + estimated_tokens token (không lấy gì nếu một trong hai thiếu)."""
+        if not self.requests.try_acquire(1):
+            return False
+        if not self.tokens.try_acquire(estimated_tokens):
+            self.requests.consume(-1)
+            return False
+        return True
+
+
+class GeminiKeyPool:
+    """
+    Pool các API key Gemini, chọn key round-robin theo quota còn lại.
+    """
+
+    def __init__(
+        self,
+        api_keys: Sequence[str],
+        rpm: float = GEMINI_RPM_PER_KEY,
+        tpm: float = GEMINI_TPM_PER_KEY,
+        max_wait: float = GEMINI_POOL_MAX_WAIT_SECONDS
+    ):
+        """
+        Args:
+            api_keys: Danh sách API key
+            rpm: Số request mỗi phút cho mỗi key
+            tpm: Số token mỗi phút cho mỗi key
+            max_wait: Thời gian chờ tối đa khi mọi key đều hết quota (giây)
+        """
+        self.slots: List[KeySlot] = [KeySlot(i, key, rpm, tpm) for i, key in enumerate(api_keys)]
+        self.max_wait = max_wait
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _usable(self, model: str, health) -> List[KeySlot]:
+        """Các key theo thứ tự round-robin, bỏ qua cặp (key, model) đã biết là lỗi."""
+        with self._lock:
+            start = self._next
+        order = self.slots[start:] + self.slots[:start]
+        return [s for s in order if health is None or health.is_usable(s.api_key, model)]
+
+    def first_usable(self, model: str, health=None) -> Optional[int]:
+        """Index key đầu tiên còn dùng được cho model (None nếu không còn key nào)."""
+        for slot in self.slots:
+            if health is None or health.is_usable(slot.api_key, model):
+                return slot.index
+        return None
+
+    def acquire(self, model: str, estimated_tokens: int = 0, health=None) -> KeySlot:
+        """
+        Chọn key cho một request.
+
+        Args:
+            model: Tên model (để bỏ qua key đã lỗi với model này)
+            estimated_tokens: Số token ước lượng của prompt
+            health: HealthTable (None = không lọc theo health)
+
+        Returns:
+            KeySlot đã được trừ quota
+
+        Raises:
+            KeyPoolExhausted nếu không còn key dùng được hoặc chờ quá max_wait
+        """
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+
+        while True:
+            slot, wait = self._try_acquire(model, estimated_tokens, health, deadline, waited)
+            if slot is not None:
+                return slot
+            waited = True
+            time.sleep(wait)
+
+    async def aacquire(self, model: str, estimated_tokens: int = 0, health=None) -> KeySlot:
+        """Phiên bản async của acquire (chờ quota bằng asyncio.sleep, không chặn event loop)."""
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+
+        while True:
+            slot, wait = self._try_acquire(model, estimated_tokens, health, deadline, waited)
+            if slot is not None:
+                return slot
+            waited = True
+            await asyncio.sleep(wait)
+
+    def _try_acquire(
+        self,
+        model: str,
+        estimated_tokens: int,
+        health,
+        deadline: float,
+        waited: bool
+    ) -> Tuple[Optional[KeySlot], float]:
+        """
+        Thử lấy quota một lượt trên các key theo thứ tự round-robin.
+
+        Returns:
+            (slot, 0) nếu thành công, (None, số giây cần chờ) nếu mọi key đều hết quota
+        """
+        candidates = self._usable(model, health)
+        if not candidates:
+            raise KeyPoolExhausted(f"❌ Không còn API key nào dùng được cho model {model}")
+
+        for slot in candidates:
+            if slot.try_acquire(estimated_tokens):
+                with self._lock:
+                    self._next = (slot.index + 1) % len(self.slots)
+                return slot, 0.0
+
+        wait = min(slot.wait_time(estimated_tokens) for slot in candidates)
+        if time.monotonic() + wait > deadline:
+            raise KeyPoolExhausted(f"❌ Mọi API key đều hết quota, cần chờ {wait:.1f}s (tối đa {self.max_wait}s)", wait)
+        if not waited:
+            logger.info(f"⏳ Mọi API key đều hết quota, chờ {wait:.1f}s...")
+        return None, max(wait, 0.01)
+
+    def record_usage(self, slot: KeySlot, estimated_tokens: int, response: Any):
+        """Điều chỉnh bucket TPM theo số token thực tế trong usage_metadata (nếu có)."""
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'total_token_count', None) if usage is not None else None
+        if isinstance(actual, int) and actual > 0:
+            slot.tokens.consume(actual - estimated_tokens)
+
+    def model(self, index: int, model_name: str, generation_config: Optional[Dict[str, Any]] = None):
+        """
+        Tạo GenerativeModel gửi request qua client của key `index`.
+
+        GenerativeModel chỉ là cấu hình (không tạo kết nối), còn client
+        (kết nối gRPC) được dùng lại cho mọi request của key.
+        """
+        llm = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+        llm._client = self.slots[index].clients.get_default_client("generative")
+        return llm
+
+    def async_model(self, index: int, model_name: str, generation_config: Optional[Dict[str, Any]] = None):
+        """
+        Tạo GenerativeModel cho generate_content_async qua client async của key `index`.
+
+        Client gRPC asyncio gắn với event loop tạo ra nó nên được giữ riêng cho từng loop.
+        """
+        llm = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+        llm._async_client = self.slots[index].async_client()
+        return llm
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Quota còn lại của từng key (dùng để hiển thị)."""
+        return [
+            {'key': slot.index + 1, 'requests': round(slot.requests.available, 1), 'tokens': int(slot.tokens.available)}
+            for slot in self.slots
+        ]
+
+
+_pools: Dict[Tuple[str, ...], GeminiKeyPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_gemini_pool(api_keys: Sequence[str]) -> GeminiKeyPool:
+    """Lấy GeminiKeyPool dùng chung cho bộ key (quota là của key nên bucket phải dùng chung)."""
+    key = tuple(api_keys)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = GeminiKeyPool(key)
+        return _pools[key]
@@ -0,0 +1,482 @@
+"""
+Index Policy - Chọn vector index theo kích thước collection và tự tune search params.
+
+- choose_index_params(): FLAT / IVF_FLAT / HNSW theo số entities
+- IndexPolicy.ensure_index(): build lại index khi collection lớn lên qua ngưỡng
+- IndexPolicy.tune(): chọn nprobe / ef nhỏ nhất đạt recall mục tiêu, đo so với
+  exact search trên mẫu query lấy từ chính collection (bỏ hit trùng với query)
+- Params đã tune được lưu ở INDEX_PARAMS_FILE để dùng lại khi khởi động lại
+- IndexPolicy.migrate_metric(): chuyển collection cũ (L2) sang metric IP
+- Scalar index (page, pdf_source) được tạo bổ sung cho collection cũ ở ensure_index
+
+Migrate tất cả collections:
+    python src/index_policy.py --migrate-metric IP
+    python src/index_policy.py --scalar-indexes
+"""
+
+import argparse
+
+import json
+import math
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import (
+    INDEX_FLAT_MAX_ENTITIES,
+    INDEX_HNSW_MIN_ENTITIES,
+    INDEX_TARGET_RECALL,
+    INDEX_PARAMS_FILE,
+    VECTOR_METRIC
+)
+from src.logging_config import get_logger
+from src.vector_store import DEFAULT_PARTITION, VectorStore, get_vector_store, normalize_vectors
+
+logger = get_logger(__name__)
+
+# Tham số HNSW khi build
+HNSW_BUILD_PARAMS = {"M": 16, "efConstruction": 200}
+
+# Các giá trị thử khi tune (tăng dần, dừng ở giá trị đầu tiên đạt recall)
+NPROBE_CANDIDATES = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+EF_CANDIDATES = (16, 32, 64, 128, 256, 512, 1024)
+
+# Tune lại khi số entities thay đổi quá tỉ lệ này so với lần tune trước
+RETUNE_GROWTH = 1.5
+
+
+def ivf_nlist(num_entities: int) -> int:
+    """nlist ≈ 4·√N, làm tròn về lũy thừa của 2 gần nhất (16 ≤ nlist ≤ 16384)."""
+    target = 4 * math.sqrt(max(num_entities, 1))
+    nlist = 2 ** round(math.log2(target))
+    return int(min(max(nlist, 16), 16384))
+
+
+def choose_index_params(
+    num_entities: int,
+    metric_type: str = VECTOR_METRIC,
+    supported: Sequence[str] = ("FLAT", "IVF_FLAT", "HNSW"),
+    flat_max: int = INDEX_FLAT_MAX_ENTITIES,
+    hnsw_min: int = INDEX_HNSW_MIN_ENTITIES
+) -> Dict[str, Any]:
+    """
+    Chọn index params phù hợp với số entities.
+
+    Args:
+        num_entities: Số vector trong collection
+        metric_type: "L2" hoặc "IP"
+        supported: Loại index backend hỗ trợ (HNSW → IVF_FLAT nếu không có)
+        flat_max: Dưới ngưỡng này dùng FLAT
+        hnsw_min: Từ ngưỡng này dùng HNSW
+
+    Returns:
+        Index params dạng Milvus
+    """
+    if num_entities < flat_max:
+        return {"metric_type": metric_type, "index_type": "FLAT", "params": {}}
+
+    if num_entities >= hnsw_min and "HNSW" in supported:
+        return {"metric_type": metric_type, "index_type": "HNSW", "params": dict(HNSW_BUILD_PARAMS)}
+
+    return {"metric_type": metric_type, "index_type": "IVF_FLAT", "params": {"nlist": ivf_nlist(num_entities)}}
+
+
+def needs_rebuild(current: Dict[str, Any], target: Dict[str, Any]) -> bool:
+    """Index hiện tại có cần build lại để khớp target không."""
+    if current.get('index_type') != target['index_type']:
+        return True
+
+    if target['index_type'] == "IVF_FLAT":
+        # nlist lệch quá 2 lần so với giá trị lý tưởng
+        current_nlist = int((current.get('params') or {}).get('nlist', 0))
+        ratio = current_nlist / target['params']['nlist']
+        return not 0.5 <= ratio <= 2.0
+
+    return False
+
+
+def _candidate_search_params(index_params: Dict[str, Any], top_k: int) -> List[Dict[str, Any]]:
+    """Các search params thử khi tune, từ rẻ đến đắt."""
+    index_type = index_params.get('index_type', 'FLAT')
+    params = index_params.get('params') or {}
+
+    if index_type.startswith("IVF"):
+        nlist = int(params.get('nlist', 1024))
+        return [{"nprobe": n} for n in NPROBE_CANDIDATES if n < nlist] + [{"nprobe": nlist}]
+
+    if index_type == "HNSW":
+        return [{"ef": ef} for ef in EF_CANDIDATES if ef >= top_k]
+
+    return [{}]
+
+
+def _exact_neighbors(
+    store: VectorStore,
+    physical: str,
+    ids: Sequence[int],
+    queries: np.ndarray,
+    metric_type: str,
+    top_k: int,
+    batch_size: int = 4096
+) -> List[List[int]]:
+    """
+    Ground truth bằng brute force: top_k id gần nhất của mỗi query trên toàn collection.
+
+    Không đi qua vector index nên đúng cho mọi loại index (kể cả HNSW). Hit trùng
+    id với query bị bỏ, giống search_ids() trong tune().
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if metric_type == "IP":
+        queries = normalize_vectors(queries)
+    query_ids = np.asarray(ids, dtype=np.int64)[:, None]
+
+    best_keys = np.zeros((len(queries), 0), dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    for rows in store.iter_rows(physical, batch_size):
+        row_ids = np.asarray([row['id'] for row in rows], dtype=np.int64)
+        vectors = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+
+        dots = queries @ vectors.T
+        if metric_type == "IP":
+            keys = -dots
+        else:
+            # ||q - x||^2 bỏ ||q||^2 vì không đổi thứ hạng của từng query
+            keys = np.einsum('ij,ij->i', vectors, vectors)[None, :] - 2.0 * dots
+        keys[row_ids[None, :] == query_ids] = np.inf
+
+        keys = np.concatenate([best_keys, keys], axis=1)
+        candidate_ids = np.concatenate([best_ids, np.broadcast_to(row_ids, (len(queries), len(row_ids)))], axis=1)
+        k = min(top_k, keys.shape[1])
+        top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        best_keys = np.take_along_axis(keys, top, axis=1)
+        best_ids = np.take_along_axis(candidate_ids, top, axis=1)
+
+    order = np.argsort(best_keys, axis=1, kind='stable')
+    best_keys = np.take_along_axis(best_keys, order, axis=1)
+    best_ids = np.take_along_axis(best_ids, order, axis=1)
+    return [
+        neighbor_ids[np.isfinite(neighbor_keys)].tolist()
+        for neighbor_ids, neighbor_keys in zip(best_ids, best_keys)
+    ]
+
+
+def _recall(result_ids: List[List[int]], truth_ids: List[List[int]]) -> float:
+    total = sum(len(set(r) & set(t)) for r, t in zip(result_ids, truth_ids))
+    return total / max(1, sum(len(t) for t in truth_ids))
+
+
+class IndexPolicy:
+    """
+    Quản lý loại index và search params theo từng collection vật lý.
+
+    Params đã tune được cache trong memory và lưu ra file JSON:
+        {collection: {index_params, search_params, recall, num_entities, updated}}
+    """
+
+    def __init__(
+        self,
+        params_file: str = INDEX_PARAMS_FILE,
+        target_recall: float = INDEX_TARGET_RECALL,
+        flat_max: int = INDEX_FLAT_MAX_ENTITIES,
+        hnsw_min: int = INDEX_HNSW_MIN_ENTITIES,
+        num_queries: int = 50,
+        top_k: int = 15
+    ):
+        self.params_file = Path(params_file)
+        self.target_recall = target_recall
+        self.flat_max = flat_max
+        self.hnsw_min = hnsw_min
+        self.num_queries = num_queries
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self.params: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self.params_file.exists():
+            try:
+                with open(self.params_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"⚠️ Không thể load index params: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            self.params_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.params_file, 'w', encoding='utf-8') as f:
+                json.dump(self.params, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"❌ Không thể lưu index params: {e}")
+
+    def get_search_params(self, vector_store: VectorStore, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Search params đã tune cho collection (None = dùng mặc định của backend).
+
+        Chỉ đọc cache trong memory, không gọi backend.
+        """
+        _, physical = vector_store.resolve(name)
+        entry = self.params.get(physical)
+        return entry['search_params'] if entry else None
+
+    def initial_index_params(self, vector_store: VectorStore, name: str, metric_type: str = VECTOR_METRIC) -> Dict[str, Any]:
+        """Index params cho collection mới (rỗng)."""
+        store, _ = vector_store.resolve(name)
+        return choose_index_params(0, metric_type, store.supported_index_types, self.flat_max, self.hnsw_min)
+
+    def invalidate(self, vector_store: VectorStore, name: str):
+        """Bỏ params đã tune khi collection vật lý bị xóa."""
+        _, physical = vector_store.resolve(name)
+        if physical == name and self.params.pop(physical, None) is not None:
+            self._save()
+
+    def ensure_index(self, vector_store: VectorStore, name: str, force_tune: bool = False) -> Dict[str, Any]:
+        """
+        Đảm bảo collection có index phù hợp với kích thước hiện tại.
+
+        Build lại index khi số entities vượt ngưỡng tier (hoặc nlist lệch nhiều),
+        sau đó tune search params nếu index đổi hoặc dữ liệu đã tăng/giảm nhiều.
+
+        Args:
+            vector_store: Vector store (có thể là PartitionedVectorStore)
+            name: Tên collection
+            force_tune: Luôn tune lại search params
+
+        Returns:
+            Entry đã lưu: index_params, search_params, recall, num_entities
+        """
+        store, physical = vector_store.resolve(name)
+
+        with self._lock:
+            # Collection tạo trước khi có scalar index → tạo bổ sung
+            created = store.ensure_scalar_indexes(physical)
+            if created:
+                logger.info(f"🔧 Đã thêm scalar index cho '{physical}': {created}")
+
+            num_entities = store.num_entities(physical)
+            current = store.get_index_params(physical)
+            target = choose_index_params(
+                num_entities,
+                current.get('metric_type', 'L2'),
+                store.supported_index_types,
+                self.flat_max,
+                self.hnsw_min
+            )
+
+            rebuilt = False
+            if needs_rebuild(current, target):
+                logger.info(
+                    f"🔧 Build lại index '{physical}': {current.get('index_type')} → "
+                    f"{target['index_type']} {target['params']} ({num_entities} entities)"
+                )
+                store.rebuild_index(physical, target)
+                current = target
+                rebuilt = True
+
+            entry = self.params.get(physical)
+            stale = (
+                entry is None
+                or entry.get('index_params') != current
+                or not (entry['num_entities'] / RETUNE_GROWTH <= num_entities <= entry['num_entities'] * RETUNE_GROWTH)
+            )
+
+            if rebuilt or stale or force_tune:
+                entry = self.tune(store, physical, current, num_entities)
+                self.params[physical] = entry
+                self._save()
+
+            return entry
+
+    def migrate_metric(
+        self,
+        vector_store: VectorStore,
+        name: str,
+        metric_type: str = VECTOR_METRIC,
+        batch_size: int = 1000
+    ) -> int:
+        """
+        Chuyển collection sang metric khác (ví dụ L2 → IP).
+
+        Dữ liệu được copy sang collection tạm với index mới (vector chuẩn hóa,
+        giữ nguyên partition), sau đó collection cũ được đổi tên sang
+        "<name>_pre_migrate", collection tạm được đổi tên thay vào và collection cũ
+        chỉ bị xóa khi swap thành công.
+        Search params được tune lại theo index mới.
+
+        Returns:
+            Số entities đã migrate (0 nếu collection đã đúng metric)
+        """
+        store, physical = vector_store.resolve(name)
+        if store.metric_type(physical) == metric_type:
+            logger.info(f"✅ '{physical}' đã dùng metric {metric_type}")
+            return 0
+
+        index_params = {**store.get_index_params(physical), 'metric_type': metric_type}
+        tmp_name = f"{physical}_migrate_{metric_type.lower()}"
+        if store.has_collection(tmp_name):
+            store.drop_collection(tmp_name)
+
+        logger.info(f"🔄 Migrate '{physical}' sang metric {metric_type}...")
+        migrated = 0
+        created = False
+        for rows in store.iter_rows(physical, batch_size):
+            vectors = normalize_vectors([row['embedding'] for row in rows])
+            with_partition = 'partition' in rows[0]
+
+            if not created:
+                store.create_collection(
+                    tmp_name,
+                    dim=vectors.shape[1],
+                    description=f"Migrated from {physical}",
+                    index_params=index_params,
+                    with_partition_field=with_partition
+                )
+                for partition in store.list_partitions(physical):
+                    if partition != DEFAULT_PARTITION:
+                        store.create_partition(tmp_name, partition)
+                created = True
+
+            # Insert theo từng partition để giữ nguyên layout
+            groups: Dict[Optional[str], List[int]] = {}
+            for i, row in enumerate(rows):
+                partition = row.get('partition')
+                groups.setdefault(None if partition in (None, DEFAULT_PARTITION) else partition, []).append(i)
+
+            for partition, indices in groups.items():
+                store.insert(
+                    tmp_name,
+                    vectors[indices],
+                    [rows[i]['text'] for i in indices],
+                    [rows[i]['page'] for i in indices],
+                    [rows[i]['pdf_source'] for i in indices],
+                    partition=partition
+                )
+            migrated += len(rows)
+
+        if created:
+            # Đổi tên collection cũ sang bên cạnh trước khi swap: nếu swap lỗi/dừng giữa
+            # chừng thì dữ liệu gốc vẫn còn (dưới tên physical hoặc backup_name)
+            backup_name = f"{physical}_pre_migrate"
+            if store.has_collection(backup_name):
+                store.drop_collection(backup_name)
+            store.rename_collection(physical, backup_name)
+            try:
+                store.rename_collection(tmp_name, physical)
+            except Exception:
+                store.rename_collection(backup_name, physical)
+                raise
+            store.drop_collection(backup_name)
+        else:
+            # Collection rỗng: chỉ cần build lại index
+            store.rebuild_index(physical, index_params)
+
+        with self._lock:
+            if self.params.pop(physical, None) is not None:
+                self._save()
+        self.ensure_index(vector_store, name)
+
+        logger.info(f"✅ Đã migrate {migrated} entities của '{physical}' sang {metric_type}")
+        return migrated
+
+    def tune(
+        self,
+        store: VectorStore,
+        physical: str,
+        index_params: Dict[str, Any],
+        num_entities: int
+    ) -> Dict[str, Any]:
+        """
+        Chọn search params rẻ nhất đạt target_recall.
+
+        Query là các vector lấy mẫu từ collection; hit trùng id với query bị bỏ
+        khỏi cả kết quả lẫn ground truth để mô phỏng query chưa từng thấy.
+        Ground truth tính bằng brute force (_exact_neighbors), không qua index.
+        """
+        metric_type = index_params.get('metric_type', 'L2')
+        candidates = _candidate_search_params(index_params, self.top_k)
+
+        def entry(params: Dict[str, Any], recall: float) -> Dict[str, Any]:
+            return {
+                'index_params': index_params,
+                'search_params': {"metric_type": metric_type, "params": params},
+                'recall': round(recall, 4),
+                'num_entities': num_entities,
+                'updated': datetime.now().isoformat()
+            }
+
+        if index_params.get('index_type', 'FLAT') == "FLAT" or num_entities <= self.top_k:
+            return entry({}, 1.0)
+
+        ids, queries = store.sample_vectors(physical, self.num_queries)
+        if len(ids) == 0:
+            return entry(candidates[-1], 1.0)
+
+        def search_ids(params: Dict[str, Any]) -> List[List[int]]:
+            results = store.search(
+                physical,
+                queries,
+                top_k=self.top_k + 1,
+                output_fields=["page"],
+                search_params={"metric_type": metric_type, "params": params}
+            )
+            return [
+                [hit['id'] for hit in hits if hit['id'] != query_id][:self.top_k]
+                for query_id, hits in zip(ids, results)
+            ]
+
+        truth = _exact_neighbors(store, physical, ids, queries, metric_type, self.top_k)
+
+        recall = 0.0
+        for params in candidates:
+            recall = _recall(search_ids(params), truth)
+            if recall >= self.target_recall:
+                break
+
+        logger.info(f"🎯 Tune '{physical}': {params} → recall@{self.top_k} = {recall:.3f}")
+        return entry(params, recall)
+
+
+# --- CONVENIENCE FUNCTIONS ---
+
+_index_policy = None
+
+def get_index_policy() -> IndexPolicy:
+    """Lấy IndexPolicy singleton."""
+    global _index_policy
+    if _index_policy is None:
+        _index_policy = IndexPolicy()
+    return _index_policy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index policy: migrate metric / tune search params")
+    parser.add_argument("--migrate-metric", choices=["IP", "L2"], help="Chuyển collections sang metric này")
+    parser.add_argument("--tune", action="store_true", help="Tune lại search params")
+    parser.add_argument("--scalar-indexes", action="store_true", help="Tạo scalar index còn thiếu (page, pdf_source)")
+    parser.add_argument("collections", nargs="*", help="Tên collection vật lý (mặc định: tất cả)")
+    args = parser.parse_args()
+
+    # Làm việc trên collection vật lý (với layout partitioned là collection chung)
+    store, _ = get_vector_store().resolve("")
+    policy = get_index_policy()
+
+    for name in args.collections or store.list_collections():
+        if args.migrate_metric:
+            policy.migrate_metric(store, name, args.migrate_metric)
+        if args.scalar_indexes:
+            print(f"{name}: scalar indexes created {store.ensure_scalar_indexes(name)}")
+        if args.tune:
+            entry = policy.ensure_index(store, name, force_tune=True)
+            print(f"{name}: {entry['index_params']['index_type']} {entry['search_params']['params']} recall={entry['recall']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
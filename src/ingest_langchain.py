@@ -11,7 +11,7 @@ Giữ nguyên tất cả tính năng:
 
 import sys
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, List, Optional, Tuple, Union
 
 project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
@@ -29,9 +29,14 @@ from src.config import (
     EMBEDDING_MODEL_NAME,
     COLLECTION_NAME,
     CHUNK_SIZE,
-    CHUNK_OVERLAP
+    CHUNK_OVERLAP,
+    CHUNK_MODE
 )
 from src.logging_config import get_logger
+from src.vector_store import VectorStore, get_vector_store
+from src.index_policy import get_index_policy
+from src.lexical_index import get_lexical_store
+from src.collection_versions import get_collection_versions
 
 logger = get_logger(__name__)
 
@@ -52,7 +57,8 @@ class DocumentIngestion:
         collection_name: str = COLLECTION_NAME,
         embedding_model_name: str = EMBEDDING_MODEL_NAME,
         chunk_size: int = CHUNK_SIZE,
-        chunk_overlap: int = CHUNK_OVERLAP
+        chunk_overlap: int = CHUNK_OVERLAP,
+        chunk_mode: str = CHUNK_MODE
     ):
         """
         Initialize ingestion pipeline.
@@ -62,10 +68,15 @@ class DocumentIngestion:
             embedding_model_name: HuggingFace model name
             chunk_size: Max characters per chunk
             chunk_overlap: Overlap between chunks
+            chunk_mode: "chars" hoặc "tokens" (theo tokenizer của embedding model)
         """
+        if chunk_mode not in ("chars", "tokens"):
+            raise ValueError(f"Unsupported chunk mode: {chunk_mode}")
+        
         self.collection_name = collection_name
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.chunk_mode = chunk_mode
         
         logger.info(f"🤖 Loading embedding model: {embedding_model_name}")
         
@@ -85,6 +96,7 @@ class DocumentIngestion:
         )
         
         logger.info(f"✅ Ingestion pipeline initialized")
+        logger.info(f"   Chunk mode: {chunk_mode}")
         logger.info(f"   Chunk size: {chunk_size}")
         logger.info(f"   Overlap: {chunk_overlap}")
     
@@ -162,11 +174,32 @@ class DocumentIngestion:
         """
         logger.info(f"✂️  Splitting {len(documents)} documents...")
         
-        chunks = self.text_splitter.split_documents(documents)
+        # SentenceTransformer bên trong HuggingFaceEmbeddings (cung cấp tokenizer)
+        embedding_model = self.embeddings._client
+        
+        if self.chunk_mode == "tokens":
+            chunks = []
+            for doc in documents:
+                for text in chunk_text_by_tokens(doc.page_content, embedding_model):
+                    chunks.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        else:
+            chunks = self.text_splitter.split_documents(documents)
         
         logger.info(f"✅ Created {len(chunks)} chunks")
+        if not chunks:
+            return chunks
+        
         logger.info(f"   Avg chunk size: {sum(len(c.page_content) for c in chunks) // len(chunks)} chars")
         
+        truncated = count_truncated_chunks([c.page_content for c in chunks], embedding_model)
+        if truncated:
+            logger.warning(
+                f"⚠️ {truncated}/{len(chunks)} chunks vượt max_seq_length "
+                f"({embedding_model.max_seq_length} tokens) và sẽ bị cắt khi encode"
+            )
+        else:
+            logger.info(f"   Không có chunk nào bị cắt (max_seq_length: {embedding_model.max_seq_length})")
+        
         return chunks
     
     def ingest_to_milvus(
@@ -188,30 +221,145 @@ class DocumentIngestion:
         logger.info(f"   Collection: {self.collection_name}")
         logger.info(f"   Drop old: {drop_old}")
         
+        vector_store = get_vector_store()
+        index_policy = get_index_policy()
+        
         try:
-            vectorstore = Milvus.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
+            if drop_old and vector_store.has_collection(self.collection_name):
+                vector_store.drop_collection(self.collection_name)
+                index_policy.invalidate(vector_store, self.collection_name)
+            
+            # Tạo collection theo schema + index policy của repo (index theo kích thước, scalar index)
+            if not vector_store.has_collection(self.collection_name):
+                vector_store.create_collection(
+                    self.collection_name,
+                    description=f"Embeddings for {self.collection_name}",
+                    index_params=index_policy.initial_index_params(vector_store, self.collection_name)
+                )
+            
+            field_kwargs = vector_store.langchain_kwargs(self.collection_name)
+            vectorstore = Milvus(
+                embedding_function=self.embeddings,
                 collection_name=self.collection_name,
                 connection_args={
                     "host": "localhost",
                     "port": "19530"
                 },
-                drop_old=drop_old
+                **field_kwargs
+            )
+            vectorstore.add_texts(
+                [c.page_content for c in chunks],
+                metadatas=[
+                    {'page': int(c.metadata.get('page', 0)), 'pdf_source': c.metadata.get('pdf_source', 'Unknown')}
+                    for c in chunks
+                ]
             )
             
+            if field_kwargs:
+                # Nâng cấp index theo kích thước mới + tune search params (kèm scalar index còn thiếu)
+                entry = index_policy.ensure_index(vector_store, self.collection_name)
+                logger.info(f"   Index: {entry['index_params']['index_type']}, search params: {entry['search_params']['params']}")
+            else:
+                logger.warning(
+                    f"⚠️ Collection '{self.collection_name}' dùng schema LangChain cũ, không tự chọn/tune index "
+                    f"(ingest lại với --drop để chuyển sang schema mới)"
+                )
+            
             logger.info(f"✅ Successfully ingested to Milvus")
             return vectorstore
             
         except Exception as e:
             logger.error(f"❌ Failed to ingest to Milvus: {e}")
             raise
+        finally:
+            # Collection có thể đã bị drop dù insert lỗi → câu trả lời đã cache không còn đúng
+            get_collection_versions().bump(self.collection_name)
+    
+    def ingest_to_vector_store(
+        self,
+        chunks: List[Document],
+        drop_old: bool = False
+    ) -> VectorStore:
+        """
+        Ingest chunks vào vector store backend của project (schema: embedding, text, page, pdf_source).
+        
+        Dùng khi VECTOR_STORE_BACKEND không phải "milvus" (ví dụ "local").
+        
+        Args:
+            chunks: List of chunked documents
+            drop_old: Whether to drop existing collection
+            
+        Returns:
+            VectorStore instance
+        """
+        vector_store = get_vector_store()
+        
+        logger.info(f"📤 Ingesting {len(chunks)} chunks to {vector_store.backend} vector store...")
+        logger.info(f"   Collection: {self.collection_name}")
+        logger.info(f"   Drop old: {drop_old}")
+        
+        index_policy = get_index_policy()
+        
+        if drop_old and vector_store.has_collection(self.collection_name):
+            vector_store.drop_collection(self.collection_name)
+            index_policy.invalidate(vector_store, self.collection_name)
+            get_collection_versions().bump(self.collection_name)
+        
+        if not vector_store.has_collection(self.collection_name):
+            vector_store.create_collection(
+                self.collection_name,
+                description=f"Embeddings for {self.collection_name}",
+                index_params=index_policy.initial_index_params(vector_store, self.collection_name)
+            )
+        
+        texts = [c.page_content for c in chunks]
+        embeddings = self.embeddings.embed_documents(texts)
+        
+        vector_store.insert(
+            self.collection_name,
+            embeddings,
+            texts,
+            [int(c.metadata.get('page', 0)) for c in chunks],
+            [c.metadata.get('pdf_source', 'Unknown') for c in chunks]
+        )
+        get_collection_versions().bump(self.collection_name)
+        
+        # Nâng cấp index theo kích thước mới + tune search params
+        entry = index_policy.ensure_index(vector_store, self.collection_name)
+        logger.info(f"   Index: {entry['index_params']['index_type']}, search params: {entry['search_params']['params']}")
+        
+        logger.info(f"✅ Successfully ingested to {vector_store.backend} vector store")
+        return vector_store
+    
+    def _ingest_chunks(
+        self,
+        chunks: List[Document],
+        drop_old: bool = False
+    ) -> Union[Milvus, VectorStore]:
+        """Ingest chunks theo backend đang cấu hình (kèm inverted index BM25)."""
+        vector_store = get_vector_store()
+        # Layout partitioned: PDF là partition trong collection chung, phải đi qua VectorStore
+        # (giống RAGChain) chứ không tạo collection LangChain riêng
+        if vector_store.backend == "milvus" and not vector_store.partitioned:
+            result = self.ingest_to_milvus(chunks, drop_old=drop_old)
+        else:
+            result = self.ingest_to_vector_store(chunks, drop_old=drop_old)
+        
+        get_lexical_store().add_documents(
+            self.collection_name,
+            [c.page_content for c in chunks],
+            [int(c.metadata.get('page', 0)) for c in chunks],
+            [c.metadata.get('pdf_source', 'Unknown') for c in chunks],
+            replace=drop_old
+        )
+        get_collection_versions().bump(self.collection_name)
+        return result
     
     def ingest_pdf(
         self,
         pdf_path: str,
         drop_old: bool = False
-    ) -> Optional[Milvus]:
+    ) -> Optional[Union[Milvus, VectorStore]]:
         """
         Complete pipeline: Load PDF → Split → Ingest.
         
@@ -220,7 +368,7 @@ class DocumentIngestion:
             drop_old: Whether to drop existing collection
             
         Returns:
-            Milvus vectorstore or None if failed
+            Vectorstore or None if failed
         """
         # Load
         documents = self.load_pdf(pdf_path)
@@ -231,7 +379,7 @@ class DocumentIngestion:
         chunks = self.split_documents(documents)
         
         # Ingest
-        vectorstore = self.ingest_to_milvus(chunks, drop_old=drop_old)
+        vectorstore = self._ingest_chunks(chunks, drop_old=drop_old)
         
         return vectorstore
     
@@ -239,7 +387,7 @@ class DocumentIngestion:
         self,
         directory_path: str,
         drop_old: bool = False
-    ) -> Optional[Milvus]:
+    ) -> Optional[Union[Milvus, VectorStore]]:
         """
         Complete pipeline: Load directory → Split → Ingest.
         
@@ -248,7 +396,7 @@ class DocumentIngestion:
             drop_old: Whether to drop existing collection
             
         Returns:
-            Milvus vectorstore or None if failed
+            Vectorstore or None if failed
         """
         # Load
         documents = self.load_directory(directory_path)
@@ -259,7 +407,7 @@ class DocumentIngestion:
         chunks = self.split_documents(documents)
         
         # Ingest
-        vectorstore = self.ingest_to_milvus(chunks, drop_old=drop_old)
+        vectorstore = self._ingest_chunks(chunks, drop_old=drop_old)
         
         return vectorstore
 
@@ -303,6 +451,13 @@ def main():
         default=CHUNK_OVERLAP,
         help=f"Chunk overlap (default: {CHUNK_OVERLAP})"
     )
+    parser.add_argument(
+        "--chunk-mode",
+        type=str,
+        choices=["chars", "tokens"],
+        default=CHUNK_MODE,
+        help=f"Chunk by characters or embedding-model tokens (default: {CHUNK_MODE})"
+    )
     
     args = parser.parse_args()
     
@@ -317,12 +472,14 @@ def main():
     print(f"   Collection: {args.collection}")
     print(f"   Chunk size: {args.chunk_size}")
     print(f"   Chunk overlap: {args.chunk_overlap}")
+    print(f"   Chunk mode: {args.chunk_mode}")
     print(f"   Drop old: {args.drop}")
     
     ingestion = DocumentIngestion(
         collection_name=args.collection,
         chunk_size=args.chunk_size,
-        chunk_overlap=args.chunk_overlap
+        chunk_overlap=args.chunk_overlap,
+        chunk_mode=args.chunk_mode
     )
     
     # Ingest
@@ -353,7 +510,7 @@ def main():
         logger.error(f"Ingestion error: {e}")
         print(f"\n❌ Error: {e}")
         print("\n💡 Make sure:")
-        print("   1. Milvus is running (localhost:19530)")
+        print("   1. Milvus is running (localhost:19530) or VECTOR_STORE_BACKEND=local")
         print("   2. PDF files are valid")
         print("   3. Enough disk space available")
 
@@ -406,3 +563,143 @@ def chunk_text(text: str, chunk_size: Optional[int] = None, chunk_overlap: Optio
     
     chunks = splitter.split_text(text)
     return chunks
+
+
+# ===== TOKEN-AWARE CHUNKING =====
+# Chunk theo tokenizer của embedding model thay vì số ký tự.
+# mpnet chỉ nhận tối đa max_seq_length token (128-512), phần dư bị cắt âm thầm khi encode.
+
+# Ranh giới tự nhiên để kết thúc chunk, theo thứ tự ưu tiên
+_TOKEN_CHUNK_BOUNDARIES = ["\n\n", "\n", ". ", " "]
+
+
+def get_embedding_tokenizer(embedding_model) -> Tuple[Any, int]:
+    """
+    Lấy tokenizer và số token nội dung tối đa của embedding model.
+    
+    Args:
+        embedding_model: SentenceTransformer model
+        
+    Returns:
+        (tokenizer, max_content_tokens) - max_content_tokens đã trừ special tokens
+        ([CLS]/[SEP] hoặc <s>/</s>) mà model tự thêm khi encode
+    """
+    tokenizer = embedding_model.tokenizer
+    max_seq_length = embedding_model.max_seq_length
+    num_special = tokenizer.num_special_tokens_to_add(pair=False)
+    return tokenizer, max_seq_length - num_special
+
+
+def _find_token_boundary(text: str, offsets: list, start: int, end: int) -> int:
+    """
+    Tìm vị trí kết thúc chunk đẹp nhất trong nửa sau cửa sổ token [start, end).
+    
+    Ưu tiên ngắt ở đoạn văn > dòng > câu > khoảng trắng, không ngắt giữa một từ.
+    
+    Returns:
+        Index token kết thúc (exclusive)
+    """
+    min_end = start + max(1, (end - start) // 2)
+    
+    for boundary in _TOKEN_CHUNK_BOUNDARIES:
+        for i in range(end, min_end, -1):
+            # Khoảng trống giữa token i-1 và token i
+            gap = text[offsets[i - 1][1]:offsets[i][0]]
+            if boundary == ". ":
+                if gap and text[offsets[i - 1][1] - 1:offsets[i - 1][1]] in ".!?":
+                    return i
+            elif boundary in gap:
+                return i
+    
+    return end
+
+
+def chunk_text_by_tokens(
+    text: str,
+    embedding_model,
+    chunk_overlap: Optional[int] = None
+) -> list:
+    """
+    Chunk text theo số token của embedding model.
+    
+    Tokenize cả đoạn text một lần bằng fast tokenizer (có offset mapping),
+    rồi cắt các cửa sổ token vừa khít max_seq_length của model.
+    
+    Args:
+        text: Text cần chunk
+        embedding_model: SentenceTransformer model (cung cấp tokenizer)
+        chunk_overlap: Số token overlap (default CHUNK_TOKEN_OVERLAP)
+        
+    Returns:
+        List of text chunks
+    """
+    from src.config import CHUNK_TOKEN_OVERLAP
+    
+    if chunk_overlap is None:
+        chunk_overlap = CHUNK_TOKEN_OVERLAP
+    
+    tokenizer, max_tokens = get_embedding_tokenizer(embedding_model)
+    chunk_overlap = min(chunk_overlap, max_tokens // 2)
+    
+    if not getattr(tokenizer, 'is_fast', False):
+        # Tokenizer chậm không có offset mapping → dùng splitter của LangChain
+        logger.warning("⚠️ Tokenizer không phải fast tokenizer, dùng RecursiveCharacterTextSplitter")
+        splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer,
+            chunk_size=max_tokens,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        return splitter.split_text(text)
+    
+    encoding = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        truncation=False
+    )
+    offsets = encoding['offset_mapping']
+    num_tokens = len(offsets)
+    
+    chunks = []
+    start = 0
+    while start < num_tokens:
+        end = min(start + max_tokens, num_tokens)
+        if end < num_tokens:
+            end = _find_token_boundary(text, offsets, start, end)
+        
+        chunk = text[offsets[start][0]:offsets[end - 1][1]].strip()
+        if chunk:
+            chunks.append(chunk)
+        
+        if end >= num_tokens:
+            break
+        start = max(end - chunk_overlap, start + 1)
+    
+    return chunks
+
+
+def count_truncated_chunks(chunks: List[str], embedding_model, batch_size: int = 256) -> int:
+    """
+    Đếm số chunk sẽ bị embedding model cắt cụt khi encode.
+    
+    Dùng batch tokenization (fast tokenizer xử lý song song cả batch).
+    
+    Args:
+        chunks: List text chunks
+        embedding_model: SentenceTransformer model
+        batch_size: Số chunk mỗi lần tokenize
+        
+    Returns:
+        Số chunk dài hơn max_seq_length của model
+    """
+    tokenizer = embedding_model.tokenizer
+    max_seq_length = embedding_model.max_seq_length
+    
+    truncated = 0
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        input_ids = tokenizer(batch, add_special_tokens=True, truncation=False)['input_ids']
+        truncated += sum(1 for ids in input_ids if len(ids) > max_seq_length)
+    
+    return truncated
@@ -0,0 +1,382 @@
+"""
+Lexical Index - Inverted index BM25 cho từng collection.
+
+Vector search hay bỏ sót các định danh chính xác (từ khóa SQL, tên công thức,
+số thứ tự câu hỏi). Inverted index BM25 được build lúc index PDF, lưu cạnh
+collection dưới dạng các mảng numpy (memory-map khi đọc):
+
+    <LEXICAL_INDEX_DIR>/<collection>/
+        meta.json          - từ điển term, số doc, avgdl, danh sách pdf_source
+        term_offsets.npy   - postings của term i nằm trong [offsets[i], offsets[i+1])
+        postings_docs.npy  - doc id (int32)
+        postings_tf.npy    - term frequency (uint16)
+        doc_len.npy        - số token mỗi doc
+        pages.npy, source_ids.npy
+        text_offsets.npy + texts.bin - nội dung chunk (UTF-8)
+
+Tokenizer giữ dấu tiếng Việt, đồng thời index thêm dạng bỏ dấu của mỗi từ nên
+câu hỏi gõ không dấu vẫn khớp ("truy van" → "truy vấn").
+
+Chạy:
+    python src/lexical_index.py --build                 # build cho mọi collection
+    python src/lexical_index.py --search "SELECT" -c my_collection
+"""
+
+import argparse
+import json
+import math
+import re
+import shutil
+import sys
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import LEXICAL_INDEX_DIR, BM25_K1, BM25_B, RRF_K
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+_MAX_TF = np.iinfo(np.uint16).max
+
+
+def fold_diacritics(token: str) -> str:
+    """Bỏ dấu tiếng Việt: "truy vấn" → "truy van", "đường" → "duong"."""
+    decomposed = unicodedata.normalize('NFD', token.replace('đ', 'd').replace('Đ', 'D'))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ: chữ thường, Unicode NFC, giữ dấu và dấu gạch dưới trong định danh."""
+    return _TOKEN_RE.findall(unicodedata.normalize('NFC', text).lower())
+
+
+def document_terms(tokens: Sequence[str]) -> Counter:
+    """Term frequency của một doc, gồm cả dạng bỏ dấu của các từ có dấu."""
+    counts = Counter(tokens)
+    for token, tf in list(counts.items()):
+        folded = fold_diacritics(token)
+        if folded != token:
+            counts[folded] += tf
+    return counts
+
+
+class LexicalIndex:
+    """Inverted index BM25 (chỉ đọc) của một collection, các mảng được memory-map."""
+
+    def __init__(self, path: Path, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+
+        meta = json.loads((self.path / "meta.json").read_text(encoding='utf-8'))
+        self.terms = {term: i for i, term in enumerate(meta['terms'])}
+        self.num_docs = meta['num_docs']
+        self.avgdl = meta['avgdl'] or 1.0
+        self.sources = meta['sources']
+
+        load = lambda name: np.load(self.path / f"{name}.npy", mmap_mode='r')
+        self.term_offsets = load("term_offsets")
+        self.postings_docs = load("postings_docs")
+        self.postings_tf = load("postings_tf")
+        self.doc_len = load("doc_len")
+        self.pages = load("pages")
+        self.source_ids = load("source_ids")
+        self.text_offsets = load("text_offsets")
+        texts_path = self.path / "texts.bin"
+        self._texts = np.memmap(texts_path, dtype=np.uint8, mode='r') if texts_path.stat().st_size else b""
+
+    @staticmethod
+    def build(path: Path, texts: Sequence[str], pages: Sequence[int], sources: Sequence[str]) -> None:
+        """
+        Build index từ danh sách chunk và ghi ra thư mục path.
+
+        Ghi vào thư mục tạm rồi đổi tên nên index cũ vẫn đọc được nếu build lỗi giữa chừng.
+        """
+        path = Path(path)
+        postings: Dict[str, List[tuple]] = {}
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc_id] = len(tokens)
+            for term, tf in document_terms(tokens).items():
+                postings.setdefault(term, []).append((doc_id, min(tf, _MAX_TF)))
+
+        terms = sorted(postings)
+        sizes = np.array([len(postings[t]) for t in terms], dtype=np.int64)
+        term_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        flat = [p for t in terms for p in postings[t]]
+        postings_docs = np.array([d for d, _ in flat], dtype=np.int32)
+        postings_tf = np.array([tf for _, tf in flat], dtype=np.uint16)
+
+        source_names = list(dict.fromkeys(sources))
+        source_index = {name: i for i, name in enumerate(source_names)}
+        encoded = [t.encode('utf-8') for t in texts]
+        text_offsets = np.concatenate([[0], np.cumsum([len(e) for e in encoded])]).astype(np.int64)
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        np.save(tmp_path / "term_offsets.npy", term_offsets)
+        np.save(tmp_path / "postings_docs.npy", postings_docs)
+        np.save(tmp_path / "postings_tf.npy", postings_tf)
+        np.save(tmp_path / "doc_len.npy", doc_len)
+        np.save(tmp_path / "pages.npy", np.asarray(pages, dtype=np.int32))
+        np.save(tmp_path / "source_ids.npy", np.array([source_index[s] for s in sources], dtype=np.int32))
+        np.save(tmp_path / "text_offsets.npy", text_offsets)
+        (tmp_path / "texts.bin").write_bytes(b"".join(encoded))
+        (tmp_path / "meta.json").write_text(json.dumps({
+            'terms': terms,
+            'num_docs': len(texts),
+            'avgdl': float(doc_len.mean()) if len(texts) else 0.0,
+            'sources': source_names
+        }, ensure_ascii=False), encoding='utf-8')
+
+        shutil.rmtree(path, ignore_errors=True)
+        tmp_path.rename(path)
+
+    def text(self, doc_id: int) -> str:
+        """Nội dung chunk doc_id."""
+        start, end = int(self.text_offsets[doc_id]), int(self.text_offsets[doc_id + 1])
+        return bytes(self._texts[start:end]).decode('utf-8')
+
+    def documents(self) -> Iterator[Dict[str, Any]]:
+        """Duyệt toàn bộ chunk (text, page, pdf_source) theo thứ tự doc id."""
+        for doc_id in range(self.num_docs):
+            yield self._row(doc_id)
+
+    def _row(self, doc_id: int) -> Dict[str, Any]:
+        return {
+            'text': self.text(doc_id),
+            'page': int(self.pages[doc_id]),
+            'pdf_source': self.sources[int(self.source_ids[doc_id])]
+        }
+
+    def search(self, query: str, top_k: int, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Tìm các chunk khớp query theo BM25.
+
+        bm25 thô phụ thuộc độ dài query và thống kê của từng collection nên không
+        so sánh được giữa các collection. 'lexical_score' chuẩn hóa bm25 về [0, 1)
+        bằng cách chia cho điểm tối đa query có thể đạt (Σ idf * (k1 + 1) của mọi
+        term trong query), tức là tỉ lệ "trọng lượng" của query mà chunk khớp.
+
+        Args:
+            query: Câu hỏi
+            top_k: Số kết quả tối đa
+            min_score: Bỏ các hit có lexical_score thấp hơn ngưỡng này
+
+        Returns:
+            List hit (text, page, pdf_source, bm25, lexical_score) sort theo bm25 giảm dần
+        """
+        if not self.num_docs:
+            return []
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        max_score = 0.0
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            df = 0 if term_id is None else int(self.term_offsets[term_id + 1] - self.term_offsets[term_id])
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            # Term không có trong từ điển vẫn tính vào điểm tối đa (chunk không khớp phần đó của query)
+            max_score += idf * (self.k1 + 1)
+            if term_id is None:
+                continue
+            start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            # Mỗi doc xuất hiện tối đa một lần trong postings của một term
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        candidates = np.flatnonzero(scores)
+        if min_score > 0 and len(candidates):
+            candidates = candidates[scores[candidates] >= min_score * max_score]
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        return [
+            dict(self._row(int(doc_id)), bm25=float(scores[doc_id]), lexical_score=float(scores[doc_id]) / max_score)
+            for doc_id in order
+        ]
+
+
+class LexicalIndexStore:
+    """Quản lý index BM25 của các collection trong LEXICAL_INDEX_DIR (cache index đã load)."""
+
+    def __init__(self, base_dir: str = LEXICAL_INDEX_DIR):
+        self.base_dir = Path(base_dir)
+        self._indexes: Dict[str, LexicalIndex] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        return self.base_dir / name
+
+    def has_index(self, name: str) -> bool:
+        return (self._path(name) / "meta.json").exists()
+
+    def get(self, name: str) -> Optional[LexicalIndex]:
+        """Index đã load của collection (None nếu chưa build)."""
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None and self.has_index(name):
+                index = self._indexes[name] = LexicalIndex(self._path(name))
+            return index
+
+    def add_documents(
+        self,
+        name: str,
+        texts: Sequence[str],
+        pages: Sequence[int],
+        sources: Sequence[str],
+        replace: bool = False
+    ) -> int:
+        """
+        Thêm chunk vào index của collection (build lại cả index, nhanh so với encode embedding).
+
+        Args:
+            name: Tên collection
+            texts, pages, sources: Dữ liệu các chunk mới
+            replace: True = bỏ dữ liệu cũ
+
+        Returns:
+            Tổng số chunk trong index
+        """
+        all_texts, all_pages, all_sources = [], [], []
+        existing = None if replace else self.get(name)
+        if existing is not None:
+            for row in existing.documents():
+                all_texts.append(row['text'])
+                all_pages.append(row['page'])
+                all_sources.append(row['pdf_source'])
+
+        all_texts.extend(texts)
+        all_pages.extend(int(p) for p in pages)
+        all_sources.extend(sources)
+
+        with self._lock:
+            # Đóng memory-map cũ trước khi ghi đè (Windows không cho xóa file đang map)
+            self._indexes.pop(name, None)
+            del existing
+            LexicalIndex.build(self._path(name), all_texts, all_pages, all_sources)
+
+        logger.info(f"🔤 Lexical index '{name}': {len(all_texts)} chunks")
+        return len(all_texts)
+
+    def build_from_vector_store(self, vector_store, name: str) -> int:
+        """Build lại index từ dữ liệu đã có trong vector store."""
+        texts, pages, sources = [], [], []
+        for row in _iter_collection_rows(vector_store, name):
+            texts.append(row.get('text', ''))
+            pages.append(int(row.get('page', 0)))
+            sources.append(row.get('pdf_source', 'Unknown'))
+        return self.add_documents(name, texts, pages, sources, replace=True)
+
+    def drop(self, name: str) -> None:
+        """Xóa index của collection."""
+        with self._lock:
+            self._indexes.pop(name, None)
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def search(self, name: str, query: str, top_k: int, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """BM25 search trong một collection ([] nếu collection chưa có index)."""
+        index = self.get(name)
+        return index.search(query, top_k, min_score=min_score) if index is not None else []
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[Sequence[Dict[str, Any]]],
+    k: int = RRF_K,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Gộp nhiều danh sách kết quả đã xếp hạng bằng reciprocal rank fusion.
+
+    Một chunk (cùng collection, trang, nội dung) xuất hiện ở nhiều danh sách được
+    cộng điểm 1 / (k + rank) và gộp các trường (vd 'score' từ vector, 'bm25' từ BM25).
+
+    Args:
+        ranked_lists: Các danh sách kết quả, mỗi danh sách sort theo độ liên quan giảm dần
+        k: Hằng số RRF (lớn hơn = giảm ảnh hưởng của thứ hạng đầu)
+        limit: Số kết quả tối đa (None = tất cả)
+
+    Returns:
+        List kết quả sort theo 'rrf_score' giảm dần
+    """
+    fused: Dict[tuple, Dict[str, Any]] = {}
+    for ranked in ranked_lists:
+        for rank, result in enumerate(ranked, 1):
+            key = (result.get('collection'), result.get('page'), result.get('text'))
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(result, rrf_score=0.0)
+            else:
+                for field, value in result.items():
+                    entry.setdefault(field, value)
+            entry['rrf_score'] += 1.0 / (k + rank)
+
+    results = sorted(fused.values(), key=lambda r: r['rrf_score'], reverse=True)
+    return results[:limit] if limit is not None else results
+
+
+def _iter_collection_rows(vector_store, name: str) -> Iterator[Dict[str, Any]]:
+    """Duyệt các row của collection (lọc theo partition khi dùng layout partitioned)."""
+    store, physical_name = vector_store.resolve(name)
+    for batch in store.iter_rows(physical_name):
+        for row in batch:
+            if physical_name != name and row.get('partition') != name:
+                continue
+            yield row
+
+
+_lexical_store: Optional[LexicalIndexStore] = None
+
+
+def get_lexical_store() -> LexicalIndexStore:
+    """Lấy LexicalIndexStore dùng chung (thư mục LEXICAL_INDEX_DIR)."""
+    global _lexical_store
+    if _lexical_store is None:
+        _lexical_store = LexicalIndexStore()
+    return _lexical_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 lexical index")
+    parser.add_argument("--build", nargs="*", metavar="COLLECTION",
+                        help="Build lại index từ vector store (không truyền tên = mọi collection)")
+    parser.add_argument("--search", metavar="QUERY", help="Thử BM25 search")
+    parser.add_argument("-c", "--collection", help="Collection dùng cho --search")
+    parser.add_argument("-k", "--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    store = get_lexical_store()
+
+    if args.build is not None:
+        from src.vector_store import get_vector_store
+        vector_store = get_vector_store()
+        for name in args.build or vector_store.list_collections():
+            count = store.build_from_vector_store(vector_store, name)
+            print(f"✅ {name}: {count} chunks")
+
+    if args.search:
+        if not args.collection:
+            parser.error("--search cần --collection")
+        for hit in store.search(args.collection, args.search, args.top_k):
+            print(f"[{hit['bm25']:.3f}] Trang {hit['page']}: {hit['text'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+LLM Health - Bảng trạng thái (API key, model) của Gemini.
+
+Thay vì gửi prompt thử ("Hi") mỗi lần khởi tạo hoặc chuyển key/model, trạng thái
+của từng cặp (key, model) được ghi lại từ chính các request thật:
+- request thành công → cặp đó "ok"
+- lỗi key (invalid, 401/403) → mọi model của key đó "failed"
+- lỗi model (404, quota/429...) → riêng cặp đó "failed"
+
+Bảng hoạt động như circuit breaker: cặp lỗi bị "ngắt" trong một khoảng cooldown
+(do RetryPolicy tính: Retry-After, hoặc tăng dần theo số lần lỗi liên tiếp), hết
+cooldown thì được thử lại ở request thật tiếp theo (half-open); thành công thì
+đóng lại và xóa bộ đếm lỗi. Failover chỉ bỏ qua các cặp đang bị ngắt, không tốn
+round trip cho prompt thử.
+"""
+
+import hashlib
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import LLM_HEALTH_TTL_SECONDS
+from src.logging_config import get_logger
+from src.llm_retry import AUTH, classify_error
+
+logger = get_logger(__name__)
+
+
+def key_id(api_key: str) -> str:
+    """Định danh key trong bảng health (không lưu key gốc)."""
+    return hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+def is_key_error(error: Any) -> bool:
+    """Lỗi do API key (sai, hết hạn, không có quyền) thay vì do model."""
+    return classify_error(error) == AUTH
+
+
+class HealthTable:
+    """Trạng thái / circuit breaker của (key, model), dùng chung giữa các LLMManager."""
+
+    def __init__(self, ttl_seconds: float = LLM_HEALTH_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._status: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._key_failures: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        """Trạng thái còn hiệu lực (ok: trong TTL, lỗi: trong cooldown)."""
+        return entry is not None and time.monotonic() < entry['until']
+
+    def status(self, api_key: str, model: str) -> Optional[bool]:
+        """
+        Trạng thái đã biết của cặp (key, model).
+
+        Returns:
+            True (ok), False (lỗi) hoặc None (chưa biết / đã hết hạn)
+        """
+        kid = key_id(api_key)
+        with self._lock:
+            if self._fresh(self._key_failures.get(kid)):
+                return False
+            entry = self._status.get((kid, model))
+            return entry['ok'] if self._fresh(entry) else None
+
+    def is_usable(self, api_key: str, model: str) -> bool:
+        """Cặp (key, model) chưa bị đánh dấu lỗi (ok hoặc chưa biết)."""
+        return self.status(api_key, model) is not False
+
+    def mark_ok(self, api_key: str, model: str):
+        """Ghi nhận request thành công."""
+        kid = key_id(api_key)
+        now = time.monotonic()
+        with self._lock:
+            self._status[(kid, model)] = {'ok': True, 'at': now, 'until': now + self.ttl_seconds, 'failures': 0}
+            self._key_failures.pop(kid, None)
+
+    def failures(self, api_key: str, model: str) -> int:
+        """Số lần lỗi liên tiếp của cặp (key, model) (reset khi request thành công)."""
+        with self._lock:
+            entry = self._status.get((key_id(api_key), model))
+            return entry['failures'] if entry is not None else 0
+
+    def mark_failed(self, api_key: str, model: str, error: Any, cooldown: Optional[float] = None):
+        """
+        Ghi nhận request lỗi và ngắt mạch cặp (key, model) (lỗi key → ngắt cả key).
+
+        Args:
+            api_key: API key của request
+            model: Model của request
+            error: Exception hoặc message lỗi
+            cooldown: Thời gian ngắt (giây); None = ttl_seconds, 0 = chỉ đếm lỗi, không ngắt
+        """
+        kid = key_id(api_key)
+        now = time.monotonic()
+        cooldown = self.ttl_seconds if cooldown is None else cooldown
+        with self._lock:
+            table, key = (self._key_failures, kid) if is_key_error(error) else (self._status, (kid, model))
+            previous = table.get(key)
+            entry = {
+                'ok': False,
+                'at': now,
+                'until': now + cooldown,
+                'failures': (previous['failures'] if previous is not None else 0) + 1,
+                'error': str(error)[:200]
+            }
+            table[key] = entry
+        logger.debug(
+            f"🩺 Đánh dấu lỗi key {kid}, model {model} (lần {entry['failures']}, ngắt {cooldown:.1f}s): "
+            f"{entry['error'][:80]}"
+        )
+
+    def retry_in(self, api_key: str, model: str) -> float:
+        """Số giây còn lại trước khi cặp (key, model) được thử lại (0 nếu dùng được)."""
+        kid = key_id(api_key)
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                entry['until'] - now
+                for entry in (self._key_failures.get(kid), self._status.get((kid, model)))
+                if entry is not None and not entry['ok']
+            ]
+        return max([0.0] + waits)
+
+    def clear(self):
+        """Xóa toàn bộ trạng thái."""
+        with self._lock:
+            self._status.clear()
+            self._key_failures.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Trạng thái còn hạn, dạng {"key_id/model": "ok" | "failed"} (dùng để hiển thị)."""
+        with self._lock:
+            result = {
+                f"{kid}/{model}": "ok" if entry['ok'] else "failed"
+                for (kid, model), entry in self._status.items() if self._fresh(entry)
+            }
+            result.update({
+                f"{kid}/*": "failed"
+                for kid, entry in self._key_failures.items() if self._fresh(entry)
+            })
+            return result
+
+
+_health_table: Optional[HealthTable] = None
+
+
+def get_health_table() -> HealthTable:
+    """Lấy HealthTable dùng chung (TTL = LLM_HEALTH_TTL_SECONDS)."""
+    global _health_table
+    if _health_table is None:
+        _health_table = HealthTable()
+    return _health_table
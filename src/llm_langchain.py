@@ -3,20 +3,29 @@ Tích hợp LangChain LLM - Giao diện LLM hợp nhất sử dụng LangChain
 
 Hybrid approach:
 - Gemini: google-generativeai trực tiếp (vì LangChain v1beta API không support nhiều models mới)
-- Ollama: LangChain wrapper (hoạt động tốt)
+- Ollama: LangChain LLM trên OllamaClient (session keep-alive dùng chung)
 
 Lợi ích:
 - Gemini: Truy cập đầy đủ 41+ models mới nhất (gemini-2.5-flash, gemini-2.0-flash, v.v.)
 - Ollama: Dùng LangChain cho tích hợp tốt và streaming
 - Interface thống nhất cho cả hai
 - Auto-fallback qua multiple keys và models
+- Health check lazy: không gửi prompt thử, trạng thái key/model lấy từ request thật
+- Key pool: mỗi key có client riêng, request chia round-robin theo quota RPM/TPM
+- Hedged request (tùy chọn): model chậm hơn p95 gần đây thì gửi thêm tới model/key dự phòng
+- Response cache (tùy chọn theo từng lời gọi): prompt giống hệt được trả lời từ SQLite
+- Usage: token, latency, TTFT, key, số lần thử và fallback của mỗi lời gọi (get_usage_tracker)
 """
 
+import asyncio
 import os
+import re
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Iterator, Union
 from dotenv import load_dotenv
 
 # Thêm thư mục gốc vào sys.path để import được src module
@@ -26,12 +35,19 @@ if str(project_root) not in sys.path:
 
 # Nhập LangChain (cho Ollama)
 from langchain_core.language_models import BaseLanguageModel
-from langchain_community.llms import Ollama
 
 # Nhập google-generativeai trực tiếp (cho Gemini)
 import google.generativeai as genai
 
 from src.logging_config import get_logger
+from src.llm_health import get_health_table
+from src.llm_retry import RetryPolicy, classify_error, get_retry_after, AUTH, NOT_FOUND, RATE_LIMIT, TRANSIENT, FATAL
+from src.gemini_pool import get_gemini_pool
+from src.context_packer import TokenCounter
+from src.llm_metrics import get_latency_tracker, get_usage_tracker
+from src.ollama_client import OllamaSessionLLM, get_ollama_client
+from src.response_cache import get_response_cache
+from src.config import LLM_HEDGE_ENABLED, LLM_MAX_CONCURRENCY
 
 logger = get_logger(__name__)
 
@@ -74,7 +90,8 @@ class LLMManager:
         provider: str = "gemini",  # "gemini" hoặc "ollama"
         model_name: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        hedge: Optional[bool] = None
     ):
         """
         Khởi tạo Trình quản lý LLM.
@@ -84,6 +101,7 @@ class LLMManager:
             model_name: Tên mô hình (nếu None, sử dụng mặc định)
             temperature: Nhiệt độ lấy mẫu (0-1)
             max_tokens: Số lượng token tối đa để tạo
+            hedge: Bật hedged request cho Gemini (None = theo LLM_HEDGE_ENABLED)
         """
         self.provider = provider
         self.model_name = model_name
@@ -98,6 +116,27 @@ class LLMManager:
         self.available_models: List[str] = GEMINI_MODELS.copy()
         self.current_model_index: int = 0
         
+        # Trạng thái (key, model) dùng chung, cập nhật từ các request thật
+        self.health = get_health_table()
+        self.key_pool = None
+        
+        # Backoff/jitter và cooldown circuit breaker khi request lỗi
+        self.retry_policy = RetryPolicy()
+        
+        # Hedged request: ngưỡng chờ lấy từ histogram độ trễ của từng model
+        self.hedge = LLM_HEDGE_ENABLED if hedge is None else hedge
+        self.latency = get_latency_tracker()
+        
+        # Thống kê token/latency/retry của từng lời gọi generate
+        self.usage = get_usage_tracker()
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        
+        # Cache response theo prompt (mở lazy ở lời gọi đầu tiên có cache=True)
+        self.response_cache = None
+        
+        # generate() có thể được gọi song song (vd câu hỏi con) → chỉ một thread khôi phục key/model
+        self._recover_lock = threading.Lock()
+        
         # Initialize LLM
         self._initialize_llm()
     
@@ -119,9 +158,10 @@ class LLMManager:
             raise ValueError("❌ Không tìm thấy Gemini API key trong .env")
         
         logger.info(f"📋 Tìm thấy {len(self.gemini_api_keys)} Gemini API key(s)")
+        self.key_pool = get_gemini_pool(self.gemini_api_keys)
         logger.info(f"📋 Có {len(self.available_models)} model(s): {', '.join(self.available_models)}")
         
-        # Thử tất cả các kết hợp key + model cho đến khi thành công
+        # Chọn kết hợp key + model đầu tiên chưa bị đánh dấu lỗi (không gọi API)
         for key_idx in range(len(self.gemini_api_keys)):
             self.current_key_index = key_idx
             for model_idx in range(len(self.available_models)):
@@ -137,39 +177,30 @@ class LLMManager:
         """
         Thử khởi tạo Gemini với key và model hiện tại.
         Dùng google-generativeai trực tiếp.
+        
+        Không gửi request thử: cặp (key, model) đã biết là lỗi trong health table
+        bị bỏ qua, còn lại được kiểm tra lazy ở request thật đầu tiên.
         Returns True nếu thành công.
         """
+        api_key = self.gemini_api_keys[self.current_key_index]
+        
+        # Luôn dùng model từ available_models theo index (để loop qua tất cả)
+        model = self.available_models[self.current_model_index]
+        
+        if not self.health.is_usable(api_key, model):
+            logger.debug(f"⏭️ Bỏ qua key {self.current_key_index + 1}, model {model} (đã lỗi gần đây)")
+            return False
+        
         try:
-            api_key = self.gemini_api_keys[self.current_key_index]
-            
-            # Luôn dùng model từ available_models theo index (để loop qua tất cả)
-            model = self.available_models[self.current_model_index]
-            
             # Mask API key cho log
             masked_key = api_key[:8] + "..." + api_key[-4:] if len(api_key) > 12 else "***"
             logger.info(f"🔑 Đang thử API key [{self.current_key_index + 1}/{len(self.gemini_api_keys)}]: {masked_key}")
             logger.info(f"🤖 Đang thử model [{self.current_model_index + 1}/{len(self.available_models)}]: {model}")
             
-            # Configure google-generativeai
-            genai.configure(api_key=api_key)
-            
-            # Khởi tạo model
-            generation_config = {
-                "temperature": self.temperature,
-            }
-            if self.max_tokens:
-                generation_config["max_output_tokens"] = self.max_tokens
-            
-            self.llm = genai.GenerativeModel(
-                model_name=model,
-                generation_config=generation_config
-            )
-            
-            # Test với prompt đơn giản
-            test_response = self.llm.generate_content("Hi")
+            # Model dùng client riêng của key (không gọi genai.configure global)
+            self.llm = self.key_pool.model(self.current_key_index, model, self._generation_config())
             
             logger.info(f"✅ Khởi tạo thành công Gemini: {model} (Key {self.current_key_index + 1})")
-            logger.info(f"   Test response: {test_response.text[:50]}...")
             self.model_name = model  # Cập nhật model_name
             return True
             
@@ -177,14 +208,23 @@ class LLMManager:
             logger.warning(f"⚠️ Thất bại với key {self.current_key_index + 1}, model {model}: {str(e)[:100]}")
             return False
     
+    def _generation_config(self) -> Dict[str, Any]:
+        """generation_config cho GenerativeModel."""
+        generation_config: Dict[str, Any] = {
+            "temperature": self.temperature,
+        }
+        if self.max_tokens:
+            generation_config["max_output_tokens"] = self.max_tokens
+        return generation_config
+    
     def _initialize_ollama(self):
-        """Initialize Ollama via LangChain."""
+        """Initialize Ollama (LangChain LLM trên session HTTP dùng chung)."""
         try:
             # Default model if not specified
             model = self.model_name or "llama3:latest"
             
-            # Initialize LangChain Ollama
-            self.llm = Ollama(
+            self.llm = OllamaSessionLLM(
+                client=get_ollama_client(),
                 model=model,
                 temperature=self.temperature,
                 num_predict=self.max_tokens
@@ -200,25 +240,24 @@ class LLMManager:
         """
         Lấy tất cả Gemini API keys từ môi trường.
         Hỗ trợ: 
-        - GEMINI_API_KEY hoặc GEMINI_API_KEY_1
-        - GEMINI_API_KEY_2
-        - GEMINI_API_KEY_3
-        - GEMINI_API_KEY_4
+        - GEMINI_API_KEY
+        - GEMINI_API_KEY_1, GEMINI_API_KEY_2, ... (không giới hạn số lượng)
+        
+        Key trùng nhau chỉ được tính một lần.
         """
+        numbered = sorted(
+            (int(match.group(1)), name)
+            for name in os.environ
+            if (match := re.fullmatch(r"GEMINI_API_KEY_(\d+)", name))
+        )
+        key_names = ["GEMINI_API_KEY"] + [name for _, name in numbered]
+        
         keys = []
-        for i in range(1, 5):  # Hỗ trợ tới 4 keys
-            # Thử cả 2 format: GEMINI_API_KEY và GEMINI_API_KEY_1
-            if i == 1:
-                key_names = ["GEMINI_API_KEY", "GEMINI_API_KEY_1"]
-            else:
-                key_names = [f"GEMINI_API_KEY_{i}"]
-            
-            for key_name in key_names:
-                key = os.getenv(key_name)
-                if key and key.strip():
-                    keys.append(key.strip())
-                    logger.debug(f"✓ Tìm thấy {key_name}")
-                    break  # Đã tìm thấy key cho slot này, không cần thử format khác
+        for key_name in key_names:
+            key = (os.getenv(key_name) or "").strip()
+            if key and key not in keys:
+                keys.append(key)
+                logger.debug(f"✓ Tìm thấy {key_name}")
         
         return keys
     
@@ -264,10 +303,13 @@ class LLMManager:
     
     def auto_recover(self) -> bool:
         """
-        Tự động khôi phục khi gặp lỗi bằng cách thử:
-        1. Model tiếp theo với key hiện tại
-        2. Key tiếp theo với model đầu tiên
+        Tự động khôi phục khi gặp lỗi.
+        
+        Key được key pool chọn round-robin cho từng request, nên chỉ cần:
+        1. Giữ model hiện tại nếu còn key chưa bị đánh dấu lỗi với model này
+        2. Nếu không, chuyển sang model tiếp theo còn key dùng được
         
+        Các cặp (key, model) đã biết là lỗi bị bỏ qua mà không gọi API.
         Returns True nếu khôi phục thành công.
         """
         if self.provider != "gemini":
@@ -275,19 +317,91 @@ class LLMManager:
         
         logger.info("🔧 Đang tự động khôi phục...")
         
-        # Thử 1: Chuyển model
-        if self.switch_gemini_model():
-            return True
+        current = (self.current_key_index, self.current_model_index)
+        total = len(self.available_models)
         
-        # Thử 2: Chuyển key (reset model về đầu)
-        self.current_model_index = 0
-        if self.switch_gemini_key():
-            return True
+        for offset in range(total):
+            model_idx = (current[1] + offset) % total
+            key_idx = self.key_pool.first_usable(self.available_models[model_idx], self.health)
+            if key_idx is None:
+                continue
+            self.current_key_index, self.current_model_index = key_idx, model_idx
+            if self._try_initialize_gemini():
+                return True
         
+        self.current_key_index, self.current_model_index = current
         logger.error("❌ Không thể tự động khôi phục")
         return False
     
-    def generate(self, prompt: str, auto_retry: bool = True, **kwargs) -> str:
+    def _cache_key(self, prompt: str, kwargs: Dict[str, Any]) -> str:
+        """Key response cache: (provider, model, temperature, max_tokens, kwargs, prompt)."""
+        if self.response_cache is None:
+            self.response_cache = get_response_cache()
+        return self.response_cache.make_key(
+            self.provider, self.model_name, self.temperature, prompt, self.max_tokens, kwargs
+        )
+    
+    def _cached_response(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            logger.info("💾 Trả lời từ response cache")
+        return cached
+    
+    def _store_response(self, key: Optional[str], text: str, ttl: Optional[float]):
+        if key is not None and text:
+            self.response_cache.put(key, text, ttl)
+    
+    def _new_call(self) -> Dict[str, Any]:
+        """Bản ghi usage của một lời gọi (các hàm generate bên trong điền model/key/token/attempts)."""
+        return {'provider': self.provider, 'model': self.model_name, 'requested_model': self.model_name, 'attempts': 1}
+    
+    def _track(
+        self,
+        call: Dict[str, Any],
+        start: float,
+        error: Optional[Exception] = None,
+        ttft: Optional[float] = None
+    ):
+        """Hoàn tất bản ghi usage (latency, fallback, lỗi) và ghi vào UsageTracker."""
+        call['latency'] = time.perf_counter() - start
+        call['ttft'] = ttft
+        call['fallback'] = call['model'] != call.pop('requested_model')
+        call['success'] = error is None
+        if error is not None:
+            call['error'] = f"{type(error).__name__}: {error}"
+        self.usage.record(call)
+    
+    @staticmethod
+    def _usage(model: str, slot: Any, prompt: str, text: str, response: Any = None) -> Dict[str, Any]:
+        """
+        Token của một request: lấy từ usage_metadata của Gemini, không có
+        (Ollama, response thiếu metadata) thì ước lượng theo TokenCounter.
+        """
+        metadata = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(metadata, 'prompt_token_count', None) or 0
+        completion_tokens = getattr(metadata, 'candidates_token_count', None) or 0
+        estimated = not prompt_tokens
+        if estimated:
+            prompt_tokens = TokenCounter.estimate(prompt)
+            completion_tokens = TokenCounter.estimate(text)
+        return {
+            'model': model,
+            'key': slot.index + 1 if slot is not None else None,
+            'prompt_tokens': int(prompt_tokens),
+            'completion_tokens': int(completion_tokens),
+            'estimated': estimated
+        }
+    
+    def generate(
+        self,
+        prompt: str,
+        auto_retry: bool = True,
+        cache: bool = False,
+        cache_ttl: Optional[float] = None,
+        **kwargs
+    ) -> str:
         """
         Generate text from prompt với tự động retry.
         
@@ -298,62 +412,545 @@ class LLMManager:
         Args:
             prompt: Input prompt
             auto_retry: Tự động thử lại với key/model khác nếu lỗi
+            cache: Dùng response cache (chỉ bật cho prompt cần câu trả lời ổn định)
+            cache_ttl: TTL của response khi lưu vào cache (None = mặc định)
             **kwargs: Additional arguments for LLM
             
         Returns:
             Generated text
         """
-        max_retries = 3
-        retry_count = 0
+        key = self._cache_key(prompt, kwargs) if cache else None
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+        
+        call, start = self._new_call(), time.perf_counter()
+        try:
+            text = self._generate(prompt, auto_retry, call, **kwargs)
+        except Exception as e:
+            self._track(call, start, error=e)
+            raise
+        self._track(call, start)
+        
+        self._store_response(key, text, cache_ttl)
+        return text
+    
+    def generate_batch(
+        self,
+        prompts: List[str],
+        concurrency: Optional[int] = None,
+        auto_retry: bool = True,
+        cache: bool = False,
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate nhiều prompt song song (vd chạy bộ câu hỏi đánh giá).
+        
+        Mỗi prompt đi qua generate() (retry, fallback, cache) nên quota RPM/TPM
+        của từng key vẫn do key pool kiểm soát; prompt lỗi không làm hỏng cả batch.
         
-        while retry_count < max_retries:
+        Args:
+            prompts: Danh sách prompt
+            concurrency: Số request chạy cùng lúc (None = LLM_MAX_CONCURRENCY của
+                provider, nhân số key với Gemini)
+            auto_retry: Tự động thử lại với key/model khác nếu lỗi
+            cache: Dùng response cache
+            **kwargs: Additional arguments for LLM
+            
+        Returns:
+            List cùng thứ tự với prompts, mỗi phần tử
+            {'success': True, 'text': str} hoặc {'success': False, 'error': str}
+        """
+        if concurrency is None:
+            concurrency = LLM_MAX_CONCURRENCY.get(self.provider, 1)
+            if self.provider == "gemini":
+                concurrency *= max(1, len(self.gemini_api_keys))
+        
+        def run(prompt: str) -> Dict[str, Any]:
+            try:
+                return {'success': True, 'text': self.generate(prompt, auto_retry=auto_retry, cache=cache, **kwargs)}
+            except Exception as e:
+                return {'success': False, 'error': f"{type(e).__name__}: {e}"}
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="llm-batch") as executor:
+            results = list(executor.map(run, prompts))
+        
+        succeeded = sum(result['success'] for result in results)
+        logger.info(
+            f"📦 Batch {succeeded}/{len(prompts)} prompt thành công "
+            f"trong {time.perf_counter() - start:.1f}s (concurrency={concurrency})"
+        )
+        return results
+    
+    def _generate(self, prompt: str, auto_retry: bool, call: Dict[str, Any], **kwargs) -> str:
+        """generate() không qua cache (điền usage vào `call`)."""
+        attempt = 0
+        
+        while True:
+            call['attempts'] = attempt + 1
             try:
                 if self.llm is None:
                     raise RuntimeError("LLM chưa được khởi tạo")
                 
                 # Gemini: Dùng generate_content() trực tiếp
+                # Key được chọn round-robin theo quota RPM/TPM còn lại của từng key
                 if self.provider == "gemini":
-                    response = self.llm.generate_content(prompt, **kwargs)  # type: ignore
-                    return response.text  # type: ignore
+                    if self.hedge:
+                        return self._generate_hedged(prompt, kwargs, call)
+                    return self._gemini_request(self.model_name, prompt, kwargs, call)
                 
                 # Ollama: Dùng LangChain invoke()
                 else:
                     response = self.llm.invoke(prompt, **kwargs)
                     # Extract text from response
                     if hasattr(response, 'content'):
-                        return str(response.content)
+                        text = str(response.content)
                     else:
-                        return str(response)
+                        text = str(response)
+                    call.update(self._usage(self.model_name, None, prompt, text))
+                    return text
                     
             except Exception as e:
-                error_msg = str(e).lower()
-                retry_count += 1
+                attempt += 1
+                # Lỗi của request Gemini đã được ghi vào health trong _gemini_request()
+                delay = self._retry_delay(e, None, None, attempt, auto_retry)
+                if delay is None:
+                    raise
+                if delay > 0:
+                    time.sleep(delay)
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        auto_retry: bool = True,
+        cache: bool = False,
+        cache_ttl: Optional[float] = None,
+        **kwargs
+    ) -> str:
+        """
+        Phiên bản async của generate() (cùng retry/fallback key/model).
+        
+        - Gemini: generate_content_async qua client async của key được chọn,
+          chờ quota bằng asyncio.sleep
+        - Ollama: LangChain ainvoke()
+        
+        Nhiều hội thoại trong cùng process dùng chung key pool và health table.
+        
+        Args:
+            prompt: Input prompt
+            auto_retry: Tự động thử lại với key/model khác nếu lỗi
+            cache: Dùng response cache (chỉ bật cho prompt cần câu trả lời ổn định)
+            cache_ttl: TTL của response khi lưu vào cache (None = mặc định)
+            **kwargs: Additional arguments for LLM
+            
+        Returns:
+            Generated text
+        """
+        key = self._cache_key(prompt, kwargs) if cache else None
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+        
+        call, start = self._new_call(), time.perf_counter()
+        try:
+            text = await self._agenerate(prompt, auto_retry, call, **kwargs)
+        except Exception as e:
+            self._track(call, start, error=e)
+            raise
+        self._track(call, start)
+        
+        self._store_response(key, text, cache_ttl)
+        return text
+    
+    async def _agenerate(self, prompt: str, auto_retry: bool, call: Dict[str, Any], **kwargs) -> str:
+        """agenerate() không qua cache (điền usage vào `call`)."""
+        attempt = 0
+        
+        while True:
+            call['attempts'] = attempt + 1
+            try:
+                if self.llm is None:
+                    raise RuntimeError("LLM chưa được khởi tạo")
                 
-                logger.error(f"❌ Lỗi generation (lần {retry_count}/{max_retries}): {e}")
+                if self.provider == "gemini":
+                    if self.hedge:
+                        return await self._agenerate_hedged(prompt, kwargs, call)
+                    return await self._agemini_request(self.model_name, prompt, kwargs, call)
                 
-                # Kiểm tra nếu là lỗi API key hoặc quota
-                is_api_error = any(keyword in error_msg for keyword in [
-                    'api key', 'quota', 'rate limit', 'invalid', 'expired',
-                    'permission', 'forbidden', '429', '401', '403', '404'
-                ])
+                response = await self.llm.ainvoke(prompt, **kwargs)
+                text = str(response.content) if hasattr(response, 'content') else str(response)
+                call.update(self._usage(self.model_name, None, prompt, text))
+                return text
+            
+            except Exception as e:
+                attempt += 1
+                # Lỗi của request Gemini đã được ghi vào health trong _gemini_request()
+                delay = self._retry_delay(e, None, None, attempt, auto_retry)
+                if delay is None:
+                    raise
+                if delay > 0:
+                    await asyncio.sleep(delay)
+    
+    def _gemini_request(
+        self,
+        model: str,
+        prompt: str,
+        kwargs: Dict[str, Any],
+        call: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Gửi một request Gemini tới model qua key được chọn từ pool.
+        
+        Độ trễ của request thành công được ghi vào histogram của model (token, key
+        được điền vào `call`); lỗi được ghi vào circuit breaker của cặp (key, model)
+        ngay tại đây (caller không cần ghi lại).
+        """
+        estimated_tokens = TokenCounter.estimate(prompt)
+        slot = self.key_pool.acquire(model, estimated_tokens, self.health)
+        start = time.perf_counter()
+        try:
+            llm = self.key_pool.model(slot.index, model, self._generation_config())
+            response = llm.generate_content(prompt, **kwargs)
+            text = response.text
+        except Exception as e:
+            self._record_failure(e, slot.api_key, model)
+            raise
+        self._record_success(slot, model, estimated_tokens, response, time.perf_counter() - start)
+        if call is not None:
+            call.update(self._usage(model, slot, prompt, text, response))
+        return text
+    
+    async def _agemini_request(
+        self,
+        model: str,
+        prompt: str,
+        kwargs: Dict[str, Any],
+        call: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Phiên bản async của _gemini_request() (generate_content_async, chờ quota bằng asyncio.sleep)."""
+        estimated_tokens = TokenCounter.estimate(prompt)
+        slot = await self.key_pool.aacquire(model, estimated_tokens, self.health)
+        start = time.perf_counter()
+        try:
+            llm = self.key_pool.async_model(slot.index, model, self._generation_config())
+            response = await llm.generate_content_async(prompt, **kwargs)
+            text = response.text
+        except Exception as e:
+            self._record_failure(e, slot.api_key, model)
+            raise
+        self._record_success(slot, model, estimated_tokens, response, time.perf_counter() - start)
+        if call is not None:
+            call.update(self._usage(model, slot, prompt, text, response))
+        return text
+    
+    def _record_success(self, slot, model: str, estimated_tokens: int, response: Any, elapsed: float):
+        """Cập nhật health, quota token và histogram độ trễ sau một request thành công."""
+        self.health.mark_ok(slot.api_key, model)
+        self.key_pool.record_usage(slot, estimated_tokens, response)
+        self.latency.record(model, elapsed)
+        self.current_key_index = slot.index
+    
+    def _hedge_target(self) -> Optional[str]:
+        """
+        Model cho request dự phòng.
+        
+        Model tiếp theo trong available_models còn key dùng được; nếu không có thì
+        chính model hiện tại qua key khác (pool chia round-robin), hoặc None nếu chỉ có 1 key.
+        """
+        models = self.available_models
+        start = models.index(self.model_name) + 1 if self.model_name in models else 0
+        for model in models[start:] + models[:start]:
+            if model != self.model_name and self.key_pool.first_usable(model, self.health) is not None:
+                return model
+        if len(self.key_pool.slots) > 1:
+            return self.model_name
+        return None
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        """Thread pool cho request chính + dự phòng (mỗi request hedged giữ tối đa 2 worker)."""
+        if self._hedge_executor is None:
+            workers = 2 * max(1, LLM_MAX_CONCURRENCY.get("gemini", 1))
+            self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+        return self._hedge_executor
+    
+    def _generate_hedged(self, prompt: str, kwargs: Dict[str, Any], call: Dict[str, Any]) -> str:
+        """
+        Hedged request: gửi tới model hiện tại, nếu chưa xong sau ngưỡng độ trễ
+        (phân vị LLM_HEDGE_PERCENTILE của model) thì gửi thêm cùng prompt tới
+        model/key dự phòng, lấy kết quả thành công về trước.
+        
+        Request gRPC đồng bộ không hủy được giữa chừng: request thua được hủy nếu
+        chưa bắt đầu, còn không thì chạy nốt trong nền và kết quả bị bỏ qua.
+        
+        Raises:
+            Lỗi của request đầu tiên nếu mọi request đều lỗi (để generate() retry)
+        """
+        primary = self.model_name
+        delay = self.latency.hedge_delay(primary)
+        executor = self._get_hedge_executor()
+        # Mỗi request có bản ghi usage riêng, chỉ bản ghi của request thắng được giữ
+        usages = {}
+        
+        def submit(model: str):
+            usage = {}
+            future = executor.submit(self._gemini_request, model, prompt, kwargs, usage)
+            usages[future] = usage
+            return future
+        
+        pending = {submit(primary)}
+        done, _ = wait(pending, timeout=delay)
+        if not done:
+            backup = self._hedge_target()
+            if backup is not None:
+                logger.info(f"🏁 {primary} chưa trả lời sau {delay:.2f}s, gửi thêm tới {backup}")
+                pending.add(submit(backup))
+        
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    call.update(usages[future])
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+    
+    async def _agenerate_hedged(self, prompt: str, kwargs: Dict[str, Any], call: Dict[str, Any]) -> str:
+        """Phiên bản async của _generate_hedged(): request thua bị hủy thật (task.cancel())."""
+        primary = self.model_name
+        delay = self.latency.hedge_delay(primary)
+        usages = {}
+        
+        def submit(model: str):
+            usage = {}
+            task = asyncio.ensure_future(self._agemini_request(model, prompt, kwargs, usage))
+            usages[task] = usage
+            return task
+        
+        pending = {submit(primary)}
+        
+        errors = []
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                backup = self._hedge_target()
+                if backup is not None:
+                    logger.info(f"🏁 {primary} chưa trả lời sau {delay:.2f}s, gửi thêm tới {backup}")
+                    pending.add(submit(backup))
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        call.update(usages[task])
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        auto_retry: bool = True,
+        cache: bool = False,
+        cache_ttl: Optional[float] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Generate text dạng stream: trả về từng đoạn text ngay khi LLM sinh ra.
+        
+        - Gemini: generate_content(stream=True)
+        - Ollama: LangChain stream()
+        
+        Retry/fallback key/model giống generate() nhưng chỉ áp dụng trước token
+        đầu tiên; lỗi sau khi đã stream một phần được raise cho caller.
+        
+        Args:
+            prompt: Input prompt
+            auto_retry: Tự động thử lại với key/model khác nếu lỗi
+            cache: Dùng response cache (hit → trả về cả câu trong một đoạn)
+            cache_ttl: TTL của response khi lưu vào cache (None = mặc định)
+            **kwargs: Additional arguments for LLM
+            
+        Yields:
+            Các đoạn text theo thứ tự
+        """
+        key = self._cache_key(prompt, kwargs) if cache else None
+        cached = self._cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        call, start, ttft = self._new_call(), time.perf_counter(), None
+        parts = []
+        try:
+            for chunk in self._generate_stream(prompt, auto_retry, call, **kwargs):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            self._track(call, start, error=e, ttft=ttft)
+            raise
+        self._track(call, start, ttft=ttft)
+        
+        # Chỉ lưu khi stream hoàn tất (caller dừng giữa chừng thì không tới đây)
+        self._store_response(key, "".join(parts), cache_ttl)
+    
+    def _generate_stream(self, prompt: str, auto_retry: bool, call: Dict[str, Any], **kwargs) -> Iterator[str]:
+        """generate_stream() không qua cache (điền usage vào `call` khi stream xong)."""
+        attempt = 0
+        
+        while True:
+            call['attempts'] = attempt + 1
+            api_key, model, slot, response = None, self.model_name, None, None
+            try:
+                if self.llm is None:
+                    raise RuntimeError("LLM chưa được khởi tạo")
                 
-                if auto_retry and is_api_error and self.provider == "gemini":
-                    logger.info("🔄 Đang thử khôi phục tự động...")
-                    
-                    if self.auto_recover():
-                        logger.info("✅ Khôi phục thành công, thử lại...")
-                        continue
-                    else:
-                        logger.error("❌ Không thể khôi phục")
-                        raise
+                if self.provider == "gemini":
+                    model = self.model_name
+                    estimated_tokens = TokenCounter.estimate(prompt)
+                    slot = self.key_pool.acquire(model, estimated_tokens, self.health)
+                    api_key = slot.api_key
+                    llm = self.key_pool.model(slot.index, model, self._generation_config())
+                    response = llm.generate_content(prompt, stream=True, **kwargs)
+                    chunks = (self._chunk_text(chunk) for chunk in response)
                 else:
-                    # Lỗi khác hoặc hết lượt retry
-                    if retry_count >= max_retries:
-                        logger.error(f"❌ Đã thử {max_retries} lần, vẫn thất bại")
+                    chunks = (self._chunk_text(chunk) for chunk in self.llm.stream(prompt, **kwargs))
+                
+                chunks = (text for text in chunks if text)
+                # Lỗi key/model/quota xuất hiện trước token đầu tiên → vẫn retry được
+                first = next(chunks, "")
+                
+            except Exception as e:
+                attempt += 1
+                delay = self._retry_delay(e, api_key, model, attempt, auto_retry)
+                if delay is None:
                     raise
+                if delay > 0:
+                    time.sleep(delay)
+                continue
+            
+            break
+        
+        if slot is not None:
+            self.current_key_index = slot.index
+        
+        parts = [first]
+        try:
+            if first:
+                yield first
+            for text in chunks:
+                parts.append(text)
+                yield text
+        except Exception as e:
+            # Đã stream một phần nên không retry, nhưng vẫn ghi lỗi vào circuit breaker như generate()
+            logger.error(f"❌ Lỗi generation giữa stream ({len(parts)} đoạn đã gửi): {e}")
+            if slot is not None:
+                self.key_pool.record_usage(slot, estimated_tokens, response)
+            if api_key is not None:
+                self._record_failure(e, api_key, model)
+            raise
         
-        # Fallback nếu vượt quá max_retries (không nên đến đây)
-        raise RuntimeError("Đã vượt quá số lần thử tối đa")
+        # Chỉ đánh dấu ok khi stream xong: mark_ok giữa chừng sẽ reset số lần lỗi liên tiếp
+        if api_key is not None:
+            self.health.mark_ok(api_key, model)
+        if slot is not None:
+            self.key_pool.record_usage(slot, estimated_tokens, response)
+        call.update(self._usage(model, slot, prompt, "".join(parts), response))
+    
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text của một chunk stream (Gemini response chunk, LangChain message hoặc str)."""
+        if isinstance(chunk, str):
+            return chunk
+        try:
+            text = chunk.content if hasattr(chunk, 'content') else chunk.text
+        except ValueError:
+            # Chunk Gemini không có text (vd chunk cuối chỉ chứa finish_reason)
+            return ""
+        return str(text or "")
+    
+    def _retry_delay(
+        self,
+        error: Exception,
+        api_key: Optional[str],
+        model: Optional[str],
+        attempt: int,
+        auto_retry: bool
+    ) -> Optional[float]:
+        """
+        Xử lý lỗi generation theo RetryPolicy.
+        
+        - Ghi lỗi vào circuit breaker của cặp (key, model) với cooldown theo loại lỗi
+        - Lỗi key/model/429 (Gemini): chuyển sang cặp còn dùng được, thử lại ngay
+        - 429 không còn cặp nào, lỗi tạm thời (5xx, timeout): chờ backoff có jitter
+          (tôn trọng Retry-After)
+        - Lỗi request (FATAL) hoặc hết số lần thử: không retry
+        
+        Returns:
+            Số giây cần chờ trước khi thử lại, hoặc None nếu caller phải raise lỗi
+        """
+        category = classify_error(error)
+        retry_after = get_retry_after(error)
+        policy = self.retry_policy
+        
+        logger.error(f"❌ Lỗi generation [{category}] (lần {attempt}/{policy.max_attempts}): {error}")
+        
+        if api_key is not None:
+            self._record_failure(error, api_key, model)
+        
+        if not auto_retry or category == FATAL:
+            return None
+        if attempt >= policy.max_attempts:
+            logger.error(f"❌ Đã thử {policy.max_attempts} lần, vẫn thất bại")
+            return None
+        
+        if self.provider == "gemini" and category in (AUTH, NOT_FOUND, RATE_LIMIT):
+            logger.info("🔄 Đang thử khôi phục tự động...")
+            
+            with self._recover_lock:
+                recovered = self.auto_recover()
+            
+            if recovered:
+                logger.info("✅ Khôi phục thành công, thử lại...")
+                return 0.0
+            if category != RATE_LIMIT:
+                logger.error("❌ Không thể khôi phục")
+                return None
+            # Mọi cặp đều đang bị ngắt → chờ tới khi cặp sớm nhất được thử lại
+            retry_after = max(retry_after or 0.0, self._breaker_wait())
+        
+        if category not in (RATE_LIMIT, TRANSIENT):
+            return None
+        
+        delay = policy.backoff(attempt, retry_after)
+        if delay is None:
+            logger.error(f"❌ Server yêu cầu chờ {retry_after:.0f}s (> {policy.max_delay}s), không thử lại")
+        else:
+            logger.info(f"⏳ Chờ {delay:.1f}s trước khi thử lại...")
+        return delay
+    
+    def _record_failure(self, error: Exception, api_key: str, model: str):
+        """Ghi lỗi vào circuit breaker của cặp (key, model) với cooldown theo loại lỗi."""
+        category = classify_error(error)
+        if category == FATAL:
+            return
+        failures = self.health.failures(api_key, model) + 1
+        cooldown = self.retry_policy.cooldown(category, failures, get_retry_after(error))
+        self.health.mark_failed(api_key, model, error, cooldown=cooldown)
+    
+    def _breaker_wait(self) -> float:
+        """Số giây tới khi có cặp (key, model hiện tại) hết bị ngắt mạch."""
+        if not self.gemini_api_keys:
+            return 0.0
+        return min(self.health.retry_in(api_key, self.model_name) for api_key in self.gemini_api_keys)
     
     def generate_with_history(
         self,
@@ -364,7 +961,7 @@ class LLMManager:
         """
         Generate with conversation history.
         
-        NOTE: Hiện tại chỉ support cho Ollama (dùng LangChain messages).
+        NOTE: Hiện tại chỉ support cho Ollama (/api/chat, message dạng dict).
         Gemini sẽ dùng format khác (chưa implement).
         
         Args:
@@ -381,34 +978,19 @@ class LLMManager:
             logger.warning("generate_with_history chưa support Gemini, dùng generate() thay thế")
             return self.generate(prompt, **kwargs)
         
-        # Ollama: Dùng LangChain messages (cần import)
+        # Ollama: Gửi thẳng history dạng dict qua /api/chat
         try:
-            from langchain_core.messages import HumanMessage, SystemMessage
-            
             if self.llm is None:
                 raise RuntimeError("LLM not initialized")
             
-            # Build messages from history
-            messages = []
-            
-            if history:
-                for msg in history:
-                    if msg['role'] == 'user':
-                        messages.append(HumanMessage(content=msg['content']))
-                    elif msg['role'] == 'assistant':
-                        messages.append(SystemMessage(content=msg['content']))
-            
-            # Add current prompt
-            messages.append(HumanMessage(content=prompt))
+            messages = [
+                {'role': msg['role'], 'content': msg['content']}
+                for msg in history or []
+                if msg['role'] in ('user', 'assistant')
+            ]
+            messages.append({'role': 'user', 'content': prompt})
             
-            # Generate
-            response = self.llm.invoke(messages, **kwargs)
-            
-            # Extract text
-            if hasattr(response, 'content'):
-                return str(response.content)  # type: ignore
-            else:
-                return str(response)
+            return self.llm.chat(messages, **kwargs)
                 
         except Exception as e:
             logger.error(f"Generation with history error: {e}")
@@ -441,9 +1023,18 @@ class LLMManager:
                 'current_key_index': self.current_key_index + 1,
                 'total_keys': len(self.gemini_api_keys),
                 'current_model_index': self.current_model_index + 1,
-                'available_models': self.available_models
+                'available_models': self.available_models,
+                'health': self.health.snapshot(),
+                'key_quota': self.key_pool.stats() if self.key_pool else [],
+                'hedge': self.hedge,
+                'latency': self.latency.snapshot()
             })
         
+        info['usage'] = self.usage.summary()['totals']
+        
+        if self.response_cache is not None:
+            info['response_cache'] = self.response_cache.stats()
+        
         return info
     
     def get_langchain_llm(self) -> BaseLanguageModel:
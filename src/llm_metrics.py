@@ -0,0 +1,315 @@
+"""
+LLM Metrics - Histogram độ trễ và thống kê usage của các lời gọi LLM.
+
+- LatencyTracker: độ trễ từng request thành công theo model. Phân vị của các
+  request gần nhất (vd p95) được dùng làm ngưỡng hedging: model chính chưa trả
+  lời sau ngưỡng này thì gửi thêm cùng prompt tới model/key dự phòng.
+- UsageTracker: mỗi lời gọi generate() (token prompt/output, latency, thời gian
+  tới token đầu tiên, model, key, số lần thử, fallback) được cộng dồn theo model
+  để hiển thị (lệnh `stats` của agent) và export cho dashboard.
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import (
+    LLM_LATENCY_WINDOW,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_DEFAULT_DELAY,
+    LLM_USAGE_WINDOW,
+    LLM_USAGE_EXPORT_FILE,
+)
+
+
+class LatencyHistogram:
+    """Độ trễ (giây) của `window` request gần nhất, thread-safe."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        """Ghi một mẫu độ trễ."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Phân vị p (0-100) theo nearest-rank.
+
+        Returns:
+            Độ trễ (giây) hoặc None nếu chưa có mẫu nào
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(p / 100 * len(samples)))
+        return samples[min(rank, len(samples)) - 1]
+
+
+class LatencyTracker:
+    """
+    Histogram độ trễ theo model, dùng chung giữa các LLMManager.
+    """
+
+    def __init__(
+        self,
+        window: int = LLM_LATENCY_WINDOW,
+        percentile: float = LLM_HEDGE_PERCENTILE,
+        min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        default_delay: float = LLM_HEDGE_DEFAULT_DELAY
+    ):
+        """
+        Args:
+            window: Số request gần nhất giữ lại cho mỗi model
+            percentile: Phân vị dùng làm ngưỡng hedging
+            min_samples: Số mẫu tối thiểu trước khi dùng phân vị
+            default_delay: Ngưỡng hedging khi chưa đủ mẫu (giây)
+        """
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, model: str) -> LatencyHistogram:
+        """Histogram của model (tạo mới nếu chưa có)."""
+        with self._lock:
+            if model not in self._histograms:
+                self._histograms[model] = LatencyHistogram(self.window)
+            return self._histograms[model]
+
+    def record(self, model: str, seconds: float):
+        """Ghi độ trễ của một request thành công."""
+        self.histogram(model).record(seconds)
+
+    def hedge_delay(self, model: str) -> float:
+        """Thời gian chờ model trả lời trước khi gửi request dự phòng (giây)."""
+        histogram = self.histogram(model)
+        if len(histogram) < self.min_samples:
+            return self.default_delay
+        return histogram.percentile(self.percentile)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/p99 (ms) và số mẫu của từng model (dùng để hiển thị)."""
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {
+            model: {
+                'count': len(histogram),
+                **{f"p{p}_ms": round(histogram.percentile(p) * 1000, 1) for p in (50, 95, 99)}
+            }
+            for model, histogram in histograms.items() if len(histogram)
+        }
+
+
+_latency_tracker: Optional[LatencyTracker] = None
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """Lấy LatencyTracker dùng chung."""
+    global _latency_tracker
+    if _latency_tracker is None:
+        _latency_tracker = LatencyTracker()
+    return _latency_tracker
+
+
+class UsageTracker:
+    """
+    Thống kê usage của các lời gọi LLM.
+
+    Bộ đếm (số lời gọi, lỗi, retry, fallback, token) cộng dồn từ lúc chạy;
+    histogram latency/TTFT và danh sách lời gọi gần nhất giữ `window` mẫu.
+    """
+
+    _COUNTERS = ('calls', 'errors', 'retries', 'fallbacks', 'prompt_tokens', 'completion_tokens', 'estimated')
+
+    def __init__(self, window: int = LLM_USAGE_WINDOW):
+        """
+        Args:
+            window: Số lời gọi gần nhất giữ lại (histogram và recent())
+        """
+        self.window = window
+        self._calls: Deque[Dict[str, Any]] = deque(maxlen=window)
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, call: Dict[str, Any]):
+        """
+        Ghi một lời gọi LLM.
+
+        Args:
+            call: Dict gồm provider, model, key (số thứ tự key, None với Ollama),
+                prompt_tokens, completion_tokens, estimated (token ước lượng),
+                latency, ttft (giây, None nếu không stream), attempts, fallback,
+                success, error
+        """
+        call = dict(call, time=call.get('time', time.time()))
+        model = call.get('model') or "unknown"
+        with self._lock:
+            self._calls.append(call)
+            stats = self._models.get(model)
+            if stats is None:
+                stats = self._models[model] = {
+                    'provider': call.get('provider'),
+                    **{name: 0 for name in self._COUNTERS},
+                    'latency': LatencyHistogram(self.window),
+                    'ttft': LatencyHistogram(self.window),
+                    'keys': {}
+                }
+            stats['calls'] += 1
+            stats['retries'] += max(0, call.get('attempts', 1) - 1)
+            stats['fallbacks'] += bool(call.get('fallback'))
+            if not call.get('success', True):
+                stats['errors'] += 1
+                return
+            stats['prompt_tokens'] += call.get('prompt_tokens') or 0
+            stats['completion_tokens'] += call.get('completion_tokens') or 0
+            stats['estimated'] += bool(call.get('estimated'))
+            if call.get('key') is not None:
+                stats['keys'][call['key']] = stats['keys'].get(call['key'], 0) + 1
+        if call.get('latency') is not None:
+            stats['latency'].record(call['latency'])
+        if call.get('ttft') is not None:
+            stats['ttft'].record(call['ttft'])
+
+    def recent(self, n: int = 20) -> List[Dict[str, Any]]:
+        """n lời gọi gần nhất (mới nhất ở cuối)."""
+        with self._lock:
+            return list(self._calls)[-n:]
+
+    @staticmethod
+    def _percentiles_ms(histogram: LatencyHistogram) -> Dict[str, Optional[float]]:
+        return {
+            f"p{p}_ms": (round(value * 1000, 1) if (value := histogram.percentile(p)) is not None else None)
+            for p in (50, 95, 99)
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Tổng hợp usage.
+
+        Returns:
+            {'uptime_seconds', 'totals': {calls, errors, ...}, 'models': {model: {...,
+            'latency': {p50_ms, p95_ms, p99_ms}, 'ttft': {...}, 'keys': {key: calls}}}}
+        """
+        with self._lock:
+            models = {model: dict(stats, keys=dict(stats['keys'])) for model, stats in self._models.items()}
+
+        totals = {name: sum(stats[name] for stats in models.values()) for name in self._COUNTERS}
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'totals': totals,
+            'models': {
+                model: {
+                    **{name: stats[name] for name in ('provider',) + self._COUNTERS},
+                    'latency': self._percentiles_ms(stats['latency']),
+                    'ttft': self._percentiles_ms(stats['ttft']),
+                    'keys': dict(stats['keys'])
+                }
+                for model, stats in models.items()
+            }
+        }
+
+    def format_summary(self) -> str:
+        """Bảng usage dạng text (cho lệnh `stats`)."""
+        summary = self.summary()
+        totals = summary['totals']
+        if not totals['calls']:
+            return "Chưa có lời gọi LLM nào."
+
+        lines = [
+            f"📊 LLM usage ({totals['calls']} lời gọi, {summary['uptime_seconds']:.0f}s)",
+            f"   Token: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} output"
+            f" | Lỗi: {totals['errors']} | Retry: {totals['retries']} | Fallback: {totals['fallbacks']}",
+        ]
+        fmt = lambda value: "-" if value is None else f"{value:.0f}"
+        for model, stats in summary['models'].items():
+            succeeded = max(1, stats['calls'] - stats['errors'])
+            latency, ttft = stats['latency'], stats['ttft']
+            lines.append(f"\n   {model} ({stats['provider']}): {stats['calls']} lời gọi, {stats['errors']} lỗi")
+            lines.append(
+                f"      Token TB: {stats['prompt_tokens'] / succeeded:.0f} prompt / "
+                f"{stats['completion_tokens'] / succeeded:.0f} output"
+                + (" (ước lượng)" if stats['estimated'] else "")
+            )
+            lines.append(
+                f"      Latency ms: p50 {fmt(latency['p50_ms'])} | p95 {fmt(latency['p95_ms'])} | p99 {fmt(latency['p99_ms'])}"
+            )
+            if ttft['p50_ms'] is not None:
+                lines.append(f"      TTFT ms: p50 {fmt(ttft['p50_ms'])} | p95 {fmt(ttft['p95_ms'])}")
+            if stats['keys']:
+                lines.append("      Key: " + ", ".join(f"#{key}: {n}" for key, n in sorted(stats['keys'].items())))
+        return "\n".join(lines)
+
+    def export(self, path: str = LLM_USAGE_EXPORT_FILE) -> Path:
+        """
+        Export usage cho dashboard.
+
+        Args:
+            path: File .prom (Prometheus text format, dùng với node_exporter textfile
+                collector) hoặc file JSON (summary + các lời gọi gần nhất)
+
+        Returns:
+            Đường dẫn file đã ghi
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            content = self._prometheus()
+        else:
+            content = json.dumps(
+                {'summary': self.summary(), 'recent_calls': self.recent(self.window)},
+                ensure_ascii=False, indent=2
+            )
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+        return path
+
+    def _prometheus(self) -> str:
+        lines = []
+        models = self.summary()['models']
+        for name in self._COUNTERS:
+            metric = f"llm_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{model="{model}"}} {stats[name]}' for model, stats in models.items())
+        for kind in ('latency', 'ttft'):
+            metric = f"llm_{kind}_ms"
+            lines.append(f"# TYPE {metric} summary")
+            for model, stats in models.items():
+                for p in (50, 95, 99):
+                    value = stats[kind][f"p{p}_ms"]
+                    if value is not None:
+                        lines.append(f'{metric}{{model="{model}",quantile="{p / 100}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+_usage_tracker: Optional[UsageTracker] = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Lấy UsageTracker dùng chung."""
+    global _usage_tracker
+    if _usage_tracker is None:
+        _usage_tracker = UsageTracker()
+    return _usage_tracker
@@ -0,0 +1,207 @@
+"""
+LLM Retry - Phân loại lỗi, backoff và thời gian ngắt mạch cho request LLM.
+
+Thay cho việc retry ngay lập tức và so khớp chuỗi ('invalid', '404'...):
+- Lỗi được phân loại theo kiểu exception của google.api_core (fallback theo
+  message cho lỗi không có kiểu, vd từ LangChain/Ollama)
+- Thời gian chờ theo exponential backoff + full jitter, tôn trọng Retry-After
+  (header HTTP hoặc RetryInfo của gRPC) khi server gửi về
+- Thời gian ngắt mạch (circuit breaker) của mỗi cặp (key, model) tăng theo số
+  lần lỗi liên tiếp, để một loạt lỗi 429 không biến thành retry storm
+"""
+
+import random
+import re
+import sys
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from google.api_core import exceptions as google_exceptions
+
+from src.config import (
+    LLM_RETRY_MAX_ATTEMPTS,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_CIRCUIT_COOLDOWN_SECONDS,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_HEALTH_TTL_SECONDS,
+)
+
+# Loại lỗi
+AUTH = "auth"                # Key sai / hết hạn / không có quyền → bỏ cả key
+NOT_FOUND = "not_found"      # Model không tồn tại với key này
+RATE_LIMIT = "rate_limit"    # 429 / hết quota → chờ hoặc đổi key
+TRANSIENT = "transient"      # 5xx, timeout, mất kết nối → backoff rồi thử lại
+FATAL = "fatal"              # Lỗi request (prompt sai, bị chặn...) → không retry
+
+# Fallback khi exception không có kiểu (so khớp message, thứ tự ưu tiên từ trên xuống)
+_MESSAGE_RULES = [
+    (RATE_LIMIT, ('429', 'quota', 'rate limit', 'resource exhausted', 'resource_exhausted', 'too many requests')),
+    (AUTH, ('api key', 'api_key', 'unauthenticated', 'unauthorized', 'permission', 'forbidden', 'expired', '401', '403')),
+    (NOT_FOUND, ('404', 'not found')),
+    (TRANSIENT, ('500', '502', '503', '504', 'unavailable', 'overloaded', 'internal error',
+                 'timeout', 'timed out', 'deadline', 'connection')),
+]
+
+_RETRY_IN = re.compile(r"retry in\s+(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+
+def classify_error(error: Any) -> str:
+    """
+    Phân loại lỗi của request LLM.
+
+    Args:
+        error: Exception (hoặc message lỗi)
+
+    Returns:
+        AUTH, NOT_FOUND, RATE_LIMIT, TRANSIENT hoặc FATAL
+    """
+    message = str(error).lower()
+
+    if isinstance(error, BaseException):
+        # Lỗi có kiểu riêng (vd KeyPoolExhausted) tự khai báo loại
+        category = getattr(error, 'category', None)
+        if category:
+            return category
+        if isinstance(error, (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)):
+            return AUTH
+        if isinstance(error, google_exceptions.InvalidArgument):
+            # Gemini trả 400 (không phải 401) khi API key sai
+            return AUTH if 'api key' in message or 'api_key' in message else FATAL
+        if isinstance(error, google_exceptions.NotFound):
+            return NOT_FOUND
+        if isinstance(error, google_exceptions.TooManyRequests):
+            return RATE_LIMIT
+        if isinstance(error, (google_exceptions.ServerError, ConnectionError, TimeoutError)):
+            return TRANSIENT
+        if isinstance(error, google_exceptions.GoogleAPICallError):
+            return FATAL
+
+    for category, keywords in _MESSAGE_RULES:
+        if any(keyword in message for keyword in keywords):
+            return category
+    return FATAL
+
+
+def get_retry_after(error: Any) -> Optional[float]:
+    """
+    Thời gian (giây) server yêu cầu chờ trước khi thử lại, nếu có.
+
+    Đọc lần lượt: thuộc tính retry_after, header Retry-After của response HTTP,
+    RetryInfo trong details của lỗi gRPC, rồi message ("retry in 23.5s").
+    """
+    retry_after = getattr(error, 'retry_after', None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        value = headers.get('Retry-After')
+        if value is not None:
+            parsed = _parse_retry_after_header(str(value))
+            if parsed is not None:
+                return parsed
+
+    for detail in getattr(error, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and hasattr(delay, 'seconds'):
+            return delay.seconds + getattr(delay, 'nanos', 0) / 1e9
+
+    message = str(error)
+    match = _RETRY_IN.search(message) or _RETRY_DELAY.search(message)
+    return float(match.group(1)) if match else None
+
+
+def _parse_retry_after_header(value: str) -> Optional[float]:
+    """Retry-After dạng số giây hoặc HTTP-date."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Chính sách retry: số lần thử, backoff có jitter và cooldown của circuit breaker.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = LLM_RETRY_MAX_ATTEMPTS,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY,
+        cooldown: float = LLM_CIRCUIT_COOLDOWN_SECONDS,
+        failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD,
+        max_cooldown: float = LLM_HEALTH_TTL_SECONDS,
+        rng: Callable[[], float] = random.random
+    ):
+        """
+        Args:
+            max_attempts: Tổng số lần gửi request (kể cả lần đầu)
+            base_delay: Backoff của lần retry đầu tiên (giây), nhân đôi mỗi lần
+            max_delay: Thời gian chờ tối đa giữa hai lần thử (giây)
+            cooldown: Thời gian ngắt mạch cơ bản cho lỗi 429/tạm thời (nhân đôi theo số lần lỗi liên tiếp)
+            failure_threshold: Số lỗi tạm thời liên tiếp trước khi ngắt mạch cặp (key, model)
+            max_cooldown: Thời gian ngắt mạch tối đa (cũng dùng cho lỗi key/model)
+            rng: Hàm random trong [0, 1) (thay được trong test)
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cooldown_base = cooldown
+        self.failure_threshold = failure_threshold
+        self.max_cooldown = max_cooldown
+        self._rng = rng
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Thời gian chờ trước lần thử tiếp theo (full jitter).
+
+        Args:
+            attempt: Số lần đã thử (1 = vừa lỗi lần đầu)
+            retry_after: Thời gian server yêu cầu chờ (nếu có)
+
+        Returns:
+            Số giây cần chờ, hoặc None nếu server yêu cầu chờ lâu hơn max_delay (không nên retry)
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = self._rng() * ceiling
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    def cooldown(self, category: str, failures: int, retry_after: Optional[float] = None) -> float:
+        """
+        Thời gian ngắt mạch cặp (key, model) sau lần lỗi thứ `failures` liên tiếp.
+
+        - Lỗi key/model: ngắt tối đa (max_cooldown)
+        - 429: theo Retry-After nếu có, không thì cooldown nhân đôi theo số lần lỗi
+        - Lỗi tạm thời: chỉ ngắt khi đạt failure_threshold lần liên tiếp
+        """
+        if category in (AUTH, NOT_FOUND):
+            return self.max_cooldown
+        if category == TRANSIENT and failures < self.failure_threshold:
+            return 0.0
+        if category == RATE_LIMIT and retry_after is not None:
+            return min(self.max_cooldown, retry_after)
+        if category == TRANSIENT:
+            failures -= self.failure_threshold - 1
+        return min(self.max_cooldown, self.cooldown_base * 2 ** (failures - 1))
@@ -1,6 +1,8 @@
 import os
 import sys
+import threading
 from pathlib import Path
+from typing import Dict, Set
 from dotenv import load_dotenv
 from pymilvus import (
     connections,
@@ -52,6 +54,103 @@ def connect_to_milvus():
         print(f"❌ Lỗi không thể kết nối đến Milvus: {e}")
         raise
 
+# --- CACHE COLLECTION HANDLES ĐÃ LOAD ---
+
+class CollectionHandleCache:
+    """
+    Cache các Collection handle đã load cho một connection alias.
+    
+    Collection(name) tốn RPC describe collection, collection.load() tốn thêm một
+    round trip (vài giây nếu collection đã bị release). Cache giữ handle và trạng
+    thái load để hot path (search/query) không gọi thêm RPC metadata nào sau warm-up.
+    
+    Phải gọi invalidate() khi collection bị drop hoặc rebuild.
+    """
+    
+    def __init__(self, alias: str = DEFAULT_ALIAS):
+        self.alias = alias
+        self._handles: Dict[str, Collection] = {}
+        self._loaded: Set[str] = set()
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'invalidations': 0}
+    
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            if name not in self._name_locks:
+                self._name_locks[name] = threading.Lock()
+            return self._name_locks[name]
+    
+    def get(self, name: str, load: bool = True) -> Collection:
+        """
+        Lấy handle của collection, tạo và load nếu chưa có trong cache.
+        
+        Args:
+            name: Tên collection
+            load: Đảm bảo collection đã được load vào memory (cần cho search/query)
+            
+        Returns:
+            Collection handle
+        """
+        handle = self._handles.get(name)
+        if handle is not None and (not load or name in self._loaded):
+            self.stats['hits'] += 1
+            return handle
+        
+        # Chỉ một thread tạo/load cho mỗi collection, các collection khác không bị chặn
+        with self._name_lock(name):
+            handle = self._handles.get(name)
+            if handle is None:
+                self.stats['misses'] += 1
+                handle = Collection(name, using=self.alias)
+                self._handles[name] = handle
+            
+            if load and name not in self._loaded:
+                logger.info(f"Load collection '{name}' vào memory")
+                handle.load()
+                self._loaded.add(name)
+                self.stats['loads'] += 1
+        
+        return handle
+    
+    def is_loaded(self, name: str) -> bool:
+        """Collection đã được load qua cache này chưa."""
+        return name in self._loaded
+    
+    def mark_unloaded(self, name: str):
+        """Đánh dấu collection cần load lại (ví dụ server báo collection chưa load)."""
+        self._loaded.discard(name)
+    
+    def release(self, name: str):
+        """Release collection khỏi memory của Milvus (ví dụ trước khi rebuild index)."""
+        handle = self._handles.get(name)
+        if handle is not None and name in self._loaded:
+            handle.release()
+        self._loaded.discard(name)
+    
+    def invalidate(self, name: str):
+        """Bỏ handle khỏi cache (gọi khi collection bị drop hoặc tạo lại)."""
+        with self._lock:
+            self._handles.pop(name, None)
+            self._loaded.discard(name)
+            self.stats['invalidations'] += 1
+    
+    def clear(self):
+        """Xóa toàn bộ cache (ví dụ khi connection bị đóng)."""
+        with self._lock:
+            self._handles.clear()
+            self._loaded.clear()
+
+
+_handle_caches: Dict[str, CollectionHandleCache] = {}
+
+def get_handle_cache(alias: str = DEFAULT_ALIAS) -> CollectionHandleCache:
+    """Lấy cache handle cho connection alias (mỗi connection một cache)."""
+    if alias not in _handle_caches:
+        _handle_caches[alias] = CollectionHandleCache(alias)
+    return _handle_caches[alias]
+
+
 def get_or_create_collection(collection_name: str, dim: int = 768, recreate: bool = True) -> Collection:
     """
     Lấy hoặc tạo mới một collection trong Milvus.
@@ -71,6 +170,7 @@ def get_or_create_collection(collection_name: str, dim: int = 768, recreate: boo
         logger.info(f"Yêu cầu tạo lại, xóa collection '{collection_name}'")
         print(f"🗑️ Yêu cầu tạo lại, đang xóa collection '{collection_name}'...")
         utility.drop_collection(collection_name, using=DEFAULT_ALIAS)
+        get_handle_cache().invalidate(collection_name)
         logger.info(f"Đã xóa collection '{collection_name}'")
         print(f"   -> Đã xóa collection '{collection_name}'.")
 
@@ -78,7 +178,7 @@ def get_or_create_collection(collection_name: str, dim: int = 768, recreate: boo
     if utility.has_collection(collection_name, using=DEFAULT_ALIAS):
         logger.info(f"Collection '{collection_name}' đã tồn tại, đang tải")
         print(f"✔️ Collection '{collection_name}' đã tồn tại. Đang tải...")
-        return Collection(collection_name, using=DEFAULT_ALIAS)
+        return get_handle_cache().get(collection_name, load=False)
     
     # --- Nếu collection chưa tồn tại, tạo mới ---
     logger.info(f"Collection '{collection_name}' chưa tồn tại, tạo mới")
@@ -107,12 +207,15 @@ def get_or_create_collection(collection_name: str, dim: int = 768, recreate: boo
     
     logger.info("Tạo index cho collection")
     print("   -> Đang tạo index cho collection...")
-    index_params = {
-        "metric_type": "L2",
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 1024}
-    }
+    # Collection rỗng dùng FLAT; IndexPolicy.ensure_index nâng cấp khi dữ liệu lớn lên
+    from src.index_policy import choose_index_params
+    index_params = choose_index_params(0)
     collection.create_index(field_name="embedding", index_params=index_params)
+    
+    # Scalar index cho filter theo trang / file nguồn (context expansion)
+    from src.vector_store import SCALAR_INDEX_PARAMS
+    for field in ("page", "pdf_source"):
+        collection.create_index(field_name=field, index_params=SCALAR_INDEX_PARAMS[field], index_name=f"{field}_idx")
     logger.info("Index đã được tạo")
     print("      -> ✅ Index đã được tạo.")
 
@@ -143,6 +246,7 @@ if __name__ == "__main__":
     logger.info("Dọn dẹp collection test")
     print(f"\n--- DỌN DẸP ---")
     utility.drop_collection(COLLECTION_NAME, using=DEFAULT_ALIAS)
+    get_handle_cache().invalidate(COLLECTION_NAME)
     logger.info(f"Đã xóa collection test '{COLLECTION_NAME}'")
     print(f"🗑️ Đã xóa collection test '{COLLECTION_NAME}'.")
     
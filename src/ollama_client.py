@@ -0,0 +1,225 @@
+"""
+Ollama Client - HTTP client dùng chung một session keep-alive cho Ollama server.
+
+Wrapper `Ollama` của LangChain gọi requests.post() cho mỗi request (mở kết nối TCP
+mới mỗi lần) và tạo aiohttp session mới cho mỗi request async. Client này:
+- Dùng một requests.Session có connection pool cho mỗi server
+- Gửi `keep_alive` để model ở lại trong RAM/VRAM giữa các request
+- Giới hạn số request đồng thời theo số request song song server xử lý được
+- Hỗ trợ stream (NDJSON) và /api/chat với message dạng dict
+
+OllamaSessionLLM bọc client thành LangChain LLM để dùng trong chain (invoke/stream/ainvoke).
+"""
+
+import asyncio
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from src.config import (
+    OLLAMA_API_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_REQUEST_TIMEOUT,
+    LLM_MAX_CONCURRENCY,
+)
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def _base_url(api_url: str) -> str:
+    """Bỏ phần path /api/... của OLLAMA_API_URL (vd http://localhost:11434/api/generate)."""
+    api_url = api_url.rstrip("/")
+    index = api_url.find("/api/")
+    return api_url[:index] if index >= 0 else api_url
+
+
+class OllamaClient:
+    """
+    Client HTTP cho một Ollama server (dùng chung giữa các model).
+    """
+
+    def __init__(
+        self,
+        base_url: str = _base_url(OLLAMA_API_URL),
+        keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY.get("ollama", 1),
+        timeout: float = OLLAMA_REQUEST_TIMEOUT
+    ):
+        """
+        Args:
+            base_url: URL của server (vd http://localhost:11434, phần /api/... nếu có được bỏ qua)
+            keep_alive: Thời gian model ở lại trong bộ nhớ sau request (vd "30m", None = mặc định server)
+            max_concurrency: Số request đồng thời tối đa (nên bằng OLLAMA_NUM_PARALLEL của server)
+            timeout: Timeout đọc response (giây)
+        """
+        self.base_url = _base_url(base_url)
+        self.keep_alive = keep_alive
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+
+        # Pool đủ kết nối cho mọi request đồng thời → không mở kết nối mới
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def _payload(self, model: str, options: Optional[Dict[str, Any]], stream: bool, **fields) -> Dict[str, Any]:
+        payload = {'model': model, 'stream': stream, **fields}
+        if options:
+            payload['options'] = {k: v for k, v in options.items() if v is not None}
+        if self.keep_alive is not None:
+            payload['keep_alive'] = self.keep_alive
+        return payload
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with self._slots:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+    def _post_stream(self, path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with self._slots:
+            with self.session.post(
+                f"{self.base_url}{path}", json=payload, stream=True, timeout=self.timeout
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get('error'):
+                        raise RuntimeError(f"Ollama: {data['error']}")
+                    yield data
+                    if data.get('done'):
+                        return
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, **fields) -> str:
+        """
+        Gọi /api/generate (không stream).
+
+        Args:
+            model: Tên model (vd "llama3:latest")
+            prompt: Prompt
+            options: Tham số sinh (temperature, num_predict, stop...)
+            **fields: Trường khác của request (vd system)
+
+        Returns:
+            Text được sinh ra
+        """
+        data = self._post("/api/generate", self._payload(model, options, False, prompt=prompt, **fields))
+        return data.get('response', "")
+
+    def stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, **fields) -> Iterator[str]:
+        """Gọi /api/generate dạng stream, yield từng đoạn text."""
+        payload = self._payload(model, options, True, prompt=prompt, **fields)
+        for data in self._post_stream("/api/generate", payload):
+            if data.get('response'):
+                yield data['response']
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Gọi /api/chat.
+
+        Args:
+            model: Tên model
+            messages: List of {'role': 'system'/'user'/'assistant', 'content': str}
+            options: Tham số sinh
+
+        Returns:
+            Nội dung message trả lời
+        """
+        data = self._post("/api/chat", self._payload(model, options, False, messages=messages))
+        return data.get('message', {}).get('content', "")
+
+    async def agenerate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, **fields) -> str:
+        """Phiên bản async của generate() (chạy trong thread, dùng chung session)."""
+        return await asyncio.to_thread(self.generate, model, prompt, options, **fields)
+
+    def close(self):
+        """Đóng các kết nối trong pool."""
+        self.session.close()
+
+
+class OllamaSessionLLM(LLM):
+    """LangChain LLM dùng OllamaClient (thay cho langchain_community Ollama)."""
+
+    client: Any
+    model: str
+    temperature: Optional[float] = None
+    num_predict: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-session"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model': self.model, 'temperature': self.temperature, 'num_predict': self.num_predict}
+
+    def _options(self, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        options = {'temperature': self.temperature, 'num_predict': self.num_predict, 'stop': stop}
+        options.update(kwargs)
+        return options
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return self.client.generate(self.model, prompt, self._options(stop, kwargs))
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any
+    ) -> str:
+        return await self.client.agenerate(self.model, prompt, self._options(stop, kwargs))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        for text in self.client.stream(self.model, prompt, self._options(stop, kwargs)):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        """Hội thoại nhiều lượt qua /api/chat."""
+        return self.client.chat(self.model, messages, self._options(None, kwargs))
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_ollama_client(base_url: str = _base_url(OLLAMA_API_URL)) -> OllamaClient:
+    """Lấy OllamaClient dùng chung cho server (một connection pool mỗi server)."""
+    base_url = _base_url(base_url)
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = OllamaClient(base_url)
+        return _clients[base_url]
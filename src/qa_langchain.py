@@ -3,7 +3,7 @@ QA App - LangChain RAG Version
 
 Thay thế src/qa_app.py bằng LangChain RetrievalQA chain.
 Giữ nguyên tất cả tính năng:
-- Context expansion (pages ±1-2)
+- Context expansion (cửa sổ ±1-2 trang quanh từng hit, có LRU cache)
 - Multi-source tracking
 - Gemini/Ollama support
 - Error handling
@@ -11,6 +11,7 @@ Giữ nguyên tất cả tính năng:
 
 import sys
 from pathlib import Path
+from typing import Callable, Iterable, List, Optional
 
 project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
@@ -19,14 +20,20 @@ if str(project_root) not in sys.path:
 # LangChain imports
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.documents import Document
 from langchain_milvus import Milvus
 from langchain_huggingface import HuggingFaceEmbeddings
 
 # Local imports
-from src.config import EMBEDDING_MODEL_NAME, COLLECTION_NAME
+from src.config import EMBEDDING_MODEL_NAME, COLLECTION_NAME, LLM_RESPONSE_CACHE_RAG
 from src.llm_langchain import LLMManager, initialize_and_select_llm_langchain
 from src.logging_config import get_logger
+from src.llm_metrics import get_usage_tracker
+from src.vector_store import get_vector_store
+from src.index_policy import get_index_policy
+from src.context_expansion import PageCache, merge_page_windows, window_pages
+from src.context_packer import get_context_packer
 
 logger = get_logger(__name__)
 
@@ -68,17 +75,30 @@ class RAGChain:
             encode_kwargs={'normalize_embeddings': True}
         )
         
-        # Initialize Milvus vectorstore
-        logger.info(f"🔌 Connecting to Milvus collection: {collection_name}")
-        self.vectorstore = Milvus(
-            embedding_function=self.embeddings,
-            collection_name=collection_name,
-            connection_args={
-                "host": "localhost",
-                "port": "19530"
-            },
-            drop_old=False  # Don't recreate
-        )
+        # Vector store backend (dùng cho context expansion và retrieval khi chạy local)
+        self.vector_store = get_vector_store()
+        
+        # Cache nội dung trang cho context expansion (câu hỏi tiếp theo cùng phần tài liệu)
+        self.page_cache = PageCache()
+        
+        if self.vector_store.backend == "milvus" and not self.vector_store.partitioned:
+            # Initialize Milvus vectorstore
+            logger.info(f"🔌 Connecting to Milvus collection: {collection_name}")
+            self.vectorstore = Milvus(
+                embedding_function=self.embeddings,
+                collection_name=collection_name,
+                connection_args={
+                    "host": "localhost",
+                    "port": "19530"
+                },
+                drop_old=False,  # Don't recreate
+                # Field của schema repo (id, embedding, ...); collection LangChain cũ giữ mặc định
+                **self.vector_store.langchain_kwargs(collection_name)
+            )
+        else:
+            # Local backend / partitioned layout: retrieval qua VectorStore
+            logger.info(f"🗄️ Using vector store collection: {collection_name}")
+            self.vectorstore = None
         
         # Build chain
         self._build_chain()
@@ -107,9 +127,15 @@ Câu trả lời:"""
         )
         
         # Build retriever
-        self.retriever = self.vectorstore.as_retriever(
-            search_kwargs={"k": 15}  # Top 15 results
-        )
+        if self.vectorstore is not None:
+            search_kwargs = {"k": 15}  # Top 15 results
+            # Search params đã tune bởi IndexPolicy (nprobe / ef) nếu có
+            search_params = get_index_policy().get_search_params(self.vector_store, self.collection_name)
+            if search_params is not None:
+                search_kwargs["param"] = search_params
+            self.retriever = self.vectorstore.as_retriever(search_kwargs=search_kwargs)
+        else:
+            self.retriever = RunnableLambda(self._retrieve_local)
         
         # Build chain based on provider
         # Gemini: Không support LangChain chains → dùng manual approach
@@ -117,171 +143,293 @@ Câu trả lời:"""
         if self.llm_manager.provider == "gemini":
             logger.info("ℹ️ Gemini provider: Sẽ dùng manual retrieval + generate()")
             self.chain = None  # Không dùng chain, xử lý manual trong answer_question()
+            self.answer_chain = None
         else:
             # Ollama: Build full chain
             logger.info("ℹ️ Ollama provider: Build LangChain chain")
+            # answer_chain: prompt → LLM với context đã đóng gói sẵn (ask() dùng để giữ báo cáo packer)
+            self.answer_chain = (
+                self.prompt
+                | self.llm_manager.get_langchain_llm()
+                | StrOutputParser()
+            )
             self.chain = (
                 {
                     "context": self.retriever | self._format_docs,
                     "question": RunnablePassthrough()
                 }
-                | self.prompt
-                | self.llm_manager.get_langchain_llm()
-                | StrOutputParser()
+                | self.answer_chain
             )
     
+    def _retrieve_local(self, question: str, k: int = 15) -> list:
+        """Retrieve top-k documents từ local vector store."""
+        query_vector = self.embeddings.embed_query(question)
+        hits = self.vector_store.search(
+            self.collection_name,
+            [query_vector],
+            top_k=k,
+            search_params=get_index_policy().get_search_params(self.vector_store, self.collection_name)
+        )[0]
+        
+        return [self._hit_to_document(hit) for hit in hits]
+    
+    @staticmethod
+    def _hit_to_document(hit: dict) -> Document:
+        return Document(
+            page_content=hit.get('text', ''),
+            metadata={'page': hit.get('page', 0), 'pdf_source': hit.get('pdf_source', 'Unknown')}
+        )
+    
     def _format_docs(self, docs):
+        """Context string cho prompt (xem _pack_docs)."""
+        return self._pack_docs(docs)['text']
+    
+    def _pack_docs(self, docs) -> dict:
         """
         Format retrieved documents with context expansion.
         
-        Expands context by ±1-2 pages like original qa_app.py
+        Mỗi hit được mở rộng ±1-2 trang như qa_app.py gốc, nhưng theo cửa sổ
+        quanh từng hit (gộp cửa sổ chồng nhau) thay vì cả khoảng min..max.
+        Các trang được lấy bằng một query qua PageCache, sau đó đóng gói theo
+        CONTEXT_TOKEN_BUDGET (trang có hit xếp hạng cao được giữ trước).
+        
+        Returns:
+            Dict với 'text' (context), 'tokens', 'truncated' và 'dropped'
+            (số trang bị cắt / bị bỏ vì vượt ngân sách token)
         """
         if not docs:
-            return ""
+            return {'text': "", 'tokens': 0, 'truncated': [], 'dropped': []}
         
-        # Get pages from initial results
-        hit_pages = sorted(list(set([
-            doc.metadata.get('page', 0) for doc in docs
-        ])))
+        # Get pages from initial results (thứ hạng = vị trí hit đầu tiên của trang)
+        page_rank = {}
+        for doc in docs:
+            page_rank.setdefault(doc.metadata.get('page', 0), len(page_rank))
+        hit_pages = sorted(page_rank)
         
         logger.info(f"📄 Hit pages: {hit_pages}")
         
+        packer = get_context_packer()
+        
+        def pack(blocks, pages, priorities=None, suffix=""):
+            packed = packer.pack(blocks, priorities)
+            return {
+                'text': packed['text'] + suffix,
+                'tokens': packed['tokens'],
+                'truncated': [pages[i] for i in packed['truncated']],
+                'dropped': [pages[i] for i in packed['dropped']]
+            }
+        
+        fallback = lambda: pack([doc.page_content for doc in docs], [doc.metadata.get('page', 0) for doc in docs])
+        
         if not hit_pages:
             # Fallback: concatenate docs
-            return "\n\n".join([doc.page_content for doc in docs])
-        
-        # Expand context: ±1-2 pages
-        min_page = min(hit_pages)
-        max_page = max(hit_pages)
-        context_min = max(1, min_page - 1)
-        context_max = max_page + 2
+            return fallback()
         
-        logger.info(f"📚 Expanding context: pages {context_min}-{context_max}")
+        windows = merge_page_windows(hit_pages)
+        logger.info(f"📚 Expanding context: windows {windows}")
         
-        # Query expanded pages from Milvus
         try:
-            from pymilvus import connections, Collection
-            
-            # Use existing connection
-            if not connections.has_connection("default"):
-                connections.connect(
-                    alias="default",
-                    host="localhost",
-                    port="19530"
-                )
-            
-            collection = Collection(self.collection_name)
-            
-            # Query by page range
-            expr = f"page >= {context_min} && page <= {context_max}"
-            expanded_results = collection.query(
-                expr=expr,
-                output_fields=["text", "page"],
-                limit=1000
+            context_map = self.page_cache.get_pages(
+                self.vector_store,
+                self.collection_name,
+                window_pages(windows)
             )
             
-            logger.info(f"📖 Retrieved {len(expanded_results)} chunks from expanded range")
+            logger.info(
+                f"📖 Retrieved {sum(len(t) for t in context_map.values())} chunks "
+                f"from {len(context_map)} pages (cache: {self.page_cache.stats})"
+            )
             
-            # Group by page
-            context_map = {}
-            for hit in expanded_results:
-                page_num = hit.get('page', 0)
-                text = hit.get('text', '')
-                if page_num not in context_map:
-                    context_map[page_num] = []
-                context_map[page_num].append(text)
+            if not context_map:
+                return fallback()
             
-            # Build final context
-            final_context = ""
-            for page_num in sorted(context_map.keys()):
-                final_context += f"--- Nội dung từ Trang {page_num} ---\n"
-                final_context += "\n".join(context_map[page_num]) + "\n\n"
+            # Build final context: trang hit theo thứ hạng, trang lân cận theo khoảng cách tới hit gần nhất
+            page_nums = sorted(context_map.keys())
+            blocks = [
+                f"--- Nội dung từ Trang {page_num} ---\n" + "\n".join(context_map[page_num])
+                for page_num in page_nums
+            ]
+            priorities = [
+                -page_rank[page_num] if page_num in page_rank
+                else -len(page_rank) - min(abs(page_num - hit) for hit in hit_pages)
+                for page_num in page_nums
+            ]
             
-            return final_context if final_context else "\n\n".join([doc.page_content for doc in docs])
+            return pack(blocks, page_nums, priorities, suffix="\n\n")
             
         except Exception as e:
             logger.warning(f"⚠️  Context expansion failed: {e}")
             # Fallback to simple concatenation
-            return "\n\n".join([doc.page_content for doc in docs])
+            return fallback()
     
-    def ask(self, question: str) -> dict:
+    def ask(self, question: str, on_token: Optional[Callable[[str], None]] = None) -> dict:
         """
         Ask a question and get answer with sources.
         
         Args:
             question: User question
+            on_token: Callback nhận từng đoạn câu trả lời khi LLM stream
+                (None = chờ câu trả lời đầy đủ)
             
         Returns:
             {
                 'answer': str,
                 'sources': List[str],
-                'pages': List[int]
+                'pages': List[int],
+                'context': {'tokens': int, 'truncated': List[int], 'dropped': List[int]}
             }
         """
         logger.info(f"❓ Question: {question[:100]}...")
         
         try:
             # Retrieve documents first for source tracking
-            docs = self.retriever.get_relevant_documents(question)
+            docs = self.retriever.invoke(question)
             
             if not docs:
                 logger.warning("No relevant documents found")
-                return {
-                    'answer': "⚠️ Không tìm thấy thông tin liên quan trong tài liệu.",
-                    'sources': [],
-                    'pages': []
-                }
+                return self._no_docs_result()
+            
+            packed = self._pack_docs(docs)
             
             # Generate answer based on provider
-            if self.chain is not None:
-                # Ollama: Dùng LangChain chain
-                answer = self.chain.invoke(question)
+            if self.answer_chain is not None:
+                # Ollama: Dùng LangChain chain (context đã retrieve ở trên)
+                inputs = {'context': packed['text'], 'question': question}
+                if on_token is None:
+                    answer = self.answer_chain.invoke(inputs)
+                else:
+                    answer = self._stream_answer(self.answer_chain.stream(inputs), on_token)
             else:
                 # Gemini: Manual retrieval + generate()
-                # Format context từ retrieved docs
-                context = self._format_docs(docs)
-                
-                # Build prompt manually
-                prompt_text = f"""Dựa vào các thông tin được cung cấp dưới đây từ tài liệu PDF:
-
-{context}
-
-Hãy trả lời câu hỏi sau một cách chi tiết và chính xác. 
-Chỉ sử dụng thông tin được cung cấp, không bịa đặt. 
-Nếu thông tin không đủ để trả lời, hãy nói rằng "Thông tin không có trong tài liệu".
-
-Câu hỏi: {question}
-
-Câu trả lời:"""
+                prompt_text = self._build_prompt(question, packed['text'])
                 
-                # Generate với Gemini
-                answer = self.llm_manager.generate(prompt_text)
+                # Generate với Gemini (cùng câu hỏi trên cùng context → response cache)
+                cache = LLM_RESPONSE_CACHE_RAG
+                if on_token is None:
+                    answer = self.llm_manager.generate(prompt_text, cache=cache)
+                else:
+                    answer = self._stream_answer(self.llm_manager.generate_stream(prompt_text, cache=cache), on_token)
             
-            # Extract sources
-            sources = []
-            pages = set()
-            for doc in docs[:15]:  # Top 15 for source display
-                source = doc.metadata.get('pdf_source', 'Unknown')
-                page = doc.metadata.get('page', 0)
-                pages.add(page)
-                if source not in sources:
-                    sources.append(source)
-            
-            logger.info(f"✅ Generated answer with {len(sources)} sources")
-            
-            return {
-                'answer': answer,
-                'sources': sources,
-                'pages': sorted(list(pages))
-            }
+            result = self._answer_result(answer, docs, packed)
+            logger.info(f"✅ Generated answer with {len(result['sources'])} sources")
+            return result
             
         except Exception as e:
             logger.error(f"❌ Error during QA: {e}")
-            return {
-                'answer': f"[LỖI HỆ THỐNG] {str(e)}",
-                'sources': [],
-                'pages': []
-            }
+            return self._error_result(e)
+    
+    def ask_batch(self, questions: List[str], concurrency: Optional[int] = None) -> List[dict]:
+        """
+        Trả lời nhiều câu hỏi (vd bộ câu hỏi đánh giá) theo batch.
+        
+        - Retrieval: encode tất cả câu hỏi trong một batch, search một lần
+        - Generation: LLMManager.generate_batch() gửi prompt song song trong giới hạn quota từng key
+        
+        Câu hỏi lỗi trả về answer "[LỖI HỆ THỐNG] ..." như ask(), không làm hỏng cả batch.
+        
+        Args:
+            questions: Danh sách câu hỏi
+            concurrency: Số request LLM chạy cùng lúc (None = mặc định của generate_batch)
+            
+        Returns:
+            List kết quả cùng thứ tự với questions, mỗi kết quả giống ask()
+        """
+        logger.info(f"❓ Batch {len(questions)} câu hỏi")
+        
+        try:
+            all_docs = self._retrieve_batch(questions)
+        except Exception as e:
+            logger.error(f"❌ Error during batch retrieval: {e}")
+            return [self._error_result(e) for _ in questions]
+        
+        results: List[Optional[dict]] = [None] * len(questions)
+        prompts, indices, contexts = [], [], {}
+        for i, (question, docs) in enumerate(zip(questions, all_docs)):
+            if not docs:
+                results[i] = self._no_docs_result()
+                continue
+            try:
+                contexts[i] = self._pack_docs(docs)
+                prompts.append(self._build_prompt(question, contexts[i]['text']))
+                indices.append(i)
+            except Exception as e:
+                results[i] = self._error_result(e)
+        
+        generations = self.llm_manager.generate_batch(
+            prompts, concurrency=concurrency, cache=LLM_RESPONSE_CACHE_RAG
+        )
+        for i, generation in zip(indices, generations):
+            if generation['success']:
+                results[i] = self._answer_result(generation['text'], all_docs[i], contexts[i])
+            else:
+                results[i] = self._error_result(generation['error'])
+        
+        return results
+    
+    def _retrieve_batch(self, questions: List[str], k: int = 15) -> List[list]:
+        """Retrieve top-k documents cho nhiều câu hỏi (encode một batch)."""
+        if self.vectorstore is not None:
+            # Milvus qua LangChain: retriever tự encode, chạy song song
+            return self.retriever.batch(questions)
+        
+        query_vectors = self.embeddings.embed_documents(questions)
+        all_hits = self.vector_store.search(
+            self.collection_name,
+            query_vectors,
+            top_k=k,
+            search_params=get_index_policy().get_search_params(self.vector_store, self.collection_name)
+        )
+        return [[self._hit_to_document(hit) for hit in hits] for hits in all_hits]
+    
+    def _build_prompt(self, question: str, context: str) -> str:
+        """Prompt RAG (template của chain) với context đã đóng gói (_pack_docs)."""
+        return self.prompt.format(context=context, question=question)
+    
+    @staticmethod
+    def _answer_result(answer: str, docs: list, packed: Optional[dict] = None) -> dict:
+        """Kết quả ask(): answer kèm nguồn, trang của top 15 docs và báo cáo context."""
+        sources = []
+        pages = set()
+        for doc in docs[:15]:  # Top 15 for source display
+            source = doc.metadata.get('pdf_source', 'Unknown')
+            page = doc.metadata.get('page', 0)
+            pages.add(page)
+            if source not in sources:
+                sources.append(source)
+        
+        result = {
+            'answer': answer,
+            'sources': sources,
+            'pages': sorted(list(pages))
+        }
+        if packed is not None:
+            result['context'] = {key: packed[key] for key in ('tokens', 'truncated', 'dropped')}
+        return result
+    
+    @staticmethod
+    def _no_docs_result() -> dict:
+        return {
+            'answer': "⚠️ Không tìm thấy thông tin liên quan trong tài liệu.",
+            'sources': [],
+            'pages': []
+        }
+    
+    @staticmethod
+    def _error_result(error) -> dict:
+        return {
+            'answer': f"[LỖI HỆ THỐNG] {str(error)}",
+            'sources': [],
+            'pages': []
+        }
+
+    @staticmethod
+    def _stream_answer(chunks: Iterable[str], on_token: Callable[[str], None]) -> str:
+        """Chuyển từng đoạn text cho on_token và trả về câu trả lời đầy đủ."""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            on_token(chunk)
+        return "".join(parts)
 
 
 def main():
@@ -319,7 +467,7 @@ def main():
     # Step 3: QA Loop
     print("\n📋 Step 3: Ask Questions")
     print("=" * 70)
-    print("Type 'exit' to quit, 'info' for help")
+    print("Type 'exit' to quit, 'info' for help, 'stats' for LLM usage")
     print("=" * 70)
     
     try:
@@ -336,19 +484,40 @@ def main():
             if question.lower() == 'info':
                 print("\n📖 RAG QA Help:")
                 print("   - Ask questions about your documents")
-                print("   - Context automatically expanded (±1-2 pages)")
+                print("   - Context automatically expanded (±1-2 pages around each hit)")
                 print("   - Sources tracked and displayed")
+                print("   - Type 'stats' for token/latency usage per model")
                 print("   - Type 'exit' to quit")
                 continue
             
+            if question.lower() == 'stats':
+                print(f"\n{get_usage_tracker().format_summary()}")
+                continue
+            
             # Ask question
             print("\n🔍 Searching...")
-            result = rag_chain.ask(question)
+            streamed = []
+            
+            def print_token(token: str):
+                # In câu trả lời ngay khi có token đầu tiên
+                if not streamed:
+                    print("\n✅ Answer:")
+                    print("-" * 70)
+                streamed.append(token)
+                print(token, end="", flush=True)
+            
+            result = rag_chain.ask(question, on_token=print_token)
             
             # Display answer
-            print("\n✅ Answer:")
-            print("-" * 70)
-            print(result['answer'])
+            if streamed:
+                print()
+                if result['answer'] != "".join(streamed):
+                    # Lỗi giữa chừng khi stream
+                    print(result['answer'])
+            else:
+                print("\n✅ Answer:")
+                print("-" * 70)
+                print(result['answer'])
             print("-" * 70)
             
             # Display sources
@@ -357,6 +526,14 @@ def main():
                 for source in result['sources']:
                     print(f"   📄 {source}")
                 print(f"   📖 Pages: {', '.join(map(str, result['pages']))}")
+            
+            # Trang bị cắt / bỏ vì vượt ngân sách token của context
+            context = result.get('context')
+            if context and (context['truncated'] or context['dropped']):
+                print(
+                    f"   ✂️ Context {context['tokens']} tokens: "
+                    f"cắt trang {context['truncated'] or '-'}, bỏ trang {context['dropped'] or '-'}"
+                )
     
     except KeyboardInterrupt:
         logger.info("User interrupted (Ctrl+C)")
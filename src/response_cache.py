@@ -0,0 +1,180 @@
+"""
+Response Cache - Cache chính xác (exact-match) câu trả lời của LLM, lưu bằng SQLite.
+
+Key là hash của (provider, model, temperature, max_tokens, prompt, tham số gọi):
+cùng prompt byte-by-byte gửi lại (vd retry cùng câu hỏi trên cùng context) được
+trả lời ngay, không tốn request/quota.
+
+- Eviction LRU theo số entry tối đa (cột last_used)
+- TTL riêng cho từng entry
+- Thống kê hit/miss
+- Chỉ dùng khi caller bật cache=True (chat không xác định bỏ qua cache)
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import (
+    LLM_RESPONSE_CACHE_FILE,
+    LLM_RESPONSE_CACHE_SIZE,
+    LLM_RESPONSE_CACHE_TTL_SECONDS,
+)
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResponseCache:
+    """
+    Cache prompt -> response trên SQLite, thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = LLM_RESPONSE_CACHE_FILE,
+        max_entries: int = LLM_RESPONSE_CACHE_SIZE,
+        ttl_seconds: float = LLM_RESPONSE_CACHE_TTL_SECONDS
+    ):
+        """
+        Args:
+            path: File SQLite (None = chỉ giữ trong bộ nhớ)
+            max_entries: Số response tối đa (LRU)
+            ttl_seconds: Thời gian sống mặc định của mỗi response (giây)
+        """
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path) if self.path else ":memory:", check_same_thread=False)
+        if self.path is not None:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+            " expires REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: Optional[str],
+        temperature: float,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Key của một request LLM.
+
+        Args:
+            provider: "gemini" hoặc "ollama"
+            model: Tên model
+            temperature: Nhiệt độ lấy mẫu
+            prompt: Prompt đầy đủ
+            max_tokens: Số token tối đa
+            params: Tham số gọi thêm (kwargs của generate)
+
+        Returns:
+            Chuỗi hex sha256
+        """
+        payload = json.dumps(
+            [provider, model, temperature, max_tokens, params or {}, prompt],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Response đã cache (None nếu chưa có hoặc đã hết hạn)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, ttl_seconds: Optional[float] = None):
+        """
+        Lưu response.
+
+        Args:
+            key: Key từ make_key()
+            response: Text trả về của LLM
+            ttl_seconds: TTL của entry này (None = ttl_seconds mặc định)
+        """
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now + ttl, now)
+            )
+            # Bỏ entry hết hạn, rồi entry ít dùng gần đây nhất nếu vượt max_entries
+            self._conn.execute("DELETE FROM responses WHERE expires < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Số hit/miss, hit rate và số entry hiện có."""
+        total = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': round(self._hits / total, 3) if total else 0.0,
+            'entries': len(self)
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Lấy ResponseCache dùng chung (lưu ở LLM_RESPONSE_CACHE_FILE)."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            try:
+                _response_cache = ResponseCache()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Không mở được response cache {LLM_RESPONSE_CACHE_FILE}: {e}, dùng cache trong bộ nhớ")
+                _response_cache = ResponseCache(path=None)
+        return _response_cache
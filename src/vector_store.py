@@ -0,0 +1,1627 @@
+"""
+Vector Store - Lớp trừu tượng cho vector database.
+
+Hai backend với cùng interface:
+- MilvusVectorStore: Milvus server (mặc định, localhost:19530)
+- LocalVectorStore: In-process, lưu ma trận numpy (memory-mapped) cho từng collection.
+  Không cần Milvus server → chạy/test/benchmark trên máy bất kỳ.
+
+Chọn backend qua VECTOR_STORE_BACKEND trong config hoặc biến môi trường.
+
+Layout lưu trữ (STORAGE_LAYOUT):
+- "per_pdf": mỗi PDF một collection riêng
+- "partitioned": PartitionedVectorStore bọc backend, mọi PDF nằm trong một collection
+  chung, mỗi PDF là một partition. Code gọi vẫn dùng tên "collection" như cũ.
+
+Kết quả search/query luôn là dict:
+    {'id': int, 'distance': float, 'text': str, 'page': int, 'pdf_source': str}
+(thêm 'partition' nếu có trong output_fields)
+
+Metric (VECTOR_METRIC): "IP" trên vector đã chuẩn hóa = cosine similarity.
+Backend tự chuẩn hóa vector khi insert/search vào collection metric IP.
+Collection L2 cũ vẫn dùng được; chuyển sang IP bằng IndexPolicy.migrate_metric.
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Thêm thư mục gốc project vào sys.path để import src module
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.config import (
+    EMBEDDING_DIM,
+    VECTOR_STORE_BACKEND,
+    LOCAL_VECTOR_STORE_DIR,
+    STORAGE_LAYOUT,
+    SHARED_COLLECTION_NAME,
+    VECTOR_METRIC
+)
+from src.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Index mặc định (giống cấu hình cũ của CollectionManager)
+DEFAULT_INDEX_PARAMS = {
+    "metric_type": VECTOR_METRIC,
+    "index_type": "IVF_FLAT",
+    "params": {"nlist": 1024}
+}
+
+# Search params mặc định
+DEFAULT_SEARCH_PARAMS = {
+    "metric_type": VECTOR_METRIC,
+    "params": {"nprobe": 10}
+}
+
+# Các field trả về mặc định
+DEFAULT_OUTPUT_FIELDS = ["text", "page", "pdf_source"]
+
+# Tham số field cho langchain_milvus.Milvus để đọc/ghi đúng schema của MilvusVectorStore
+LANGCHAIN_MILVUS_FIELDS = {"primary_field": "id", "text_field": "text", "vector_field": "embedding", "auto_id": True}
+
+# Partition mặc định (giống Milvus)
+DEFAULT_PARTITION = "_default"
+
+# Scalar index cho các field dùng trong filter (context expansion, lọc theo PDF/partition)
+SCALAR_INDEX_PARAMS = {
+    "page": {"index_type": "STL_SORT"},
+    "pdf_source": {"index_type": "INVERTED"},
+    "partition": {"index_type": "INVERTED"}
+}
+
+
+def normalize_vectors(vectors: Any) -> np.ndarray:
+    """Chuẩn hóa L2 từng vector (vector 0 giữ nguyên)."""
+    array = np.asarray(vectors, dtype=np.float32)
+    if array.ndim == 1:
+        array = array[None, :]
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    return array / np.where(norms > 0, norms, 1.0)
+
+
+def similarity_from_distance(distance: float, metric_type: str) -> float:
+    """
+    Chuyển distance của backend sang similarity (càng lớn càng giống).
+
+    IP trên vector chuẩn hóa: distance chính là cosine similarity.
+    L2 (collection cũ): 1 / (1 + distance) như trước.
+    """
+    if metric_type == "IP":
+        return float(distance)
+    return 1.0 / (1.0 + float(distance))
+
+
+def build_filter_expr(
+    pages: Optional[Sequence[int]] = None,
+    page_range: Optional[Tuple[int, int]] = None,
+    pdf_source: Optional[str] = None
+) -> str:
+    """
+    Tạo Milvus boolean expression từ các filter.
+
+    Args:
+        pages: Danh sách số trang (page in [...])
+        page_range: (min_page, max_page), bao gồm 2 đầu
+        pdf_source: Tên file PDF nguồn
+
+    Returns:
+        Expression string ("" nếu không có filter)
+    """
+    clauses = []
+
+    if pages is not None:
+        clauses.append(f"page in [{', '.join(str(int(p)) for p in pages)}]")
+
+    if page_range is not None:
+        clauses.append(f"page >= {int(page_range[0])} && page <= {int(page_range[1])}")
+
+    if pdf_source is not None:
+        escaped = pdf_source.replace('\\', '\\\\').replace('"', '\\"')
+        clauses.append(f'pdf_source == "{escaped}"')
+
+    return " && ".join(clauses)
+
+
+class VectorStore:
+    """
+    Interface chung cho các vector store backend.
+
+    Mỗi collection chứa các chunk với schema:
+    embedding (float vector), text, page, pdf_source.
+    """
+
+    backend = "base"
+
+    # True nếu mỗi "collection" thực chất là một partition trong collection dùng chung
+    partitioned = False
+
+    # Các loại vector index backend hỗ trợ (xem src/index_policy.py)
+    supported_index_types: Tuple[str, ...] = ("FLAT", "IVF_FLAT")
+
+    def resolve(self, name: str) -> Tuple['VectorStore', str]:
+        """Backend và tên collection vật lý chứa dữ liệu của "collection" name."""
+        return self, name
+
+    def has_collection(self, name: str) -> bool:
+        """Kiểm tra collection có tồn tại không."""
+        raise NotImplementedError
+
+    def list_collections(self) -> List[str]:
+        """Danh sách tên tất cả collections."""
+        raise NotImplementedError
+
+    def create_collection(
+        self,
+        name: str,
+        dim: int = EMBEDDING_DIM,
+        description: str = "",
+        index_params: Optional[Dict[str, Any]] = None,
+        with_partition_field: bool = False
+    ) -> None:
+        """
+        Tạo collection mới (kèm vector index).
+
+        with_partition_field: thêm field scalar 'partition' để hit trả về tên partition
+        (dùng cho collection chung của layout "partitioned").
+        """
+        raise NotImplementedError
+
+    def get_collection(self, name: str) -> Any:
+        """Lấy handle native của backend (đã load, sẵn sàng search)."""
+        raise NotImplementedError
+
+    def drop_collection(self, name: str) -> None:
+        """Xóa collection."""
+        raise NotImplementedError
+
+    def insert(
+        self,
+        name: str,
+        embeddings: Any,
+        texts: List[str],
+        pages: List[int],
+        sources: List[str],
+        partition: Optional[str] = None
+    ) -> int:
+        """
+        Insert các chunk vào collection (vào partition nếu có).
+
+        Returns:
+            Số chunk đã insert
+        """
+        raise NotImplementedError
+
+    def num_entities(self, name: str, partition: Optional[str] = None) -> int:
+        """Số entities trong collection (hoặc trong một partition)."""
+        raise NotImplementedError
+
+    def has_partition(self, name: str, partition: str) -> bool:
+        """Kiểm tra partition có tồn tại trong collection không."""
+        raise NotImplementedError
+
+    def list_partitions(self, name: str) -> List[str]:
+        """Danh sách partition của collection (gồm cả DEFAULT_PARTITION)."""
+        raise NotImplementedError
+
+    def create_partition(self, name: str, partition: str) -> None:
+        """Tạo partition trong collection."""
+        raise NotImplementedError
+
+    def drop_partition(self, name: str, partition: str) -> None:
+        """Xóa partition cùng toàn bộ dữ liệu của nó."""
+        raise NotImplementedError
+
+    def get_index_params(self, name: str) -> Dict[str, Any]:
+        """Index params hiện tại của field embedding."""
+        raise NotImplementedError
+
+    def metric_type(self, name: str) -> str:
+        """Metric của vector index ("L2" hoặc "IP")."""
+        return self.get_index_params(name).get('metric_type', 'L2')
+
+    def langchain_kwargs(self, name: str) -> Dict[str, Any]:
+        """Tham số field cho langchain_milvus.Milvus để dùng chung schema với backend này."""
+        return dict(LANGCHAIN_MILVUS_FIELDS)
+
+    def ensure_scalar_indexes(self, name: str) -> List[str]:
+        """
+        Tạo scalar index (SCALAR_INDEX_PARAMS) còn thiếu cho collection.
+
+        Returns:
+            Danh sách field vừa được tạo index
+        """
+        raise NotImplementedError
+
+    def iter_rows(self, name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Duyệt toàn bộ dữ liệu theo batch (dùng khi migrate).
+
+        Mỗi row: id, embedding, text, page, pdf_source và partition (nếu collection có).
+        """
+        raise NotImplementedError
+
+    def rename_collection(self, old_name: str, new_name: str) -> None:
+        """Đổi tên collection."""
+        raise NotImplementedError
+
+    def rebuild_index(self, name: str, index_params: Dict[str, Any]) -> None:
+        """Xóa vector index hiện tại và build lại với index_params."""
+        raise NotImplementedError
+
+    def sample_vectors(self, name: str, n: int, seed: int = 0) -> Tuple[List[int], np.ndarray]:
+        """
+        Lấy mẫu n vector đã lưu (dùng làm query khi tune search params).
+
+        Returns:
+            (ids, vectors) - ids khớp với 'id' trong kết quả search
+        """
+        raise NotImplementedError
+
+    def search(
+        self,
+        name: str,
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        partitions: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Vector search (nq = len(vectors)).
+
+        Returns:
+            Một list hits cho mỗi query vector, sắp xếp từ gần nhất
+        """
+        raise NotImplementedError
+
+    def query(
+        self,
+        name: str,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        limit: int = 1000,
+        partitions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Scalar query theo filter (không dùng vector)."""
+        raise NotImplementedError
+
+
+# ============================================================================
+# Milvus backend
+# ============================================================================
+
+class MilvusVectorStore(VectorStore):
+    """Vector store dùng Milvus server qua pymilvus."""
+
+    backend = "milvus"
+    supported_index_types = ("FLAT", "IVF_FLAT", "HNSW")
+
+    def __init__(self):
+        from src.milvus import connect_to_milvus, get_handle_cache, DEFAULT_ALIAS
+
+        self.alias = DEFAULT_ALIAS
+        connect_to_milvus()
+        # Handle đã load được cache theo connection → search/query không tốn RPC metadata
+        self.handles = get_handle_cache(self.alias)
+        # Metric của từng collection (cache để search không cần describe index)
+        self._metrics: Dict[str, str] = {}
+
+    def _forget(self, name: str):
+        """Bỏ cache handle và metric của collection."""
+        self.handles.invalidate(name)
+        self._metrics.pop(name, None)
+
+    def has_collection(self, name: str) -> bool:
+        from pymilvus import utility
+        return utility.has_collection(name, using=self.alias)
+
+    def list_collections(self) -> List[str]:
+        from pymilvus import utility
+        return list(utility.list_collections(using=self.alias))
+
+    def create_collection(
+        self,
+        name: str,
+        dim: int = EMBEDDING_DIM,
+        description: str = "",
+        index_params: Optional[Dict[str, Any]] = None,
+        with_partition_field: bool = False
+    ) -> None:
+        from pymilvus import Collection, CollectionSchema, FieldSchema, DataType
+
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(name="page", dtype=DataType.INT64),
+            FieldSchema(name="pdf_source", dtype=DataType.VARCHAR, max_length=512)
+        ]
+        if with_partition_field:
+            # Milvus không trả tên partition trong hit → lưu thêm thành field scalar
+            fields.append(FieldSchema(name="partition", dtype=DataType.VARCHAR, max_length=255))
+        schema = CollectionSchema(fields, description=description)
+
+        # Tên có thể vừa bị drop/tạo lại → bỏ handle cũ trong cache
+        self._forget(name)
+        collection = Collection(name, schema, using=self.alias)
+        collection.create_index("embedding", index_params or DEFAULT_INDEX_PARAMS)
+        self.ensure_scalar_indexes(name)
+
+    def get_collection(self, name: str) -> Any:
+        return self.handles.get(name)
+
+    def langchain_kwargs(self, name: str) -> Dict[str, Any]:
+        """
+        Tham số field cho langchain_milvus.Milvus trên collection name.
+
+        Collection do repo tạo (hoặc chưa tồn tại) dùng LANGCHAIN_MILVUS_FIELDS để
+        IndexPolicy quản lý được; collection cũ tạo bằng schema mặc định của
+        LangChain (pk, vector) giữ tham số mặc định.
+        """
+        if self.has_collection(name):
+            fields = {field.name for field in self.get_collection(name).schema.fields}
+            if "embedding" not in fields:
+                return {}
+        return dict(LANGCHAIN_MILVUS_FIELDS)
+
+    def drop_collection(self, name: str) -> None:
+        from pymilvus import utility
+        utility.drop_collection(name, using=self.alias)
+        self._forget(name)
+
+    def rename_collection(self, old_name: str, new_name: str) -> None:
+        from pymilvus import utility
+        self.handles.release(old_name)
+        utility.rename_collection(old_name, new_name, using=self.alias)
+        self._forget(old_name)
+        self._forget(new_name)
+
+    def _with_loaded(self, name: str, operation):
+        """
+        Chạy operation(collection) trên handle đã load.
+        
+        Nếu server báo collection chưa load (bị release từ bên ngoài),
+        đánh dấu lại trong cache, load lại và thử thêm một lần.
+        """
+        from pymilvus import MilvusException
+
+        collection = self.handles.get(name)
+        try:
+            return operation(collection)
+        except MilvusException as e:
+            if "not loaded" not in str(e).lower():
+                raise
+            logger.warning(f"⚠️ Collection '{name}' đã bị release, load lại")
+            self.handles.mark_unloaded(name)
+            return operation(self.handles.get(name))
+
+    def insert(
+        self,
+        name: str,
+        embeddings: Any,
+        texts: List[str],
+        pages: List[int],
+        sources: List[str],
+        partition: Optional[str] = None
+    ) -> int:
+        collection = self.handles.get(name, load=False)
+        if self.metric_type(name) == "IP":
+            embeddings = normalize_vectors(embeddings)
+
+        # Insert theo rows để không phụ thuộc thứ tự field trong schema
+        rows = [
+            {
+                'embedding': list(map(float, vector)),
+                'text': text,
+                'page': int(page),
+                'pdf_source': source
+            }
+            for vector, text, page, source in zip(embeddings, texts, pages, sources)
+        ]
+        if partition is not None:
+            for row in rows:
+                row['partition'] = partition
+        collection.insert(rows, partition_name=partition)
+        collection.flush()
+        return len(rows)
+
+    def num_entities(self, name: str, partition: Optional[str] = None) -> int:
+        collection = self.handles.get(name, load=False)
+        if partition is not None:
+            return collection.partition(partition).num_entities
+        return collection.num_entities
+
+    def has_partition(self, name: str, partition: str) -> bool:
+        return self.handles.get(name, load=False).has_partition(partition)
+
+    def list_partitions(self, name: str) -> List[str]:
+        return [p.name for p in self.handles.get(name, load=False).partitions]
+
+    def create_partition(self, name: str, partition: str) -> None:
+        self.handles.get(name, load=False).create_partition(partition)
+        # Partition mới chưa được load → lần search sau load lại collection
+        self.handles.mark_unloaded(name)
+
+    def drop_partition(self, name: str, partition: str) -> None:
+        # Milvus không cho drop partition đang load
+        self.handles.release(name)
+        self.handles.get(name, load=False).drop_partition(partition)
+
+    def get_index_params(self, name: str) -> Dict[str, Any]:
+        collection = self.handles.get(name, load=False)
+        for index in collection.indexes:
+            if index.field_name == "embedding":
+                return dict(index.params)
+        return {}
+
+    def metric_type(self, name: str) -> str:
+        if name not in self._metrics:
+            self._metrics[name] = self.get_index_params(name).get('metric_type', 'L2')
+        return self._metrics[name]
+
+    def rebuild_index(self, name: str, index_params: Dict[str, Any]) -> None:
+        # Phải release trước khi drop index; lần search sau sẽ load lại
+        self.handles.release(name)
+        self._metrics.pop(name, None)
+        collection = self.handles.get(name, load=False)
+        for index in collection.indexes:
+            if index.field_name == "embedding":
+                collection.drop_index(index_name=index.index_name)
+        collection.create_index("embedding", index_params)
+
+    def ensure_scalar_indexes(self, name: str) -> List[str]:
+        collection = self.handles.get(name, load=False)
+        indexed = {index.field_name for index in collection.indexes}
+        fields = {field.name for field in collection.schema.fields}
+        missing = [f for f in SCALAR_INDEX_PARAMS if f in fields and f not in indexed]
+        if not missing:
+            return []
+
+        # Collection phải load lại để dùng index mới
+        self.handles.release(name)
+        for field in missing:
+            collection.create_index(field, SCALAR_INDEX_PARAMS[field], index_name=f"{field}_idx")
+            logger.info(f"✅ Đã tạo scalar index {SCALAR_INDEX_PARAMS[field]['index_type']} cho '{name}.{field}'")
+        return missing
+
+    def iter_rows(self, name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        collection = self.handles.get(name)
+        fields = ["id", "embedding", "text", "page", "pdf_source"]
+        if any(field.name == "partition" for field in collection.schema.fields):
+            fields.append("partition")
+
+        iterator = collection.query_iterator(batch_size=batch_size, expr="", output_fields=fields)
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield [dict(row) for row in batch]
+        finally:
+            iterator.close()
+
+    def sample_vectors(self, name: str, n: int, seed: int = 0) -> Tuple[List[int], np.ndarray]:
+        total = self.num_entities(name)
+        n = min(n, total)
+        if n == 0:
+            return [], np.zeros((0, 0), dtype=np.float32)
+
+        # Milvus không có sample ngẫu nhiên → lấy một đoạn liên tiếp ở offset ngẫu nhiên
+        offset = int(np.random.default_rng(seed).integers(0, total - n + 1))
+        rows = self._with_loaded(name, lambda collection: collection.query(
+            expr="",
+            output_fields=["id", "embedding"],
+            limit=n,
+            offset=offset
+        ))
+        return [row['id'] for row in rows], np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+
+    def search(
+        self,
+        name: str,
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        partitions: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        output_fields = output_fields or DEFAULT_OUTPUT_FIELDS
+        expr = build_filter_expr(pages, page_range, pdf_source)
+        metric_type = self.metric_type(name)
+        if metric_type == "IP":
+            vectors = normalize_vectors(vectors)
+        data = [list(map(float, v)) for v in vectors]
+        # Search params mặc định phải cùng metric với index của collection
+        params = search_params or {**DEFAULT_SEARCH_PARAMS, "metric_type": metric_type}
+
+        results = self._with_loaded(name, lambda collection: collection.search(
+            data=data,
+            anns_field="embedding",
+            param=params,
+            limit=top_k,
+            expr=expr or None,
+            output_fields=output_fields,
+            partition_names=partitions
+        ))
+
+        return [
+            [
+                {
+                    'id': hit.id,
+                    'distance': hit.distance,
+                    **{field: hit.entity.get(field) for field in output_fields}
+                }
+                for hit in hits
+            ]
+            for hits in results
+        ]
+
+    def query(
+        self,
+        name: str,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        limit: int = 1000,
+        partitions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._with_loaded(name, lambda collection: collection.query(
+            expr=build_filter_expr(pages, page_range, pdf_source),
+            output_fields=output_fields or DEFAULT_OUTPUT_FIELDS,
+            limit=limit,
+            partition_names=partitions
+        ))
+
+
+# ============================================================================
+# Local in-process backend
+# ============================================================================
+
+def _train_ivf(
+    embeddings: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    max_train_size: int = 50000,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Train IVF centroids bằng k-means (L2) trên một mẫu embeddings.
+
+    Returns:
+        Ma trận centroids (nlist x dim)
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = len(embeddings)
+    nlist = max(1, min(nlist, num_rows))
+
+    if num_rows > max_train_size:
+        train = np.asarray(embeddings[np.sort(rng.choice(num_rows, max_train_size, replace=False))])
+    else:
+        train = np.asarray(embeddings)
+
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = _assign_to_centroids(train, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+
+        # Cộng dồn theo cluster bằng reduceat trên dữ liệu đã sort
+        order = np.argsort(assign, kind='stable')
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[non_empty])[:-1]))
+        sums = np.add.reduceat(train[order], starts, axis=0)
+
+        centroids[non_empty] = sums / counts[non_empty, None]
+
+    return centroids.astype(np.float32)
+
+
+def _assign_to_centroids(
+    embeddings: np.ndarray,
+    centroids: np.ndarray,
+    batch_size: int = 4096
+) -> np.ndarray:
+    """Gán mỗi vector vào centroid gần nhất (L2), xử lý theo batch để giới hạn RAM."""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(embeddings), dtype=np.int32)
+
+    for start in range(0, len(embeddings), batch_size):
+        batch = np.asarray(embeddings[start:start + batch_size])
+        # ||x - c||^2 = ||x||^2 - 2x.c + ||c||^2 (bỏ ||x||^2 vì không đổi argmin)
+        scores = centroid_norms[None, :] - 2.0 * batch @ centroids.T
+        assign[start:start + batch_size] = np.argmin(scores, axis=1)
+
+    return assign
+
+
+class _SortedIndex:
+    """
+    Scalar index dạng mảng đã sort (tương tự STL_SORT của Milvus).
+
+    Lookup theo giá trị / khoảng bằng binary search thay vì quét cả cột.
+    """
+
+    def __init__(self, values: np.ndarray, order: Optional[np.ndarray] = None):
+        self.order = np.argsort(values, kind='stable') if order is None else order
+        self.sorted_values = values[self.order]
+
+    def extend(self, values: np.ndarray, first_row: int) -> '_SortedIndex':
+        """
+        Index mới có thêm các dòng từ first_row (index cũ không bị sửa).
+
+        Args:
+            values: Toàn bộ cột (dòng cũ + dòng mới)
+            first_row: Row id của dòng mới đầu tiên
+
+        Returns:
+            _SortedIndex của values
+        """
+        new_order = np.argsort(values[first_row:], kind='stable') + first_row
+        merged_order = np.concatenate([self.order, new_order])
+        # Hai dãy đã sort nối nhau → stable sort gần như tuyến tính
+        merged_values = np.concatenate([self.sorted_values, values[new_order]])
+        return _SortedIndex(values, merged_order[np.argsort(merged_values, kind='stable')])
+
+    def lookup(self, low: int, high: Optional[int] = None) -> np.ndarray:
+        """Row ids có giá trị trong [low, high] (chưa sort theo row id)."""
+        high = low if high is None else high
+        start = np.searchsorted(self.sorted_values, low, side='left')
+        end = np.searchsorted(self.sorted_values, high, side='right')
+        return self.order[start:end]
+
+    def lookup_many(self, values: Sequence[int]) -> np.ndarray:
+        """Row ids có giá trị thuộc values."""
+        parts = [self.lookup(int(v)) for v in np.unique(np.asarray(list(values), dtype=np.int64))]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+class LocalCollection:
+    """
+    Một collection lưu trên disk dưới dạng file numpy.
+
+    Layout thư mục:
+        meta.json        - dim, index_params, danh sách pdf_source và partition
+        embeddings.npy   - float32 (N x dim), mở bằng memory-map
+        norms.npy        - ||x||^2 từng dòng (cho L2)
+        pages.npy        - int64 (N)
+        source_ids.npy   - int32 (N), index vào meta['sources']
+        partition_ids.npy - int32 (N), index vào meta['partitions']
+        texts.json       - list text (N)
+        ivf_centroids.npy, ivf_assign.npy - chỉ có khi index IVF
+
+    Scalar index (page, pdf_source, partition) là _SortedIndex build khi load.
+
+    Insert chỉ nối dòng mới vào cuối các file và gán chúng vào centroid IVF có sẵn;
+    k-means chỉ train lại khi collection lớn gấp đôi lúc train. Các thao tác ghi
+    thay mảng mới thay vì sửa tại chỗ, search đọc qua _snapshot() nên không thấy
+    lẫn mảng cũ và mới.
+    """
+
+    _STATE = (
+        'meta', 'embeddings', 'norms', 'pages', 'source_ids', 'partition_ids',
+        'texts', 'scalar_indexes', 'ivf_centroids', 'ivf_index'
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.meta: Dict[str, Any] = {}
+        self.embeddings = None
+        self.norms = None
+        self.pages = None
+        self.source_ids = None
+        self.partition_ids = None
+        self.scalar_indexes: Dict[str, _SortedIndex] = {}
+        self.texts: List[str] = []
+        self.ivf_centroids = None
+        self.ivf_index: Optional[_SortedIndex] = None
+
+    # --- Persistence ---
+
+    @classmethod
+    def create(cls, path: Path, dim: int, description: str, index_params: Dict[str, Any]) -> 'LocalCollection':
+        """Tạo collection rỗng trên disk."""
+        path.mkdir(parents=True, exist_ok=True)
+        meta = {
+            'dim': dim,
+            'description': description,
+            'index_params': index_params,
+            'sources': [],
+            'partitions': [DEFAULT_PARTITION]
+        }
+        with open(path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        collection = cls(path)
+        collection._write_arrays(
+            np.zeros((0, dim), dtype=np.float32),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            []
+        )
+        return collection
+
+    def _save(self, filename: str, array: np.ndarray):
+        """Ghi file qua file tạm rồi rename để không để lại file hỏng."""
+        tmp_path = self.path / f"{filename}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, self.path / filename)
+
+    def _append(self, filename: str, rows: np.ndarray, current: Optional[np.ndarray] = None):
+        """
+        Nối thêm dòng vào cuối file .npy mà không ghi lại dữ liệu cũ.
+
+        Ghi dữ liệu mới trước rồi mới ghi đè header (shape) tại chỗ. Nếu file chưa có
+        hoặc header mới không vừa chỗ header cũ thì ghi lại cả file (current + rows).
+
+        Args:
+            filename: Tên file trong thư mục collection
+            rows: Các dòng mới
+            current: Dữ liệu hiện có (chỉ dùng khi phải ghi lại cả file)
+        """
+        path = self.path / filename
+        if path.exists():
+            with open(path, 'r+b') as f:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                data_offset = f.tell()
+
+                new_shape = (shape[0] + len(rows),) + tuple(shape[1:])
+                header = io.BytesIO()
+                header_fields = {
+                    'descr': np.lib.format.dtype_to_descr(dtype),
+                    'fortran_order': False,
+                    'shape': new_shape
+                }
+                if version == (1, 0):
+                    np.lib.format.write_array_header_1_0(header, header_fields)
+                else:
+                    np.lib.format.write_array_header_2_0(header, header_fields)
+
+                if (
+                    not fortran_order
+                    and tuple(shape[1:]) == tuple(rows.shape[1:])
+                    and len(header.getvalue()) == data_offset
+                ):
+                    f.seek(data_offset + int(np.prod(shape)) * dtype.itemsize)
+                    f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+                    f.truncate()
+                    f.flush()
+                    f.seek(0)
+                    f.write(header.getvalue())
+                    return
+
+        existing = np.load(path) if current is None else np.asarray(current)
+        self._save(filename, np.concatenate([existing, rows.astype(existing.dtype)]))
+
+    def _append_texts(self, texts: List[str], current: List[str]):
+        """Nối text vào cuối texts.json (list JSON) mà không ghi lại text cũ."""
+        path = self.path / 'texts.json'
+        items = ", ".join(json.dumps(text, ensure_ascii=False) for text in texts)
+        with open(path, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end >= 2:
+                f.seek(end - 1)
+                if f.read(1) == b']':
+                    f.seek(end - 1)
+                    f.write(((", " if current else "") + items + "]").encode('utf-8'))
+                    return
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(current + list(texts), f, ensure_ascii=False)
+
+    def _write_arrays(
+        self,
+        embeddings: np.ndarray,
+        pages: np.ndarray,
+        source_ids: np.ndarray,
+        partition_ids: np.ndarray,
+        texts: List[str]
+    ):
+        self._save('embeddings.npy', embeddings)
+        self._save('norms.npy', np.einsum('ij,ij->i', embeddings, embeddings).astype(np.float32))
+        self._save('pages.npy', pages)
+        self._save('source_ids.npy', source_ids)
+        self._save('partition_ids.npy', partition_ids)
+        with open(self.path / 'texts.json', 'w', encoding='utf-8') as f:
+            json.dump(texts, f, ensure_ascii=False)
+
+    def _write_meta(self):
+        with open(self.path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+
+    def load(self):
+        """Load collection vào bộ nhớ (embeddings memory-mapped)."""
+        with self._lock:
+            self._load_locked()
+
+    def _load_locked(self):
+        """load() khi đã giữ self._lock."""
+        if self._loaded:
+            return
+
+        with open(self.path / 'meta.json', 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        # Collection tạo trước khi có partition: mọi dòng thuộc DEFAULT_PARTITION
+        self.meta.setdefault('partitions', [DEFAULT_PARTITION])
+
+        self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='r')
+        self.norms = np.load(self.path / 'norms.npy')
+        self.pages = np.load(self.path / 'pages.npy')
+        self.source_ids = np.load(self.path / 'source_ids.npy')
+        if (self.path / 'partition_ids.npy').exists():
+            self.partition_ids = np.load(self.path / 'partition_ids.npy')
+        else:
+            self.partition_ids = np.zeros(len(self.pages), dtype=np.int32)
+        with open(self.path / 'texts.json', 'r', encoding='utf-8') as f:
+            self.texts = json.load(f)
+
+        if (self.path / 'ivf_centroids.npy').exists():
+            self.ivf_centroids = np.load(self.path / 'ivf_centroids.npy')
+            # Inverted lists: row ids sort theo cluster
+            self.ivf_index = _SortedIndex(np.load(self.path / 'ivf_assign.npy'))
+        else:
+            self.ivf_centroids = None
+            self.ivf_index = None
+
+        self.scalar_indexes = {
+            'page': _SortedIndex(self.pages),
+            'pdf_source': _SortedIndex(self.source_ids),
+            'partition': _SortedIndex(self.partition_ids)
+        }
+
+        self._loaded = True
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """Tham chiếu tới toàn bộ mảng hiện tại, lấy dưới lock (load nếu cần)."""
+        with self._lock:
+            self._load_locked()
+            return {name: getattr(self, name) for name in self._STATE}
+
+    def release(self):
+        """Giải phóng dữ liệu đã load (lần truy cập sau sẽ đọc lại từ disk)."""
+        with self._lock:
+            self._loaded = False
+            self.embeddings = None
+            self.texts = []
+
+    # --- Write ---
+
+    def insert(
+        self,
+        embeddings: Any,
+        texts: List[str],
+        pages: List[int],
+        sources: List[str],
+        partition: Optional[str] = None
+    ) -> int:
+        with self._lock:
+            self._load_locked()
+
+            new_embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.meta['dim'])
+            if len(new_embeddings) == 0:
+                return 0
+            index_params = self.meta.get('index_params') or {}
+            if index_params.get('metric_type', 'L2') == "IP":
+                new_embeddings = normalize_vectors(new_embeddings)
+            partition_id = self._partition_id(partition or DEFAULT_PARTITION)
+
+            meta = {**self.meta, 'sources': list(self.meta['sources'])}
+            new_source_ids = []
+            for source in sources:
+                if source not in meta['sources']:
+                    meta['sources'].append(source)
+                new_source_ids.append(meta['sources'].index(source))
+
+            first_row = len(self.texts)
+            new_norms = np.einsum('ij,ij->i', new_embeddings, new_embeddings).astype(np.float32)
+            new_pages = np.asarray(pages, dtype=np.int64)
+            new_source_ids = np.asarray(new_source_ids, dtype=np.int32)
+            new_partition_ids = np.full(len(new_embeddings), partition_id, dtype=np.int32)
+
+            self._append('embeddings.npy', new_embeddings, self.embeddings)
+            self._append('norms.npy', new_norms, self.norms)
+            self._append('pages.npy', new_pages, self.pages)
+            self._append('source_ids.npy', new_source_ids, self.source_ids)
+            self._append('partition_ids.npy', new_partition_ids, self.partition_ids)
+            self._append_texts(list(texts), self.texts)
+
+            # IVF: gán dòng mới vào centroid có sẵn, chỉ train lại khi collection lớn gấp đôi
+            total = first_row + len(new_embeddings)
+            retrain = index_params.get('index_type', '').startswith('IVF') and (
+                self.ivf_centroids is None or total > 2 * meta.get('ivf_trained_rows', 0)
+            )
+            if retrain:
+                self.meta = meta
+                self._build_index(np.load(self.path / 'embeddings.npy', mmap_mode='r'))
+                self._write_meta()
+                self._loaded = False
+                return len(new_embeddings)
+
+            if self.ivf_centroids is not None:
+                self._append('ivf_assign.npy', _assign_to_centroids(new_embeddings, self.ivf_centroids))
+
+            self.meta = meta
+            self._write_meta()
+
+            # Cập nhật bộ nhớ bằng mảng mới (không sửa mảng mà search đang đọc)
+            self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='r')
+            self.norms = np.concatenate([self.norms, new_norms])
+            self.pages = np.concatenate([self.pages, new_pages])
+            self.source_ids = np.concatenate([self.source_ids, new_source_ids])
+            self.partition_ids = np.concatenate([self.partition_ids, new_partition_ids])
+            self.texts = self.texts + list(texts)
+            self.scalar_indexes = {
+                'page': self.scalar_indexes['page'].extend(self.pages, first_row),
+                'pdf_source': self.scalar_indexes['pdf_source'].extend(self.source_ids, first_row),
+                'partition': self.scalar_indexes['partition'].extend(self.partition_ids, first_row)
+            }
+            if self.ivf_centroids is not None:
+                self.ivf_index = self.ivf_index.extend(np.load(self.path / 'ivf_assign.npy'), first_row)
+
+        return len(new_embeddings)
+
+    # --- Partitions ---
+
+    def _partition_id(self, partition: str, meta: Optional[Dict[str, Any]] = None) -> int:
+        partitions = (meta or self.meta)['partitions']
+        if partition not in partitions:
+            raise ValueError(f"Partition '{partition}' không tồn tại")
+        return partitions.index(partition)
+
+    def list_partitions(self) -> List[str]:
+        return list(self._snapshot()['meta']['partitions'])
+
+    def create_partition(self, partition: str):
+        with self._lock:
+            self._load_locked()
+            if partition in self.meta['partitions']:
+                raise ValueError(f"Partition '{partition}' đã tồn tại")
+            self.meta = {**self.meta, 'partitions': self.meta['partitions'] + [partition]}
+            self._write_meta()
+
+    def drop_partition(self, partition: str):
+        """Xóa partition: ghi lại các dòng còn lại và build lại index."""
+        if partition == DEFAULT_PARTITION:
+            raise ValueError("Không thể xóa partition mặc định")
+
+        with self._lock:
+            self._load_locked()
+            partition_id = self._partition_id(partition)
+            keep = np.flatnonzero(self.partition_ids != partition_id)
+            embeddings = np.asarray(self.embeddings[keep])
+
+            # Partition phía sau dịch lên một vị trí trong meta['partitions']
+            partition_ids = self.partition_ids[keep]
+            partition_ids = np.where(partition_ids > partition_id, partition_ids - 1, partition_ids).astype(np.int32)
+            partitions = list(self.meta['partitions'])
+            del partitions[partition_id]
+
+            self._write_arrays(
+                embeddings,
+                self.pages[keep],
+                self.source_ids[keep],
+                partition_ids,
+                [self.texts[row] for row in keep]
+            )
+            self.meta = {**self.meta, 'partitions': partitions}
+            self._build_index(embeddings)
+            self._write_meta()
+            self._loaded = False
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        state = self._snapshot()
+        for start in range(0, len(state['texts']), batch_size):
+            rows = range(start, min(start + batch_size, len(state['texts'])))
+            yield [
+                {
+                    'embedding': np.asarray(state['embeddings'][row]),
+                    **self._row_to_dict(state, row, ['text', 'page', 'pdf_source', 'partition'])
+                }
+                for row in rows
+            ]
+
+    def count(self, partition: Optional[str] = None) -> int:
+        """Số dòng trong collection hoặc trong một partition."""
+        state = self._snapshot()
+        if partition is None:
+            return len(state['texts'])
+        return int(np.count_nonzero(state['partition_ids'] == self._partition_id(partition, state['meta'])))
+
+    def rebuild_index(self, index_params: Dict[str, Any]):
+        """Đổi index params và build lại index."""
+        with self._lock:
+            self._load_locked()
+            self.meta = {**self.meta, 'index_params': index_params}
+            self._build_index(np.asarray(self.embeddings))
+            self._write_meta()
+            self._loaded = False
+
+    def _build_index(self, embeddings: np.ndarray):
+        """
+        Build lại IVF index (nếu index_type là IVF).
+
+        Ghi số dòng lúc train vào self.meta['ivf_trained_rows']; caller ghi meta.
+        """
+        index_params = self.meta.get('index_params') or {}
+
+        for filename in ('ivf_centroids.npy', 'ivf_assign.npy'):
+            (self.path / filename).unlink(missing_ok=True)
+        self.meta.pop('ivf_trained_rows', None)
+
+        if not index_params.get('index_type', '').startswith('IVF') or len(embeddings) == 0:
+            return
+
+        nlist = index_params.get('params', {}).get('nlist', 1024)
+        centroids = _train_ivf(embeddings, nlist)
+        self._save('ivf_centroids.npy', centroids)
+        self._save('ivf_assign.npy', _assign_to_centroids(embeddings, centroids))
+        self.meta['ivf_trained_rows'] = len(embeddings)
+
+    # --- Read ---
+
+    @property
+    def num_entities(self) -> int:
+        return len(self._snapshot()['texts'])
+
+    @property
+    def metric_type(self) -> str:
+        return (self._snapshot()['meta'].get('index_params') or {}).get('metric_type', 'L2')
+
+    def _filter_rows(
+        self,
+        state: Dict[str, Any],
+        pages: Optional[Sequence[int]],
+        page_range: Optional[Tuple[int, int]],
+        pdf_source: Optional[str],
+        partitions: Optional[List[str]] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Row ids (tăng dần) thỏa filter, tra qua scalar index (None = không filter).
+        """
+        indexes = state['scalar_indexes']
+        sources = state['meta']['sources']
+        candidates = []
+
+        if page_range is not None:
+            candidates.append(indexes['page'].lookup(int(page_range[0]), int(page_range[1])))
+
+        if pages is not None:
+            candidates.append(indexes['page'].lookup_many(pages))
+
+        if pdf_source is not None:
+            if pdf_source in sources:
+                candidates.append(indexes['pdf_source'].lookup(sources.index(pdf_source)))
+            else:
+                candidates.append(np.zeros(0, dtype=np.int64))
+
+        if partitions is not None:
+            partition_ids = [self._partition_id(p, state['meta']) for p in partitions]
+            candidates.append(indexes['partition'].lookup_many(partition_ids))
+
+        if not candidates:
+            return None
+
+        # Giao các tập, bắt đầu từ tập nhỏ nhất
+        candidates.sort(key=len)
+        rows = np.sort(candidates[0])
+        for other in candidates[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    @staticmethod
+    def _row_to_dict(state: Dict[str, Any], row: int, output_fields: List[str]) -> Dict[str, Any]:
+        values = {
+            'text': state['texts'][row],
+            'page': int(state['pages'][row]),
+            'pdf_source': state['meta']['sources'][state['source_ids'][row]],
+            'partition': state['meta']['partitions'][state['partition_ids'][row]]
+        }
+        result = {'id': int(row)}
+        result.update({field: values[field] for field in output_fields if field in values})
+        return result
+
+    def search(
+        self,
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        partitions: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        state = self._snapshot()
+        embeddings = state['embeddings']
+        centroids = state['ivf_centroids']
+        output_fields = output_fields or DEFAULT_OUTPUT_FIELDS
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, state['meta']['dim'])
+        metric = (state['meta'].get('index_params') or {}).get('metric_type', 'L2')
+        if metric == 'IP':
+            queries = normalize_vectors(queries)
+
+        base_rows = self._filter_rows(state, pages, page_range, pdf_source, partitions)
+
+        nprobe = (search_params or DEFAULT_SEARCH_PARAMS).get('params', {}).get('nprobe')
+        use_ivf = centroids is not None and nprobe is not None and nprobe < len(centroids)
+
+        all_hits = []
+        for query in queries:
+            if use_ivf:
+                # Chỉ xét các vector thuộc nprobe cluster gần query nhất
+                centroid_scores = np.einsum('ij,ij->i', centroids, centroids) - 2.0 * centroids @ query
+                probe = np.argpartition(centroid_scores, nprobe - 1)[:nprobe]
+                rows = np.sort(np.concatenate([state['ivf_index'].lookup(int(c)) for c in probe]))
+                if base_rows is not None:
+                    rows = np.intersect1d(rows, base_rows, assume_unique=True)
+            else:
+                rows = base_rows
+
+            candidates = embeddings if rows is None else embeddings[rows]
+            if len(candidates) == 0:
+                all_hits.append([])
+                continue
+
+            dots = np.asarray(candidates) @ query
+            if metric == 'IP':
+                distances = dots
+                order_key = -distances
+            else:
+                norms = state['norms'] if rows is None else state['norms'][rows]
+                distances = norms - 2.0 * dots + float(query @ query)
+                order_key = distances
+
+            k = min(top_k, len(distances))
+            top = np.argpartition(order_key, k - 1)[:k]
+            top = top[np.argsort(order_key[top], kind='stable')]
+
+            hits = []
+            for idx in top:
+                row = int(idx) if rows is None else int(rows[idx])
+                hit = self._row_to_dict(state, row, output_fields)
+                hit['distance'] = float(distances[idx])
+                hits.append(hit)
+            all_hits.append(hits)
+
+        return all_hits
+
+    def query(
+        self,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        limit: int = 1000,
+        partitions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        state = self._snapshot()
+        output_fields = output_fields or DEFAULT_OUTPUT_FIELDS
+
+        rows = self._filter_rows(state, pages, page_range, pdf_source, partitions)
+        if rows is None:
+            rows = np.arange(len(state['texts']))
+
+        return [self._row_to_dict(state, int(row), output_fields) for row in rows[:limit]]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store in-process, không cần Milvus server.
+
+    Mỗi collection là một thư mục trong base_dir (xem LocalCollection).
+    Hỗ trợ exact search (FLAT) và IVF (k-means + nprobe), filter theo page/pdf_source.
+    Distance giống Milvus: L2 là bình phương khoảng cách Euclid, IP là tích vô hướng.
+    """
+
+    backend = "local"
+
+    def __init__(self, base_dir: str = LOCAL_VECTOR_STORE_DIR):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        logger.info(f"✅ LocalVectorStore tại {self.base_dir}")
+
+    def _path(self, name: str) -> Path:
+        return self.base_dir / name
+
+    def _get(self, name: str) -> LocalCollection:
+        with self._lock:
+            if name not in self._collections:
+                if not (self._path(name) / 'meta.json').exists():
+                    raise ValueError(f"Collection '{name}' không tồn tại")
+                self._collections[name] = LocalCollection(self._path(name))
+            return self._collections[name]
+
+    def has_collection(self, name: str) -> bool:
+        return (self._path(name) / 'meta.json').exists()
+
+    def list_collections(self) -> List[str]:
+        return sorted(
+            p.name for p in self.base_dir.iterdir()
+            if (p / 'meta.json').exists()
+        )
+
+    def create_collection(
+        self,
+        name: str,
+        dim: int = EMBEDDING_DIM,
+        description: str = "",
+        index_params: Optional[Dict[str, Any]] = None,
+        with_partition_field: bool = False
+    ) -> None:
+        # Local luôn lưu partition từng dòng nên không cần field riêng
+        if self.has_collection(name):
+            raise ValueError(f"Collection '{name}' đã tồn tại")
+
+        collection = LocalCollection.create(
+            self._path(name),
+            dim,
+            description,
+            index_params or DEFAULT_INDEX_PARAMS
+        )
+        with self._lock:
+            self._collections[name] = collection
+
+    def get_collection(self, name: str) -> LocalCollection:
+        collection = self._get(name)
+        collection.load()
+        return collection
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def insert(
+        self,
+        name: str,
+        embeddings: Any,
+        texts: List[str],
+        pages: List[int],
+        sources: List[str],
+        partition: Optional[str] = None
+    ) -> int:
+        return self._get(name).insert(embeddings, texts, pages, sources, partition)
+
+    def num_entities(self, name: str, partition: Optional[str] = None) -> int:
+        return self._get(name).count(partition)
+
+    def has_partition(self, name: str, partition: str) -> bool:
+        return partition in self._get(name).list_partitions()
+
+    def list_partitions(self, name: str) -> List[str]:
+        return self._get(name).list_partitions()
+
+    def create_partition(self, name: str, partition: str) -> None:
+        self._get(name).create_partition(partition)
+
+    def drop_partition(self, name: str, partition: str) -> None:
+        self._get(name).drop_partition(partition)
+
+    def get_index_params(self, name: str) -> Dict[str, Any]:
+        return dict(self._get(name)._snapshot()['meta'].get('index_params') or {})
+
+    def rebuild_index(self, name: str, index_params: Dict[str, Any]) -> None:
+        self._get(name).rebuild_index(index_params)
+
+    def iter_rows(self, name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        return self._get(name).iter_rows(batch_size)
+
+    def ensure_scalar_indexes(self, name: str) -> List[str]:
+        # Scalar index luôn được build khi load (_SortedIndex), không cần tạo riêng
+        self._get(name)
+        return []
+
+    def rename_collection(self, old_name: str, new_name: str) -> None:
+        if self.has_collection(new_name):
+            raise ValueError(f"Collection '{new_name}' đã tồn tại")
+        with self._lock:
+            self._collections.pop(old_name, None)
+        os.replace(self._path(old_name), self._path(new_name))
+
+    def sample_vectors(self, name: str, n: int, seed: int = 0) -> Tuple[List[int], np.ndarray]:
+        embeddings = self._get(name)._snapshot()['embeddings']
+        total = len(embeddings)
+        rows = np.sort(np.random.default_rng(seed).choice(total, min(n, total), replace=False))
+        return rows.tolist(), np.asarray(embeddings[rows], dtype=np.float32)
+
+    def search(
+        self,
+        name: str,
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        partitions: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        return self._get(name).search(
+            vectors, top_k, pages, page_range, pdf_source, output_fields, search_params, partitions
+        )
+
+    def query(
+        self,
+        name: str,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        limit: int = 1000,
+        partitions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._get(name).query(pages, page_range, pdf_source, output_fields, limit, partitions)
+
+
+# ============================================================================
+# Partitioned layout
+# ============================================================================
+
+class PartitionedVectorStore(VectorStore):
+    """
+    Lưu mọi PDF trong một collection chung, mỗi PDF một partition.
+
+    Bọc một backend (Milvus hoặc local) và giữ nguyên interface VectorStore:
+    "collection" mà code gọi truyền vào được map thành partition trong
+    shared_collection. Search nhiều PDF chỉ cần một lần search với
+    partition filter (xem search_collections) thay vì fan-out từng collection.
+    """
+
+    partitioned = True
+
+    def __init__(self, inner: VectorStore, shared_collection: str = SHARED_COLLECTION_NAME):
+        self.inner = inner
+        self.shared_collection = shared_collection
+        self.backend = inner.backend
+        self.supported_index_types = inner.supported_index_types
+
+    def resolve(self, name: str) -> Tuple[VectorStore, str]:
+        return self.inner, self.shared_collection
+
+    def _ensure_shared(self, dim: int = EMBEDDING_DIM, index_params: Optional[Dict[str, Any]] = None):
+        """Tạo collection chung nếu chưa có."""
+        if not self.inner.has_collection(self.shared_collection):
+            self.inner.create_collection(
+                self.shared_collection,
+                dim=dim,
+                description="Shared collection, one partition per PDF",
+                index_params=index_params,
+                with_partition_field=True
+            )
+            logger.info(f"✅ Đã tạo collection chung '{self.shared_collection}'")
+
+    def has_collection(self, name: str) -> bool:
+        return (
+            self.inner.has_collection(self.shared_collection)
+            and self.inner.has_partition(self.shared_collection, name)
+        )
+
+    def list_collections(self) -> List[str]:
+        if not self.inner.has_collection(self.shared_collection):
+            return []
+        return [
+            p for p in self.inner.list_partitions(self.shared_collection)
+            if p != DEFAULT_PARTITION
+        ]
+
+    def create_collection(
+        self,
+        name: str,
+        dim: int = EMBEDDING_DIM,
+        description: str = "",
+        index_params: Optional[Dict[str, Any]] = None,
+        with_partition_field: bool = False
+    ) -> None:
+        self._ensure_shared(dim, index_params)
+        if self.inner.has_partition(self.shared_collection, name):
+            raise ValueError(f"Collection '{name}' đã tồn tại")
+        self.inner.create_partition(self.shared_collection, name)
+
+    def get_collection(self, name: str) -> Any:
+        """Handle của collection chung (partition không có handle riêng)."""
+        return self.inner.get_collection(self.shared_collection)
+
+    def metric_type(self, name: str) -> str:
+        return self.inner.metric_type(self.shared_collection)
+
+    def get_index_params(self, name: str) -> Dict[str, Any]:
+        return self.inner.get_index_params(self.shared_collection)
+
+    def rebuild_index(self, name: str, index_params: Dict[str, Any]) -> None:
+        # Vector index thuộc collection chung nên build lại cho mọi partition
+        self.inner.rebuild_index(self.shared_collection, index_params)
+
+    def sample_vectors(self, name: str, n: int, seed: int = 0) -> Tuple[List[int], np.ndarray]:
+        # Mẫu lấy trên collection chung: search params được tune cho cả index chung
+        return self.inner.sample_vectors(self.shared_collection, n, seed)
+
+    def ensure_scalar_indexes(self, name: str) -> List[str]:
+        return self.inner.ensure_scalar_indexes(self.shared_collection)
+
+    def has_partition(self, name: str, partition: str) -> bool:
+        return partition in self.list_partitions(name)
+
+    def list_partitions(self, name: str) -> List[str]:
+        # Mỗi "collection" đã là một partition nên chỉ có partition mặc định
+        if not self.has_collection(name):
+            raise ValueError(f"Collection '{name}' không tồn tại")
+        return [DEFAULT_PARTITION]
+
+    def iter_rows(self, name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        batch = []
+        for rows in self.inner.iter_rows(self.shared_collection, batch_size):
+            batch.extend(row for row in rows if row.get('partition') == name)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def rename_collection(self, old_name: str, new_name: str) -> None:
+        """Partition không đổi tên được: copy sang partition mới rồi xóa partition cũ."""
+        if self.has_collection(new_name):
+            raise ValueError(f"Collection '{new_name}' đã tồn tại")
+        if not self.has_collection(old_name):
+            raise ValueError(f"Collection '{old_name}' không tồn tại")
+
+        self.inner.create_partition(self.shared_collection, new_name)
+        for rows in self.iter_rows(old_name):
+            self.insert(
+                new_name,
+                [row['embedding'] for row in rows],
+                [row['text'] for row in rows],
+                [row['page'] for row in rows],
+                [row['pdf_source'] for row in rows]
+            )
+        self.inner.drop_partition(self.shared_collection, old_name)
+
+    def drop_collection(self, name: str) -> None:
+        self.inner.drop_partition(self.shared_collection, name)
+
+    def insert(
+        self,
+        name: str,
+        embeddings: Any,
+        texts: List[str],
+        pages: List[int],
+        sources: List[str],
+        partition: Optional[str] = None
+    ) -> int:
+        return self.inner.insert(self.shared_collection, embeddings, texts, pages, sources, partition=name)
+
+    def num_entities(self, name: str, partition: Optional[str] = None) -> int:
+        return self.inner.num_entities(self.shared_collection, partition=name)
+
+    def search(
+        self,
+        name: str,
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        partitions: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        return self.search_collections(
+            [name], vectors, top_k, pages, page_range, pdf_source, output_fields, search_params
+        )
+
+    def search_collections(
+        self,
+        names: List[str],
+        vectors: Any,
+        top_k: int,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Một lần search trên nhiều "collection" (partition).
+
+        Mỗi hit có thêm key 'partition' = tên collection chứa hit.
+        """
+        output_fields = list(output_fields or DEFAULT_OUTPUT_FIELDS)
+        if 'partition' not in output_fields:
+            output_fields.append('partition')
+
+        return self.inner.search(
+            self.shared_collection,
+            vectors,
+            top_k=top_k,
+            pages=pages,
+            page_range=page_range,
+            pdf_source=pdf_source,
+            output_fields=output_fields,
+            search_params=search_params,
+            partitions=list(names)
+        )
+
+    def query(
+        self,
+        name: str,
+        pages: Optional[Sequence[int]] = None,
+        page_range: Optional[Tuple[int, int]] = None,
+        pdf_source: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        limit: int = 1000,
+        partitions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self.inner.query(
+            self.shared_collection,
+            pages=pages,
+            page_range=page_range,
+            pdf_source=pdf_source,
+            output_fields=output_fields,
+            limit=limit,
+            partitions=[name]
+        )
+
+
+# --- CONVENIENCE FUNCTIONS ---
+
+_vector_store = None
+
+def get_vector_store() -> VectorStore:
+    """
+    Lấy vector store singleton theo cấu hình.
+
+    Backend: biến môi trường VECTOR_STORE_BACKEND, nếu không có thì dùng config.
+    Layout: biến môi trường STORAGE_LAYOUT, nếu không có thì dùng config.
+    """
+    global _vector_store
+    if _vector_store is None:
+        backend = os.getenv("VECTOR_STORE_BACKEND", VECTOR_STORE_BACKEND).lower()
+        layout = os.getenv("STORAGE_LAYOUT", STORAGE_LAYOUT).lower()
+
+        if backend == "milvus":
+            store = MilvusVectorStore()
+        elif backend == "local":
+            store = LocalVectorStore()
+        else:
+            raise ValueError(f"Unsupported vector store backend: {backend}")
+
+        if layout == "partitioned":
+            store = PartitionedVectorStore(store)
+        elif layout != "per_pdf":
+            raise ValueError(f"Unsupported storage layout: {layout}")
+
+        _vector_store = store
+        logger.info(f"🗄️ Vector store backend: {backend} (layout: {layout})")
+    return _vector_store
+
+
+def reset_vector_store():
+    """Reset singleton (dùng khi đổi backend hoặc trong tests)."""
+    global _vector_store
+    _vector_store = None
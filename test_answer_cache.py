@@ -0,0 +1,184 @@
+"""
+Tests cho semantic answer cache (agent/answer_cache.py)
+"""
+
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+
+from agent.answer_cache import AnswerCache
+from src.collection_versions import CollectionVersions
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+RESULT = {'success': True, 'answer': "SELECT lấy dữ liệu", 'sources': [{'pdf': 'a.pdf', 'page': 3}], 'search_results': [1, 2]}
+VERSIONS = {'col_a': "v1", 'col_b': "v1"}
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(max_entries=2, ttl_seconds=60, similarity_threshold=0.95, path=None)
+
+
+def test_near_identical_question_hits(cache):
+    cache.store("SELECT là gì?", _unit(1, 0, 0), ['col_a', 'col_b'], VERSIONS, RESULT)
+
+    hit = cache.lookup(_unit(1, 0.1, 0), ['col_b', 'col_a'], VERSIONS)
+
+    assert hit['answer'] == RESULT['answer'] and hit['sources'] == RESULT['sources']
+    assert 'search_results' not in hit
+    assert hit['cached_question'] == "SELECT là gì?" and hit['similarity'] > 0.95
+    assert cache.lookup(_unit(1, 1, 0), ['col_a', 'col_b'], VERSIONS) is None
+    assert cache.stats == {'hits': 1, 'misses': 1}
+
+
+def test_scope_and_version_mismatch_miss(cache):
+    cache.store("q", _unit(1, 0), ['col_a'], VERSIONS, RESULT)
+
+    assert cache.lookup(_unit(1, 0), ['col_a', 'col_b'], VERSIONS) is None
+    # Collection được index lại → entry cũ bị loại
+    assert cache.lookup(_unit(1, 0), ['col_a'], {'col_a': "v2"}) is None
+    assert len(cache) == 0
+
+
+def test_ttl_and_lru_eviction(cache):
+    cache.store("q1", _unit(1, 0, 0), ['col_a'], VERSIONS, RESULT)
+    cache.store("q2", _unit(0, 1, 0), ['col_a'], VERSIONS, RESULT)
+    cache.lookup(_unit(1, 0, 0), ['col_a'], VERSIONS)
+    cache.store("q3", _unit(0, 0, 1), ['col_a'], VERSIONS, RESULT)
+
+    assert cache.lookup(_unit(0, 1, 0), ['col_a'], VERSIONS) is None
+    assert cache.lookup(_unit(1, 0, 0), ['col_a'], VERSIONS) is not None
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.lookup(_unit(1, 0, 0), ['col_a'], VERSIONS) is None
+
+
+def test_persist_and_reload(tmp_path):
+    path = tmp_path / "answers.npz"
+    AnswerCache(path=str(path)).store("q", _unit(1, 0), ['col_a'], VERSIONS, RESULT)
+
+    reloaded = AnswerCache(path=str(path))
+    hit = reloaded.lookup(_unit(1, 0), ['col_a'], VERSIONS)
+
+    assert hit['answer'] == RESULT['answer']
+    reloaded.invalidate('col_a')
+    assert len(AnswerCache(path=str(path))) == 0
+
+
+def test_collection_versions_bump_and_reload(tmp_path):
+    path = str(tmp_path / "versions.json")
+    writer, reader = CollectionVersions(path=path), CollectionVersions(path=path)
+
+    first = writer.bump('col_a')
+    # Process khác (instance khác cùng file) thấy version mới ngay
+    assert reader.get(['col_a', 'col_b']) == {'col_a': first, 'col_b': None}
+
+    second = writer.bump('col_a')
+    assert second != first and reader.get(['col_a'])['col_a'] == second
+
+
+def test_ingest_bumps_collection_version(tmp_path, monkeypatch):
+    import src.ingest_langchain as ingest_module
+    from langchain.schema import Document
+    from src.config import EMBEDDING_DIM
+    from src.index_policy import IndexPolicy
+    from src.lexical_index import LexicalIndexStore
+    from src.vector_store import LocalVectorStore
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return np.random.default_rng(0).normal(size=(len(texts), EMBEDDING_DIM)).astype(np.float32)
+
+    versions = CollectionVersions(path=None)
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    monkeypatch.setattr(ingest_module, "get_vector_store", lambda: store)
+    monkeypatch.setattr(ingest_module, "get_index_policy", lambda: IndexPolicy(params_file=str(tmp_path / "index.json")))
+    lexical_store = LexicalIndexStore(base_dir=str(tmp_path / "lexical"))
+    monkeypatch.setattr(ingest_module, "get_lexical_store", lambda: lexical_store)
+    monkeypatch.setattr(ingest_module, "get_collection_versions", lambda: versions)
+
+    ingestion = ingest_module.DocumentIngestion.__new__(ingest_module.DocumentIngestion)
+    ingestion.collection_name = 'docs'
+    ingestion.embeddings = FakeEmbeddings()
+    chunks = [Document(page_content="SELECT lấy dữ liệu", metadata={'page': 1, 'pdf_source': 'a.pdf'})]
+
+    ingestion._ingest_chunks(chunks)
+    first = versions.get(['docs'])['docs']
+    assert first is not None
+
+    # Re-ingest (kể cả drop_old) đổi version → answer cache cũ không còn khớp
+    ingestion._ingest_chunks(chunks, drop_old=True)
+    assert versions.get(['docs'])['docs'] != first
+
+
+def test_agent_skips_answer_cache_for_follow_up_questions():
+    from agent.agent import Agent
+    from agent.conversation_history import ConversationHistory
+
+    class FakeSearchTool:
+        def encode_queries(self, queries):
+            return np.array([[1.0, 0.0] if "thứ hai" in q else [0.0, 1.0] for q in queries], dtype=np.float32)
+
+    class FakeRagTool:
+        def __init__(self):
+            self.calls = 0
+
+        def answer_question(self, question, collection_names, conversation_history, top_k, on_token=None):
+            self.calls += 1
+            return {'success': True, 'answer': f"trả lời {self.calls}", 'sources': [{'source': 'a.pdf', 'page': 1}]}
+
+    class FakeCollectionManager:
+        def get_collection_versions(self, names):
+            return {name: "v1" for name in names}
+
+    answer_cache = AnswerCache(path=None)
+    rag_tool = FakeRagTool()
+
+    def make_agent():
+        agent = Agent.__new__(Agent)
+        agent.initialized = True
+        agent.selected_collections = ['col_a']
+        agent.answer_cache = answer_cache
+        agent.search_tool = FakeSearchTool()
+        agent.rag_tool = rag_tool
+        agent.collection_manager = FakeCollectionManager()
+        agent.conversation_history = ConversationHistory()
+        agent._ensure_rag_tool_initialized = lambda: None
+        return agent
+
+    def ask(agent, question):
+        agent.conversation_history.add_message('user', question)
+        response = agent._handle_question(question)
+        agent.conversation_history.add_message('assistant', response)
+        return response
+
+    ask(make_agent(), "còn cái thứ hai thì sao?")
+    assert len(answer_cache) == 1
+
+    # Cùng câu hỏi nhưng là câu nối tiếp trong hội thoại khác → không dùng cache, không lưu
+    follow_up = make_agent()
+    ask(follow_up, "Liệt kê các mệnh đề SQL")
+    response = ask(follow_up, "còn cái thứ hai thì sao?")
+    assert rag_tool.calls == 3 and "cache" not in response
+    assert len(answer_cache) == 2
+
+    # Hội thoại mới hỏi lại câu đầu tiên → trả lời từ cache
+    assert "Trả lời từ cache" in ask(make_agent(), "còn cái thứ hai thì sao?")
+    assert rag_tool.calls == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
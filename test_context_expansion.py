@@ -0,0 +1,105 @@
+"""
+Tests cho context expansion theo cửa sổ trang (src/context_expansion.py)
+
+Dùng LocalVectorStore trong thư mục tạm, không cần Milvus server.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+
+from src.collection_versions import CollectionVersions
+from src.context_expansion import PageCache, merge_page_windows, window_pages
+from src.vector_store import LocalVectorStore
+
+
+def test_distant_hits_stay_separate():
+    windows = merge_page_windows([3, 700], before=1, after=2)
+
+    assert windows == [(2, 5), (699, 702)]
+    assert len(window_pages(windows)) == 8
+
+
+def test_overlapping_and_adjacent_windows_merge():
+    assert merge_page_windows([1, 4, 8], before=1, after=2) == [(1, 10)]
+    assert merge_page_windows([5, 12], before=1, after=2) == [(4, 7), (11, 14)]
+    assert merge_page_windows([]) == []
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path))
+    store.create_collection("docs", dim=4)
+    num_rows = 40
+    store.insert(
+        "docs",
+        np.random.default_rng(0).normal(size=(num_rows, 4)).astype(np.float32),
+        [f"chunk {i}" for i in range(num_rows)],
+        [i // 2 + 1 for i in range(num_rows)],
+        ["a.pdf"] * num_rows
+    )
+
+    calls = []
+    original = store.query
+    store.query = lambda *args, **kwargs: calls.append(kwargs.get('pages')) or original(*args, **kwargs)
+    store.calls = calls
+    return store
+
+
+def test_page_cache_fetches_missing_pages_once(store):
+    cache = PageCache(max_pages=100)
+
+    pages = cache.get_pages(store, "docs", [2, 3, 30])
+
+    assert store.calls == [[2, 3, 30]]
+    assert pages == {2: ["chunk 2", "chunk 3"], 3: ["chunk 4", "chunk 5"]}
+
+    # Câu hỏi tiếp theo: chỉ query trang chưa có (kể cả trang rỗng 30 cũng được cache)
+    assert cache.get_pages(store, "docs", [3, 4, 30])[4] == ["chunk 6", "chunk 7"]
+    assert store.calls == [[2, 3, 30], [4]]
+    assert cache.get_pages(store, "docs", [2, 4]) == {2: ["chunk 2", "chunk 3"], 4: ["chunk 6", "chunk 7"]}
+    assert len(store.calls) == 2
+
+
+def test_page_cache_evicts_lru_and_invalidates(store):
+    cache = PageCache(max_pages=2)
+
+    cache.get_pages(store, "docs", [1, 2])
+    cache.get_pages(store, "docs", [1])
+    cache.get_pages(store, "docs", [3])  # đẩy trang 2 ra
+
+    cache.get_pages(store, "docs", [1, 2])
+    assert store.calls[-1] == [2]
+
+    cache.invalidate("docs")
+    cache.get_pages(store, "docs", [1])
+    assert store.calls[-1] == [1]
+
+
+def test_page_cache_serves_new_text_after_reingest(store):
+    versions = CollectionVersions(path=None)
+    versions.bump("docs")
+    cache = PageCache(max_pages=100, versions=versions)
+
+    assert cache.get_pages(store, "docs", [1]) == {1: ["chunk 0", "chunk 1"]}
+
+    # Ingest lại collection (drop_old) → version đổi
+    store.drop_collection("docs")
+    store.create_collection("docs", dim=4)
+    store.insert("docs", np.ones((1, 4), dtype=np.float32), ["nội dung mới"], [1], ["a.pdf"])
+    versions.bump("docs")
+
+    assert cache.get_pages(store, "docs", [1]) == {1: ["nội dung mới"]}
+    assert store.calls == [[1], [1]]
+    assert cache.get_pages(store, "docs", [1]) == {1: ["nội dung mới"]}
+    assert len(store.calls) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
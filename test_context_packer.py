@@ -0,0 +1,68 @@
+"""
+Tests cho ContextPacker (src/context_packer.py)
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+from src.config import GEMINI_INPUT_TOKEN_LIMIT
+from src.context_packer import ContextPacker, TokenCounter, split_sentences
+
+
+class WordCounter(TokenCounter):
+    """Đếm 1 token / từ để dễ tính ngân sách trong test."""
+
+    def __init__(self):
+        super().__init__(count_fn=lambda text: len(text.split()))
+
+
+def test_estimate_counts_vietnamese_bytes():
+    assert TokenCounter.estimate("abcd") == 1
+    assert TokenCounter.estimate("Tiếng Việt") > TokenCounter.estimate("Tieng Viet")
+
+
+def test_budget_clamped_to_input_limit():
+    assert ContextPacker(budget=GEMINI_INPUT_TOKEN_LIMIT * 2).budget == GEMINI_INPUT_TOKEN_LIMIT
+
+
+def test_packs_highest_priority_first_and_keeps_original_order():
+    packer = ContextPacker(budget=7, counter=WordCounter(), min_truncate_tokens=10)
+    blocks = ["low one two", "high one two", "mid one two"]
+
+    result = packer.pack(blocks, priorities=[0.1, 0.9, 0.5], separator=" | ")
+
+    assert result['kept'] == [1, 2]
+    assert result['dropped'] == [0]
+    assert result['text'] == "high one two | mid one two"
+
+
+def test_truncates_at_sentence_boundary():
+    packer = ContextPacker(budget=7, counter=WordCounter(), min_truncate_tokens=2)
+    blocks = ["a b c", "Câu một hai. Câu ba bốn năm. Câu sáu."]
+
+    result = packer.pack(blocks)
+
+    assert result['truncated'] == [1]
+    assert result['text'].endswith("Câu một hai.")
+    assert result['tokens'] <= packer.budget
+    assert split_sentences(blocks[1]) == ["Câu một hai.", "Câu ba bốn năm.", "Câu sáu."]
+
+
+def test_truncate_keeps_original_whitespace():
+    packer = ContextPacker(counter=WordCounter())
+    text = "Định nghĩa:  ROUGE đo độ trùng n-gram. Ví dụ\nROUGE-1 dùng unigram.\n\nBảng 2 so sánh."
+
+    assert packer.truncate(text, 7) == "Định nghĩa:  ROUGE đo độ trùng n-gram."
+    assert packer.truncate(text, 12) == "Định nghĩa:  ROUGE đo độ trùng n-gram. Ví dụ\nROUGE-1 dùng unigram."
+    assert packer.truncate(text, 1) == ""
+    assert packer.truncate(text, 100) == text
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
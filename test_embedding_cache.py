@@ -0,0 +1,78 @@
+"""
+Tests cho QueryEmbeddingCache (src/embedding_cache.py)
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import unicodedata
+
+import numpy as np
+import pytest
+
+from src.embedding_cache import QueryEmbeddingCache, normalize_query
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_normalize_query():
+    assert normalize_query("  Máy\thọc \n là gì ") == "Máy học là gì"
+    # Dạng tổ hợp (NFD) và dựng sẵn (NFC) cho cùng key
+    assert normalize_query("Việt") == normalize_query("Việt")
+
+
+def test_encode_only_misses_and_dedupes():
+    cache = QueryEmbeddingCache(path=None)
+    model = CountingModel()
+
+    first = cache.encode(model, "m", ["a", "bb", "a "])
+    second = cache.encode(model, "m", ["bb", "ccc"])
+
+    assert model.encoded == ["a", "bb", "ccc"]
+    assert first.shape == (3, 2) and np.allclose(first[2], first[0])
+    assert np.allclose(second[0], first[1])
+    assert cache.stats == {'hits': 1, 'misses': 4}
+
+    # Model khác → key khác
+    cache.encode(model, "other", ["a"])
+    assert model.encoded[-1] == "a"
+
+
+def test_lru_eviction():
+    cache = QueryEmbeddingCache(max_size=2, path=None)
+    for text in ("a", "b"):
+        cache.put("m", text, np.ones(2))
+    cache.get("m", "a")
+    cache.put("m", "c", np.ones(2))
+
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None
+
+
+def test_persist_and_reload(tmp_path):
+    path = tmp_path / "cache.npz"
+    cache = QueryEmbeddingCache(path=str(path))
+    cache.encode(CountingModel(), "m", ["xin chào", "hello"])
+    cache.save()
+
+    reloaded = QueryEmbeddingCache(path=str(path))
+    model = CountingModel()
+    vectors = reloaded.encode(model, "m", ["hello", "xin chào"])
+
+    assert model.encoded == []
+    assert vectors[0][0] == len("hello") and len(reloaded) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,107 @@
+"""
+Tests cho Gemini key pool (src/gemini_pool.py)
+
+Không gọi API thật: _ClientManager được thay bằng fake trả về chính API key.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+import src.llm_langchain as llm_langchain
+from src.gemini_pool import GeminiKeyPool, TokenBucket
+from src.llm_health import HealthTable
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate_per_minute=600)  # 10 token / giây
+
+    assert bucket.try_acquire(600)
+    assert not bucket.try_acquire(5)
+    assert 0.4 < bucket.wait_time(5) <= 0.5
+
+    time.sleep(0.6)
+    assert bucket.try_acquire(5)
+    # Yêu cầu lớn hơn capacity được tính bằng capacity (không chờ mãi)
+    assert bucket.wait_time(10 ** 9) <= 60
+
+
+def test_round_robin_across_keys():
+    pool = GeminiKeyPool(["k1", "k2", "k3"], rpm=100, tpm=10 ** 6)
+
+    chosen = [pool.acquire("m").api_key for _ in range(6)]
+
+    assert chosen == ["k1", "k2", "k3", "k1", "k2", "k3"]
+
+
+def test_exhausted_and_failed_keys_are_skipped():
+    health = HealthTable(ttl_seconds=60)
+    pool = GeminiKeyPool(["k1", "k2", "k3"], rpm=2, tpm=1000)
+    health.mark_failed("k3", "m", "429 quota exceeded")
+
+    # k1 chỉ đủ TPM cho 1 request 800 token → request sau dùng k2
+    assert pool.acquire("m", 800, health).api_key == "k1"
+    assert pool.acquire("m", 800, health).api_key == "k2"
+    # k3 lỗi với model "m" nhưng vẫn dùng được cho model khác
+    assert pool.acquire("other", 100, health).api_key == "k3"
+
+
+def test_waits_for_refill_then_gives_up():
+    pool = GeminiKeyPool(["k1", "k2"], rpm=120, tpm=10 ** 6, max_wait=1.0)  # 2 request / giây / key
+    for _ in range(240):
+        pool.acquire("m")
+
+    start = time.monotonic()
+    pool.acquire("m")
+    assert 0.3 < time.monotonic() - start < 1.0
+
+    pool.max_wait = 0.0
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            pool.acquire("m")
+
+
+def test_record_usage_reconciles_tokens():
+    class Usage:
+        total_token_count = 900
+
+    class Response:
+        usage_metadata = Usage()
+
+    pool = GeminiKeyPool(["k1"], rpm=100, tpm=1000)
+    slot = pool.acquire("m", 100)
+    pool.record_usage(slot, 100, Response())
+
+    assert slot.tokens.available < 150
+
+
+def test_each_key_has_own_client(fake_client_manager):
+    pool = GeminiKeyPool(["k1", "k2"])
+
+    first, second = pool.model(0, "models/test"), pool.model(1, "models/test")
+
+    assert first._client == "k1" and second._client == "k2"
+    assert pool.slots[0].clients is pool.slots[0].clients
+
+
+def test_reads_all_numbered_keys(monkeypatch):
+    for name in list(llm_langchain.os.environ):
+        if name.startswith("GEMINI_API_KEY"):
+            monkeypatch.delenv(name)
+    for i in (1, 2, 10, 5, 7):
+        monkeypatch.setenv(f"GEMINI_API_KEY_{i}", f"key-{i}")
+    monkeypatch.setenv("GEMINI_API_KEY", "key-1")
+
+    keys = llm_langchain.LLMManager._get_gemini_api_keys(object())
+
+    assert keys == ["key-1", "key-2", "key-5", "key-7", "key-10"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
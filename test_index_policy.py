@@ -0,0 +1,196 @@
+"""
+Tests cho IndexPolicy (src/index_policy.py)
+
+Dùng LocalVectorStore trong thư mục tạm, không cần Milvus server.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import json
+
+import numpy as np
+import pytest
+
+from src.index_policy import IndexPolicy, _exact_neighbors, choose_index_params, ivf_nlist, needs_rebuild
+from src.vector_store import LocalVectorStore, PartitionedVectorStore
+
+
+DIM = 16
+
+
+def _clustered(num_rows, seed=0):
+    """Dữ liệu có cấu trúc cụm (giống embedding thật hơn dữ liệu đều)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(32, DIM)) * 4
+    return (centers[rng.integers(0, 32, num_rows)] + rng.normal(size=(num_rows, DIM))).astype(np.float32)
+
+
+def _insert(store, name, embeddings, offset=0):
+    num_rows = len(embeddings)
+    store.insert(
+        name,
+        embeddings,
+        [f"chunk {offset + i}" for i in range(num_rows)],
+        [1] * num_rows,
+        ["a.pdf"] * num_rows
+    )
+
+
+@pytest.fixture
+def policy(tmp_path):
+    return IndexPolicy(params_file=str(tmp_path / "index_params.json"), flat_max=500, hnsw_min=10**9)
+
+
+def test_choose_index_params_tiers():
+    assert choose_index_params(100, flat_max=1000, hnsw_min=5000)['index_type'] == "FLAT"
+
+    ivf = choose_index_params(2000, flat_max=1000, hnsw_min=5000)
+    assert ivf['index_type'] == "IVF_FLAT" and ivf['params']['nlist'] == ivf_nlist(2000)
+
+    assert choose_index_params(10000, flat_max=1000, hnsw_min=5000)['index_type'] == "HNSW"
+    assert choose_index_params(
+        10000, supported=("FLAT", "IVF_FLAT"), flat_max=1000, hnsw_min=5000
+    )['index_type'] == "IVF_FLAT"
+
+
+def test_needs_rebuild():
+    ivf_1024 = {"index_type": "IVF_FLAT", "params": {"nlist": 1024}}
+
+    assert needs_rebuild({"index_type": "FLAT"}, ivf_1024)
+    assert needs_rebuild({"index_type": "IVF_FLAT", "params": {"nlist": 128}}, ivf_1024)
+    assert not needs_rebuild({"index_type": "IVF_FLAT", "params": {"nlist": "1024"}}, ivf_1024)
+
+
+def test_small_collection_stays_flat(policy, tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=DIM, index_params=policy.initial_index_params(store, "docs"))
+    _insert(store, "docs", _clustered(300))
+
+    entry = policy.ensure_index(store, "docs")
+
+    assert entry['index_params']['index_type'] == "FLAT"
+    assert entry['search_params']['params'] == {}
+    assert entry['recall'] == 1.0
+
+
+def test_growth_rebuilds_and_tunes_to_target_recall(policy, tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=DIM, index_params=policy.initial_index_params(store, "docs"))
+    _insert(store, "docs", _clustered(300))
+    policy.ensure_index(store, "docs")
+
+    _insert(store, "docs", _clustered(3000, seed=1), offset=300)
+    entry = policy.ensure_index(store, "docs")
+
+    assert store.get_index_params("docs")['index_type'] == "IVF_FLAT"
+    assert entry['recall'] >= policy.target_recall
+    nprobe = entry['search_params']['params']['nprobe']
+    assert nprobe < entry['index_params']['params']['nlist']
+    assert policy.get_search_params(store, "docs") == entry['search_params']
+
+    # Params được lưu ra file và dùng lại ở instance mới
+    saved = json.loads(Path(policy.params_file).read_text(encoding='utf-8'))
+    assert saved['docs']['search_params'] == entry['search_params']
+    reloaded = IndexPolicy(params_file=str(policy.params_file))
+    assert reloaded.get_search_params(store, "docs") == entry['search_params']
+
+
+def test_ground_truth_is_brute_force(policy, tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=DIM, index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}})
+    embeddings = _clustered(700)
+    _insert(store, "docs", embeddings)
+    ids, queries = store.sample_vectors("docs", 20)
+
+    truth = _exact_neighbors(store, "docs", ids, queries, "L2", top_k=5)
+
+    distances = ((embeddings[None, :, :] - queries[:, None, :]) ** 2).sum(axis=2)
+    distances[np.arange(len(ids)), ids] = np.inf
+    assert truth == np.argsort(distances, axis=1, kind='stable')[:, :5].tolist()
+
+
+def test_tune_recall_is_measured_against_exact_search(policy, tmp_path, monkeypatch):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    ivf = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 32}}
+    store.create_collection("docs", dim=DIM, index_params=ivf)
+    _insert(store, "docs", _clustered(2000))
+
+    # Index chỉ trả về nửa đầu collection dù probe bao nhiêu: recall thật không thể đạt target
+    search = store.search
+    monkeypatch.setattr(store, "search", lambda name, vectors, top_k, **kw: [
+        [hit for hit in hits if hit['id'] < 1000][:top_k]
+        for hits in search(name, vectors, top_k=2000, **kw)
+    ])
+
+    entry = policy.tune(store, "docs", ivf, 2000)
+
+    assert entry['search_params']['params'] == {"nprobe": 32}
+    assert entry['recall'] < policy.target_recall
+
+
+def test_partitioned_layout_tunes_shared_collection(policy, tmp_path):
+    store = PartitionedVectorStore(LocalVectorStore(base_dir=str(tmp_path / "vectors")), shared_collection="shared")
+    store.create_collection("doc_a", dim=DIM, index_params=policy.initial_index_params(store, "doc_a"))
+    _insert(store, "doc_a", _clustered(1000))
+
+    entry = policy.ensure_index(store, "doc_a")
+
+    assert entry['index_params']['index_type'] == "IVF_FLAT"
+    assert list(policy.params) == ["shared"]
+    assert policy.get_search_params(store, "doc_b") == entry['search_params']
+
+
+def test_migrate_l2_to_ip_keeps_partitions(policy, tmp_path):
+    store = PartitionedVectorStore(LocalVectorStore(base_dir=str(tmp_path / "vectors")), shared_collection="shared")
+    l2_flat = {"metric_type": "L2", "index_type": "FLAT", "params": {}}
+    embeddings = _clustered(40) * 3
+    for i, name in enumerate(("doc_a", "doc_b")):
+        store.create_collection(name, dim=DIM, index_params=l2_flat)
+        _insert(store, name, embeddings[i * 20:(i + 1) * 20], offset=i * 20)
+
+    migrated = policy.migrate_metric(store, "doc_a", "IP")
+
+    assert migrated == 40
+    assert store.metric_type("doc_a") == "IP"
+    assert store.list_collections() == ["doc_a", "doc_b"]
+    assert store.num_entities("doc_b") == 20
+    assert store.inner.list_collections() == ["shared"]
+
+    hits = store.search("doc_b", [embeddings[25]], top_k=1)[0]
+    assert hits[0]['text'] == "chunk 25"
+    assert hits[0]['distance'] == pytest.approx(1.0, abs=1e-5)
+    assert policy.migrate_metric(store, "doc_a", "IP") == 0
+
+
+def test_migrate_keeps_original_when_swap_fails(policy, tmp_path, monkeypatch):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=DIM, index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}})
+    _insert(store, "docs", _clustered(30))
+
+    rename = store.rename_collection
+
+    def failing_rename(old_name, new_name):
+        if old_name.startswith("docs_migrate"):
+            raise OSError("disk full")
+        rename(old_name, new_name)
+
+    monkeypatch.setattr(store, "rename_collection", failing_rename)
+    with pytest.raises(OSError):
+        policy.migrate_metric(store, "docs", "IP")
+
+    assert store.metric_type("docs") == "L2"
+    assert store.num_entities("docs") == 30
+    assert not store.has_collection("docs_pre_migrate")
+
+    monkeypatch.setattr(store, "rename_collection", rename)
+    assert policy.migrate_metric(store, "docs", "IP") == 30
+    assert store.list_collections() == ["docs"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
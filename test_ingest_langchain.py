@@ -0,0 +1,110 @@
+"""
+Tests cho pipeline ingest (src/ingest_langchain.DocumentIngestion)
+
+Embedding giả + LocalVectorStore trong thư mục tạm, không cần Milvus server.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+import src.ingest_langchain as ingest_module
+from src.collection_versions import CollectionVersions
+from src.config import EMBEDDING_DIM
+from src.index_policy import IndexPolicy
+from src.lexical_index import LexicalIndexStore
+from src.vector_store import LocalVectorStore, PartitionedVectorStore
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return np.random.default_rng(0).normal(size=(len(texts), EMBEDDING_DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def ingestion(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module, "get_index_policy", lambda: IndexPolicy(params_file=str(tmp_path / "index.json")))
+    lexical_store = LexicalIndexStore(base_dir=str(tmp_path / "lexical"))
+    monkeypatch.setattr(ingest_module, "get_lexical_store", lambda: lexical_store)
+    monkeypatch.setattr(ingest_module, "get_collection_versions", lambda: CollectionVersions(path=None))
+
+    ingestion = ingest_module.DocumentIngestion.__new__(ingest_module.DocumentIngestion)
+    ingestion.collection_name = 'docs'
+    ingestion.embeddings = FakeEmbeddings()
+    return ingestion
+
+
+def test_partitioned_milvus_layout_ingests_into_shared_collection(ingestion, tmp_path, monkeypatch):
+    store = PartitionedVectorStore(LocalVectorStore(base_dir=str(tmp_path / "vectors")), shared_collection="shared")
+    # Giả lập Milvus: PartitionedVectorStore lấy backend từ store bên trong
+    store.backend = "milvus"
+    monkeypatch.setattr(ingest_module, "get_vector_store", lambda: store)
+
+    def fail_langchain_milvus(*args, **kwargs):
+        raise AssertionError("layout partitioned không được tạo collection LangChain riêng")
+
+    monkeypatch.setattr(ingest_module.DocumentIngestion, "ingest_to_milvus", fail_langchain_milvus)
+
+    chunks = [
+        Document(page_content="SELECT lấy dữ liệu", metadata={'page': 1, 'pdf_source': 'a.pdf'}),
+        Document(page_content="WHERE lọc dòng", metadata={'page': 2, 'pdf_source': 'a.pdf'}),
+    ]
+    ingestion._ingest_chunks(chunks)
+
+    assert store.list_collections() == ['docs']
+    rows = [row for batch in store.iter_rows('docs') for row in batch]
+    assert sorted((row['page'], row['text']) for row in rows) == [(1, "SELECT lấy dữ liệu"), (2, "WHERE lọc dòng")]
+
+
+class FakeLangChainMilvus:
+    """Thay langchain_milvus.Milvus: add_texts ghi vào vector store của test."""
+
+    store = None
+    instances = []
+
+    def __init__(self, embedding_function, collection_name, connection_args=None, **kwargs):
+        self.embedding_function = embedding_function
+        self.collection_name = collection_name
+        self.kwargs = kwargs
+        FakeLangChainMilvus.instances.append(self)
+
+    def add_texts(self, texts, metadatas=None):
+        FakeLangChainMilvus.store.insert(
+            self.collection_name,
+            self.embedding_function.embed_documents(texts),
+            list(texts),
+            [m['page'] for m in metadatas],
+            [m['pdf_source'] for m in metadatas]
+        )
+
+
+def test_milvus_ingest_uses_index_policy(ingestion, tmp_path, monkeypatch):
+    store = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    policy = IndexPolicy(params_file=str(tmp_path / "policy.json"))
+    monkeypatch.setattr(ingest_module, "get_vector_store", lambda: store)
+    monkeypatch.setattr(ingest_module, "get_index_policy", lambda: policy)
+    FakeLangChainMilvus.store, FakeLangChainMilvus.instances = store, []
+    monkeypatch.setattr(ingest_module, "Milvus", FakeLangChainMilvus)
+
+    chunks = [Document(page_content=f"chunk {i}", metadata={'page': i, 'pdf_source': 'a.pdf', 'source': 'x'}) for i in range(5)]
+    ingestion.ingest_to_milvus(chunks)
+
+    # Collection được tạo theo index policy (không hardcode HNSW) với schema của repo
+    [milvus] = FakeLangChainMilvus.instances
+    assert milvus.kwargs == store.langchain_kwargs('docs')
+    assert store.get_index_params('docs')['index_type'] == "FLAT"
+    # ensure_index đã chạy → search params được tune và lưu
+    assert 'docs' in policy.params and policy.params['docs']['num_entities'] == 5
+    rows = [row for batch in store.iter_rows('docs') for row in batch]
+    assert sorted(row['page'] for row in rows) == [0, 1, 2, 3, 4]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
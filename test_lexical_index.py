@@ -0,0 +1,113 @@
+"""
+Tests cho lexical index BM25 (src/lexical_index.py)
+
+Dùng thư mục tạm, không cần Milvus server.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+
+from src.lexical_index import (
+    LexicalIndexStore,
+    fold_diacritics,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+from src.vector_store import LocalVectorStore
+
+
+TEXTS = [
+    "Câu lệnh SELECT dùng để truy vấn dữ liệu từ bảng.",
+    "Định luật Ohm: cường độ dòng điện tỉ lệ với hiệu điện thế.",
+    "Câu 15: Tính vận tốc của vật rơi tự do sau 2 giây.",
+    "Mệnh đề WHERE lọc các dòng thỏa mãn điều kiện, thường đi kèm SELECT.",
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LexicalIndexStore(base_dir=str(tmp_path))
+    store.add_documents("docs", TEXTS, [1, 2, 3, 4], ["a.pdf"] * 4)
+    return store
+
+
+def test_tokenize_keeps_diacritics_and_identifiers():
+    assert tokenize("Truy VẤN user_id = 15") == ["truy", "vấn", "user_id", "15"]
+    assert fold_diacritics("đường truyền") == "duong truyen"
+
+
+def test_exact_identifier_ranks_first(store):
+    hits = store.search("docs", "SELECT", top_k=5)
+
+    assert [h['page'] for h in hits] == [1, 4]
+    assert hits[0]['bm25'] > hits[1]['bm25'] > 0
+    assert hits[0]['text'] == TEXTS[0] and hits[0]['pdf_source'] == "a.pdf"
+
+    assert [h['page'] for h in store.search("docs", "câu 15", top_k=1)] == [3]
+
+
+def test_query_without_diacritics_matches(store):
+    assert [h['page'] for h in store.search("docs", "dinh luat ohm", top_k=1)] == [2]
+    # Query có dấu chỉ khớp đúng từ có dấu
+    assert store.search("docs", "đinh", top_k=5) == []
+
+
+def test_reload_from_disk_and_append(store, tmp_path):
+    reloaded = LexicalIndexStore(base_dir=str(tmp_path))
+    index = reloaded.get("docs")
+    assert isinstance(index.postings_docs, np.memmap)
+
+    reloaded.add_documents("docs", ["JOIN kết hợp nhiều bảng"], [9], ["b.pdf"])
+    assert reloaded.get("docs").num_docs == 5
+    assert reloaded.search("docs", "join", top_k=1)[0]['pdf_source'] == "b.pdf"
+
+    reloaded.drop("docs")
+    assert reloaded.search("docs", "SELECT", top_k=1) == []
+
+
+def test_build_from_vector_store(tmp_path):
+    vectors = LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+    vectors.create_collection("docs", dim=4)
+    vectors.insert("docs", np.ones((2, 4), dtype=np.float32), TEXTS[:2], [1, 2], ["a.pdf"] * 2)
+
+    store = LexicalIndexStore(base_dir=str(tmp_path / "lexical"))
+
+    assert store.build_from_vector_store(vectors, "docs") == 2
+    assert store.search("docs", "ohm", top_k=1)[0]['page'] == 2
+
+
+def test_lexical_score_is_normalized_and_floored(store):
+    hits = store.search("docs", "SELECT dữ liệu bảng", top_k=5)
+
+    assert [h['page'] for h in hits] == [1, 4]
+    assert all(0 < h['lexical_score'] < 1 for h in hits)
+    assert hits[0]['lexical_score'] > hits[1]['lexical_score']
+
+    # Trang 4 chỉ khớp "SELECT" (một phần nhỏ trọng lượng query) → bị bỏ khi có ngưỡng
+    floored = store.search("docs", "SELECT dữ liệu bảng", top_k=5, min_score=hits[1]['lexical_score'] + 1e-6)
+    assert [h['page'] for h in floored] == [1]
+
+
+def test_reciprocal_rank_fusion_merges_lists():
+    vector = [{'collection': 'c', 'page': 1, 'text': 'a', 'score': 0.9},
+              {'collection': 'c', 'page': 2, 'text': 'b', 'score': 0.8}]
+    lexical = [{'collection': 'c', 'page': 2, 'text': 'b', 'bm25': 3.0},
+               {'collection': 'c', 'page': 3, 'text': 'c', 'bm25': 1.0}]
+
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+
+    assert [r['page'] for r in fused] == [2, 1, 3]
+    assert fused[0]['score'] == 0.8 and fused[0]['bm25'] == 3.0
+    assert fused[0]['rrf_score'] == pytest.approx(1 / 62 + 1 / 61)
+    assert len(reciprocal_rank_fusion([vector, lexical], limit=2)) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+"""
+Tests cho batch generation (LLMManager.generate_batch, RAGChain.ask_batch)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật;
+RAGChain dùng LocalVectorStore tạm và embedding giả.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from src.context_expansion import PageCache
+from src.qa_langchain import RAGChain
+from src.vector_store import LocalVectorStore
+
+
+class SlowEchoModel:
+    """Mỗi request mất 0.1s; prompt chứa "bad" bị từ chối (lỗi không retry)."""
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(0.1)
+        if "bad" in prompt:
+            raise google_exceptions.InvalidArgument("prompt bị chặn")
+
+        class Response:
+            text = f"echo {prompt}"
+        return Response()
+
+
+@pytest.fixture
+def manager(gemini_manager):
+    return gemini_manager(SlowEchoModel, keys=["k1", "k2"], models=["m1"])
+
+
+def test_generate_batch_keeps_order_and_isolates_errors(manager):
+    prompts = [f"q{i}" for i in range(7)] + ["bad q"]
+
+    start = time.monotonic()
+    results = manager.generate_batch(prompts, concurrency=4)
+    elapsed = time.monotonic() - start
+
+    assert [r['text'] for r in results[:7]] == [f"echo q{i}" for i in range(7)]
+    assert results[7]['success'] is False and "InvalidArgument" in results[7]['error']
+    # 8 request x 0.1s với 4 luồng → ~0.2s thay vì 0.8s
+    assert elapsed < 0.5
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        vectors = {"alpha": [1, 0, 0, 0], "beta": [0, 1, 0, 0]}
+        return [vectors.get(text.split()[0], [0, 0, 1, 0]) for text in texts]
+
+
+class FakeBatchLLM:
+    provider = "gemini"
+
+    def __init__(self):
+        self.prompts = None
+
+    def generate_batch(self, prompts, concurrency=None, cache=False):
+        self.prompts = prompts
+        return [
+            {'success': False, 'error': "quota"} if "Câu hỏi: beta" in prompt else {'success': True, 'text': "ok"}
+            for prompt in prompts
+        ]
+
+
+def test_ask_batch_retrieves_once_and_keeps_order(tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path))
+    store.create_collection("docs", dim=4)
+    store.insert(
+        "docs",
+        np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float32),
+        ["nội dung alpha", "nội dung beta"],
+        [1, 5],
+        ["a.pdf", "b.pdf"]
+    )
+
+    chain = object.__new__(RAGChain)
+    chain.llm_manager = FakeBatchLLM()
+    chain.collection_name = "docs"
+    chain.embeddings = FakeEmbeddings()
+    chain.vector_store = store
+    chain.page_cache = PageCache()
+    chain.vectorstore = None
+    chain._build_chain()
+
+    results = chain.ask_batch(["alpha là gì?", "beta là gì?"])
+
+    assert chain.embeddings.batches == [["alpha là gì?", "beta là gì?"]]
+    assert len(chain.llm_manager.prompts) == 2
+    assert "alpha là gì?" in chain.llm_manager.prompts[0]
+    assert results[0]['answer'] == "ok"
+    assert results[0]['context']['tokens'] > 0 and results[0]['context']['dropped'] == []
+    assert results[1]['answer'] == "[LỖI HỆ THỐNG] quota"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
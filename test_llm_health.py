@@ -0,0 +1,117 @@
+"""
+Tests cho health check lazy của Gemini (src/llm_health.py, LLMManager)
+
+Thay genai.GenerativeModel bằng fake model, không gọi API thật.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+import src.llm_langchain as llm_langchain
+from src.llm_health import HealthTable, is_key_error
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Ghi lại mọi request; model trong `broken` luôn lỗi 404, key 'bad' lỗi 403."""
+
+    calls = []
+    broken = set()
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+        self._async_client = None
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self._client = self._async_client
+        return self.generate_content(prompt, **kwargs)
+
+    def generate_content(self, prompt, **kwargs):
+        key = self._client
+        FakeGenerativeModel.calls.append((key, self.model_name, prompt))
+        if key == "bad-key-000000":
+            raise RuntimeError("403 API key not valid")
+        if self.model_name in FakeGenerativeModel.broken:
+            raise RuntimeError("404 model not found")
+        return FakeResponse(f"answer from {self.model_name}")
+
+
+@pytest.fixture
+def manager_factory(gemini_manager, monkeypatch):
+    FakeGenerativeModel.calls = []
+    FakeGenerativeModel.broken = set()
+    monkeypatch.setattr(llm_langchain.genai, "configure", lambda **kwargs: pytest.fail("genai.configure là global"))
+
+    def _make(keys, models, health=None):
+        health = health or HealthTable(ttl_seconds=60)
+        return gemini_manager(FakeGenerativeModel, keys=keys, models=models, get_health_table=lambda: health)
+
+    return _make
+
+
+def test_init_sends_no_probe(manager_factory):
+    manager = manager_factory(["bad-key-000000", "good-key-11111"], ["m1", "m2"])
+
+    assert FakeGenerativeModel.calls == []
+    assert manager.current_key_index == 0 and manager.model_name == "m1"
+
+
+def test_failover_skips_known_bad_without_round_trips(manager_factory):
+    health = HealthTable(ttl_seconds=60)
+    FakeGenerativeModel.broken = {"m1"}
+    manager = manager_factory(["bad-key-000000", "good-key-11111"], ["m1", "m2"], health)
+
+    assert manager.generate("q1") == "answer from m2"
+    # bad key (403 → cả key bị đánh dấu), rồi good-key/m1 (404), rồi good-key/m2
+    assert [(k[:3], m) for k, m, _ in FakeGenerativeModel.calls] == [("bad", "m1"), ("goo", "m1"), ("goo", "m2")]
+    assert all(prompt == "q1" for _, _, prompt in FakeGenerativeModel.calls)
+
+    # Manager mới dùng chung health table → chọn ngay cặp còn tốt
+    FakeGenerativeModel.calls = []
+    other = manager_factory(["bad-key-000000", "good-key-11111"], ["m1", "m2"], health)
+    assert other.generate("q2") == "answer from m2"
+    assert len(FakeGenerativeModel.calls) == 1
+
+
+def test_agenerate_uses_same_failover(manager_factory):
+    FakeGenerativeModel.broken = {"m1"}
+    manager = manager_factory(["bad-key-000000", "good-key-11111"], ["m1", "m2"])
+
+    async def ask_concurrently():
+        return await asyncio.gather(manager.agenerate("q1"), manager.agenerate("q2"))
+
+    assert asyncio.run(ask_concurrently()) == ["answer from m2", "answer from m2"]
+    assert manager.model_name == "m2"
+    # Sau khi đã biết bad-key và m1 lỗi, không request nào gửi lại cặp lỗi
+    assert ("bad", "m2") not in [(k[:3], m) for k, m, _ in FakeGenerativeModel.calls]
+
+
+def test_health_entries_expire():
+    health = HealthTable(ttl_seconds=0.05)
+    health.mark_failed("k", "m", "404 not found")
+    health.mark_failed("k2", "m", "401 invalid api key")
+
+    assert health.status("k", "m") is False
+    assert health.status("k2", "other-model") is False
+    assert health.status("k", "other-model") is None
+
+    time.sleep(0.1)
+    assert health.is_usable("k", "m") and health.is_usable("k2", "m")
+    assert is_key_error("403 Forbidden") and not is_key_error("429 quota exceeded")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,130 @@
+"""
+Tests cho hedged request (src/llm_metrics.py, LLMManager.generate/agenerate khi hedge=True)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+import src.gemini_pool as gemini_pool
+from src.llm_metrics import LatencyHistogram, LatencyTracker
+
+
+def test_histogram_percentile_and_window():
+    histogram = LatencyHistogram(window=100)
+    assert histogram.percentile(95) is None
+
+    for ms in range(1, 201):
+        histogram.record(ms / 1000)
+
+    # Chỉ giữ 100 mẫu gần nhất (101..200 ms)
+    assert len(histogram) == 100
+    assert histogram.percentile(50) == pytest.approx(0.150)
+    assert histogram.percentile(95) == pytest.approx(0.195)
+    assert histogram.percentile(100) == pytest.approx(0.200)
+
+
+def test_hedge_delay_uses_default_until_enough_samples():
+    tracker = LatencyTracker(percentile=90, min_samples=5, default_delay=3.0)
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        tracker.record("m", seconds)
+    assert tracker.hedge_delay("m") == 3.0
+
+    tracker.record("m", 0.5)
+    assert tracker.hedge_delay("m") == pytest.approx(0.5)
+    assert tracker.snapshot()["m"]["count"] == 5
+
+
+class SlowModel:
+    """Độ trễ của mỗi model lấy từ `delays`; ghi lại request bị hủy (async)."""
+
+    delays = {}
+    calls = []
+    cancelled = []
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+        self._async_client = None
+
+    def _response(self):
+        class Response:
+            text = f"ok from {self.model_name}"
+        return Response()
+
+    def generate_content(self, prompt, **kwargs):
+        SlowModel.calls.append(self.model_name)
+        time.sleep(SlowModel.delays.get(self.model_name, 0.0))
+        return self._response()
+
+    async def generate_content_async(self, prompt, **kwargs):
+        SlowModel.calls.append(self.model_name)
+        try:
+            await asyncio.sleep(SlowModel.delays.get(self.model_name, 0.0))
+        except asyncio.CancelledError:
+            SlowModel.cancelled.append(self.model_name)
+            raise
+        return self._response()
+
+
+@pytest.fixture
+def manager(gemini_manager, monkeypatch):
+    SlowModel.delays, SlowModel.calls, SlowModel.cancelled = {}, [], []
+    monkeypatch.setattr(gemini_pool.KeySlot, "async_client", lambda self: self.api_key)
+    return gemini_manager(
+        SlowModel,
+        models=["m1", "m2"],
+        manager_kwargs={'hedge': True},
+        get_latency_tracker=lambda: LatencyTracker(min_samples=3, default_delay=0.05)
+    )
+
+
+def test_fast_primary_is_not_hedged(manager):
+    assert manager.generate("q") == "ok from m1"
+    assert SlowModel.calls == ["m1"]
+    assert len(manager.latency.histogram("m1")) == 1
+
+
+def test_slow_primary_hedged_to_next_model(manager):
+    SlowModel.delays = {"m1": 0.5}
+
+    start = time.monotonic()
+    assert manager.generate("q") == "ok from m2"
+
+    assert time.monotonic() - start < 0.4
+    assert SlowModel.calls == ["m1", "m2"]
+
+
+def test_hedge_threshold_follows_model_latency(manager):
+    for _ in range(3):
+        manager.latency.record("m1", 1.0)
+    SlowModel.delays = {"m1": 0.2}
+
+    # p95 của m1 là 1s → request 0.2s không bị hedge
+    assert manager.generate("q") == "ok from m1"
+    assert SlowModel.calls == ["m1"]
+
+
+def test_async_hedge_cancels_loser(manager):
+    SlowModel.delays = {"m1": 0.5}
+
+    async def run():
+        result = await manager.agenerate("q")
+        await asyncio.sleep(0)  # cho task bị hủy chạy xong
+        return result
+
+    assert asyncio.run(run()) == "ok from m2"
+    assert SlowModel.cancelled == ["m1"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,176 @@
+"""
+Tests cho retry policy và circuit breaker (src/llm_retry.py, HealthTable, LLMManager)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import src.llm_langchain as llm_langchain
+from src.gemini_pool import KeyPoolExhausted
+from src.llm_health import HealthTable
+from src.llm_retry import (
+    AUTH, FATAL, NOT_FOUND, RATE_LIMIT, TRANSIENT,
+    RetryPolicy, classify_error, get_retry_after,
+)
+
+
+def test_classify_typed_errors_and_messages():
+    assert classify_error(google_exceptions.ResourceExhausted("quota")) == RATE_LIMIT
+    assert classify_error(google_exceptions.PermissionDenied("no")) == AUTH
+    assert classify_error(google_exceptions.InvalidArgument("API key not valid")) == AUTH
+    assert classify_error(google_exceptions.InvalidArgument("invalid JSON payload")) == FATAL
+    assert classify_error(google_exceptions.NotFound("models/x")) == NOT_FOUND
+    assert classify_error(google_exceptions.ServiceUnavailable("overloaded")) == TRANSIENT
+    assert classify_error(TimeoutError("read timed out")) == TRANSIENT
+    assert classify_error(KeyPoolExhausted("Không còn API key nào")) == RATE_LIMIT
+    # Không có kiểu → theo message; "invalid" đơn lẻ không còn bị coi là lỗi key
+    assert classify_error(RuntimeError("429 Too Many Requests")) == RATE_LIMIT
+    assert classify_error(ValueError("invalid prompt")) == FATAL
+
+
+def test_retry_after_sources():
+    class Response:
+        headers = {'Retry-After': "7"}
+
+    class HttpError(Exception):
+        response = Response()
+
+    class Duration:
+        seconds, nanos = 3, 500_000_000
+
+    class RetryInfo:
+        retry_delay = Duration()
+
+    grpc_error = google_exceptions.ResourceExhausted("quota", details=[RetryInfo()])
+
+    assert get_retry_after(HttpError("429")) == 7.0
+    assert get_retry_after(grpc_error) == 3.5
+    assert get_retry_after(RuntimeError("429 quota. Please retry in 12.5s.")) == 12.5
+    assert get_retry_after(KeyPoolExhausted("hết quota", 4.0)) == 4.0
+    assert get_retry_after(RuntimeError("boom")) is None
+
+
+def test_backoff_jitter_and_cooldown():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0, cooldown=10, failure_threshold=3,
+                         max_cooldown=300, rng=lambda: 0.5)
+
+    assert [policy.backoff(a) for a in (1, 2, 3, 5)] == [0.5, 1.0, 2.0, 4.0]
+    assert policy.backoff(1, retry_after=3.0) == 3.0
+    assert policy.backoff(1, retry_after=60.0) is None
+
+    assert [policy.cooldown(RATE_LIMIT, f) for f in (1, 2, 3)] == [10, 20, 40]
+    assert policy.cooldown(RATE_LIMIT, 1, retry_after=5) == 5
+    assert [policy.cooldown(TRANSIENT, f) for f in (1, 2, 3, 4)] == [0.0, 0.0, 10, 20]
+    assert policy.cooldown(AUTH, 1) == 300
+
+
+def test_breaker_half_opens_after_cooldown():
+    health = HealthTable(ttl_seconds=60)
+    health.mark_failed("k", "m", "429 quota", cooldown=0.05)
+
+    assert not health.is_usable("k", "m")
+    assert 0 < health.retry_in("k", "m") <= 0.05
+
+    time.sleep(0.06)
+    assert health.is_usable("k", "m") and health.failures("k", "m") == 1
+
+    health.mark_failed("k", "m", "429 quota", cooldown=0.05)
+    assert health.failures("k", "m") == 2
+    health.mark_ok("k", "m")
+    assert health.failures("k", "m") == 0 and health.status("k", "m") is True
+
+
+class ScriptedModel:
+    """Mỗi key có một danh sách lỗi được raise lần lượt trước khi trả lời thành công."""
+
+    calls = []
+    script = {}
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+
+    def generate_content(self, prompt, **kwargs):
+        ScriptedModel.calls.append(self._client)
+        errors = ScriptedModel.script.get(self._client, [])
+        if errors:
+            raise errors.pop(0)
+
+        class Response:
+            text = f"ok from {self._client}"
+        return Response()
+
+
+@pytest.fixture
+def manager_factory(gemini_manager, monkeypatch):
+    ScriptedModel.calls = []
+    sleeps = []
+    real_sleep = time.sleep
+
+    def fake_sleep(seconds):
+        # Ghi lại thời gian chờ, chỉ ngủ thật tối đa 50ms
+        sleeps.append(seconds)
+        real_sleep(min(seconds, 0.05))
+
+    monkeypatch.setattr(llm_langchain.time, "sleep", fake_sleep)
+
+    def _make(keys, script):
+        ScriptedModel.script = script
+        manager = gemini_manager(ScriptedModel, keys=keys)
+        manager.retry_policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=lambda: 1.0)
+        return manager, sleeps
+
+    return _make
+
+
+def test_rate_limited_key_is_skipped_without_sleeping(manager_factory):
+    manager, sleeps = manager_factory(
+        ["k1", "k2"], {"k1": [google_exceptions.ResourceExhausted("quota exceeded")]}
+    )
+
+    assert manager.generate("q1") == "ok from k2"
+    # Breaker của k1 đang mở → các request sau không gửi lại qua k1
+    assert manager.generate("q2") == "ok from k2"
+    assert manager.generate("q3") == "ok from k2"
+    assert ScriptedModel.calls == ["k1", "k2", "k2", "k2"]
+    assert sleeps == []
+
+
+def test_transient_errors_back_off_then_succeed(manager_factory):
+    manager, sleeps = manager_factory(
+        ["k1"], {"k1": [google_exceptions.ServiceUnavailable("overloaded")] * 2}
+    )
+
+    assert manager.generate("q") == "ok from k1"
+    assert sleeps == [1.0, 2.0]
+
+
+def test_retry_after_honoured_when_all_keys_limited(manager_factory):
+    manager, sleeps = manager_factory(
+        ["k1"], {"k1": [google_exceptions.ResourceExhausted("quota. Please retry in 0.02s")]}
+    )
+
+    assert manager.generate("q") == "ok from k1"
+    assert len(sleeps) == 1 and 0.0 < sleeps[0] <= 1.0
+
+
+def test_fatal_error_not_retried(manager_factory):
+    manager, sleeps = manager_factory(["k1"], {"k1": [google_exceptions.InvalidArgument("bad request")]})
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        manager.generate("q")
+    assert ScriptedModel.calls == ["k1"] and sleeps == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,122 @@
+"""
+Tests cho streaming của LLMManager.generate_stream và RagTool (on_token)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+from agent.tools.rag_tool import RagTool
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("chunk không có text")
+        return self._text
+
+
+class FakeStreamingModel:
+    """Model trong `broken` lỗi 404 trước chunk đầu tiên; `midway` lỗi sau chunk đầu tiên."""
+
+    calls = []
+    broken = set()
+    midway = set()
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        FakeStreamingModel.calls.append((self.model_name, stream))
+
+        def chunks():
+            if self.model_name in FakeStreamingModel.broken:
+                raise RuntimeError("404 model not found")
+            yield FakeChunk("Xin ")
+            if self.model_name in FakeStreamingModel.midway:
+                raise RuntimeError("500 connection reset")
+            yield FakeChunk(None)
+            yield FakeChunk("chào")
+
+        return chunks()
+
+
+@pytest.fixture
+def manager(gemini_manager):
+    FakeStreamingModel.calls = []
+    FakeStreamingModel.broken = set()
+    FakeStreamingModel.midway = set()
+    return gemini_manager(FakeStreamingModel, keys=["key-1111111111"], models=["m1", "m2"])
+
+
+def test_stream_falls_back_before_first_token(manager):
+    FakeStreamingModel.broken = {"m1"}
+
+    chunks = list(manager.generate_stream("q"))
+
+    assert chunks == ["Xin ", "chào"]
+    assert FakeStreamingModel.calls == [("m1", True), ("m2", True)]
+    assert manager.model_name == "m2"
+
+
+def test_stream_error_after_first_token_is_raised(manager):
+    FakeStreamingModel.midway = {"m1"}
+    received = []
+
+    with pytest.raises(RuntimeError, match="connection reset"):
+        for chunk in manager.generate_stream("q"):
+            received.append(chunk)
+
+    assert received == ["Xin "]
+    assert FakeStreamingModel.calls == [("m1", True)]
+    # Lỗi giữa stream vẫn được ghi vào circuit breaker như generate()
+    assert manager.health.failures("key-1111111111", "m1") == 1
+
+    # Model liên tục lỗi giữa stream bị ngắt mạch sau failure_threshold lần liên tiếp
+    for _ in range(manager.retry_policy.failure_threshold - 1):
+        with pytest.raises(RuntimeError):
+            list(manager.generate_stream("q"))
+    assert not manager.health.is_usable("key-1111111111", "m1")
+
+
+class FakeSearchTool:
+    def search_multi_collections(self, query, collection_names, top_k, similarity_threshold):
+        return [{'text': "context", 'page': 1, 'source': 'a.pdf', 'collection': 'docs', 'score': 0.9}]
+
+    def pack_results_for_context(self, results, max_results=None):
+        return {'text': "\n".join(r['text'] for r in results), 'tokens': 1, 'truncated': [], 'dropped': []}
+
+
+class StreamingLLM:
+    def generate(self, prompt):
+        raise AssertionError("on_token được truyền → phải dùng generate_stream")
+
+    def generate_stream(self, prompt):
+        yield from [" Câu ", "trả lời "]
+
+
+def test_rag_tool_forwards_tokens():
+    tool = RagTool(search_tool=FakeSearchTool(), llm_client=StreamingLLM(), llm_type="gemini")
+    tokens = []
+
+    result = tool.answer_question("một câu hỏi", ['docs'], on_token=tokens.append)
+
+    assert tokens == [" Câu ", "trả lời "]
+    assert result['answer'] == "Câu trả lời"
+    assert result['sources'] == [{'pdf': 'a.pdf', 'page': 1, 'collection': 'docs'}]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
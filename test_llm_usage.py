@@ -0,0 +1,104 @@
+"""
+Tests cho thống kê usage LLM (src/llm_metrics.UsageTracker, LLMManager)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from src.llm_metrics import UsageTracker
+
+
+def test_tracker_aggregates_and_exports(tmp_path):
+    tracker = UsageTracker(window=10)
+    tracker.record({'provider': 'gemini', 'model': 'm1', 'key': 1, 'prompt_tokens': 100,
+                    'completion_tokens': 20, 'latency': 0.5, 'attempts': 1, 'success': True})
+    tracker.record({'provider': 'gemini', 'model': 'm1', 'key': 2, 'prompt_tokens': 300,
+                    'completion_tokens': 40, 'latency': 1.5, 'ttft': 0.2, 'attempts': 3,
+                    'fallback': True, 'success': True})
+    tracker.record({'provider': 'gemini', 'model': 'm1', 'attempts': 4, 'success': False, 'error': "quota"})
+
+    m1 = tracker.summary()['models']['m1']
+    assert (m1['calls'], m1['errors'], m1['retries'], m1['fallbacks']) == (3, 1, 5, 1)
+    assert (m1['prompt_tokens'], m1['completion_tokens']) == (400, 60)
+    assert m1['latency']['p50_ms'] == 500.0 and m1['latency']['p99_ms'] == 1500.0
+    assert m1['ttft']['p50_ms'] == 200.0
+    assert m1['keys'] == {1: 1, 2: 1}
+    assert "m1 (gemini): 3 lời gọi, 1 lỗi" in tracker.format_summary()
+
+    exported = json.loads(tracker.export(str(tmp_path / "usage.json")).read_text(encoding="utf-8"))
+    assert exported['summary']['totals']['calls'] == 3
+    assert len(exported['recent_calls']) == 3
+
+    prom = tracker.export(str(tmp_path / "usage.prom")).read_text(encoding="utf-8")
+    assert 'llm_prompt_tokens_total{model="m1"} 400' in prom
+    assert 'llm_latency_ms{model="m1",quantile="0.95"} 1500.0' in prom
+
+
+class Usage:
+    prompt_token_count = 42
+    candidates_token_count = 7
+    total_token_count = 49
+
+
+class MeteredModel:
+    """Model trong `missing` trả 404; response có usage_metadata thật (trừ khi stream)."""
+
+    missing = set()
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if self.model_name in MeteredModel.missing:
+            raise google_exceptions.NotFound(f"{self.model_name} not found")
+
+        class Response:
+            text = "một câu trả lời"
+            usage_metadata = Usage()
+
+        if stream:
+            return iter([type("Chunk", (), {'text': "một câu "})(), type("Chunk", (), {'text': "trả lời"})()])
+        return Response()
+
+
+@pytest.fixture
+def manager(gemini_manager):
+    MeteredModel.missing = set()
+    tracker = UsageTracker()
+    return gemini_manager(MeteredModel, keys=["k1", "k2"], models=["m1", "m2"], get_usage_tracker=lambda: tracker)
+
+
+def test_generate_records_usage_metadata_and_fallback(manager):
+    MeteredModel.missing = {"m1"}
+
+    manager.generate("câu hỏi")
+
+    [call] = manager.usage.recent()
+    assert call['model'] == "m2" and call['fallback'] is True
+    assert call['attempts'] == 3  # m1 lỗi với cả 2 key rồi mới chuyển sang m2
+    assert (call['prompt_tokens'], call['completion_tokens'], call['estimated']) == (42, 7, False)
+    assert call['key'] in (1, 2) and call['success'] and call['ttft'] is None
+
+
+def test_stream_records_ttft_and_estimated_tokens(manager):
+    assert "".join(manager.generate_stream("câu hỏi")) == "một câu trả lời"
+
+    [call] = manager.usage.recent()
+    assert call['estimated'] is True and call['completion_tokens'] > 0
+    assert 0 <= call['ttft'] <= call['latency']
+    assert manager.get_info()['usage']['calls'] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,122 @@
+"""
+Tests cho Ollama client (src/ollama_client.py)
+
+Chạy với HTTP server local giả lập Ollama, không cần Ollama thật.
+"""
+
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+import src.llm_langchain as llm_langchain
+from src.ollama_client import OllamaClient
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16  # gửi header + body trong một lần ghi (tránh trễ Nagle/delayed ACK)
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests.append((self.path, payload))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+
+        if self.path == "/api/chat":
+            lines = [{'message': {'role': 'assistant', 'content': "chat ok"}, 'done': True}]
+        elif payload['stream']:
+            lines = [{'response': "Xin ", 'done': False}, {'response': "chào", 'done': False},
+                     {'response': "", 'done': True}]
+        else:
+            lines = [{'response': f"echo {payload['prompt']}", 'done': True}]
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    server.daemon_threads = True
+    server.connections, server.requests = 0, []
+    server.in_flight, server.max_in_flight, server.latency = 0, 0, 0.0
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_generate_reuses_connection_and_sends_keep_alive(server):
+    client = OllamaClient(server.url + "/api/generate", keep_alive="30m", max_concurrency=2)
+
+    answers = [client.generate("llama3", f"q{i}", {'temperature': 0.1, 'num_predict': None}) for i in range(5)]
+
+    assert answers == [f"echo q{i}" for i in range(5)]
+    assert server.connections == 1
+    path, payload = server.requests[0]
+    assert path == "/api/generate"
+    assert payload['keep_alive'] == "30m"
+    assert payload['options'] == {'temperature': 0.1}
+
+
+def test_stream_yields_chunks(server):
+    client = OllamaClient(server.url)
+
+    assert list(client.stream("llama3", "q")) == ["Xin ", "chào"]
+    assert server.requests[0][1]['stream'] is True
+
+
+def test_concurrency_bounded_by_server_parallelism(server):
+    server.latency = 0.05
+    client = OllamaClient(server.url, max_concurrency=2)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda i: client.generate("llama3", f"q{i}"), range(6)))
+
+    assert server.max_in_flight == 2
+    assert server.connections <= 2
+
+
+def test_manager_uses_session_client(server, monkeypatch):
+    client = OllamaClient(server.url)
+    monkeypatch.setattr(llm_langchain, "get_ollama_client", lambda: client)
+    manager = llm_langchain.LLMManager(provider="ollama", model_name="llama3")
+
+    assert manager.generate("q") == "echo q"
+    assert "".join(manager.generate_stream("q")) == "Xin chào"
+    history = [{'role': 'user', 'content': "hi"}, {'role': 'assistant', 'content': "hello"}]
+    assert manager.generate_with_history("tiếp", history) == "chat ok"
+
+    path, payload = server.requests[-1]
+    assert path == "/api/chat"
+    assert [m['role'] for m in payload['messages']] == ['user', 'assistant', 'user']
+    assert server.connections == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
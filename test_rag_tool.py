@@ -0,0 +1,121 @@
+"""
+Tests cho RagTool (agent/tools/rag_tool.py)
+
+Dùng fake search tool và fake LLM, không cần Milvus hay API key.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+from agent.tools.rag_tool import RagTool
+
+
+class FakeSearchTool:
+    def __init__(self):
+        self.batches = []
+
+    def search_many(self, queries, collection_names, top_k, similarity_threshold):
+        self.batches.append(list(queries))
+        return [
+            [{'text': f"context {q}", 'page': i + 1, 'pdf_source': 'a.pdf', 'collection': 'docs', 'score': 0.9}]
+            for i, q in enumerate(queries)
+        ]
+
+    async def asearch_many(self, queries, collection_names, top_k, similarity_threshold):
+        return self.search_many(queries, collection_names, top_k, similarity_threshold)
+
+    def pack_results_for_context(self, results, max_results=None):
+        return {'text': "\n".join(r['text'] for r in results), 'tokens': 3, 'truncated': [], 'dropped': []}
+
+
+class SlowLLM:
+    """Câu hỏi đầu tiên trả lời chậm nhất để kiểm tra thứ tự ghép."""
+
+    def __init__(self, delay=0.3):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay if "first part" in prompt else self.delay / 3)
+        with self.lock:
+            self.active -= 1
+        return "answer for " + prompt.split("Question: ")[1].split("\n")[0]
+
+
+SUB_QUESTIONS = ["first part question", "second part question", "third part question"]
+
+
+def test_sub_questions_answered_concurrently_in_order():
+    llm = SlowLLM()
+    tool = RagTool(search_tool=FakeSearchTool(), llm_client=llm, llm_type="gemini")
+
+    start = time.perf_counter()
+    result = tool._handle_complex_question(SUB_QUESTIONS, ['docs'], None, top_k=15)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.3 + 0.2
+    assert tool.search_tool.batches == [SUB_QUESTIONS]
+    assert [line for line in result['answer'].split("\n") if line.startswith("**")] == [
+        f"**{i}. {q}**" for i, q in enumerate(SUB_QUESTIONS, 1)
+    ]
+    assert "answer for first part question" in result['answer'].split("\n\n")[0]
+    assert len(result['sources']) == 3
+
+
+def test_concurrency_bounded_by_provider_limit():
+    llm = SlowLLM(delay=0.1)
+    tool = RagTool(search_tool=FakeSearchTool(), llm_client=llm, llm_type="gemini")
+    tool.max_concurrency = 2
+
+    tool._handle_complex_question(SUB_QUESTIONS, ['docs'], None, top_k=15)
+
+    assert llm.max_active == 2
+
+
+class AsyncLLM(SlowLLM):
+    async def agenerate(self, prompt):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay if "first part" in prompt else self.delay / 3)
+        with self.lock:
+            self.active -= 1
+        return "answer for " + prompt.split("Question: ")[1].split("\n")[0]
+
+
+def test_async_answer_bounded_and_ordered():
+    llm = AsyncLLM(delay=0.2)
+    tool = RagTool(search_tool=FakeSearchTool(), llm_client=llm, llm_type="gemini")
+    tool.max_concurrency = 2
+    question = "1) first part question 2) second part question 3) third part question"
+
+    result = asyncio.run(tool.aanswer_question(question, ['docs']))
+
+    assert tool.search_tool.batches == [SUB_QUESTIONS]
+    assert llm.max_active == 2
+    assert result['answer'].split("\n\n")[0] == "**1. first part question**\nanswer for first part question"
+    assert len(result['sources']) == 3
+
+    # LLM không có agenerate → generate chạy trong thread
+    sync_tool = RagTool(search_tool=FakeSearchTool(), llm_client=SlowLLM(delay=0.01), llm_type="gemini")
+    simple = asyncio.run(sync_tool.aanswer_question("first part question", ['docs']))
+    assert simple['answer'] == "answer for first part question"
+    assert simple['context'] == {'tokens': 3, 'truncated': [], 'dropped': []}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
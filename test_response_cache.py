@@ -0,0 +1,95 @@
+"""
+Tests cho response cache của LLM (src/response_cache.py, LLMManager cache=True)
+
+Thay genai.GenerativeModel / _ClientManager bằng fake, không gọi API thật.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+from src.response_cache import ResponseCache
+
+
+def test_key_depends_on_model_and_temperature():
+    key = ResponseCache.make_key("gemini", "m1", 0.7, "prompt")
+
+    assert key == ResponseCache.make_key("gemini", "m1", 0.7, "prompt")
+    assert key != ResponseCache.make_key("gemini", "m2", 0.7, "prompt")
+    assert key != ResponseCache.make_key("gemini", "m1", 0.2, "prompt")
+    assert key != ResponseCache.make_key("ollama", "m1", 0.7, "prompt")
+
+
+def test_lru_eviction_and_hit_rate():
+    cache = ResponseCache(path=None, max_entries=2)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    cache.put("b", "B")
+    time.sleep(0.01)
+    assert cache.get("a") == "A"  # a mới được dùng → b là LRU
+    time.sleep(0.01)
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_rate': 0.667, 'entries': 2}
+
+
+def test_per_entry_ttl_and_persistence(tmp_path):
+    path = tmp_path / "llm.sqlite"
+    cache = ResponseCache(path=str(path), ttl_seconds=3600)
+    cache.put("short", "hết hạn nhanh", ttl_seconds=0.01)
+    cache.put("long", "còn hạn")
+    time.sleep(0.02)
+
+    assert cache.get("short") is None
+
+    reopened = ResponseCache(path=str(path))
+    assert reopened.get("long") == "còn hạn"
+    assert len(reopened) == 1
+
+
+class CountingModel:
+    calls = 0
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self._client = None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        CountingModel.calls += 1
+
+        class Response:
+            text = f"answer #{CountingModel.calls}"
+
+        return iter([Response()]) if stream else Response()
+
+
+@pytest.fixture
+def manager(gemini_manager):
+    CountingModel.calls = 0
+    return gemini_manager(CountingModel, get_response_cache=lambda: ResponseCache(path=None))
+
+
+def test_manager_cache_is_opt_in(manager):
+    assert manager.generate("q", cache=True) == "answer #1"
+    assert manager.generate("q", cache=True) == "answer #1"
+    # Không bật cache → luôn gọi LLM
+    assert manager.generate("q") == "answer #2"
+    # Stream dùng chung cache với generate
+    assert list(manager.generate_stream("q", cache=True)) == ["answer #1"]
+    assert list(manager.generate_stream("q2", cache=True)) == ["answer #3"]
+    assert manager.generate("q2", cache=True) == "answer #3"
+
+    assert CountingModel.calls == 3
+    assert manager.get_info()['response_cache']['hits'] == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
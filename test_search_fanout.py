@@ -0,0 +1,293 @@
+"""
+Tests cho fan-out search nhiều collection (SearchToolLangChain.search_multi_collections)
+
+Dùng fake embedding model và fake vector store, không cần Milvus hay model thật.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+
+from agent.tools.search_tool_langchain import SearchToolLangChain
+from src.config import BM25_MIN_SCORE
+from src.embedding_cache import QueryEmbeddingCache
+from src.lexical_index import LexicalIndexStore
+from src.vector_store import LocalVectorStore, PartitionedVectorStore, VectorStore
+
+
+class FakeEmbeddingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+class FakeVectorStore(VectorStore):
+    """Mỗi collection trả về các distance cố định, có thể cấu hình độ trễ."""
+
+    def __init__(self, distances, delays=None, failing=()):
+        self.distances = distances
+        self.delays = delays or {}
+        self.failing = set(failing)
+
+    def metric_type(self, name):
+        return "L2"
+
+    def search(self, name, vectors, top_k, **kwargs):
+        time.sleep(self.delays.get(name, 0))
+        if name in self.failing:
+            raise RuntimeError("boom")
+        self.calls = getattr(self, 'calls', []) + [(name, len(vectors))]
+        return [[
+            {'id': i, 'distance': d + q, 'text': f"{name}-{i}", 'page': i, 'pdf_source': f"{name}.pdf"}
+            for i, d in enumerate(sorted(self.distances[name])[:top_k])
+        ] for q in range(len(vectors))]
+
+
+@pytest.fixture
+def lexical_store(tmp_path):
+    return LexicalIndexStore(base_dir=str(tmp_path / "lexical"))
+
+
+@pytest.fixture
+def make_tool(lexical_store):
+    tools = []
+
+    def _make(store, retrieval_mode="hybrid"):
+        tool = SearchToolLangChain(
+            embedding_model=FakeEmbeddingModel(),
+            vector_store=store,
+            query_cache=QueryEmbeddingCache(path=None),
+            lexical_store=lexical_store,
+            retrieval_mode=retrieval_mode
+        )
+        tools.append(tool)
+        return tool
+
+    yield _make
+    for tool in tools:
+        tool.close()
+
+
+def test_merge_orders_by_score(make_tool):
+    store = FakeVectorStore({'a': [0.1, 0.5, 2.0], 'b': [0.2, 0.3, 9.0]})
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("q", ['a', 'b'], top_k=3, similarity_threshold=0.15)
+
+    assert [r['distance'] for r in results] == [0.1, 0.2, 0.3, 0.5, 2.0]
+    assert [r['collection'] for r in results[:2]] == ['a', 'b']
+
+
+def test_max_results_bounds_merge(make_tool):
+    store = FakeVectorStore({'a': [0.1, 0.5], 'b': [0.2, 0.3]})
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("q", ['a', 'b'], top_k=2, max_results=3)
+
+    assert [r['distance'] for r in results] == [0.1, 0.2, 0.3]
+
+
+def test_collections_searched_concurrently(make_tool):
+    names = [f"c{i}" for i in range(4)]
+    store = FakeVectorStore({n: [0.1] for n in names}, delays={n: 0.2 for n in names})
+    tool = make_tool(store)
+
+    start = time.perf_counter()
+    results = tool.search_multi_collections("q", names, top_k=1)
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 4
+    assert elapsed < 0.6
+
+
+def test_deadline_returns_partial_results(make_tool):
+    store = FakeVectorStore({'fast': [0.1], 'slow': [0.05]}, delays={'slow': 1.0})
+    tool = make_tool(store)
+
+    start = time.perf_counter()
+    results = tool.search_multi_collections("q", ['fast', 'slow'], top_k=1, deadline=0.2)
+
+    assert time.perf_counter() - start < 0.8
+    assert [r['collection'] for r in results] == ['fast']
+
+
+def test_failing_collection_is_skipped(make_tool):
+    store = FakeVectorStore({'ok': [0.1], 'bad': [0.1]}, failing=['bad'])
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("q", ['bad', 'ok'], top_k=1)
+
+    assert [r['collection'] for r in results] == ['ok']
+
+
+def test_partitioned_layout_single_search(make_tool, tmp_path):
+    store = PartitionedVectorStore(LocalVectorStore(base_dir=str(tmp_path)), shared_collection="shared")
+    for i, name in enumerate(['a', 'b', 'c']):
+        store.create_collection(name, dim=4, index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}})
+        vectors = np.full((2, 4), 0.1 * (i + 1), dtype=np.float32)
+        store.insert(name, vectors, [f"{name}-0", f"{name}-1"], [1, 2], [f"{name}.pdf"] * 2)
+
+    calls = []
+    original = store.inner.search
+    store.inner.search = lambda *args, **kwargs: calls.append(kwargs['partitions']) or original(*args, **kwargs)
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("q", ['a', 'c'], top_k=2, similarity_threshold=0.0)
+
+    assert calls == [['a', 'c']]
+    assert [r['collection'] for r in results] == ['a', 'a', 'c', 'c']
+    assert all(r['pdf_source'] == f"{r['collection']}.pdf" for r in results)
+
+
+def test_query_normalized_only_for_ip_collections(make_tool, tmp_path):
+    store = LocalVectorStore(base_dir=str(tmp_path))
+    raw = np.array([[3, 0, 0, 0], [0, 2, 0, 0]], dtype=np.float32)
+    for name, metric in (("legacy", "L2"), ("cosine", "IP")):
+        store.create_collection(name, dim=4, index_params={"metric_type": metric, "index_type": "FLAT", "params": {}})
+        store.insert(name, raw, ["x", "y"], [1, 2], [f"{name}.pdf"] * 2)
+    tool = make_tool(store, retrieval_mode="vector")
+    tool.embedding_model.encode = lambda texts, **kwargs: np.tile([[3, 0, 0, 0]], (len(texts), 1)).astype(np.float32)
+
+    legacy = tool.search_multi_collections("q", ["legacy"], top_k=2, similarity_threshold=0.0)
+    cosine = tool.search_multi_collections("q", ["cosine"], top_k=2, similarity_threshold=0.0)
+
+    # Collection L2 cũ: vector gốc so với vector gốc như trước khi có metric IP
+    assert [(r['text'], r['distance']) for r in legacy] == [("x", 0.0), ("y", pytest.approx(13.0))]
+    assert [(r['text'], r['distance']) for r in cosine] == [("x", pytest.approx(1.0)), ("y", pytest.approx(0.0))]
+
+
+def test_repeated_query_uses_embedding_cache(make_tool):
+    store = FakeVectorStore({'a': [0.1]})
+    tool = make_tool(store)
+
+    tool.search_multi_collections("Máy  học là gì?", ['a'], top_k=1)
+    tool.search_multi_collections(" Máy học là gì? ", ['a'], top_k=1)
+
+    assert tool.embedding_model.calls == [["Máy học là gì?"]]
+    assert tool.query_cache.stats == {'hits': 1, 'misses': 1}
+
+
+def test_search_many_one_batch_per_collection(make_tool):
+    store = FakeVectorStore({'a': [0.1, 0.5], 'b': [0.2]})
+    tool = make_tool(store)
+
+    results = tool.search_many(["q1", "q2", "q3"], ['a', 'b'], top_k=2)
+
+    assert tool.embedding_model.calls == [["q1", "q2", "q3"]]
+    assert sorted(store.calls) == [('a', 3), ('b', 3)]
+    assert len(results) == 3
+    assert [r['distance'] for r in results[0]] == [0.1, 0.2, 0.5]
+    # Query thứ 2 có distance +1 (FakeVectorStore)
+    assert [r['distance'] for r in results[1]] == [1.1, 1.2, 1.5]
+
+
+def test_hybrid_fuses_lexical_hits(make_tool, lexical_store):
+    store = FakeVectorStore({'a': [0.1, 0.2]})
+    lexical_store.add_documents('a', ["a-1", "SELECT 1 FROM bảng"], [1, 7], ["a.pdf", "a.pdf"])
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("1", ['a'], top_k=2, max_results=3)
+
+    # a-1 có ở cả hai danh sách → đứng đầu; chunk chỉ BM25 tìm thấy vẫn được giữ
+    assert [r['text'] for r in results] == ["a-1", "a-0", "SELECT 1 FROM bảng"]
+    assert results[0]['vector_score'] > 0 and results[0]['bm25'] > 0
+    assert results[0]['rrf_score'] == pytest.approx(1 / 62 + 1 / 61)
+    # Mọi kết quả (kể cả chunk chỉ BM25 tìm thấy) đều có 'score' = rrf_score
+    assert [r['score'] for r in results] == [r['rrf_score'] for r in results]
+    assert 'vector_score' not in results[2]
+
+    vector_only = tool.search_multi_collections("1", ['a'], top_k=2, retrieval_mode="vector")
+    assert [r['text'] for r in vector_only] == ["a-0", "a-1"]
+
+
+def test_hybrid_ranks_each_collection_bm25_separately(make_tool, lexical_store):
+    store = FakeVectorStore({'a': [], 'b': []})
+    # Collection 'b' nhỏ và có nhiều từ hiếm nên bm25 thô lớn hơn hẳn 'a'
+    lexical_store.add_documents('a', ["ohm ohm ohm", "ohm", "ohm điện trở", "dòng điện"], [1, 2, 3, 4], ["a.pdf"] * 4)
+    lexical_store.add_documents('b', ["ohm", "khác"], [9, 10], ["b.pdf"] * 2)
+    tool = make_tool(store)
+
+    results = tool.search_multi_collections("ohm", ['a', 'b'], top_k=3)
+
+    # Hạng 1 của mỗi collection được điểm RRF như nhau, không bị bm25 thô của 'b' lấn át
+    assert results[0]['rrf_score'] == results[1]['rrf_score'] == pytest.approx(1 / 61)
+    assert {(r['collection'], r['page']) for r in results[:2]} == {('a', 1), ('b', 9)}
+    assert all(r['score'] == r['rrf_score'] for r in results)
+
+    # Chunk chỉ khớp "ohm" trong một câu hỏi dài không đạt ngưỡng BM25_MIN_SCORE
+    lexical = tool.search_multi_collections(
+        "định luật ohm cho dòng điện trở", ['a', 'b'], top_k=5, retrieval_mode="lexical"
+    )
+    assert [(r['collection'], r['page']) for r in lexical] == [('a', 4), ('a', 3)]
+    assert all(r['score'] == r['lexical_score'] >= BM25_MIN_SCORE for r in lexical)
+
+
+def test_lexical_fast_path_when_vector_search_slow(make_tool, lexical_store):
+    store = FakeVectorStore({'slow': [0.05]}, delays={'slow': 1.0})
+    lexical_store.add_documents('slow', ["Định luật Ohm"], [3], ["slow.pdf"])
+    tool = make_tool(store)
+
+    start = time.perf_counter()
+    results = tool.search_multi_collections("dinh luat ohm", ['slow'], top_k=1, deadline=0.2)
+
+    assert time.perf_counter() - start < 0.8
+    assert [(r['collection'], r['page']) for r in results] == [('slow', 3)]
+
+    lexical_only = make_tool(store, retrieval_mode="lexical")
+    assert lexical_only.search_multi_collections("ohm", ['slow'], top_k=1)[0]['page'] == 3
+    assert lexical_only.embedding_model.calls == []
+
+
+def test_async_search_matches_sync_and_overlaps(make_tool, lexical_store):
+    store = FakeVectorStore({'a': [0.1, 0.2], 'b': [0.3]}, delays={'a': 0.2, 'b': 0.2})
+    lexical_store.add_documents('a', ["a-1", "SELECT 1 FROM bảng"], [1, 7], ["a.pdf", "a.pdf"])
+    tool = make_tool(store)
+
+    expected = tool.search_many(["1", "2"], ['a', 'b'], top_k=2)
+
+    async def run_sessions():
+        # 3 hội thoại đồng thời dùng chung một tool (một embedding model)
+        return await asyncio.gather(*(tool.asearch_many(["1", "2"], ['a', 'b'], top_k=2) for _ in range(3)))
+
+    start = time.perf_counter()
+    sessions = asyncio.run(run_sessions())
+    elapsed = time.perf_counter() - start
+
+    assert all(results == expected for results in sessions)
+    assert elapsed < 0.5
+    assert asyncio.run(tool.asearch_multi_collections("1", ['a', 'b'], top_k=2)) == expected[0]
+
+
+def test_pack_results_reports_dropped_chunks(make_tool, monkeypatch):
+    import agent.tools.search_tool_langchain as search_module
+    from src.context_packer import ContextPacker
+
+    monkeypatch.setattr(search_module, "get_context_packer", lambda: ContextPacker(budget=60, min_truncate_tokens=1000))
+    tool = make_tool(FakeVectorStore({}))
+    results = [
+        {'text': "nội dung " * 10, 'page': page, 'pdf_source': "a.pdf", 'collection': "a", 'score': 0.9 - page / 10}
+        for page in (1, 2, 3)
+    ]
+
+    packed = tool.pack_results_for_context(results)
+
+    assert packed['dropped'] == [
+        {'pdf_source': "a.pdf", 'page': page, 'collection': "a"} for page in (2, 3)
+    ]
+    assert packed['truncated'] == [] and 0 < packed['tokens'] <= 60
+    assert tool.format_results_for_context(results) == packed['text']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+"""
+Tests cho token-aware chunking (src/ingest_langchain.py)
+
+Dùng tokenizer giả (tách theo khoảng trắng) để không phải tải model thật.
+"""
+
+import re
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import pytest
+
+from src.ingest_langchain import chunk_text_by_tokens, count_truncated_chunks
+
+
+class WhitespaceTokenizer:
+    """Fast tokenizer giả: mỗi từ là một token, thêm 2 special tokens."""
+
+    is_fast = True
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 2
+
+    def _encode(self, text):
+        return [(m.start(), m.end()) for m in re.finditer(r'\S+', text)]
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, truncation=False):
+        texts = text if isinstance(text, list) else [text]
+        extra = 2 if add_special_tokens else 0
+        input_ids = [list(range(len(self._encode(t)) + extra)) for t in texts]
+
+        if isinstance(text, list):
+            return {'input_ids': input_ids}
+
+        result = {'input_ids': input_ids[0]}
+        if return_offsets_mapping:
+            result['offset_mapping'] = self._encode(text)
+        return result
+
+
+class FakeEmbeddingModel:
+    def __init__(self, max_seq_length):
+        self.tokenizer = WhitespaceTokenizer()
+        self.max_seq_length = max_seq_length
+
+
+class TestTokenChunking:
+    """Test chunk_text_by_tokens và count_truncated_chunks."""
+
+    def test_chunks_fit_model_window(self):
+        model = FakeEmbeddingModel(max_seq_length=12)  # 10 token nội dung
+        text = " ".join(f"w{i}" for i in range(95))
+
+        chunks = chunk_text_by_tokens(text, model, chunk_overlap=0)
+
+        assert all(len(c.split()) <= 10 for c in chunks)
+        assert count_truncated_chunks(chunks, model) == 0
+        # Không overlap → ghép lại đúng text gốc
+        assert " ".join(chunks) == text
+
+    def test_overlap_repeats_tokens(self):
+        model = FakeEmbeddingModel(max_seq_length=12)
+        text = " ".join(f"w{i}" for i in range(30))
+
+        chunks = chunk_text_by_tokens(text, model, chunk_overlap=3)
+
+        assert chunks[0].split()[-3:] == chunks[1].split()[:3]
+
+    def test_prefers_paragraph_boundary(self):
+        model = FakeEmbeddingModel(max_seq_length=12)
+        text = "a b c d e f g\n\nh i j k l m n"
+
+        chunks = chunk_text_by_tokens(text, model, chunk_overlap=0)
+
+        assert chunks[0] == "a b c d e f g"
+        assert chunks[1] == "h i j k l m n"
+
+    def test_count_truncated_chunks(self):
+        model = FakeEmbeddingModel(max_seq_length=5)
+        chunks = ["a b c", "a b c d", "a b c d e f"]
+
+        # "a b c d" → 4 + 2 special = 6 > 5
+        assert count_truncated_chunks(chunks, model, batch_size=2) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
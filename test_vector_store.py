@@ -0,0 +1,333 @@
+"""
+Tests cho LocalVectorStore (src/vector_store.py)
+
+Không cần Milvus server: dữ liệu lưu trong thư mục tạm.
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pytest
+
+from src.vector_store import (
+    LocalVectorStore,
+    PartitionedVectorStore,
+    build_filter_expr,
+    similarity_from_distance
+)
+
+
+DIM = 16
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalVectorStore(base_dir=str(tmp_path / "vectors"))
+
+
+@pytest.fixture
+def populated(store):
+    rng = np.random.default_rng(42)
+    embeddings = rng.normal(size=(300, DIM)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(300)]
+    pages = [i // 10 + 1 for i in range(300)]
+    sources = ["a.pdf" if i < 150 else "b.pdf" for i in range(300)]
+
+    store.create_collection(
+        "docs",
+        dim=DIM,
+        index_params={"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 16}}
+    )
+    store.insert("docs", embeddings, texts, pages, sources)
+    return store, embeddings
+
+
+class TestLocalVectorStore:
+    """Test CRUD, search và filter của LocalVectorStore."""
+
+    def test_collection_lifecycle(self, store):
+        assert not store.has_collection("docs")
+
+        store.create_collection("docs", dim=DIM)
+        assert store.has_collection("docs")
+        assert store.list_collections() == ["docs"]
+        assert store.num_entities("docs") == 0
+
+        store.drop_collection("docs")
+        assert not store.has_collection("docs")
+
+    def test_exact_search_matches_brute_force(self, populated):
+        store, embeddings = populated
+        query = embeddings[7] + 0.01
+
+        hits = store.search("docs", [query], top_k=5, search_params={"params": {}})[0]
+
+        expected = np.argsort(((embeddings - query) ** 2).sum(axis=1))[:5]
+        assert [h['id'] for h in hits] == expected.tolist()
+        assert hits[0]['text'] == "chunk 7"
+        assert hits[0]['distance'] == pytest.approx(((embeddings[7] - query) ** 2).sum(), abs=1e-4)
+
+    def test_ivf_full_probe_equals_exact(self, populated):
+        store, embeddings = populated
+        queries = embeddings[:10] + 0.05
+
+        exact = store.search("docs", queries, top_k=10, search_params={"params": {}})
+        ivf = store.search("docs", queries, top_k=10, search_params={"params": {"nprobe": 16}})
+
+        assert [[h['id'] for h in hits] for hits in exact] == [[h['id'] for h in hits] for hits in ivf]
+
+    def test_search_with_filters(self, populated):
+        store, embeddings = populated
+
+        hits = store.search("docs", [embeddings[0]], top_k=20, pdf_source="b.pdf")[0]
+        assert hits and all(h['pdf_source'] == "b.pdf" for h in hits)
+
+        hits = store.search("docs", [embeddings[0]], top_k=50, pages=[2, 5])[0]
+        assert {h['page'] for h in hits} <= {2, 5}
+
+    def test_combined_filters_match_brute_force(self, populated):
+        store, _ = populated
+
+        rows = store.query("docs", pages=[3, 17, 25], page_range=(10, 30), pdf_source="b.pdf", limit=1000)
+
+        expected = [
+            i for i in range(300)
+            if i // 10 + 1 in (17, 25) and i >= 150
+        ]
+        assert [r['id'] for r in rows] == expected
+
+    def test_query_page_range(self, populated):
+        store, _ = populated
+
+        rows = store.query("docs", page_range=(3, 4), output_fields=["text", "page"])
+
+        assert len(rows) == 20
+        assert {r['page'] for r in rows} == {3, 4}
+        assert 'pdf_source' not in rows[0]
+
+    def test_ip_metric_returns_cosine_similarity(self, store):
+        rng = np.random.default_rng(1)
+        embeddings = rng.normal(size=(50, DIM)).astype(np.float32) * 5
+        store.create_collection("ip", dim=DIM, index_params={"metric_type": "IP", "index_type": "FLAT", "params": {}})
+        store.insert("ip", embeddings, [f"c{i}" for i in range(50)], [1] * 50, ["a.pdf"] * 50)
+
+        query = embeddings[4] * 3
+        hits = store.search("ip", [query], top_k=5)[0]
+
+        unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        cosine = unit @ (query / np.linalg.norm(query))
+        assert [h['id'] for h in hits] == np.argsort(-cosine)[:5].tolist()
+        assert hits[0]['distance'] == pytest.approx(1.0, abs=1e-5)
+        assert store.metric_type("ip") == "IP"
+
+    def test_persists_across_instances(self, populated, tmp_path):
+        store, embeddings = populated
+
+        reopened = LocalVectorStore(base_dir=str(store.base_dir))
+
+        assert reopened.num_entities("docs") == 300
+        assert reopened.search("docs", [embeddings[3]], top_k=1)[0][0]['text'] == "chunk 3"
+
+    def test_batched_insert_appends_without_retraining(self, store):
+        rng = np.random.default_rng(3)
+        embeddings = rng.normal(size=(400, DIM)).astype(np.float32)
+        store.create_collection(
+            "docs",
+            dim=DIM,
+            index_params={"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 8}}
+        )
+        store.insert("docs", embeddings[:300], [f"chunk {i}" for i in range(300)], [1] * 300, ["a.pdf"] * 300)
+        centroids = np.load(store.base_dir / "docs" / "ivf_centroids.npy")
+
+        # Mỗi batch chỉ nối thêm dòng và gán vào centroid có sẵn (không train lại k-means)
+        for start in range(300, 400, 25):
+            store.insert(
+                "docs", embeddings[start:start + 25], [f"chunk {i}" for i in range(start, start + 25)],
+                [2] * 25, ["b.pdf"] * 25
+            )
+        assert np.array_equal(np.load(store.base_dir / "docs" / "ivf_centroids.npy"), centroids)
+
+        reopened = LocalVectorStore(base_dir=str(store.base_dir))
+        for current in (store, reopened):
+            assert current.num_entities("docs") == 400
+            assert [r['id'] for r in current.query("docs", pdf_source="b.pdf")] == list(range(300, 400))
+            exact = current.search("docs", embeddings[290:310], top_k=5, search_params={"params": {}})
+            ivf = current.search("docs", embeddings[290:310], top_k=5, search_params={"params": {"nprobe": 8}})
+            assert [[h['id'] for h in hits] for hits in exact] == [[h['id'] for h in hits] for hits in ivf]
+            assert [hits[0]['text'] for hits in exact] == [f"chunk {i}" for i in range(290, 310)]
+
+    def test_search_sees_consistent_snapshot_during_insert(self, store):
+        import threading
+
+        rng = np.random.default_rng(5)
+        store.create_collection("docs", dim=DIM, index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}})
+        store.insert("docs", rng.normal(size=(50, DIM)).astype(np.float32), ["x"] * 50, [1] * 50, ["a.pdf"] * 50)
+        errors = []
+
+        def search_loop():
+            try:
+                for _ in range(200):
+                    hits = store.search("docs", rng.normal(size=(1, DIM)), top_k=500, pages=[1, 2])[0]
+                    assert len({h['id'] for h in hits}) == len(hits)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=search_loop)
+        thread.start()
+        for i in range(20):
+            store.insert("docs", rng.normal(size=(10, DIM)).astype(np.float32), ["y"] * 10, [2] * 10, ["b.pdf"] * 10)
+        thread.join()
+
+        assert errors == []
+        assert store.num_entities("docs") == 250
+
+
+class TestPartitionedVectorStore:
+    """Test layout partitioned: mỗi "collection" là một partition trong collection chung."""
+
+    @pytest.fixture
+    def partitioned(self, tmp_path):
+        store = PartitionedVectorStore(LocalVectorStore(base_dir=str(tmp_path)), shared_collection="shared")
+        rng = np.random.default_rng(0)
+        data = {}
+        for name in ("doc_a", "doc_b", "doc_c"):
+            store.create_collection(name, dim=DIM, index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}})
+            embeddings = rng.normal(size=(20, DIM)).astype(np.float32)
+            store.insert(name, embeddings, [f"{name} {i}" for i in range(20)], [i // 5 + 1 for i in range(20)], [f"{name}.pdf"] * 20)
+            data[name] = embeddings
+        return store, data
+
+    def test_collections_map_to_partitions(self, partitioned):
+        store, _ = partitioned
+
+        assert store.list_collections() == ["doc_a", "doc_b", "doc_c"]
+        assert store.inner.list_collections() == ["shared"]
+        assert store.has_collection("doc_b") and not store.has_collection("doc_x")
+        assert store.num_entities("doc_b") == 20
+        assert store.inner.num_entities("shared") == 60
+
+    def test_search_and_query_scoped_to_partition(self, partitioned):
+        store, data = partitioned
+
+        hits = store.search("doc_b", [data["doc_a"][0]], top_k=30)[0]
+        assert len(hits) == 20
+        assert {h['partition'] for h in hits} == {"doc_b"}
+
+        rows = store.query("doc_c", page_range=(2, 2), output_fields=["text", "page"])
+        assert sorted(r['text'] for r in rows) == [f"doc_c {i}" for i in range(5, 10)]
+
+    def test_search_collections_single_call(self, partitioned):
+        store, data = partitioned
+
+        hits = store.search_collections(["doc_a", "doc_c"], [data["doc_c"][3]], top_k=5)[0]
+
+        assert hits[0]['text'] == "doc_c 3" and hits[0]['partition'] == "doc_c"
+        assert {h['partition'] for h in hits} <= {"doc_a", "doc_c"}
+
+    def test_drop_collection_keeps_other_partitions(self, partitioned):
+        store, data = partitioned
+
+        store.drop_collection("doc_a")
+
+        assert store.list_collections() == ["doc_b", "doc_c"]
+        assert store.inner.num_entities("shared") == 40
+        hits = store.search("doc_c", [data["doc_c"][7]], top_k=1)[0]
+        assert hits[0]['text'] == "doc_c 7"
+
+        reopened = PartitionedVectorStore(LocalVectorStore(base_dir=str(store.inner.base_dir)), shared_collection="shared")
+        assert reopened.num_entities("doc_c") == 20
+
+    def test_index_and_migration_api_delegates_to_shared_collection(self, partitioned):
+        store, data = partitioned
+
+        assert store.get_index_params("doc_a") == store.inner.get_index_params("shared")
+        assert store.list_partitions("doc_a") == ["_default"] and store.has_partition("doc_a", "_default")
+
+        rows = [row for batch in store.iter_rows("doc_b", batch_size=7) for row in batch]
+        assert [row['text'] for row in rows] == [f"doc_b {i}" for i in range(20)]
+
+        ids, vectors = store.sample_vectors("doc_a", 10)
+        assert len(ids) == 10 and vectors.shape == (10, DIM)
+
+        ivf = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 4}}
+        store.rebuild_index("doc_a", ivf)
+        assert store.inner.get_index_params("shared") == ivf
+
+        store.rename_collection("doc_b", "doc_renamed")
+        assert store.list_collections() == ["doc_a", "doc_c", "doc_renamed"]
+        hits = store.search("doc_renamed", [data["doc_b"][4]], top_k=1)[0]
+        assert hits[0]['text'] == "doc_b 4" and hits[0]['partition'] == "doc_renamed"
+
+
+class TestCollectionHandleCache:
+    """Test cache handle Milvus (không cần server: thay Collection bằng fake)."""
+
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        import src.milvus as milvus_module
+
+        created = []
+
+        class FakeCollection:
+            def __init__(self, name, using=None):
+                self.name = name
+                self.loads = 0
+                created.append(self)
+
+            def load(self):
+                self.loads += 1
+
+        monkeypatch.setattr(milvus_module, "Collection", FakeCollection)
+        cache = milvus_module.CollectionHandleCache(alias="test")
+        cache.created = created
+        return cache
+
+    def test_handle_created_and_loaded_once(self, cache):
+        first = cache.get("docs")
+        for _ in range(5):
+            assert cache.get("docs") is first
+
+        assert len(cache.created) == 1
+        assert first.loads == 1
+        assert cache.stats['loads'] == 1
+
+    def test_unloaded_handle_loads_on_demand(self, cache):
+        handle = cache.get("docs", load=False)
+        assert handle.loads == 0 and not cache.is_loaded("docs")
+
+        assert cache.get("docs") is handle
+        assert handle.loads == 1
+
+    def test_invalidate_and_mark_unloaded(self, cache):
+        first = cache.get("docs")
+
+        cache.mark_unloaded("docs")
+        assert cache.get("docs") is first
+        assert first.loads == 2
+
+        cache.invalidate("docs")
+        second = cache.get("docs")
+        assert second is not first
+        assert second.loads == 1
+
+
+def test_similarity_from_distance():
+    assert similarity_from_distance(0.42, "IP") == pytest.approx(0.42)
+    assert similarity_from_distance(1.0, "L2") == pytest.approx(0.5)
+
+
+def test_build_filter_expr():
+    assert build_filter_expr() == ""
+    assert build_filter_expr(pages=[1, 2]) == "page in [1, 2]"
+    assert build_filter_expr(page_range=(1, 3), pdf_source='a "b".pdf') == (
+        'page >= 1 && page <= 3 && pdf_source == "a \\"b\\".pdf"'
+    )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])